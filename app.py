@@ -1,26 +1,57 @@
 # app.py
+import base64
+import csv
+import hashlib
+import io
+import json
 import os
+import re
+import secrets
+import threading
+import time
+import zlib
+from collections import namedtuple
+from functools import wraps
 from datetime import datetime, date, timedelta
 from pathlib import Path
 
 from flask import (
     Flask,
+    Response,
+    abort,
     g,
+    make_response,
     redirect,
     render_template,
     request,
+    send_file,
     session,
+    stream_template,
+    stream_with_context,
     url_for,
 )
+import click
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, Integer, and_, case, cast, delete, event, func, insert, literal, or_, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import object_session
 from werkzeug.security import check_password_hash
 
+from database import (
+    DATA_VERSION_DDL,
+    LOAN_BALANCE_DDL,
+    rebuild_loan_balances,
+    verify_loan_balances,
+)
+from view_cache import ViewCache
+
 BASE_DIR = Path(__file__).resolve().parent
 
 DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-DB_PATH = DATA_DIR / "loan_ledger.db"
+# 環境変数 APP_DB_PATH で上書き可（テスト・負荷試験用）
+DB_PATH = Path(os.environ.get("APP_DB_PATH", DATA_DIR / "loan_ledger.db"))
 
 app = Flask(__name__)
 
@@ -100,6 +131,9 @@ class Customer(db.Model):
 
 class Loan(db.Model):
     __tablename__ = "loans"
+    __table_args__ = (
+        db.Index("ix_loans_user_loan_date", "user_id", "loan_date", "loan_id"),
+    )
 
     loan_id = db.Column(db.String, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
@@ -126,6 +160,10 @@ class Loan(db.Model):
 
 class Repayment(db.Model):
     __tablename__ = "repayments"
+    __table_args__ = (
+        db.Index("ix_repayments_user_loan", "user_id", "loan_id"),
+        db.Index("ix_repayments_user_date", "user_id", "repayment_date", "repayment_id"),
+    )
 
     repayment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
@@ -138,23 +176,168 @@ class Repayment(db.Model):
     created_at = db.Column(db.String, nullable=False)
 
 
+class LoanBalance(db.Model):
+    """
+    貸付ごとの返済累計（loans / repayments のトリガーで更新される。定義は database.py）
+    """
+    __tablename__ = "loan_balances"
+
+    loan_id = db.Column(db.String, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    total_repaid = db.Column(db.Integer, nullable=False, default=0)
+    late_fee_paid = db.Column(db.Integer, nullable=False, default=0)
+    last_repayment_date = db.Column(db.String)
+    fully_repaid = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class LoanIdSequence(db.Model):
+    """
+    貸付日ごとの loan_id 連番（LYYYYMMDD-001 の 001 部分）。allocate_loan_id だけが更新する
+    """
+    __tablename__ = "loan_id_sequences"
+
+    date_part = db.Column(db.String, primary_key=True)
+    last_number = db.Column(db.Integer, nullable=False)
+
+
+class UserDataVersion(db.Model):
+    """
+    ユーザーごとのデータバージョン（customers / loans / repayments への書き込みのたびにトリガーで +1）
+    """
+    __tablename__ = "user_data_versions"
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class OverdueSnapshot(db.Model):
+    """
+    日付ごとの未返済・延滞の状態（flask snapshot-overdue が夜間に作る。過去日付の画面はここを読む）
+    - 列は unpaid_loans_cte と同じ。その日までの貸付・返済だけで計算した値
+    """
+    __tablename__ = "overdue_snapshot"
+    __table_args__ = (
+        db.Index("ix_overdue_snapshot_user_date", "user_id", "snapshot_date", "due_date", "loan_id"),
+    )
+
+    snapshot_date = db.Column(db.String, primary_key=True)
+    loan_id = db.Column(db.String, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    customer_id = db.Column(db.String, nullable=False)
+    loan_amount = db.Column(db.Integer, nullable=False)
+    loan_date = db.Column(db.String, nullable=False)
+    due_date = db.Column(db.String, nullable=False)
+    repayment_expected = db.Column(db.Integer, nullable=False)
+    total_repaid = db.Column(db.Integer, nullable=False)
+    remaining = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String, nullable=False)
+    overdue_days = db.Column(db.Integer, nullable=False)
+    late_fee_paid = db.Column(db.Integer, nullable=False)
+    late_fee_amount = db.Column(db.Integer, nullable=False)
+    late_fee_remaining = db.Column(db.Integer, nullable=False)
+    current_collect_amount = db.Column(db.Integer, nullable=False)
+
+
+class OverdueSnapshotRun(db.Model):
+    """
+    overdue_snapshot を作った日付（未返済が1件も無いユーザーでも、その日のスナップショットがあると分かるように）
+    """
+    __tablename__ = "overdue_snapshot_runs"
+
+    snapshot_date = db.Column(db.String, primary_key=True)
+    row_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.String, nullable=False)
+
+
+# トリガーは loans / repayments などを参照するので、全テーブル作成後に作る
+for _statement in LOAN_BALANCE_DDL + DATA_VERSION_DDL:
+    event.listen(db.metadata, "after_create", DDL(_statement))
+
+# 画面の計算結果キャッシュ（キーは user_id・データバージョン・日付）
+view_cache = ViewCache.from_env()
+
+
 def now_str():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
+# ログインユーザー（テンプレートと各画面が参照する属性だけを持つ読み取り専用の値）
+Principal = namedtuple("Principal", ["user_id", "username", "role", "is_active"])
+
+# worker ごとの Principal キャッシュ: user_id -> (Principal, 有効期限)
+# - 同じ worker 内で User を更新・削除した場合は即座に捨てる（下の ORM イベント）
+# - 別の worker・プロセスで無効化された場合は、最長 PRINCIPAL_TTL_SECONDS 秒で反映される
+PRINCIPAL_TTL_SECONDS = float(os.environ.get("APP_PRINCIPAL_TTL", 30))
+_principal_cache = {}
+_principal_lock = threading.Lock()
+
+def invalidate_principal(user_id=None):
+    """
+    キャッシュ済みのログインユーザーを捨てる（user_id 省略時は全員）
+    """
+    with _principal_lock:
+        if user_id is None:
+            _principal_cache.clear()
+        else:
+            _principal_cache.pop(user_id, None)
+
+def get_principal(user_id):
+    """
+    user_id のログインユーザーを返す（存在しない・無効なら None）
+    TTL 内はDBを読まない
+    """
+    now = time.monotonic()
+
+    with _principal_lock:
+        cached = _principal_cache.get(user_id)
+
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    user = db.session.get(User, user_id)
+
+    if user is None or not user.is_active:
+        invalidate_principal(user_id)
+        return None
+
+    principal = Principal(user.user_id, user.username, user.role, user.is_active)
+
+    with _principal_lock:
+        _principal_cache[user_id] = (principal, now + PRINCIPAL_TTL_SECONDS)
+
+    return principal
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    # 無効化・権限変更はコミット前にも捨てておき、コミット後にもう一度捨てる
+    # （その間に別スレッドが古い値を読み込んでいても残らないようにする）
+    invalidate_principal(target.user_id)
+    object_session(target).info.setdefault("changed_user_ids", set()).add(target.user_id)
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_principal(user_id)
+
 @app.before_request
 def load_logged_in_user():
     """
     sessionのuser_idから現在のログインユーザーを取得する。
+    static はログイン不要なので、DBもキャッシュも見ない。
     """
+    if request.endpoint == "static":
+        g.user = None
+        return
+
     user_id = session.get("user_id")
 
     if user_id is None:
         g.user = None
         return
 
-    user = db.session.get(User, user_id)
+    user = get_principal(user_id)
 
-    if user is None or not user.is_active:
+    if user is None:
         session.clear()
         g.user = None
         return
@@ -177,76 +360,217 @@ def require_login():
     if g.user is None:
         return redirect(url_for("login"))
 
+def loan_to_dict(loan):
+    return {
+        "loan_id": loan.loan_id,
+        "customer_id": loan.customer_id,
+        "loan_amount": loan.loan_amount,
+        "loan_date": loan.loan_date,
+        "due_date": loan.due_date,
+        "interest_rate_percent": loan.interest_rate_percent,
+        "repayment_expected": loan.repayment_expected,
+        "repayment_method": loan.repayment_method,
+        "grace_period_days": loan.grace_period_days,
+        "late_fee_rate_percent": loan.late_fee_rate_percent,
+        "late_base_amount": loan.late_base_amount,
+        "contract_status": loan.contract_status,
+        "cancelled_at": loan.cancelled_at or "",
+        "cancel_reason": loan.cancel_reason or "",
+        "notes": loan.notes or "",
+    }
+
+def repayment_to_dict(repayment):
+    return {
+        "loan_id": repayment.loan_id,
+        "customer_id": repayment.customer_id,
+        "repayment_amount": repayment.repayment_amount,
+        "repayment_date": repayment.repayment_date,
+        "payment_type": repayment.payment_type,
+    }
+
+def customer_to_dict(customer):
+    return {
+        "customer_id": customer.customer_id,
+        "customer_name": customer.customer_name,
+        "credit_limit": customer.credit_limit,
+    }
+
+# load_* は ORM オブジェクトを作らずに列だけを select して dict にする
+# （identity map への登録・属性の計装が要らないぶん、件数が多いと大きく速い）。
+# 値は *_to_dict と同じ（NULL になりうる文字列列は空文字にそろえる）。
+LOAD_BATCH_SIZE = 2000
+
+LOAN_DICT_COLUMNS = (
+    Loan.loan_id,
+    Loan.customer_id,
+    Loan.loan_amount,
+    Loan.loan_date,
+    Loan.due_date,
+    Loan.interest_rate_percent,
+    Loan.repayment_expected,
+    Loan.repayment_method,
+    Loan.grace_period_days,
+    Loan.late_fee_rate_percent,
+    Loan.late_base_amount,
+    Loan.contract_status,
+    func.coalesce(Loan.cancelled_at, "").label("cancelled_at"),
+    func.coalesce(Loan.cancel_reason, "").label("cancel_reason"),
+    func.coalesce(Loan.notes, "").label("notes"),
+)
+
+REPAYMENT_DICT_COLUMNS = (
+    Repayment.loan_id,
+    Repayment.customer_id,
+    Repayment.repayment_amount,
+    Repayment.repayment_date,
+    Repayment.payment_type,
+)
+
+CUSTOMER_DICT_COLUMNS = (
+    Customer.customer_id,
+    Customer.customer_name,
+    Customer.credit_limit,
+)
+
+def load_rows(statement):
+    """列だけの select を yield_per で読み、行ごとの dict のリストを返す。"""
+    result = db.session.execute(statement.execution_options(yield_per=LOAD_BATCH_SIZE))
+    keys = tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
 def load_loans(file_path=None):
-    loans = (
-        Loan.query
-        .filter_by(user_id=g.user.user_id)
+    return load_rows(
+        select(*LOAN_DICT_COLUMNS)
+        .where(Loan.user_id == g.user.user_id)
         .order_by(
             Loan.loan_date,
             Loan.loan_id,
         )
-        .all()
     )
 
-    return [
-        {
-            "loan_id": loan.loan_id,
-            "customer_id": loan.customer_id,
-            "loan_amount": loan.loan_amount,
-            "loan_date": loan.loan_date,
-            "due_date": loan.due_date,
-            "interest_rate_percent": loan.interest_rate_percent,
-            "repayment_expected": loan.repayment_expected,
-            "repayment_method": loan.repayment_method,
-            "grace_period_days": loan.grace_period_days,
-            "late_fee_rate_percent": loan.late_fee_rate_percent,
-            "late_base_amount": loan.late_base_amount,
-            "contract_status": loan.contract_status,
-            "cancelled_at": loan.cancelled_at or "",
-            "cancel_reason": loan.cancel_reason or "",
-            "notes": loan.notes or "",
-        }
-        for loan in loans
-    ]
-
 def load_repayments(file_path=None):
-    repayments = (
-        Repayment.query
-        .filter_by(user_id=g.user.user_id)
+    return load_rows(
+        select(*REPAYMENT_DICT_COLUMNS)
+        .where(Repayment.user_id == g.user.user_id)
         .order_by(
             Repayment.repayment_date,
             Repayment.repayment_id,
         )
-        .all()
     )
 
-    return [
-        {
-            "loan_id": repayment.loan_id,
-            "customer_id": repayment.customer_id,
-            "repayment_amount": repayment.repayment_amount,
-            "repayment_date": repayment.repayment_date,
-            "payment_type": repayment.payment_type,
-        }
-        for repayment in repayments
-    ]
-
 def load_customers(file_path=None):
-    customers = (
-        Customer.query
-        .filter_by(user_id=g.user.user_id)
+    return load_rows(
+        select(*CUSTOMER_DICT_COLUMNS)
+        .where(Customer.user_id == g.user.user_id)
         .order_by(Customer.customer_id)
-        .all()
     )
 
-    return [
-        {
-            "customer_id": customer.customer_id,
-            "customer_name": customer.customer_name,
-            "credit_limit": customer.credit_limit,
-        }
-        for customer in customers
-    ]
+# ======================
+# 一覧のページング（keyset / cursor 方式）
+# ======================
+
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+
+# 一覧をストリーミングで描画するときの読み出し単位と送信単位
+STREAM_BATCH_SIZE = 500
+STREAM_CHUNK_BYTES = 16 * 1024
+
+def encode_cursor(values):
+    """並び順キーの値（例: [loan_date, loan_id]）を URL 用のトークンにする"""
+    raw = json.dumps(list(values), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(token, size):
+    """壊れたトークンは None（先頭ページ扱い）"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+def get_page_size():
+    try:
+        per_page = int(request.args.get("per_page", PAGE_SIZE_DEFAULT))
+    except ValueError:
+        per_page = PAGE_SIZE_DEFAULT
+    return max(1, min(per_page, PAGE_SIZE_MAX))
+
+def iter_keyset_page(query, sort_columns, to_dict):
+    """
+    query を sort_columns の昇順で1ページ分だけ取得する（OFFSET を使わない）
+    - ?after=<cursor> : そのキーより後ろ
+    - ?before=<cursor>: そのキーより前（前ページ）
+    途中で行が追加されても、キーの大小で区切るのでページ境界がずれない
+    返り値: (rows, page)  page = {"next": cursor|None, "prev": cursor|None, "per_page": n}
+    - rows はジェネレーター。前向きのページは STREAM_BATCH_SIZE 件ずつカーソルから読みながら返す
+    - page の next / prev は rows を読み終えた時点で埋まる（テンプレートではページ送りを表の後に置く）
+    """
+    per_page = get_page_size()
+    key = tuple_(*sort_columns)
+    after = decode_cursor(request.args.get("after"), len(sort_columns))
+    before = decode_cursor(request.args.get("before"), len(sort_columns))
+    page = {"next": None, "prev": None, "per_page": per_page}
+
+    def cursor_of(item):
+        return encode_cursor(getattr(item, column.key) for column in sort_columns)
+
+    def backward():
+        # 降順で読んで並べ直すので、前ページは1ページ分（per_page 件）だけ読み込む
+        items = (
+            query
+            .filter(key < tuple_(*before))
+            .order_by(*[column.desc() for column in sort_columns])
+            .limit(per_page + 1)
+            .all()
+        )
+        has_prev = len(items) > per_page
+        items = list(reversed(items[:per_page]))
+
+        if items:
+            page["next"] = cursor_of(items[-1])
+            page["prev"] = cursor_of(items[0]) if has_prev else None
+
+        for item in items:
+            yield to_dict(item)
+
+    def forward():
+        forward_query = query if after is None else query.filter(key > tuple_(*after))
+        first = last = None
+        count = 0
+
+        for item in (
+            forward_query
+            .order_by(*sort_columns)
+            .limit(per_page + 1)
+            .yield_per(STREAM_BATCH_SIZE)
+        ):
+            count += 1
+            if count > per_page:
+                # per_page + 1 件目は「次がある」ことの確認だけ
+                page["next"] = cursor_of(last)
+                continue
+
+            if first is None:
+                first = item
+                if after is not None:
+                    page["prev"] = cursor_of(first)
+            last = item
+            yield to_dict(item)
+
+    return (backward() if before is not None else forward()), page
+
+def keyset_page(query, sort_columns, to_dict):
+    """
+    iter_keyset_page の結果をリストで返す
+    """
+    rows, page = iter_keyset_page(query, sort_columns, to_dict)
+    return list(rows), page
 
 def calculate_total_repaid_map(repayments):
     """
@@ -298,6 +622,407 @@ def calculate_late_fee_paid_map(repayments):
 
     return late_fee_paid_map
 
+def _normalized(column):
+    """TRIM + UPPER（Python 側の .strip().upper() に合わせる）"""
+    return func.upper(func.trim(func.coalesce(column, "")))
+
+def overdue_days_expr(today):
+    """
+    calc_overdue_days と同じ延滞日数（SQL式）
+    - date(due_date) = due_date で YYYY-MM-DD として正しい日付だけを対象にし、それ以外は 0
+    """
+    due_date = func.trim(Loan.due_date)
+    elapsed = cast(
+        func.julianday(today.strftime("%Y-%m-%d")) - func.julianday(due_date),
+        Integer,
+    )
+    return case(
+        (
+            func.date(due_date) == due_date,
+            func.max(elapsed - Loan.grace_period_days, 0),
+        ),
+        else_=0,
+    )
+
+def loan_balances_as_of(as_of, user_id=None):
+    """
+    as_of 以前の返済だけで集計した loan_balances 相当のサブクエリ（集計条件は database.py と同じ）
+    - user_id を指定すると、そのユーザーの貸付だけを集計する（None なら全ユーザー分）
+    """
+    payment_type = _normalized(Repayment.payment_type)
+    total_repaid = func.coalesce(
+        func.sum(case((payment_type == "REPAYMENT", Repayment.repayment_amount), else_=0)), 0
+    )
+    late_fee_paid = func.coalesce(
+        func.sum(case((payment_type == "LATE_FEE", Repayment.repayment_amount), else_=0)), 0
+    )
+    query = (
+        select(
+            Loan.loan_id,
+            total_repaid.label("total_repaid"),
+            late_fee_paid.label("late_fee_paid"),
+            (Loan.repayment_expected <= total_repaid).label("fully_repaid"),
+        )
+        .select_from(Loan)
+        .outerjoin(
+            Repayment,
+            and_(
+                Repayment.user_id == Loan.user_id,
+                func.trim(Repayment.loan_id) == func.trim(Loan.loan_id),
+                func.trim(Repayment.repayment_date) <= as_of.strftime("%Y-%m-%d"),
+            ),
+        )
+    )
+    if user_id is not None:
+        query = query.where(Loan.user_id == user_id)
+
+    return query.group_by(Loan.loan_id).subquery("loan_balances_as_of")
+
+def unpaid_loans_cte(user_id, today, as_of=False):
+    """
+    build_unpaid_loan_rows と同じ計算をSQLで行うCTE
+    - loan_balances（貸付ごとの返済累計）を結合し、残高・延滞日数・延滞手数料・ステータスを求める
+    - CANCELLED と、残高・延滞手数料残額がどちらも0の貸付は含めない
+    - 延滞手数料は Python と同じ順序の浮動小数点計算を CAST AS INTEGER で切り捨てる
+    - user_id=None なら全ユーザー分（スナップショット作成用）
+    - as_of=True なら today 以前の貸付・返済だけで計算する（過去日付の状態の再現）
+    """
+    if as_of:
+        balances = loan_balances_as_of(today, user_id)
+    else:
+        balances = LoanBalance.__table__
+
+    total_repaid = func.coalesce(balances.c.total_repaid, 0)
+    overdue_days = overdue_days_expr(today)
+
+    conditions = [
+        _normalized(Loan.contract_status) != "CANCELLED",
+        # 完済済みで延滞もしていなければ、残高も延滞手数料も0なので最初から読まない
+        or_(balances.c.fully_repaid.isnot(True), overdue_days > 0),
+    ]
+    if user_id is not None:
+        conditions.append(Loan.user_id == user_id)
+    if as_of:
+        conditions.append(func.trim(Loan.loan_date) <= today.strftime("%Y-%m-%d"))
+
+    base = (
+        select(
+            Loan.user_id,
+            func.trim(Loan.loan_id).label("loan_id"),
+            func.trim(Loan.customer_id).label("customer_id"),
+            Loan.loan_amount,
+            func.trim(Loan.loan_date).label("loan_date"),
+            func.trim(Loan.due_date).label("due_date"),
+            Loan.repayment_expected,
+            total_repaid.label("total_repaid"),
+            func.max(Loan.repayment_expected - total_repaid, 0).label("remaining"),
+            overdue_days.label("overdue_days"),
+            func.coalesce(balances.c.late_fee_paid, 0).label("late_fee_paid"),
+            Loan.late_fee_rate_percent,
+            Loan.late_base_amount,
+        )
+        .select_from(Loan)
+        .outerjoin(balances, balances.c.loan_id == Loan.loan_id)
+        .where(*conditions)
+        .cte("unpaid_base")
+    )
+
+    late_fee_amount = case(
+        (
+            base.c.overdue_days > 0,
+            cast(
+                base.c.late_base_amount
+                * (base.c.late_fee_rate_percent / literal(100.0))
+                * (base.c.overdue_days / literal(30.0)),
+                Integer,
+            ),
+        ),
+        else_=0,
+    )
+    with_fee = select(
+        base,
+        late_fee_amount.label("late_fee_amount"),
+    ).cte("unpaid_with_fee")
+
+    late_fee_remaining = func.max(with_fee.c.late_fee_amount - with_fee.c.late_fee_paid, 0)
+    rows = select(
+        with_fee,
+        late_fee_remaining.label("late_fee_remaining"),
+    ).cte("unpaid_rows")
+
+    status = case(
+        (and_(rows.c.remaining > 0, rows.c.overdue_days > 0), "OVERDUE"),
+        (rows.c.remaining > 0, "UNPAID"),
+        (rows.c.late_fee_remaining > 0, "LATE_FEE_ONLY"),
+        else_="UNPAID",
+    )
+    return (
+        select(
+            rows,
+            status.label("status"),
+            (rows.c.remaining + rows.c.late_fee_remaining).label("current_collect_amount"),
+        )
+        .where(or_(rows.c.remaining > 0, rows.c.late_fee_remaining > 0))
+        .cte("unpaid_loans")
+    )
+
+UNPAID_ROW_COLUMNS = [
+    "loan_id",
+    "customer_id",
+    "loan_amount",
+    "loan_date",
+    "due_date",
+    "repayment_expected",
+    "total_repaid",
+    "remaining",
+    "status",
+    "overdue_days",
+    "late_fee_paid",
+    "late_fee_amount",
+    "late_fee_remaining",
+    "current_collect_amount",
+]
+
+def unpaid_rows_source(user_id, today, as_of=False):
+    """
+    未返済一覧の行（UNPAID_ROW_COLUMNS の列）を持つ FROM 句
+    - as_of=True なら overdue_snapshot の today の行（インデックスを引くだけ）
+      その日のスナップショットがまだ無ければ（overdue_snapshot_runs に日付が無ければ）、
+      today 以前の貸付・返済から計算する
+    """
+    if as_of:
+        day = today.strftime("%Y-%m-%d")
+
+        if db.session.get(OverdueSnapshotRun, day) is not None:
+            return (
+                select(OverdueSnapshot)
+                .where(
+                    OverdueSnapshot.user_id == user_id,
+                    OverdueSnapshot.snapshot_date == day,
+                )
+                .subquery("unpaid_snapshot")
+            )
+
+    return unpaid_loans_cte(user_id, today, as_of=as_of)
+
+def iter_unpaid_loan_rows(user_id, today, batch_size=None, as_of=False):
+    """
+    未返済一覧用の表示データをSQLで1行ずつ返す（build_unpaid_loan_rows と同じ内容・同じ並び順）
+    batch_size を指定すると、その件数ずつカーソルから読み出す（エクスポート・ストリーミング描画用）
+    """
+    unpaid = unpaid_rows_source(user_id, today, as_of=as_of)
+    statement = (
+        select(*[unpaid.c[name] for name in UNPAID_ROW_COLUMNS])
+        .order_by(unpaid.c.due_date, unpaid.c.loan_id)
+    )
+    if batch_size:
+        statement = statement.execution_options(yield_per=batch_size)
+
+    for row in db.session.execute(statement).mappings():
+        item = dict(row)
+        item["status_label"] = UNPAID_STATUS_LABELS.get(item["status"], item["status"])
+        yield item
+
+def query_unpaid_loan_rows(user_id, today, as_of=False):
+    """
+    未返済一覧用の表示データをSQLで取得する（build_unpaid_loan_rows と同じ内容・同じ並び順）
+    """
+    return list(iter_unpaid_loan_rows(user_id, today, as_of=as_of))
+
+def summarize_unpaid_rows(user_id, today, as_of=False):
+    """
+    未返済一覧の件数・合計（/loan-status の上部）をSQLの集計だけで求める
+    """
+    unpaid = unpaid_rows_source(user_id, today, as_of=as_of)
+
+    def count_status(status):
+        return func.coalesce(func.sum(case((unpaid.c.status == status, 1), else_=0)), 0)
+
+    def total(column):
+        return func.coalesce(func.sum(column), 0)
+
+    row = db.session.execute(
+        select(
+            func.count().label("unpaid_loan_count"),
+            count_status("OVERDUE").label("overdue_count"),
+            count_status("UNPAID").label("unpaid_count"),
+            count_status("LATE_FEE_ONLY").label("late_fee_only_count"),
+            total(unpaid.c.loan_amount).label("total_loan_amount"),
+            total(unpaid.c.repayment_expected).label("total_repayment_expected"),
+            total(unpaid.c.total_repaid).label("total_repaid"),
+            total(unpaid.c.remaining).label("total_remaining"),
+            total(unpaid.c.late_fee_remaining).label("total_late_fee_remaining"),
+            total(unpaid.c.current_collect_amount).label("total_current_collect_amount"),
+        ).select_from(unpaid)
+    ).mappings().one()
+    return dict(row)
+
+def write_overdue_snapshot(snapshot_date):
+    """
+    snapshot_date 時点の全ユーザーの未返済・延滞状態を overdue_snapshot に書き、件数を返す（同じ日付は作り直す）
+    """
+    day = snapshot_date.strftime("%Y-%m-%d")
+    unpaid = unpaid_loans_cte(None, snapshot_date, as_of=True)
+    columns = ["user_id"] + UNPAID_ROW_COLUMNS
+
+    db.session.execute(delete(OverdueSnapshot).where(OverdueSnapshot.snapshot_date == day))
+    db.session.execute(
+        insert(OverdueSnapshot).from_select(
+            ["snapshot_date"] + columns,
+            select(literal(day), *[unpaid.c[name] for name in columns]),
+        )
+    )
+    # WITH 句つきの INSERT は sqlite3 の rowcount が -1 になるので数え直す
+    count = db.session.execute(
+        select(func.count()).where(OverdueSnapshot.snapshot_date == day)
+    ).scalar_one()
+    # 行が1件も無いユーザー・日付でも「スナップショットあり」と分かるよう、作った日付を記録する
+    db.session.execute(delete(OverdueSnapshotRun).where(OverdueSnapshotRun.snapshot_date == day))
+    db.session.execute(insert(OverdueSnapshotRun).values(snapshot_date=day, row_count=count, created_at=now_str()))
+    # 過去日付の画面キャッシュ・ETag はデータバージョンを鍵にしているので、作り直したら全ユーザー分進める
+    db.session.execute(update(UserDataVersion).values(version=UserDataVersion.version + 1))
+    db.session.commit()
+    return count
+
+def get_as_of_date():
+    """
+    クエリ文字列の as_of（YYYY-MM-DD）を date で返す。未指定・不正・今日以降なら None（現在の状態を表示）
+    """
+    value = request.args.get("as_of", "").strip()
+    try:
+        as_of = datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    if as_of >= date.today():
+        return None
+    return as_of
+
+def calculate_dashboard_data(user_id, today):
+    """
+    ダッシュボードの4指標をSQLの集計だけで求める（全件をPythonに読み込まない）
+    build_unpaid_loan_rows を使った従来の計算と同じ値になる
+    """
+    total_loan_amount = db.session.execute(
+        select(func.coalesce(func.sum(Loan.loan_amount), 0))
+        .where(Loan.user_id == user_id)
+    ).scalar_one()
+
+    total_repaid = db.session.execute(
+        select(func.coalesce(func.sum(Repayment.repayment_amount), 0))
+        .where(
+            Repayment.user_id == user_id,
+            _normalized(Repayment.payment_type) == "REPAYMENT",
+        )
+    ).scalar_one()
+
+    unpaid = unpaid_loans_cte(user_id, today)
+    total_remaining, overdue_count = db.session.execute(
+        select(
+            func.coalesce(func.sum(unpaid.c.remaining), 0),
+            func.coalesce(
+                func.sum(case((unpaid.c.status == "OVERDUE", 1), else_=0)),
+                0,
+            ),
+        )
+    ).one()
+
+    return {
+        "total_loan_amount": total_loan_amount,
+        "total_repaid": total_repaid,
+        "total_remaining": total_remaining,
+        "overdue_count": overdue_count,
+    }
+
+UNPAID_STATUS_LABELS = {
+    "UNPAID": "期日内未返済",
+    "OVERDUE": "延滞中",
+    "LATE_FEE_ONLY": "延滞手数料のみ未払い",
+}
+
+def get_data_version(user_id):
+    """
+    user_id のデータバージョンを返す（まだ書き込みが無ければ 0）
+    """
+    version = db.session.execute(
+        select(UserDataVersion.version).where(UserDataVersion.user_id == user_id)
+    ).scalar_one_or_none()
+    return version or 0
+
+def current_data_version():
+    """
+    ログインユーザーのデータバージョン（1リクエスト内では1回だけ読む）
+    """
+    if "data_version" not in g:
+        g.data_version = get_data_version(g.user.user_id)
+    return g.data_version
+
+def cached_view(view, build, daily=True, day=None):
+    """
+    build(user_id, today) の結果を、データバージョンが変わるまで（daily=True なら日付が変わるまでも）使い回す
+    day を指定すると today の代わりにその日付で計算する（過去日付の表示用）
+    """
+    user_id = g.user.user_id
+    today = day or date.today()
+    return view_cache.get_or_compute(
+        view,
+        user_id,
+        current_data_version(),
+        today.isoformat() if daily or day else "",
+        lambda: build(user_id, today),
+    )
+
+def _template_fingerprint():
+    """
+    app.py とテンプレートの更新時刻から作る値（デプロイで画面が変わったら ETag も変わるように）
+    """
+    paths = [Path(__file__)] + sorted((BASE_DIR / "templates").glob("*.html"))
+    stamp = "|".join(f"{p.name}:{p.stat().st_mtime_ns}" for p in paths if p.exists())
+    return hashlib.sha256(stamp.encode("utf-8")).hexdigest()[:16]
+
+ETAG_SALT = os.environ.get("APP_ETAG_SALT") or _template_fingerprint()
+
+def page_etag(daily=False):
+    """
+    画面・ユーザー・データバージョン・クエリ文字列（ページ送り）から強い ETag を作る
+    daily=True の画面（延滞判定を含む）は日付も入れる
+    """
+    parts = [
+        ETAG_SALT,
+        request.endpoint,
+        str(g.user.user_id),
+        str(current_data_version()),
+        request.query_string.decode("latin-1"),
+    ]
+
+    if daily:
+        parts.append(date.today().isoformat())
+
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32]
+
+def conditional_get(daily=False):
+    """
+    GET の画面に ETag を付け、If-None-Match が一致すれば描画せずに 304 を返すデコレーター
+    - 判定に使うのはデータバージョン1件の読み込みだけ（一覧・集計のクエリは走らない）
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = page_etag(daily=daily)
+
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+
+            response.set_etag(etag)
+            # ブラウザには保存させてよいが、使う前に必ず問い合わせさせる
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return wrapper
+
+    return decorator
+
 def calc_overdue_days(today, due_date_str, grace_period_days):
     """
     due_date + grace_period_days を過ぎていれば延滞日数を返す
@@ -307,6 +1032,19 @@ def calc_overdue_days(today, due_date_str, grace_period_days):
     threshold_date = due_date + timedelta(days=grace_period_days)
     return max(0, (today - threshold_date).days)
 
+def calculate_late_fee_amount(late_base_amount, late_fee_rate_percent, overdue_days):
+    """
+    延滞手数料（円未満切り捨て）
+    """
+    if overdue_days <= 0:
+        return 0
+
+    return int(
+        late_base_amount
+        * (late_fee_rate_percent / 100)
+        * (overdue_days / 30)
+    )
+
 def build_unpaid_loan_rows(loans, repayments):
     """
     未返済一覧用の表示データを作る
@@ -378,10 +1116,10 @@ def build_unpaid_loan_rows(loans, repayments):
                 )
 
                 if overdue_days > 0:
-                    late_fee_amount = int(
-                        late_base_amount
-                        * (late_fee_rate_percent / 100)
-                        * (overdue_days / 30)
+                    late_fee_amount = calculate_late_fee_amount(
+                        late_base_amount,
+                        late_fee_rate_percent,
+                        overdue_days,
                     )
 
                     late_fee_remaining = max(
@@ -416,11 +1154,7 @@ def build_unpaid_loan_rows(loans, repayments):
                 "total_repaid": total_repaid,
                 "remaining": remaining,
                 "status": status,
-                "status_label": {
-                    "UNPAID": "期日内未返済",
-                    "OVERDUE": "延滞中",
-                    "LATE_FEE_ONLY": "延滞手数料のみ未払い",
-                }.get(status, status),
+                "status_label": UNPAID_STATUS_LABELS.get(status, status),
                 "overdue_days": overdue_days,
                 "late_fee_paid": late_fee_paid,
                 "late_fee_amount": late_fee_amount,
@@ -432,26 +1166,98 @@ def build_unpaid_loan_rows(loans, repayments):
     unpaid_rows.sort(key=lambda row: (row["due_date"], row["loan_id"]))
     return unpaid_rows
 
-def generate_loan_id(loans, loan_date):
+LOAN_ID_MAX_ATTEMPTS = 20
+
+# 連番を :count 個進めて最後の番号を返す（1文で読み取りと更新を行うので、同時実行でも同じ番号は返らない）
+# - 初回は loans に既にある同日の最大番号の次から始める
+# - 連番表を経由せずに登録された貸付（CSV移行など）があっても、既存の最大番号より後ろに進める
+_ALLOCATE_LOAN_NUMBER_SQL = text("""
+    INSERT INTO loan_id_sequences (date_part, last_number)
+    SELECT :date_part, COALESCE(MAX(CAST(substr(loan_id, :suffix_start) AS INTEGER)), 0) + :count
+    FROM loans
+    WHERE loan_id >= :range_start AND loan_id < :range_end
+    ON CONFLICT (date_part) DO UPDATE
+        SET last_number = MAX(last_number + :count, excluded.last_number)
+    RETURNING last_number
+""")
+
+def _is_database_locked(error):
+    return "locked" in str(error.orig).lower() or "busy" in str(error.orig).lower()
+
+def _is_loan_id_conflict(error):
+    """IntegrityError が loans.loan_id の重複によるものか"""
+    return "loans.loan_id" in str(error.orig)
+
+def allocate_loan_id(loan_date):
     """
-    loan_date をもとに LYYYYMMDD-001 形式の loan_id を生成する
+    loan_date をもとに LYYYYMMDD-001 形式の loan_id を払い出す
+    """
+    return allocate_loan_ids(loan_date, 1)[0]
+
+def allocate_loan_ids(loan_date, count):
+    """
+    loan_date の loan_id を count 個まとめて払い出す（連続した番号）
+    - loan_id_sequences の UPDATE ... RETURNING で番号を取り、その場でコミットする
+      （別の worker・プロセスと同時に呼ばれても同じ番号にならない）
+    - DBが他の書き込みでロック中ならしばらく待って再試行する
     """
     date_part = loan_date.replace("-", "")
-    prefix = f"L{date_part}"
+    prefix = f"L{date_part}-"
 
-    same_day_numbers = []
+    for attempt in range(LOAN_ID_MAX_ATTEMPTS):
+        try:
+            with db.engine.begin() as conn:
+                last_number = conn.execute(
+                    _ALLOCATE_LOAN_NUMBER_SQL,
+                    {
+                        "date_part": date_part,
+                        "count": count,
+                        "suffix_start": len(prefix) + 1,
+                        "range_start": prefix,
+                        # "-" の次の文字。prefix で始まる loan_id だけを主キーの範囲検索で拾う
+                        "range_end": f"L{date_part}.",
+                    },
+                ).scalar_one()
+            return [
+                f"{prefix}{number:03d}"
+                for number in range(last_number - count + 1, last_number + 1)
+            ]
+
+        except OperationalError as e:
+            if not _is_database_locked(e) or attempt == LOAN_ID_MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01 * (attempt + 1))
+
+def save_new_loan(loan_data):
+    """
+    loan_id を払い出して貸付を登録し、登録した loan_id を返す
+    - 同じ loan_id が既にあった（連番表を経由しない登録と衝突した）場合は番号を取り直す
+      （それ以外の制約違反は番号を取り直しても通らないので、そのまま送出する）
+    - DBがロック中で書けなかった場合は、同じ loan_id のまま再試行する
+    """
+    loan_id = None
 
-    for loan in loans:
-        loan_id = loan.get("loan_id", "")
-        if loan_id.startswith(prefix):
-            try:
-                number = int(loan_id.split("-")[1])
-                same_day_numbers.append(number)
-            except (IndexError, ValueError):
-                continue
+    for attempt in range(LOAN_ID_MAX_ATTEMPTS):
+        if loan_id is None:
+            loan_id = allocate_loan_id(loan_data["loan_date"])
+
+        try:
+            save_loan_to_csv("data/loan_v3.csv", {**loan_data, "loan_id": loan_id})
+            return loan_id
+
+        except IntegrityError as e:
+            db.session.rollback()
+            if not _is_loan_id_conflict(e):
+                raise
+            loan_id = None
 
-    next_number = max(same_day_numbers, default=0) + 1
-    return f"{prefix}-{next_number:03d}"
+        except OperationalError as e:
+            db.session.rollback()
+            if not _is_database_locked(e):
+                raise
+            time.sleep(0.01 * (attempt + 1))
+
+    raise RuntimeError(f"貸付を登録できませんでした（{LOAN_ID_MAX_ATTEMPTS} 回再試行）")
 
 def save_loan_to_csv(file_path, loan_data):
     loan = Loan(
@@ -614,224 +1420,260 @@ def home():
     )
 
 @app.route("/dashboard")
+@conditional_get(daily=True)
 def dashboard():
-    loans = load_loans()
-    repayments = load_repayments()
-
-    # 総貸付額
-    total_loan_amount = sum(
-        loan["loan_amount"]
-        for loan in loans
-    )
+    # 4指標はSQLの集計で取得（貸付・返済の全件読み込みはしない）
+    dashboard_data = cached_view("dashboard", calculate_dashboard_data)
 
-    # 総返済額
-    # 通常返済（REPAYMENT）のみ集計
-    total_repaid = sum(
-        repayment["repayment_amount"]
-        for repayment in repayments
-        if repayment["payment_type"].strip().upper() == "REPAYMENT"
+    return render_template(
+        "dashboard.html",
+        dashboard_data=dashboard_data,
     )
 
-    # 未返済情報を作成
-    unpaid_loans = build_unpaid_loan_rows(
-        loans,
-        repayments,
-    )
+def stream_page(template_name, **context):
+    """
+    テンプレートを描画しながら送る（全体の HTML を組み立ててから送らない）
+    - Jinja は文ごとに細かく返すので、STREAM_CHUNK_BYTES ごとにまとめる
+    - 最初のチャンク（<head> と見出し）はすぐに送る
+    """
+    def chunks(parts):
+        buffer = []
+        size = 0
+        first = True
 
-    # 未返済残高
-    total_remaining = sum(
-        loan["remaining"]
-        for loan in unpaid_loans
-    )
+        for part in parts:
+            buffer.append(part)
+            size += len(part)
 
-    # 延滞件数
-    overdue_count = sum(
-        1
-        for loan in unpaid_loans
-        if loan["status"] == "OVERDUE"
-    )
+            if first or size >= STREAM_CHUNK_BYTES:
+                first = False
+                yield "".join(buffer)
+                buffer = []
+                size = 0
 
-    dashboard_data = {
-        "total_loan_amount": total_loan_amount,
-        "total_repaid": total_repaid,
-        "total_remaining": total_remaining,
-        "overdue_count": overdue_count,
-    }
+        if buffer:
+            yield "".join(buffer)
 
-    return render_template(
-        "dashboard.html",
-        dashboard_data=dashboard_data,
-    )
+    # stream_template がリクエストコンテキストを保ったまま描画する
+    return Response(chunks(stream_template(template_name, **context)), mimetype="text/html")
 
 @app.route("/loans")
+@conditional_get(daily=False)
 def loan_list():
-    loans = load_loans("data/loan_v3.csv")
-    return render_template("loan_list.html", loans=loans)
+    loans, page = iter_keyset_page(
+        Loan.query.filter_by(user_id=g.user.user_id),
+        (Loan.loan_date, Loan.loan_id),
+        loan_to_dict,
+    )
+    return stream_page("loan_list.html", loans=loans, page=page)
 
 @app.route("/repayments")
+@conditional_get(daily=False)
 def repayment_list():
-    repayments = load_repayments("data/repayments.csv")
-    return render_template("repayment_list.html", repayments=repayments)
-
-@app.route("/repayments/new", methods=["GET", "POST"])
-def repayment_new():
+    repayments, page = iter_keyset_page(
+        Repayment.query.filter_by(user_id=g.user.user_id),
+        (Repayment.repayment_date, Repayment.repayment_id),
+        repayment_to_dict,
+    )
+    return stream_page("repayment_list.html", repayments=repayments, page=page)
 
-    if request.method == "POST":
+def find_user_loan(user_id, loan_id):
+    """
+    user_id の貸付を loan_id で1件だけ引く（見つからなければ None）
+    - loan_id は前後の空白を無視して比較する（load_loans + .strip() での検索と同じ）
+    - (user_id, trim(loan_id)) の式インデックスを使うので、貸付件数に関係なく一定時間
+    """
+    if not loan_id:
+        return None
+
+    return db.session.execute(
+        select(Loan)
+        .where(
+            Loan.user_id == user_id,
+            func.trim(Loan.loan_id) == loan_id,
+        )
+        .limit(1)
+    ).scalar_one_or_none()
 
-        loans = load_loans("data/loan_v3.csv")
+def get_loan_balance(loan):
+    """
+    貸付1件の (返済累計, 延滞手数料支払済額) を loan_balances から主キーで取得する
+    """
+    balance = db.session.get(LoanBalance, loan.loan_id)
 
-        repayments = load_repayments("data/repayments.csv")
-        repaid_map = calculate_total_repaid_map(repayments)
-        late_fee_paid_map = calculate_late_fee_paid_map(repayments)
+    if balance is None:
+        return 0, 0
 
-        errors = []
+    return balance.total_repaid, balance.late_fee_paid
 
-        form_data = {
-            "loan_id": request.form.get("loan_id", "").strip(),
-            "repayment_amount": request.form.get("repayment_amount", "").strip(),
-            "repayment_date": request.form.get("repayment_date", "").strip(),
-            "payment_type": request.form.get("payment_type", "REPAYMENT").strip().upper(),
-        }
+def repayment_limit_errors(loan, total_repaid, late_fee_paid, payment_type, repayment_amount, today):
+    """
+    返済種別ごとの登録可否チェック（通常残高・延滞手数料残額を超えていないか）
+    loan は Loan か、同じ属性名を持つ行（一括登録で事前に読み込んだ行など）
+    """
+    errors = []
+    normal_remaining = max(0, loan.repayment_expected - total_repaid)
 
-        # 返済種別チェック
-        valid_payment_types = ["REPAYMENT", "LATE_FEE"]
+    due_date = (loan.due_date or "").strip()
+    overdue_days = 0
+    late_fee_amount = 0
 
-        if form_data["payment_type"] not in valid_payment_types:
-            errors.append("返済種別が正しくありません。")
+    if due_date:
+        try:
+            overdue_days = calc_overdue_days(
+                today,
+                due_date,
+                loan.grace_period_days
+            )
 
-        target_loan = None
+            late_fee_amount = calculate_late_fee_amount(
+                loan.late_base_amount,
+                loan.late_fee_rate_percent,
+                overdue_days,
+            )
 
-        for loan in loans:
-            if loan.get("loan_id", "").strip() == form_data["loan_id"]:
-                target_loan = loan
-                break
+        except ValueError:
+            overdue_days = 0
+            late_fee_amount = 0
 
-        # 取消済み貸付への返済禁止チェック
-        if target_loan:
-            contract_status = target_loan.get("contract_status", "").strip().upper()
+    late_fee_remaining = max(0, late_fee_amount - late_fee_paid)
 
-            if contract_status == "CANCELLED":
-                errors.append("取消済みの貸付には返済登録できません。")
+    if payment_type == "REPAYMENT":
+        if normal_remaining <= 0:
+            errors.append("この貸付は通常返済がすでに完了しています。")
 
-        # loan_id 一覧取得
-        loan_ids = [
-            loan.get("loan_id", "").strip()
-            for loan in loans
-        ]
+        elif repayment_amount > normal_remaining:
+            errors.append(
+                f"通常返済額が通常残高を超えています。通常残高は {normal_remaining} 円です。"
+            )
 
-        # loan_id チェック
-        if not form_data["loan_id"]:
-            errors.append("loan_id を入力してください。")
+    elif payment_type == "LATE_FEE":
+        if overdue_days <= 0:
+            errors.append("この貸付には現在、延滞手数料が発生していません。")
 
-        elif form_data["loan_id"] not in loan_ids:
-            errors.append("存在しない loan_id です。")
+        elif late_fee_amount <= 0:
+            errors.append("この貸付には現在、延滞手数料が発生していません。")
 
-        # 返済金額チェック
-        if not form_data["repayment_amount"]:
-            errors.append("返済金額を入力してください。")
+        elif late_fee_remaining <= 0:
+            errors.append("この貸付の延滞手数料はすでに支払い済みです。")
 
-        else:
-            try:
-                repayment_amount = int(form_data["repayment_amount"])
+        elif repayment_amount > late_fee_remaining:
+            errors.append(
+                f"延滞手数料返済額が延滞手数料残額を超えています。延滞手数料残額は {late_fee_remaining} 円です。"
+            )
 
-                if repayment_amount <= 0:
-                    errors.append("返済金額は1円以上で入力してください。")
+    return errors
 
-            except ValueError:
-                repayment_amount = 0
-                errors.append("返済金額は数値で入力してください。")
+def validate_repayment_form(user_id, form_data, today, find_loan=None, get_balance=None):
+    """
+    返済登録フォームの入力チェック
+    - 対象の貸付は主キー相当の1件検索、返済累計は loan_balances の1行だけを読む
+      （find_loan(loan_id) / get_balance(loan) を渡すと、その関数で引く。一括登録用）
+    - 返済日が未入力なら form_data["repayment_date"] に today を入れる
+    戻り値: (エラーメッセージのリスト, 登録する返済データ or None)
+    """
+    if find_loan is None:
+        find_loan = lambda loan_id: find_user_loan(user_id, loan_id)
 
-        # 返済種別ごとの登録可否チェック
-        if target_loan and not errors:
-            try:
-                repayment_expected = int(float(target_loan.get("repayment_expected", 0)))
-            except ValueError:
-                repayment_expected = 0
+    if get_balance is None:
+        get_balance = get_loan_balance
 
-            total_repaid = repaid_map.get(form_data["loan_id"], 0)
-            normal_remaining = max(0, repayment_expected - total_repaid)
+    errors = []
 
-            try:
-                grace_period_days = int(float(target_loan.get("grace_period_days", 0)))
-            except ValueError:
-                grace_period_days = 0
+    # 返済種別チェック
+    valid_payment_types = ["REPAYMENT", "LATE_FEE"]
 
-            try:
-                late_fee_rate_percent = float(target_loan.get("late_fee_rate_percent", 0))
-            except ValueError:
-                late_fee_rate_percent = 0
+    if form_data["payment_type"] not in valid_payment_types:
+        errors.append("返済種別が正しくありません。")
 
-            try:
-                late_base_amount = int(float(target_loan.get("late_base_amount", 0)))
-            except ValueError:
-                late_base_amount = 0
+    target_loan = find_loan(form_data["loan_id"]) if form_data["loan_id"] else None
 
-            due_date = target_loan.get("due_date", "").strip()
-            overdue_days = 0
-            late_fee_amount = 0
+    # 取消済み貸付への返済禁止チェック
+    if target_loan:
+        contract_status = (target_loan.contract_status or "").strip().upper()
 
-            if due_date:
-                try:
-                    overdue_days = calc_overdue_days(
-                        date.today(),
-                        due_date,
-                        grace_period_days
-                    )
+        if contract_status == "CANCELLED":
+            errors.append("取消済みの貸付には返済登録できません。")
 
-                    if overdue_days > 0:
-                        late_fee_amount = int(
-                            late_base_amount
-                            * (late_fee_rate_percent / 100)
-                            * (overdue_days / 30)
-                        )
+    # loan_id チェック
+    if not form_data["loan_id"]:
+        errors.append("loan_id を入力してください。")
 
-                except ValueError:
-                    overdue_days = 0
-                    late_fee_amount = 0
+    elif target_loan is None:
+        errors.append("存在しない loan_id です。")
 
-            late_fee_paid = late_fee_paid_map.get(form_data["loan_id"], 0)
-            late_fee_remaining = max(0, late_fee_amount - late_fee_paid)
+    # 返済金額チェック
+    repayment_amount = 0
 
-            if form_data["payment_type"] == "REPAYMENT":
-                if normal_remaining <= 0:
-                    errors.append("この貸付は通常返済がすでに完了しています。")
+    if not form_data["repayment_amount"]:
+        errors.append("返済金額を入力してください。")
 
-                elif repayment_amount > normal_remaining:
-                    errors.append(
-                        f"通常返済額が通常残高を超えています。通常残高は {normal_remaining} 円です。"
-                    )
+    else:
+        try:
+            repayment_amount = int(form_data["repayment_amount"])
 
-            elif form_data["payment_type"] == "LATE_FEE":
-                if overdue_days <= 0:
-                    errors.append("この貸付には現在、延滞手数料が発生していません。")
+            if repayment_amount <= 0:
+                errors.append("返済金額は1円以上で入力してください。")
 
-                elif late_fee_amount <= 0:
-                    errors.append("この貸付には現在、延滞手数料が発生していません。")
+        except ValueError:
+            errors.append("返済金額は数値で入力してください。")
+
+    # 返済種別ごとの登録可否チェック
+    if target_loan and not errors:
+        total_repaid, late_fee_paid = get_balance(target_loan)
+        errors.extend(
+            repayment_limit_errors(
+                target_loan,
+                total_repaid,
+                late_fee_paid,
+                form_data["payment_type"],
+                repayment_amount,
+                today,
+            )
+        )
 
-                elif late_fee_remaining <= 0:
-                    errors.append("この貸付の延滞手数料はすでに支払い済みです。")
+    # 返済日チェック
+    if not form_data["repayment_date"]:
+        form_data["repayment_date"] = today.strftime("%Y-%m-%d")
 
-                elif repayment_amount > late_fee_remaining:
-                    errors.append(
-                        f"延滞手数料返済額が延滞手数料残額を超えています。延滞手数料残額は {late_fee_remaining} 円です。"
-                    )
+    else:
+        try:
+            datetime.strptime(
+                form_data["repayment_date"],
+                "%Y-%m-%d"
+            )
 
-        # 返済日チェック
-        if not form_data["repayment_date"]:
+        except ValueError:
+            errors.append("返済日の形式が正しくありません。")
 
-            today_str = date.today().strftime("%Y-%m-%d")
+    if errors:
+        return errors, None
 
-            form_data["repayment_date"] = today_str
+    return errors, {
+        "loan_id": form_data["loan_id"],
+        "customer_id": (target_loan.customer_id or "").strip(),
+        "repayment_amount": repayment_amount,
+        "repayment_date": form_data["repayment_date"],
+        "payment_type": form_data["payment_type"],
+    }
 
-        else:
-            try:
-                datetime.strptime(
-                    form_data["repayment_date"],
-                    "%Y-%m-%d"
-                )
+@app.route("/repayments/new", methods=["GET", "POST"])
+def repayment_new():
 
-            except ValueError:
-                errors.append("返済日の形式が正しくありません。")
+    if request.method == "POST":
+
+        form_data = {
+            "loan_id": request.form.get("loan_id", "").strip(),
+            "repayment_amount": request.form.get("repayment_amount", "").strip(),
+            "repayment_date": request.form.get("repayment_date", "").strip(),
+            "payment_type": request.form.get("payment_type", "REPAYMENT").strip().upper(),
+        }
+
+        errors, repayment_data = validate_repayment_form(
+            g.user.user_id,
+            form_data,
+            date.today(),
+        )
 
         # エラーがある場合
         if errors:
@@ -842,24 +1684,6 @@ def repayment_new():
                 form_data=form_data
             )
 
-        # customer_id を取得
-        customer_id = ""
-
-        for loan in loans:
-
-            if loan.get("loan_id", "").strip() == form_data["loan_id"]:
-
-                customer_id = loan.get("customer_id", "").strip()
-                break
-
-        repayment_data = {
-            "loan_id": form_data["loan_id"],
-            "customer_id": customer_id,
-            "repayment_amount": repayment_amount,
-            "repayment_date": form_data["repayment_date"],
-            "payment_type": form_data["payment_type"],
-        }
-
         save_repayment_to_csv(
             "data/repayments.csv",
             repayment_data
@@ -874,9 +1698,14 @@ def repayment_new():
     )
 
 @app.route("/customers")
+@conditional_get(daily=False)
 def customer_list():
-    customers = load_customers("data/customers.csv")
-    return render_template("customer_list.html", customers=customers)
+    customers, page = keyset_page(
+        Customer.query.filter_by(user_id=g.user.user_id),
+        (Customer.customer_id,),
+        customer_to_dict,
+    )
+    return render_template("customer_list.html", customers=customers, page=page)
 
 @app.route("/customers/new", methods=["GET", "POST"])
 def new_customer():
@@ -937,82 +1766,85 @@ def new_customer():
         form_data=form_data
     )
 
+def build_loan_status_view(user_id, today, as_of=False):
+    """
+    未返済一覧（/loan-status）の上部の件数・合計
+    明細行は画面キャッシュに載せず、描画しながらカーソルから読む（loan_status）
+    """
+    return summarize_unpaid_rows(user_id, today, as_of=as_of)
+
 @app.route("/loan-status")
+@conditional_get(daily=True)
 def loan_status():
-    loans = load_loans("data/loan_v3.csv")
-    repayments = load_repayments("data/repayments.csv")
-
-    unpaid_loans = build_unpaid_loan_rows(loans, repayments)
+    as_of = get_as_of_date()
+
+    if as_of is None:
+        summary = cached_view("loan_status_summary", build_loan_status_view)
+    else:
+        summary = cached_view(
+            "loan_status_summary_as_of",
+            lambda user_id, today: build_loan_status_view(user_id, today, as_of=True),
+            day=as_of,
+        )
 
-    overdue_count = sum(
-        1 for loan in unpaid_loans
-        if loan["status"] == "OVERDUE"
+    unpaid_loans = iter_unpaid_loan_rows(
+        g.user.user_id,
+        as_of or date.today(),
+        batch_size=STREAM_BATCH_SIZE,
+        as_of=as_of is not None,
     )
+    return stream_page("loan_status.html", as_of=as_of, unpaid_loans=unpaid_loans, **summary)
 
-    unpaid_count = sum(
-        1 for loan in unpaid_loans
-        if loan["status"] == "UNPAID"
-    )
+def build_overdue_loans_view(user_id, today, as_of=False):
+    """
+    延滞一覧（/overdue-loans）の表示データ
+    """
+    # 残高・延滞の計算はSQLで行い、未返済の行だけを受け取る
+    unpaid_loans = query_unpaid_loan_rows(user_id, today, as_of=as_of)
 
-    late_fee_only_count = sum(
-        1 for loan in unpaid_loans
-        if loan["status"] == "LATE_FEE_ONLY"
-    )
+    overdue_loans = [
+        loan for loan in unpaid_loans
+        if loan["status"] in ["OVERDUE", "LATE_FEE_ONLY"]
+    ]
 
-    total_loan_amount = sum(
-        loan["loan_amount"] for loan in unpaid_loans
-    )
+    return dict(overdue_loans=overdue_loans)
 
-    total_repayment_expected = sum(
-        loan["repayment_expected"] for loan in unpaid_loans
-    )
+@app.route("/overdue-loans")
+@conditional_get(daily=True)
+def overdue_loans():
+    as_of = get_as_of_date()
+
+    if as_of is None:
+        view = cached_view("overdue_loans", build_overdue_loans_view)
+    else:
+        view = cached_view(
+            "overdue_loans_as_of",
+            lambda user_id, today: build_overdue_loans_view(user_id, today, as_of=True),
+            day=as_of,
+        )
 
-    total_repaid = sum(
-        loan["total_repaid"] for loan in unpaid_loans
-    )
+    return render_template("overdue_loans.html", as_of=as_of, **view)
 
-    total_remaining = sum(
-        loan["remaining"] for loan in unpaid_loans
-    )
+def validate_loan_cancel_form(user_id, form_data):
+    """
+    契約解除フォームの入力チェック（対象の貸付だけを1件検索する）
+    """
+    errors = []
+    target_loan = find_user_loan(user_id, form_data["loan_id"])
 
-    total_late_fee_remaining = sum(
-        loan["late_fee_remaining"] for loan in unpaid_loans
-    )
+    if not form_data["loan_id"]:
+        errors.append("貸付IDを入力してください。")
 
-    total_current_collect_amount = sum(
-        loan["current_collect_amount"] for loan in unpaid_loans
-    )
+    elif target_loan is None:
+        errors.append("存在しない貸付IDです。")
 
-    return render_template(
-        "loan_status.html",
-        unpaid_loans=unpaid_loans,
-        overdue_count=overdue_count,
-        unpaid_count=unpaid_count,
-        late_fee_only_count=late_fee_only_count,
-        total_loan_amount=total_loan_amount,
-        total_repayment_expected=total_repayment_expected,
-        total_repaid=total_repaid,
-        total_remaining=total_remaining,
-        total_late_fee_remaining=total_late_fee_remaining,
-        total_current_collect_amount=total_current_collect_amount,
-    )
+    elif (target_loan.contract_status or "").strip().upper() == "CANCELLED":
+        errors.append("この貸付はすでに契約解除済みです。")
 
-@app.route("/overdue-loans")
-def overdue_loans():
-    loans = load_loans("data/loan_v3.csv")
-    repayments = load_repayments("data/repayments.csv")
+    if not form_data["cancel_reason"]:
+        errors.append("契約解除理由を入力してください。")
 
-    unpaid_loans = build_unpaid_loan_rows(loans, repayments)
-
-    overdue_loans = [
-        loan for loan in unpaid_loans
-        if loan["status"] in ["OVERDUE", "LATE_FEE_ONLY"]
-    ]
-
-    return render_template(
-        "overdue_loans.html",
-        overdue_loans=overdue_loans
-    )
+    return errors
 
 @app.route("/loans/cancel", methods=["GET", "POST"])
 def loan_cancel():
@@ -1023,31 +1855,12 @@ def loan_cancel():
     }
 
     if request.method == "POST":
-        loans = load_loans("data/loan_v3.csv")
-
         form_data = {
             "loan_id": request.form.get("loan_id", "").strip(),
             "cancel_reason": request.form.get("cancel_reason", "").strip(),
         }
 
-        target_loan = None
-
-        for loan in loans:
-            if loan.get("loan_id", "").strip() == form_data["loan_id"]:
-                target_loan = loan
-                break
-
-        if not form_data["loan_id"]:
-            errors.append("貸付IDを入力してください。")
-
-        elif target_loan is None:
-            errors.append("存在しない貸付IDです。")
-
-        elif target_loan.get("contract_status", "").strip().upper() == "CANCELLED":
-            errors.append("この貸付はすでに契約解除済みです。")
-
-        if not form_data["cancel_reason"]:
-            errors.append("契約解除理由を入力してください。")
+        errors = validate_loan_cancel_form(g.user.user_id, form_data)
 
         if errors:
             return render_template(
@@ -1070,8 +1883,10 @@ def loan_cancel():
         form_data=form_data
     )
 
-@app.route("/loan-contracts")
-def loan_contracts():
+def build_loan_contracts_view(user_id, today):
+    """
+    契約状況一覧（/loan-contracts）の表示データ（日付に依存しない）
+    """
     loans = load_loans("data/loan_v3.csv")
 
     active_count = 0
@@ -1097,8 +1912,7 @@ def loan_contracts():
             cancelled_count += 1
             cancelled_loans.append(loan)
 
-    return render_template(
-        "loan_contracts.html",
+    return dict(
         loans=loans,
         cancelled_loans=cancelled_loans,
         active_count=active_count,
@@ -1106,13 +1920,117 @@ def loan_contracts():
         total_count=len(loans),
     )
 
+@app.route("/loan-contracts")
+@conditional_get(daily=False)
+def loan_contracts():
+    return render_template(
+        "loan_contracts.html",
+        **cached_view("loan_contracts", build_loan_contracts_view, daily=False),
+    )
+
+def validate_loan_form(form_data, customer_exists):
+    """
+    貸付登録フォームの入力チェック
+    customer_exists(customer_id) は顧客が存在するかを返す関数（画面では1件検索、一括登録では読み込み済みの集合）
+    戻り値: (エラーメッセージのリスト, 登録する貸付データ（loan_id なし） or None)
+    """
+    errors = []
+
+    customer_found = False
+
+    if not form_data["customer_id"]:
+        errors.append("顧客IDを入力してください。")
+    else:
+        customer_found = customer_exists(form_data["customer_id"])
+
+    if not customer_found:
+        errors.append("存在しない顧客IDです。")
+
+    if not form_data["loan_amount"]:
+        errors.append("貸付額を入力してください。")
+    else:
+        try:
+            loan_amount = int(form_data["loan_amount"])
+            if loan_amount <= 0:
+                errors.append("貸付額は1円以上で入力してください。")
+        except ValueError:
+            loan_amount = 0
+            errors.append("貸付額は数値で入力してください。")
+
+    try:
+        interest_rate_percent = float(form_data["interest_rate_percent"])
+        if interest_rate_percent < 0:
+            errors.append("通常利率は0以上で入力してください。")
+    except ValueError:
+        interest_rate_percent = 0
+        errors.append("通常利率は数値で入力してください。")
+
+    try:
+        grace_period_days = int(form_data["grace_period_days"])
+        if grace_period_days < 0:
+            errors.append("延滞猶予日数は0以上で入力してください。")
+    except ValueError:
+        grace_period_days = 0
+        errors.append("延滞猶予日数は数値で入力してください。")
+
+    try:
+        late_fee_rate_percent = float(form_data["late_fee_rate_percent"])
+        if late_fee_rate_percent < 0:
+            errors.append("延滞利率は0以上で入力してください。")
+    except ValueError:
+        late_fee_rate_percent = 0
+        errors.append("延滞利率は数値で入力してください。")
+
+    loan_date_obj = None
+    due_date_obj = None
+
+    if not form_data["loan_date"]:
+        errors.append("貸付日を入力してください。")
+    else:
+        try:
+            loan_date_obj = datetime.strptime(form_data["loan_date"], "%Y-%m-%d").date()
+        except ValueError:
+            errors.append("貸付日の形式が正しくありません。")
+
+    if not form_data["due_date"]:
+        errors.append("返済期日を入力してください。")
+    else:
+        try:
+            due_date_obj = datetime.strptime(form_data["due_date"], "%Y-%m-%d").date()
+        except ValueError:
+            errors.append("返済期日の形式が正しくありません。")
+
+    if loan_date_obj and due_date_obj:
+        if loan_date_obj > due_date_obj:
+            errors.append("返済期日は貸付日以降の日付を入力してください。")
+
+    if errors:
+        return errors, None
+
+    repayment_expected = int(loan_amount * (1 + interest_rate_percent / 100))
+
+    loan_data = {
+        "customer_id": form_data["customer_id"],
+        "loan_amount": loan_amount,
+        "loan_date": form_data["loan_date"],
+        "due_date": form_data["due_date"],
+        "interest_rate_percent": interest_rate_percent,
+        "repayment_expected": repayment_expected,
+        "repayment_method": form_data["repayment_method"],
+        "grace_period_days": grace_period_days,
+        "late_fee_rate_percent": late_fee_rate_percent,
+        "late_base_amount": loan_amount,
+        "contract_status": "ACTIVE",
+        "cancelled_at": "",
+        "cancel_reason": "",
+        "notes": form_data["notes"],
+    }
+
+    return errors, loan_data
+
 @app.route("/loans/new", methods=["GET", "POST"])
 def loan_new():
     if request.method == "POST":
-        loans = load_loans("data/loan_v3.csv")
-
-        errors = []
-
         form_data = {
             "customer_id": request.form.get("customer_id", "").strip(),
             "loan_amount": request.form.get("loan_amount", "").strip(),
@@ -1125,114 +2043,785 @@ def loan_new():
             "notes": request.form.get("notes", "").strip(),
         }
 
-        customer = None
-
-        if not form_data["customer_id"]:
-            errors.append("顧客IDを入力してください。")
-        else:
-            customer = Customer.query.filter_by(
-                customer_id=form_data["customer_id"],
+        errors, loan_data = validate_loan_form(
+            form_data,
+            lambda customer_id: Customer.query.filter_by(
+                customer_id=customer_id,
                 user_id=g.user.user_id,
-        ).first()
+            ).first() is not None,
+        )
+
+        if errors:
+            return render_template(
+                "loan_form.html",
+                errors=errors,
+                form_data=form_data
+            )
+
+        # loan_id は連番表から払い出す（同時登録でも重複しない）
+        save_new_loan(loan_data)
+
+        return redirect(url_for("loan_list"))
+
+    return render_template(
+        "loan_form.html",
+        form_data={}
+    )
+
+# ======================
+# エクスポート（CSV / JSON Lines のストリーミング）
+# ======================
+
+# CLI の台帳CSV（loan_v3.csv / repayments.csv）と同じ列順
+LOAN_CSV_COLUMNS = [
+    "loan_id",
+    "customer_id",
+    "loan_amount",
+    "loan_date",
+    "due_date",
+    "interest_rate_percent",
+    "repayment_expected",
+    "repayment_method",
+    "grace_period_days",
+    "late_fee_rate_percent",
+    "late_base_amount",
+    "contract_status",
+    "cancelled_at",
+    "cancel_reason",
+    "notes",
+]
+
+REPAYMENT_CSV_COLUMNS = [
+    "loan_id",
+    "customer_id",
+    "repayment_amount",
+    "repayment_date",
+    "payment_type",
+]
+
+# カーソルから一度に読む行数と、まとめて送るバイト数の目安
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def iter_csv_chunks(header, rows):
+    """
+    ヘッダーを先に1チャンクとして返し、以降は EXPORT_CHUNK_BYTES ごとにまとめて返す
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue().encode("utf-8")
+
+    buffer.seek(0)
+    buffer.truncate()
+
+    for row in rows:
+        writer.writerow(row)
+
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def iter_jsonl_chunks(items):
+    """
+    1行目はすぐに返し、以降は EXPORT_CHUNK_BYTES ごとにまとめて返す
+    """
+    lines = []
+    size = 0
+    first = True
+
+    for item in items:
+        line = json.dumps(item, ensure_ascii=False) + "\n"
+        lines.append(line)
+        size += len(line)
+
+        if first or size >= EXPORT_CHUNK_BYTES:
+            first = False
+            yield "".join(lines).encode("utf-8")
+            lines = []
+            size = 0
+
+    if lines:
+        yield "".join(lines).encode("utf-8")
+
+def gzip_chunks(chunks):
+    """
+    チャンクごとに gzip 圧縮して返す（Z_SYNC_FLUSH で区切るので、全体を待たずに送れる）
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+def export_response(chunks, filename, mimetype):
+    """
+    チャンクのジェネレーターをそのままレスポンスにする
+    - クライアントが Accept-Encoding: gzip を送ってきた場合だけ、その場で圧縮する
+    """
+    use_gzip = "gzip" in request.accept_encodings
+
+    response = Response(
+        stream_with_context(gzip_chunks(chunks) if use_gzip else chunks),
+        mimetype=mimetype,
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.vary.add("Accept-Encoding")
+
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+
+    return response
+
+@app.route("/export/loans.csv")
+def export_loans():
+    statement = (
+        select(*[getattr(Loan, column) for column in LOAN_CSV_COLUMNS])
+        .where(Loan.user_id == g.user.user_id)
+        .order_by(Loan.loan_date, Loan.loan_id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    rows = db.session.execute(statement)
+
+    return export_response(
+        iter_csv_chunks(LOAN_CSV_COLUMNS, rows),
+        "loans.csv",
+        "text/csv",
+    )
+
+@app.route("/export/repayments.csv")
+def export_repayments():
+    statement = (
+        select(*[getattr(Repayment, column) for column in REPAYMENT_CSV_COLUMNS])
+        .where(Repayment.user_id == g.user.user_id)
+        .order_by(Repayment.repayment_date, Repayment.repayment_id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    rows = db.session.execute(statement)
+
+    return export_response(
+        iter_csv_chunks(REPAYMENT_CSV_COLUMNS, rows),
+        "repayments.csv",
+        "text/csv",
+    )
+
+@app.route("/export/unpaid.jsonl")
+def export_unpaid():
+    items = iter_unpaid_loan_rows(
+        g.user.user_id,
+        date.today(),
+        batch_size=EXPORT_BATCH_SIZE,
+    )
+
+    return export_response(
+        iter_jsonl_chunks(items),
+        "unpaid.jsonl",
+        "application/x-ndjson",
+    )
+
+# ======================
+# 一括登録（CSVアップロード）
+# ======================
+
+UPLOAD_BATCH_SIZE = 500
+UPLOAD_REPORT_DIR = Path(os.environ.get("APP_UPLOAD_REPORT_DIR", DATA_DIR / "upload_reports"))
+UPLOAD_REPORT_COLUMNS = ["row", "status", "key", "errors"]
+# 結果CSVの保存期間。これより古いものは次にそのユーザーがアップロードしたときに消す
+UPLOAD_REPORT_KEEP_SECONDS = int(os.environ.get("APP_UPLOAD_REPORT_KEEP_DAYS", "7")) * 24 * 60 * 60
+
+# 最低限必要な列（無い列は空欄として扱う。payment_type は旧形式の repayments.csv に無いので任意）
+UPLOAD_REQUIRED_COLUMNS = {
+    "loans": [
+        "customer_id",
+        "loan_amount",
+        "loan_date",
+        "due_date",
+        "interest_rate_percent",
+        "grace_period_days",
+        "late_fee_rate_percent",
+    ],
+    "repayments": [
+        "loan_id",
+        "repayment_amount",
+        "repayment_date",
+    ],
+}
+
+def _optional_int(value, label, errors):
+    """
+    空欄なら None、整数（0以上）ならその値、それ以外はエラーを追加して None
+    """
+    if not value:
+        return None
+
+    try:
+        number = int(value)
+    except ValueError:
+        errors.append(f"{label}は数値で入力してください。")
+        return None
+
+    if number < 0:
+        errors.append(f"{label}は0以上で入力してください。")
+        return None
+
+    return number
+
+def validate_loan_upload_row(row, customer_ids, taken_loan_ids):
+    """
+    貸付CSV（loan_v3.csv 形式）の1行をチェックする
+    - 画面の貸付登録と同じチェックに加えて、loan_id の重複（DB・同じファイルの前の行）を見る
+    - repayment_expected / late_base_amount / contract_status などは、列があればその値を使う
+    戻り値: (エラーメッセージのリスト, 登録する貸付データ or None)
+    """
+    form_data = {
+        key: (row.get(key) or "").strip()
+        for key in (
+            "customer_id",
+            "loan_amount",
+            "loan_date",
+            "due_date",
+            "interest_rate_percent",
+            "repayment_method",
+            "grace_period_days",
+            "late_fee_rate_percent",
+            "notes",
+        )
+    }
+    form_data["repayment_method"] = form_data["repayment_method"] or "UNKNOWN"
+
+    errors, loan_data = validate_loan_form(form_data, customer_ids.__contains__)
+
+    loan_id = (row.get("loan_id") or "").strip()
+
+    if loan_id and loan_id in taken_loan_ids:
+        errors.append(f"loan_id {loan_id} は既に登録されています。")
+
+    repayment_expected = _optional_int(
+        (row.get("repayment_expected") or "").strip(), "予定返済額", errors
+    )
+    late_base_amount = _optional_int(
+        (row.get("late_base_amount") or "").strip(), "延滞対象元金", errors
+    )
+
+    contract_status = (row.get("contract_status") or "").strip().upper() or "ACTIVE"
+
+    if contract_status not in ("ACTIVE", "CANCELLED"):
+        errors.append("契約状態は ACTIVE または CANCELLED を入力してください。")
+
+    if errors:
+        return errors, None
+
+    loan_data["loan_id"] = loan_id
+    loan_data["contract_status"] = contract_status
+    loan_data["cancelled_at"] = (row.get("cancelled_at") or "").strip()
+    loan_data["cancel_reason"] = (row.get("cancel_reason") or "").strip()
+
+    if repayment_expected is not None:
+        loan_data["repayment_expected"] = repayment_expected
+
+    if late_base_amount is not None:
+        loan_data["late_base_amount"] = late_base_amount
+
+    return errors, loan_data
+
+def _loan_row_values(user_id, loan_data, created_at):
+    return {
+        "loan_id": loan_data["loan_id"],
+        "user_id": user_id,
+        "customer_id": loan_data["customer_id"],
+        "loan_amount": loan_data["loan_amount"],
+        "loan_date": loan_data["loan_date"],
+        "due_date": loan_data["due_date"],
+        "interest_rate_percent": loan_data["interest_rate_percent"],
+        "repayment_expected": loan_data["repayment_expected"],
+        "repayment_method": loan_data["repayment_method"],
+        "grace_period_days": loan_data["grace_period_days"],
+        "late_fee_rate_percent": loan_data["late_fee_rate_percent"],
+        "late_base_amount": loan_data["late_base_amount"],
+        "contract_status": loan_data["contract_status"],
+        "cancelled_at": loan_data["cancelled_at"] or None,
+        "cancel_reason": loan_data["cancel_reason"] or None,
+        "notes": loan_data["notes"] or None,
+        "created_at": created_at,
+    }
+
+def check_loan_upload(user_id, rows, today):
+    """
+    貸付CSVの全行をチェックする（顧客ID・登録済みの loan_id は最初に1回だけ読み込んだ集合で引く）
+    戻り値: [(行番号, キー, エラーのリスト, 登録する値 or None), ...]
+    """
+    customer_ids = set(
+        db.session.execute(
+            select(Customer.customer_id).where(Customer.user_id == user_id)
+        ).scalars()
+    )
+    # loan_id はユーザーをまたいで一意なので全ユーザー分を見るが、読むのはファイルに書かれた loan_id だけ
+    uploaded_loan_ids = sorted({(row.get("loan_id") or "").strip() for _, row in rows} - {""})
+    taken_loan_ids = set()
+
+    for start in range(0, len(uploaded_loan_ids), UPLOAD_BATCH_SIZE):
+        chunk = uploaded_loan_ids[start:start + UPLOAD_BATCH_SIZE]
+        taken_loan_ids.update(
+            db.session.execute(select(Loan.loan_id).where(Loan.loan_id.in_(chunk))).scalars()
+        )
+
+    created_at = now_str()
+    results = []
 
-        if customer is None:
-            errors.append("存在しない顧客IDです。")
+    for row_number, row in rows:
+        errors, loan_data = validate_loan_upload_row(row, customer_ids, taken_loan_ids)
+        values = None
 
-        if not form_data["loan_amount"]:
-            errors.append("貸付額を入力してください。")
+        if loan_data is not None:
+            if loan_data["loan_id"]:
+                taken_loan_ids.add(loan_data["loan_id"])
+            values = _loan_row_values(user_id, loan_data, created_at)
+
+        results.append((row_number, (row.get("loan_id") or "").strip(), errors, values))
+
+    return results
+
+def _repayment_targets(user_id, loan_ids=None):
+    """
+    返済チェック用に、user_id の貸付と返済累計（loan_balances）を loan_id -> 行 で読む
+    - loan_ids を渡すと、その loan_id（前後の空白は無視）の貸付だけを読む
+    """
+    query = (
+        select(
+            Loan.loan_id,
+            Loan.customer_id,
+            Loan.due_date,
+            Loan.repayment_expected,
+            Loan.grace_period_days,
+            Loan.late_fee_rate_percent,
+            Loan.late_base_amount,
+            Loan.contract_status,
+            func.coalesce(LoanBalance.total_repaid, 0).label("total_repaid"),
+            func.coalesce(LoanBalance.late_fee_paid, 0).label("late_fee_paid"),
+        )
+        .outerjoin(LoanBalance, LoanBalance.loan_id == Loan.loan_id)
+        .where(Loan.user_id == user_id)
+    )
+
+    if loan_ids is not None:
+        query = query.where(func.trim(Loan.loan_id).in_(sorted(set(loan_ids))))
+
+    loans = {}
+
+    for loan in db.session.execute(query):
+        loans.setdefault(loan.loan_id.strip(), loan)
+
+    return loans
+
+def _validate_repayment_rows(user_id, loans, form_rows, today):
+    """
+    返済の入力を1行ずつチェックする（loans は _repayment_targets の戻り値）
+    - 通常残高・延滞手数料残額のチェックは、前の行（エラーの無いもの）の金額も数に入れる
+    - form_rows は (form_data, customer_id) の並び。customer_id が空でなければ貸付の顧客と照合する
+    戻り値: [(エラーのリスト, 返済データ or None), ...]
+    """
+    # 登録予定の分を足し込んでいく: loan_id -> [返済累計, 延滞手数料支払済額]
+    balances = {}
+
+    def get_balance(loan):
+        key = loan.loan_id.strip()
+
+        if key not in balances:
+            balances[key] = [loan.total_repaid, loan.late_fee_paid]
+
+        return tuple(balances[key])
+
+    checked = []
+
+    for form_data, customer_id in form_rows:
+        errors, repayment_data = validate_repayment_form(
+            user_id,
+            form_data,
+            today,
+            find_loan=loans.get,
+            get_balance=get_balance,
+        )
+
+        if repayment_data is not None and customer_id and customer_id != repayment_data["customer_id"]:
+            errors.append(f"customer_id が貸付の顧客（{repayment_data['customer_id']}）と一致しません。")
+
+        if errors:
+            checked.append((errors, None))
+            continue
+
+        balance = balances[form_data["loan_id"]]
+
+        if repayment_data["payment_type"] == "REPAYMENT":
+            balance[0] += repayment_data["repayment_amount"]
         else:
-            try:
-                loan_amount = int(form_data["loan_amount"])
-                if loan_amount <= 0:
-                    errors.append("貸付額は1円以上で入力してください。")
-            except ValueError:
-                loan_amount = 0
-                errors.append("貸付額は数値で入力してください。")
+            balance[1] += repayment_data["repayment_amount"]
 
-        try:
-            interest_rate_percent = float(form_data["interest_rate_percent"])
-            if interest_rate_percent < 0:
-                errors.append("通常利率は0以上で入力してください。")
-        except ValueError:
-            interest_rate_percent = 0
-            errors.append("通常利率は数値で入力してください。")
+        checked.append((errors, repayment_data))
 
-        try:
-            grace_period_days = int(form_data["grace_period_days"])
-            if grace_period_days < 0:
-                errors.append("延滞猶予日数は0以上で入力してください。")
-        except ValueError:
-            grace_period_days = 0
-            errors.append("延滞猶予日数は数値で入力してください。")
+    return checked
+
+def check_repayment_upload(user_id, rows, today):
+    """
+    返済CSV（repayments.csv 形式）の全行をチェックする
+    - 貸付と返済累計は最初に1回だけ読み込み、loan_id で引く
+    - 通常残高・延滞手数料残額・CANCELLED のチェックは、同じファイルの前の行（エラーの無いもの）も数に入れる
+    戻り値: [(行番号, キー, エラーのリスト, 登録する値 or None), ...]
+    """
+    form_rows = [
+        (
+            {
+                "loan_id": (row.get("loan_id") or "").strip(),
+                "repayment_amount": (row.get("repayment_amount") or "").strip(),
+                "repayment_date": (row.get("repayment_date") or "").strip(),
+                "payment_type": ((row.get("payment_type") or "").strip() or "REPAYMENT").upper(),
+            },
+            (row.get("customer_id") or "").strip(),
+        )
+        for _, row in rows
+    ]
+    checked = _validate_repayment_rows(user_id, _repayment_targets(user_id), form_rows, today)
+
+    created_at = now_str()
+    results = []
+
+    for (row_number, _), (form_data, _), (errors, repayment_data) in zip(rows, form_rows, checked):
+        values = None
+
+        if repayment_data is not None:
+            values = {
+                "user_id": user_id,
+                **repayment_data,
+                "created_at": created_at,
+            }
+
+        results.append((row_number, form_data["loan_id"], errors, values))
+
+    return results
+
+def _insert_batches(model, results, recheck=None):
+    """
+    エラーの無い行を UPLOAD_BATCH_SIZE 件ずつ1トランザクションで登録する
+    - recheck(batch) を渡すと、各トランザクションの最初に呼び、戻り値の行だけを登録する
+      （書き込みロックを取ってからDBの今の状態でチェックし直し、通らない行にはエラーを付けて外す関数）
+    - バッチがDBの制約で失敗した場合（同時に登録された loan_id と衝突した等）は、
+      そのバッチだけ1行ずつ登録し直し、失敗した行にエラーを付ける
+    戻り値: 登録した件数
+    """
+    pending = [result for result in results if result[3] is not None]
+    inserted = 0
+
+    def insert_rows(rows):
+        if recheck is not None:
+            rows = recheck(rows)
+
+        if not rows:
+            db.session.rollback()
+            return 0
+
+        db.session.execute(insert(model), [result[3] for result in rows])
+        db.session.commit()
+        return len(rows)
+
+    for start in range(0, len(pending), UPLOAD_BATCH_SIZE):
+        batch = pending[start:start + UPLOAD_BATCH_SIZE]
 
         try:
-            late_fee_rate_percent = float(form_data["late_fee_rate_percent"])
-            if late_fee_rate_percent < 0:
-                errors.append("延滞利率は0以上で入力してください。")
-        except ValueError:
-            late_fee_rate_percent = 0
-            errors.append("延滞利率は数値で入力してください。")
+            inserted += insert_rows(batch)
+            continue
 
-        loan_date_obj = None
-        due_date_obj = None
+        except IntegrityError:
+            db.session.rollback()
 
-        if not form_data["loan_date"]:
-            errors.append("貸付日を入力してください。")
-        else:
-            try:
-                loan_date_obj = datetime.strptime(form_data["loan_date"], "%Y-%m-%d").date()
-            except ValueError:
-                errors.append("貸付日の形式が正しくありません。")
+        for result in batch:
+            # バッチのチェックで付けたエラーは巻き戻した状態が前提なので、1行ずつチェックし直す
+            result[2].clear()
 
-        if not form_data["due_date"]:
-            errors.append("返済期日を入力してください。")
-        else:
             try:
-                due_date_obj = datetime.strptime(form_data["due_date"], "%Y-%m-%d").date()
-            except ValueError:
-                errors.append("返済期日の形式が正しくありません。")
+                inserted += insert_rows([result])
+
+            except IntegrityError as e:
+                db.session.rollback()
+                result[2].append(_integrity_error_message(model, e))
+
+    return inserted
 
-        if loan_date_obj and due_date_obj:
-            if loan_date_obj > due_date_obj:
-                errors.append("返済期日は貸付日以降の日付を入力してください。")
+def _integrity_error_message(model, error):
+    """一括登録の1行がDBの制約で登録できなかったときのメッセージ"""
+    if model is Loan and _is_loan_id_conflict(error):
+        return "登録できませんでした（同じ loan_id が既に登録されています）。"
 
+    return "登録できませんでした（DB制約）。"
+
+def _begin_write_transaction():
+    """
+    書き込みロックを取ってトランザクションを始める（SQLite は BEGIN IMMEDIATE）
+    - この後に読んだ loan_balances は、コミットするまで他の登録で変わらない
+    """
+    db.session.rollback()
+
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(text("BEGIN IMMEDIATE"))
+
+def _recheck_repayment_batch(user_id, batch, today):
+    """
+    一括登録する返済のバッチを、書き込みロックを取ってからDBの今の貸付・loan_balances でチェックし直す
+    （アップロード全体をチェックした後に、別の画面・別のアップロードで返済が入っているかもしれないため）
+    - 読むのはバッチに出てくる loan_id の分だけ。他の DBMS では貸付の行を FOR UPDATE で押さえる
+    - 通らない行にはエラーを付ける
+    戻り値: 登録してよい行のリスト
+    """
+    _begin_write_transaction()
+
+    loan_ids = {result[3]["loan_id"] for result in batch}
+
+    if db.engine.dialect.name != "sqlite":
+        db.session.execute(
+            select(Loan.loan_id)
+            .where(Loan.user_id == user_id, func.trim(Loan.loan_id).in_(sorted(loan_ids)))
+            .with_for_update()
+        )
+
+    loans = _repayment_targets(user_id, loan_ids)
+    form_rows = [
+        (
+            {
+                "loan_id": result[3]["loan_id"],
+                "repayment_amount": str(result[3]["repayment_amount"]),
+                "repayment_date": result[3]["repayment_date"],
+                "payment_type": result[3]["payment_type"],
+            },
+            "",
+        )
+        for result in batch
+    ]
+    ok = []
+
+    for result, (errors, _) in zip(batch, _validate_repayment_rows(user_id, loans, form_rows, today)):
         if errors:
-            return render_template(
-                "loan_form.html",
-                errors=errors,
-                form_data=form_data
-            )
+            result[2].extend(errors)
+        else:
+            ok.append(result)
 
-        repayment_expected = int(loan_amount * (1 + interest_rate_percent / 100))
-        loan_id = generate_loan_id(loans, form_data["loan_date"])
-
-        loan_data = {
-            "loan_id": loan_id,
-            "customer_id": form_data["customer_id"],
-            "loan_amount": loan_amount,
-            "loan_date": form_data["loan_date"],
-            "due_date": form_data["due_date"],
-            "interest_rate_percent": interest_rate_percent,
-            "repayment_expected": repayment_expected,
-            "repayment_method": form_data["repayment_method"],
-            "grace_period_days": grace_period_days,
-            "late_fee_rate_percent": late_fee_rate_percent,
-            "late_base_amount": loan_amount,
-            "contract_status": "ACTIVE",
-            "cancelled_at": "",
-            "cancel_reason": "",
-            "notes": form_data["notes"],
+    return ok
+
+def _assign_loan_ids(results):
+    """
+    loan_id が空欄の行に、貸付日ごとにまとめて連番を払い出す
+    """
+    by_date = {}
+
+    for result in results:
+        values = result[3]
+
+        if values is not None and not values["loan_id"]:
+            by_date.setdefault(values["loan_date"], []).append(values)
+
+    for loan_date, rows in by_date.items():
+        for values, loan_id in zip(rows, allocate_loan_ids(loan_date, len(rows))):
+            values["loan_id"] = loan_id
+
+def read_upload_csv(file_storage, kind):
+    """
+    アップロードされたCSVを (行番号, 行の辞書) のリストにする（行番号はヘッダーを1行目として数える）
+    戻り値: (行のリスト, エラーメッセージ or None)
+    """
+    try:
+        text_stream = io.TextIOWrapper(file_storage.stream, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text_stream)
+        header = [name.strip() for name in (reader.fieldnames or [])]
+        reader.fieldnames = header
+
+        missing = [
+            column for column in UPLOAD_REQUIRED_COLUMNS[kind]
+            if column not in header
+        ]
+
+        if missing:
+            return [], f"CSVに必要な列がありません: {', '.join(missing)}"
+
+        return [
+            (reader.line_num, row)
+            for row in reader
+            if any((value or "").strip() for value in row.values() if isinstance(value, str))
+        ], None
+
+    except UnicodeDecodeError:
+        return [], "CSVは UTF-8 で保存してください。"
+
+    except csv.Error as e:
+        return [], f"CSVを読み込めませんでした: {e}"
+
+def write_upload_report(user_id, results, dry_run):
+    """
+    行ごとの結果をCSVに保存し、ダウンロード用のトークンを返す
+    - 同じユーザーの UPLOAD_REPORT_KEEP_SECONDS より古い結果CSVは、ここで消す
+    """
+    token = secrets.token_hex(16)
+    report_dir = UPLOAD_REPORT_DIR / str(user_id)
+    report_dir.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - UPLOAD_REPORT_KEEP_SECONDS
+
+    for old_report in report_dir.glob("*.csv"):
+        try:
+            if old_report.stat().st_mtime < cutoff:
+                old_report.unlink()
+        except FileNotFoundError:
+            # 同時に別のアップロードが消した
+            pass
+
+    with open(report_dir / f"{token}.csv", "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(UPLOAD_REPORT_COLUMNS)
+
+        for row_number, key, errors, values in results:
+            if errors:
+                status = "ERROR"
+            elif dry_run:
+                status = "OK"
+            else:
+                status = "INSERTED"
+
+            writer.writerow([
+                row_number,
+                status,
+                values["loan_id"] if values and values.get("loan_id") else key,
+                " / ".join(errors),
+            ])
+
+    return token
+
+def handle_upload(kind):
+    """
+    貸付・返済のCSV一括登録（画面は共通）
+    - 全行をチェックしてから、エラーの無い行だけをバッチで登録する
+    - 「チェックのみ」の場合は登録しない
+    """
+    model = Loan if kind == "loans" else Repayment
+    context = {"kind": kind, "errors": [], "summary": None}
+
+    if request.method == "POST":
+        file_storage = request.files.get("file")
+        dry_run = request.form.get("dry_run") == "1"
+
+        if file_storage is None or not file_storage.filename:
+            context["errors"].append("CSVファイルを選択してください。")
+            return render_template("upload_form.html", **context)
+
+        rows, error = read_upload_csv(file_storage, kind)
+
+        if error:
+            context["errors"].append(error)
+            return render_template("upload_form.html", **context)
+
+        user_id = g.user.user_id
+        check = check_loan_upload if kind == "loans" else check_repayment_upload
+        today = date.today()
+        results = check(user_id, rows, today)
+
+        inserted = 0
+
+        if not dry_run:
+            recheck = None
+
+            if kind == "loans":
+                _assign_loan_ids(results)
+
+            else:
+                recheck = lambda batch: _recheck_repayment_batch(user_id, batch, today)
+
+            inserted = _insert_batches(model, results, recheck)
+
+        context["summary"] = {
+            "total": len(results),
+            "error_count": sum(1 for result in results if result[2]),
+            "inserted": inserted,
+            "dry_run": dry_run,
+            "report_token": write_upload_report(user_id, results, dry_run),
         }
 
-        save_loan_to_csv("data/loan_v3.csv", loan_data)
+    return render_template("upload_form.html", **context)
 
-        return redirect(url_for("loan_list"))
+@app.route("/loans/upload", methods=["GET", "POST"])
+def loan_upload():
+    return handle_upload("loans")
 
-    return render_template(
-        "loan_form.html",
-        form_data={}
+@app.route("/repayments/upload", methods=["GET", "POST"])
+def repayment_upload():
+    return handle_upload("repayments")
+
+@app.route("/uploads/reports/<token>.csv")
+def upload_report(token):
+    if not re.fullmatch(r"[0-9a-f]{32}", token):
+        abort(404)
+
+    path = UPLOAD_REPORT_DIR / str(g.user.user_id) / f"{token}.csv"
+
+    if not path.is_file():
+        abort(404)
+
+    return send_file(
+        path,
+        mimetype="text/csv",
+        as_attachment=True,
+        download_name="upload_report.csv",
     )
 
+@app.cli.command("rebuild-balances")
+def rebuild_balances_command():
+    """loan_balances を返済履歴から作り直す。"""
+    db.create_all()
+    conn = db.engine.raw_connection()
+    try:
+        count = rebuild_loan_balances(conn)
+    finally:
+        conn.close()
+    print(f"loan_balances を再作成しました（{count} 件）。")
+
+@app.cli.command("verify-balances")
+def verify_balances_command():
+    """loan_balances が返済履歴の再集計と一致するか確認する。"""
+    conn = db.engine.raw_connection()
+    try:
+        mismatched = verify_loan_balances(conn)
+    finally:
+        conn.close()
+
+    if mismatched:
+        print(f"loan_balances が一致しません（{len(mismatched)} 件）: {', '.join(mismatched[:20])}")
+        raise SystemExit(1)
+    print("loan_balances は返済履歴と一致しています。")
+
+@app.cli.command("snapshot-overdue")
+@click.option("--date", "snapshot_date", default=None, help="YYYY-MM-DD（省略時は今日）")
+@click.option("--keep-days", type=int, default=None, help="これより古いスナップショットを削除する日数")
+def snapshot_overdue_command(snapshot_date, keep_days):
+    """指定日（既定は今日）の未返済・延滞状態を overdue_snapshot に保存する（cron から日次で実行）。"""
+    try:
+        day = datetime.strptime(snapshot_date, "%Y-%m-%d").date() if snapshot_date else date.today()
+    except ValueError:
+        raise click.BadParameter("YYYY-MM-DD形式で指定してください。", param_hint="--date")
+
+    db.create_all()
+    count = write_overdue_snapshot(day)
+    print(f"overdue_snapshot を作成しました（{day:%Y-%m-%d}: {count} 件）。")
+
+    if keep_days is not None:
+        cutoff = (day - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+        db.session.execute(delete(OverdueSnapshotRun).where(OverdueSnapshotRun.snapshot_date < cutoff))
+        removed = db.session.execute(
+            delete(OverdueSnapshot).where(OverdueSnapshot.snapshot_date < cutoff)
+        ).rowcount
+        db.session.commit()
+        print(f"{cutoff} より前のスナップショットを削除しました（{removed} 件）。")
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
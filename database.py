@@ -1,5 +1,6 @@
 # database.py
 import getpass
+import os
 import sqlite3
 from datetime import datetime
 from pathlib import Path
@@ -8,7 +9,7 @@ from werkzeug.security import generate_password_hash
 
 
 BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "data" / "loan_ledger.db"
+DB_PATH = Path(os.environ.get("APP_DB_PATH", BASE_DIR / "data" / "loan_ledger.db"))
 
 
 def now_str():
@@ -106,10 +107,320 @@ def init_db():
     )
     """)
 
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS ix_loans_user_loan_date
+        ON loans (user_id, loan_date, loan_id)
+    """)
+
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS ix_repayments_user_loan
+        ON repayments (user_id, loan_id)
+    """)
+
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS ix_repayments_user_date
+        ON repayments (user_id, repayment_date, repayment_id)
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS loan_id_sequences (
+        date_part TEXT PRIMARY KEY,
+        last_number INTEGER NOT NULL
+    )
+    """)
+
+    balances_exist = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'loan_balances'"
+    ).fetchone()
+
+    cursor.execute(LOAN_BALANCES_TABLE_SQL)
+
+    for statement in LOAN_BALANCE_DDL:
+        cursor.execute(statement)
+
+    cursor.execute(USER_DATA_VERSIONS_TABLE_SQL)
+
+    for statement in DATA_VERSION_DDL:
+        cursor.execute(statement)
+
+    for statement in OVERDUE_SNAPSHOT_DDL:
+        cursor.execute(statement)
+
+    # overdue_snapshot_runs より前に作ったスナップショットの日付も記録しておく
+    cursor.execute("""
+    INSERT OR IGNORE INTO overdue_snapshot_runs (snapshot_date, row_count, created_at)
+    SELECT snapshot_date, COUNT(*), '' FROM overdue_snapshot GROUP BY snapshot_date
+    """)
+
     conn.commit()
+
+    # 既存DBに後から追加した場合は、現在の返済履歴から作り直す
+    if balances_exist is None:
+        rebuild_loan_balances(conn)
+
     conn.close()
 
 
+# ======================
+# loan_balances（貸付ごとの返済累計）
+# ======================
+#
+# repayments / loans への書き込みのたびにトリガーで該当貸付の行だけを再計算する。
+# - total_repaid: payment_type == "REPAYMENT" の合計
+# - late_fee_paid: payment_type == "LATE_FEE" の合計
+# - last_repayment_date: 最後の入金日（種別を問わない）
+# - fully_repaid: repayment_expected - total_repaid <= 0 なら 1
+# 集計条件は app.py の calculate_total_repaid_map / calculate_late_fee_paid_map と同じ
+# （loan_id は TRIM、payment_type は TRIM + UPPER して比較し、同じ user_id の返済だけを数える）。
+
+LOAN_BALANCES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS loan_balances (
+    loan_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    total_repaid INTEGER NOT NULL DEFAULT 0,
+    late_fee_paid INTEGER NOT NULL DEFAULT 0,
+    last_repayment_date TEXT,
+    fully_repaid INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_LOAN_BALANCE_SELECT = """
+SELECT
+    l.loan_id,
+    l.user_id,
+    COALESCE(SUM(CASE WHEN UPPER(TRIM(COALESCE(r.payment_type, ''))) = 'REPAYMENT'
+                      THEN r.repayment_amount ELSE 0 END), 0),
+    COALESCE(SUM(CASE WHEN UPPER(TRIM(COALESCE(r.payment_type, ''))) = 'LATE_FEE'
+                      THEN r.repayment_amount ELSE 0 END), 0),
+    MAX(r.repayment_date),
+    l.repayment_expected <= COALESCE(SUM(CASE WHEN UPPER(TRIM(COALESCE(r.payment_type, ''))) = 'REPAYMENT'
+                                              THEN r.repayment_amount ELSE 0 END), 0)
+FROM loans l
+LEFT JOIN repayments r
+    ON r.user_id = l.user_id AND trim(r.loan_id) = trim(l.loan_id)
+WHERE {where}
+GROUP BY l.loan_id
+"""
+
+
+def _refresh_loan_balance_sql(where):
+    return (
+        "INSERT OR REPLACE INTO loan_balances "
+        "(loan_id, user_id, total_repaid, late_fee_paid, last_repayment_date, fully_repaid)"
+        + _LOAN_BALANCE_SELECT.format(where=where)
+    )
+
+
+def _refresh_for_repayment(ref):
+    return _refresh_loan_balance_sql(
+        f"l.user_id = {ref}.user_id AND trim(l.loan_id) = trim({ref}.loan_id)"
+    )
+
+
+LOAN_BALANCE_DDL = [
+    # トリガーから貸付・返済を loan_id の TRIM で引くための式インデックス
+    """
+    CREATE INDEX IF NOT EXISTS ix_loans_user_trim_loan
+        ON loans (user_id, trim(loan_id))
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_repayments_user_trim_loan
+        ON repayments (user_id, trim(loan_id))
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_loans_balance_insert
+    AFTER INSERT ON loans
+    BEGIN
+        {_refresh_loan_balance_sql("l.loan_id = NEW.loan_id")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_loans_balance_update
+    AFTER UPDATE OF loan_id, user_id, repayment_expected ON loans
+    BEGIN
+        DELETE FROM loan_balances WHERE loan_id = OLD.loan_id;
+        {_refresh_loan_balance_sql("l.loan_id = NEW.loan_id")};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_loans_balance_delete
+    AFTER DELETE ON loans
+    BEGIN
+        DELETE FROM loan_balances WHERE loan_id = OLD.loan_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_repayments_balance_insert
+    AFTER INSERT ON repayments
+    BEGIN
+        {_refresh_for_repayment("NEW")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_repayments_balance_update
+    AFTER UPDATE ON repayments
+    BEGIN
+        {_refresh_for_repayment("OLD")};
+        {_refresh_for_repayment("NEW")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_repayments_balance_delete
+    AFTER DELETE ON repayments
+    BEGIN
+        {_refresh_for_repayment("OLD")};
+    END
+    """,
+]
+
+
+# ======================
+# user_data_versions（画面キャッシュの無効化用）
+# ======================
+#
+# loans / repayments / customers に書き込みがあるたびに、その user_id の version を +1 する。
+# 画面キャッシュ（view_cache.py）は version をキーに含めるので、書き込み後は必ず再計算される。
+
+USER_DATA_VERSIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS user_data_versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_BUMP_VERSION_SQL = """
+    INSERT INTO user_data_versions (user_id, version)
+    SELECT {ref}.user_id, 1 WHERE {cond}
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+"""
+
+
+def _data_version_triggers(table):
+    triggers = []
+    for event_name, ref in (("INSERT", "NEW"), ("DELETE", "OLD")):
+        triggers.append(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event_name.lower()}
+        AFTER {event_name} ON {table}
+        BEGIN
+            {_BUMP_VERSION_SQL.format(ref=ref, cond="1 = 1")};
+        END
+        """)
+    triggers.append(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update
+    AFTER UPDATE ON {table}
+    BEGIN
+        {_BUMP_VERSION_SQL.format(ref="NEW", cond="1 = 1")};
+        {_BUMP_VERSION_SQL.format(ref="OLD", cond="OLD.user_id IS NOT NEW.user_id")};
+    END
+    """)
+    return triggers
+
+
+DATA_VERSION_DDL = [
+    statement
+    for table in ("customers", "loans", "repayments")
+    for statement in _data_version_triggers(table)
+]
+
+
+# ======================
+# overdue_snapshot（日付ごとの未返済・延滞状態）
+# ======================
+#
+# flask snapshot-overdue（app.py）が日次で書く。中身は app.py の unpaid_loans_cte を
+# その日以前の貸付・返済だけで計算した結果で、過去日付の一覧は返済履歴を集計し直さずにここを読む。
+
+OVERDUE_SNAPSHOT_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS overdue_snapshot (
+        snapshot_date TEXT NOT NULL,
+        loan_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        customer_id TEXT NOT NULL,
+        loan_amount INTEGER NOT NULL,
+        loan_date TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        repayment_expected INTEGER NOT NULL,
+        total_repaid INTEGER NOT NULL,
+        remaining INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        overdue_days INTEGER NOT NULL,
+        late_fee_paid INTEGER NOT NULL,
+        late_fee_amount INTEGER NOT NULL,
+        late_fee_remaining INTEGER NOT NULL,
+        current_collect_amount INTEGER NOT NULL,
+        PRIMARY KEY (snapshot_date, loan_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_overdue_snapshot_user_date
+        ON overdue_snapshot (user_id, snapshot_date, due_date, loan_id)
+    """,
+    # スナップショットを作った日付（未返済が0件のユーザーでも、その日の分があると分かるように）
+    """
+    CREATE TABLE IF NOT EXISTS overdue_snapshot_runs (
+        snapshot_date TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+]
+
+
+def rebuild_loan_balances(conn=None):
+    """
+    loan_balances を全件作り直し、作成した行数を返す。
+    conn は sqlite3 互換の DB-API 接続（省略時は DB_PATH に接続）。
+    """
+    own = conn is None
+    if own:
+        conn = get_connection()
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM loan_balances")
+        cursor.execute(_refresh_loan_balance_sql("1 = 1"))
+        count = cursor.execute("SELECT COUNT(*) FROM loan_balances").fetchone()[0]
+        conn.commit()
+        return count
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        if own:
+            conn.close()
+
+
+def verify_loan_balances(conn=None):
+    """
+    loan_balances と返済履歴からの再集計を突き合わせ、食い違う loan_id の一覧を返す（一致なら空）。
+    """
+    own = conn is None
+    if own:
+        conn = get_connection()
+
+    expected = _LOAN_BALANCE_SELECT.format(where="1 = 1")
+    stored = """
+    SELECT loan_id, user_id, total_repaid, late_fee_paid, last_repayment_date, fully_repaid
+    FROM loan_balances
+    """
+
+    try:
+        rows = conn.cursor().execute(f"""
+            SELECT loan_id FROM ({expected} EXCEPT {stored})
+            UNION
+            SELECT loan_id FROM ({stored} EXCEPT {expected})
+            ORDER BY 1
+        """).fetchall()
+        return [row[0] for row in rows]
+
+    finally:
+        if own:
+            conn.close()
+
+
 def migrate_users_table():
     """
     既存usersテーブルへF-6認証用カラムを追加する。
@@ -1,99 +1,66 @@
-# --- 軽量 import（--summary で必要なものだけ） ---
+# --- 軽量 import（起動・--summary で必要なものだけ） ---
+# 貸付・返済（decimal / enum / 監査・ジャーナルまで読み込む）・顧客・残高の各モジュールは
+# そのモードに入ったときに import する（起動時間は tests/test_startup_budget.py で見張る）
 from datetime import datetime, date
-import argparse
-import csv
 import os
 import sys
 from pathlib import Path
 
-# C-1（--summaryでも使う）
-from modules.utils import (
-    normalize_customer_id,
-    normalize_method,
-    fmt_date,
-    get_project_paths,
-    clean_header_if_quoted,
-    prompt_method,
-    validate_schema,
-    prompt_int,
-    prompt_float,
-    prompt_date_or_today,
-    prompt_customer_id
-)
-
-def _count_csv_rows(path: Path) -> int:
-    """ヘッダー除く行数（ファイル無ければ0）"""
-    if not path.exists():
-        return 0
-    with path.open("r", encoding="utf-8-sig", newline="") as f:
-        # 1行目ヘッダーを除外
-        n = -1
-        for _ in f:
-            n += 1
-        return max(0, n)
+# グローバル・ロガー（main() で生成。二重出力しないようモジュールレベルで1つだけ持つ）
+logger = None
+
+# 常駐デーモン（modules.ledger_daemon）のソケット。main() が見つけたときだけ設定する
+daemon_socket = None
+
+def _summary_today(argv: list[str]) -> date:
+    """--summary と一緒に渡された --today（無ければ今日）。"""
+    for i, arg in enumerate(argv):
+        value = None
+        if arg == "--today" and i + 1 < len(argv):
+            value = argv[i + 1]
+        elif arg.startswith("--today="):
+            value = arg.split("=", 1)[1]
+        if value is not None:
+            try:
+                return datetime.strptime(value, "%Y-%m-%d").date()
+            except ValueError:
+                raise SystemExit(f"❌ ERROR: --todayはYYYY-MM-DD形式で指定してください: {value!r}。")
+    return date.today()
 
 def _quick_summary(argv: list[str]) -> bool:
     if "--summary" not in argv:
         return False
 
+    # 集計はサイドカー（data/ledger_stats.json）を読むだけ。台帳が変わっていたときだけ数え直す
+    from modules.ledger_stats import get_stats, portfolio_summary
+
     root = Path(__file__).resolve().parent
     data_dir = root / "data"
     loans = data_dir / "loan_v3.csv"
     reps  = data_dir / "repayments.csv"
 
-    print(f"[summary] loans: {_count_csv_rows(loans)} | repayments: {_count_csv_rows(reps)}")
+    s = portfolio_summary(get_stats(loans, reps), _summary_today(argv))
+    print(f"[summary] loans: {s['loans']} | repayments: {s['repayments']}")
+    print(f"[summary] lent: ¥{s['total_lent']:,} | repaid: ¥{s['total_repaid']:,} | outstanding: ¥{s['outstanding']:,}")
+    print(f"[summary] overdue: {s['overdue_count']} loans | ¥{s['overdue_amount']:,}")
     raise SystemExit(0)
 
 _quick_summary(sys.argv[1:])
 
-try:
-    # 顧客情報関連
-    from modules.customer_module import (
-        list_customers,
-        search_customer,
-        get_all_customer_ids,
-        get_credit_limit,
-    )
-
-    # 貸付・返済関連
-    from modules.loan_module import (
-        register_loan,
-        display_loan_history,
-        register_repayment,
-        display_repayment_history,
-        display_unpaid_loans,
-        calculate_total_repaid_by_loan_id,
-        is_loan_fully_repaid,
-        get_total_repaid_amount,
-        get_loan_info_by_loan_id,
-        is_over_repayment,
-    )
-
-    # 残高照会
-    from modules.balance_module import display_balance
-
-    # ログ・監査
-    from modules.logger import get_logger
-    from modules.audit import append_audit   
-
-    # グローバル・ロガー （二重出力しないようモジュールレベルで生成）
-    logger = get_logger("k_loan_ledger")
-
-except ModuleNotFoundError as e:
-    #print(f"[ERROR] import 失敗: {e}")
-    print(f"❌ ERROR: importに失敗しました: {e}。")
-    raise
-    # tests/test_seed_flow.py は最小構成のみをコピーするため、
-    # --summary 実行時はこれらが無い想定。ダミーを用意しておく。
-    def append_audit(*a, **k):
-        return None
-
-    class _DummyLogger:
-        def info(self, *a, **k): pass
-        def warning(self, *a, **k): pass
-        def error(self, *a, **k): pass
-
-    logger = _DummyLogger()
+# C-1（--summary はここまでで終了するので、以降は通常起動でのみ読み込む）
+from modules.utils import (
+    normalize_customer_id,
+    normalize_method,
+    fmt_date,
+    get_project_paths,
+    clean_header_if_quoted,
+    prompt_method,
+    validate_schema,
+    prompt_int,
+    prompt_float,
+    prompt_date_or_today,
+    prompt_customer_id
+)
 
 def _parse_today_arg(s: str | None) -> date:
     """--today の文字列を date に。未指定(None)なら今日を返す。"""
@@ -105,17 +72,67 @@ def _parse_today_arg(s: str | None) -> date:
         raise SystemExit(f"❌ ERROR: --todayはYYYY-MM-DD形式で指定してください: {s!r}。")
 
 # === 2) 既存の _parse_cli_args を置き換え === C-7.5
-def _parse_cli_args():
-    p = argparse.ArgumentParser()
+# サブコマンド無しなら従来どおりメニュー。サブコマンドは cron などから stdin 無しで1回実行する用。
+def _parse_cli_args(argv: list[str] | None = None):
+    import argparse
+
+    # --today はサブコマンドの前後どちらに書いてもよい（後ろに書いたときだけ上書き）
+    today_opt = argparse.ArgumentParser(add_help=False)
+    today_opt.add_argument("--today", type=str, default=argparse.SUPPRESS, help="YYYY-MM-DD（指定がなければ今日）")
+
+    def customers_opt(sp):
+        g = sp.add_mutually_exclusive_group(required=True)
+        g.add_argument("--customer", action="append", metavar="ID", help="顧客ID（複数指定可。例：CUST001 または 001）")
+        g.add_argument("--all", action="store_true", help="全顧客")
+
+    def format_opt(sp):
+        sp.add_argument("--format", choices=("csv", "json"), default="csv", help="出力形式（既定 csv）")
+
+    p = argparse.ArgumentParser(description="K's Loan Ledger（サブコマンド無しで対話メニュー）")
     p.add_argument("--today", type=str, help="YYYY-MM-DD（指定がなければ今日）")
-    return p.parse_args()
+    sub = p.add_subparsers(dest="command", metavar="COMMAND")
+
+    sp = sub.add_parser("unpaid", parents=[today_opt], help="未返済（延滞）貸付の一覧")
+    customers_opt(sp)
+    sp.add_argument("--overdue", action="store_true", help="延滞中（猶予込みで期日超過）のみ")
+    format_opt(sp)
+
+    sp = sub.add_parser("balance", parents=[today_opt], help="顧客ごとの残高")
+    customers_opt(sp)
+    format_opt(sp)
+
+    sp = sub.add_parser("summary", parents=[today_opt], help="台帳全体の件数・残高の集計")
+    format_opt(sp)
+
+    sp = sub.add_parser("register-repayment", parents=[today_opt], help="返済登録（延滞手数料との配分は自動）")
+    g = sp.add_mutually_exclusive_group(required=True)
+    g.add_argument("--loan-id")
+    g.add_argument("--file", help="一括登録するCSV（見出し loan_id,amount[,repayment_date]。- で標準入力）")
+    sp.add_argument("--amount", type=int, help="支払合計額（円）。--loan-id のとき必須")
+    sp.add_argument("--date", help="返済日 YYYY-MM-DD（既定は --today。--file では日付欄が空の行に使う）")
+
+    sp = sub.add_parser("cancel", parents=[today_opt], help="契約解除")
+    sp.add_argument("--loan-id", required=True)
+    sp.add_argument("--reason", default="")
+
+    sp = sub.add_parser("serve", help="台帳を読み込んだまま常駐し、Unix ソケットで照会・登録を受ける")
+    sp.add_argument("--socket", help="ソケットのパス（既定は APP_LEDGER_SOCKET か data/ledger.sock）")
+
+    args = p.parse_args(argv)
+    if args.command == "register-repayment" and args.loan_id and args.amount is None:
+        p.error("register-repayment: --loan-id には --amount が必要です")
+    return args
 
 # 共通関数：モード突入時の技術ログ + 監査ログをセットで残す
 def enter_mode(mode_name: str):
+    from modules.audit import append_audit
+
     logger.info(f"Enter mode: {mode_name}")
     append_audit("ENTER", "mode", mode_name, None)
 
 def loan_registration_mode(loans_file):
+    from modules.customer_module import get_credit_limit, get_all_customer_ids, list_customers, search_customer
+    from modules.loan_module import register_loan
 
     # 顧客IDの存在を確認
     print("=== 顧客検索＆貸付記録モード ===")
@@ -196,6 +213,8 @@ def loan_registration_mode(loans_file):
     )
 
 def loan_history_mode(loans_file):
+    from modules.loan_module import display_loan_history
+
     print("=== 履歴表示モード ===")
     # 顧客IDを入力
     customer_id = normalize_customer_id(
@@ -206,6 +225,8 @@ def loan_history_mode(loans_file):
 
 
 def repayment_registration_mode(loans_file, repayments_file):
+    from modules.loan_module import display_unpaid_loans, register_repayment_complete
+
     print("\n=== 返済記録モード (B-11 新実装）===")
 
     # 1) loan_id 直接入力 or 空Enterで未返済候補表示→選択
@@ -234,8 +255,6 @@ def repayment_registration_mode(loans_file, repayments_file):
     repayment_date = prompt_date_or_today(
         "返済日を入力してください（YYYY-MM-DD、未入力で今日の日付）: "
     )
-    
-    from modules.loan_module import register_repayment_complete
 
     # 追記
     summary = register_repayment_complete(
@@ -260,6 +279,8 @@ def repayment_registration_mode(loans_file, repayments_file):
         print(f"✅ SUCCESS: 追記行: {r}。")
 
 def cancel_contract_mode(loans_file):
+    from modules.loan_module import cancel_contract, get_loan_info_by_loan_id
+
     print("\n=== 契約解除登録(C-9) ===")
     loan_id = input("契約解除する loan_id を入力してください: ").strip()
     info = get_loan_info_by_loan_id(loans_file, loan_id)
@@ -282,18 +303,328 @@ def cancel_contract_mode(loans_file):
         print("⚠️ WARN: キャンセルしました。")
         return
 
-    from modules.loan_module import cancel_contract
     if cancel_contract(loans_file, loan_id, reason=reason, operator="CLI"):
         pass  # 監査は cancel_contract 内で記録済み
 
-def main():
-    # C-7.5
-    args = _parse_cli_args()
+# ======================
+# バッチ用サブコマンド
+# ======================
+# 結果（CSV / JSON）だけを標準出力に書く。モジュール関数のメッセージは標準エラーへ回す。
+# 終了コード: 0=成功 / 1=処理できなかった（上限超過・解除済み・読み込み失敗など）/ 2=引数の誤り / 3=顧客・loan_id が見つからない
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_NOT_FOUND = 3
+
+UNPAID_FIELDS = [
+    "customer_id", "loan_id", "loan_date", "loan_amount", "due_date", "status",
+    "repayment_expected", "total_repaid", "remaining", "grace_period_days",
+    "overdue_days", "late_fee", "late_fee_paid", "recovery_total",
+]
+BALANCE_FIELDS = ["customer_id", "unpaid_loans", "total_expected", "total_repaid", "total_remaining"]
+SUMMARY_FIELDS = [
+    "today", "loans", "repayments", "total_lent", "total_repaid", "outstanding",
+    "customers_with_unpaid", "unpaid_loans",
+    "overdue_loans", "total_remaining", "total_late_fee", "total_recovery",
+]
+
+def _write_rows(out, rows: list[dict], fieldnames: list[str], fmt: str) -> None:
+    if fmt == "json":
+        import json
+
+        json.dump(rows, out, ensure_ascii=False)
+        out.write("\n")
+        return
 
-    today_override = _parse_today_arg(args.today)
-    paths = get_project_paths()
-    loans_file = str(paths["loans_csv"])
-    repayments_file = str(paths["repayments_csv"])
+    import csv
+
+    w = csv.DictWriter(out, fieldnames=fieldnames, extrasaction="ignore", lineterminator="\n")
+    w.writeheader()
+    w.writerows(rows)
+
+def _write_result(out, result: dict) -> None:
+    import json
+
+    json.dump(result, out, ensure_ascii=False)
+    out.write("\n")
+
+def _selected_customers(args) -> list[str] | None:
+    if args.all:
+        return None
+    return [normalize_customer_id(c) for c in args.customer]
+
+def _missing_customers(customers: list[str] | None, loans_file: str) -> list[str]:
+    """台帳に1件も貸付が無い顧客ID（--all のときは無し）。"""
+    if customers is None:
+        return []
+    from modules.ledger_snapshot import load_loan_rows
+
+    known = {row.get("customer_id") for row in load_loan_rows(loans_file)}
+    return [c for c in customers if c not in known]
+
+def _daemon_call(loans_file, request: dict, *, write: bool = False) -> dict | None:
+    """
+    常駐デーモンに要求を送って応答を返す。デーモンが無い・使えなければ None（ローカルで処理する）。
+    書き込みは送ったあとに失敗したら None にしない（ローカルでやり直すと二重に書くため）。
+    """
+    if daemon_socket is None:
+        return None
+    from modules.ledger_daemon import DaemonError, DaemonUnavailable, call
+
+    try:
+        resp = call(daemon_socket, {"loans_file": loans_file, **request})
+    except DaemonUnavailable as e:
+        logger.warning(f"Ledger daemon unavailable ({request['op']}), using local files: {e}")
+        return None
+    except DaemonError as e:
+        resp = {"ok": False, "error": str(e)}
+
+    if resp.get("messages"):
+        print(resp["messages"], end="")
+    if resp.get("ok"):
+        return resp
+    logger.warning(f"Ledger daemon failed ({request['op']}): {resp.get('error')}")
+    if resp.get("rejected") or not write:
+        return None
+    return resp
+
+def cmd_unpaid(args, out, today, loans_file, repayments_file) -> int:
+    customers = _selected_customers(args)
+    filter_mode = "overdue" if args.overdue else "all"
+    remote = _daemon_call(loans_file, {
+        "op": "unpaid", "customers": customers, "filter_mode": filter_mode, "today": today.isoformat(),
+    })
+    if remote is not None:
+        rows, missing = remote["rows"], remote["missing"]
+    else:
+        from modules.loan_module import build_unpaid_loan_rows
+
+        # 顧客が何人でも台帳は1回だけ集計し、指定された顧客の順に並べ直す
+        rows = build_unpaid_loan_rows(None, loans_file, repayments_file, filter_mode=filter_mode, today=today)
+        if customers is not None:
+            by_customer = {}
+            for row in rows:
+                by_customer.setdefault(row["customer_id"], []).append(row)
+            rows = [row for customer_id in dict.fromkeys(customers) for row in by_customer.get(customer_id, [])]
+        missing = _missing_customers(customers, loans_file)
+
+    _write_rows(out, rows, UNPAID_FIELDS, args.format)
+    for customer_id in missing:
+        print(f"⚠️ WARN: 貸付が見つからない顧客IDです: {customer_id}。")
+    return EXIT_NOT_FOUND if missing else EXIT_OK
+
+def cmd_balance(args, out, today, loans_file, repayments_file) -> int:
+    customers = _selected_customers(args)
+    remote = _daemon_call(loans_file, {"op": "balance", "customers": customers, "today": today.isoformat()})
+    if remote is not None:
+        rows, missing = remote["rows"], remote["missing"]
+    else:
+        from modules.balance_module import compute_balances
+
+        paths = {"loans_csv": Path(loans_file), "repayments_csv": Path(repayments_file)}
+        rows = compute_balances(customers, paths=paths, today=today)
+        missing = _missing_customers(customers, loans_file)
+
+    _write_rows(out, rows, BALANCE_FIELDS, args.format)
+    for customer_id in missing:
+        print(f"⚠️ WARN: 貸付が見つからない顧客IDです: {customer_id}。")
+    return EXIT_NOT_FOUND if missing else EXIT_OK
+
+def cmd_summary(args, out, today, loans_file, repayments_file) -> int:
+    remote = _daemon_call(loans_file, {"op": "summary", "today": today.isoformat()})
+    if remote is not None:
+        summary = remote["result"]
+    else:
+        from modules.ledger_stats import get_stats, portfolio_summary, summary_row
+        from modules.loan_module import build_unpaid_loan_rows
+
+        totals = portfolio_summary(get_stats(loans_file, repayments_file), today)
+        rows = build_unpaid_loan_rows(None, loans_file, repayments_file, today=today)
+        summary = summary_row(today, totals, rows)
+    if args.format == "json":
+        _write_result(out, summary)
+    else:
+        _write_rows(out, [summary], SUMMARY_FIELDS, "csv")
+    return EXIT_OK
+
+def cmd_register_repayment(args, out, today, loans_file, repayments_file) -> int:
+    from modules.loan_module import get_loan_info_by_loan_id, register_repayment_complete
+
+    if args.file:
+        return _register_repayments_from_file(args, out, today, loans_file, repayments_file)
+
+    loan_id = args.loan_id.strip()
+    repayment_date = args.date or today.isoformat()
+    _parse_today_arg(repayment_date)  # 形式チェック（不正なら終了）
+
+    remote = _daemon_call(loans_file, {
+        "op": "register-repayment", "loan_id": loan_id, "amount": args.amount,
+        "repayment_date": repayment_date, "actor": "BATCH",
+    }, write=True)
+    if remote is not None:
+        if not remote.get("ok"):
+            _write_result(out, {"ok": False, "loan_id": loan_id, "error": f"daemon: {remote.get('error')}"})
+            return EXIT_FAILED
+        found, summary = remote["found"], remote.get("result")
+    else:
+        found = bool(get_loan_info_by_loan_id(loans_file, loan_id))
+        summary = found and register_repayment_complete(
+            loans_file=loans_file,
+            repayments_file=repayments_file,
+            loan_id=loan_id,
+            amount=args.amount,
+            repayment_date=repayment_date,
+            actor="BATCH",
+        )
+
+    if not found:
+        _write_result(out, {"ok": False, "loan_id": loan_id, "error": "loan_id not found"})
+        return EXIT_NOT_FOUND
+    if not summary:
+        _write_result(out, {"ok": False, "loan_id": loan_id, "error": "repayment rejected"})
+        return EXIT_FAILED
+
+    _write_result(out, {"ok": True, **summary})
+    return EXIT_OK
+
+def _register_repayments_from_file(args, out, today, loans_file, repayments_file) -> int:
+    """
+    --file の各行を返済登録し、行ごとの結果を1行の JSON で出す。
+    ジャーナルの CSV 側 fsync・チェックポイントは group_commit でまとめる（デーモンは通さず、この場で書く）。
+    終了コードは、失敗した行があれば 1、見つからない loan_id があれば 3。
+    """
+    import csv
+    from contextlib import nullcontext
+    from modules.journal import group_commit
+    from modules.loan_module import get_loan_info_by_loan_id, register_repayment_complete
+
+    default_date = args.date or today.isoformat()
+    _parse_today_arg(default_date)  # 形式チェック（不正なら終了）
+
+    failed = not_found = False
+    source = nullcontext(sys.stdin) if args.file == "-" else open(args.file, newline="", encoding="utf-8-sig")
+    with source as f, group_commit():
+        for row_number, row in enumerate(csv.DictReader(f), start=2):
+            loan_id = (row.get("loan_id") or "").strip()
+            repayment_date = (row.get("repayment_date") or "").strip() or default_date
+            result = {"row": row_number, "loan_id": loan_id}
+            try:
+                amount = int((row.get("amount") or "").strip())
+                datetime.strptime(repayment_date, "%Y-%m-%d")
+            except ValueError:
+                failed = True
+                _write_result(out, {"ok": False, **result, "error": "invalid amount or repayment_date"})
+                continue
+
+            if not get_loan_info_by_loan_id(loans_file, loan_id):
+                not_found = True
+                _write_result(out, {"ok": False, **result, "error": "loan_id not found"})
+                continue
+            summary = register_repayment_complete(
+                loans_file=loans_file,
+                repayments_file=repayments_file,
+                loan_id=loan_id,
+                amount=amount,
+                repayment_date=repayment_date,
+                actor="BATCH",
+            )
+            if not summary:
+                failed = True
+                _write_result(out, {"ok": False, **result, "error": "repayment rejected"})
+                continue
+            _write_result(out, {"ok": True, "row": row_number, **summary})
+
+    if failed:
+        return EXIT_FAILED
+    return EXIT_NOT_FOUND if not_found else EXIT_OK
+
+def cmd_cancel(args, out, today, loans_file, repayments_file) -> int:
+    from modules.loan_module import cancel_contract, get_loan_info_by_loan_id
+
+    loan_id = args.loan_id.strip()
+    remote = _daemon_call(loans_file, {
+        "op": "cancel", "loan_id": loan_id, "reason": args.reason, "actor": "BATCH",
+    }, write=True)
+    if remote is not None:
+        if not remote.get("ok"):
+            _write_result(out, {"ok": False, "loan_id": loan_id, "error": f"daemon: {remote.get('error')}"})
+            return EXIT_FAILED
+        found, ok = remote["found"], remote.get("result")
+    else:
+        found = bool(get_loan_info_by_loan_id(loans_file, loan_id))
+        ok = found and cancel_contract(loans_file, loan_id, reason=args.reason, operator="BATCH")
+
+    if not found:
+        _write_result(out, {"ok": False, "loan_id": loan_id, "error": "loan_id not found"})
+        return EXIT_NOT_FOUND
+    if not ok:
+        _write_result(out, {"ok": False, "loan_id": loan_id, "error": "cancel rejected"})
+        return EXIT_FAILED
+
+    _write_result(out, {"ok": True, "loan_id": loan_id, "reason": args.reason})
+    return EXIT_OK
+
+BATCH_COMMANDS = {
+    "unpaid": cmd_unpaid,
+    "balance": cmd_balance,
+    "summary": cmd_summary,
+    "register-repayment": cmd_register_repayment,
+    "cancel": cmd_cancel,
+}
+
+def run_batch(args, today, loans_file, repayments_file) -> int:
+    """
+    サブコマンドを1回実行して終了コードを返す（対話入力は使わない）。
+    常駐デーモンが動いていれば台帳の整備（_boot）はデーモン起動時に済んでいるので省き、照会・登録をデーモンに任せる。
+    """
+    global daemon_socket
+    from contextlib import redirect_stdout
+    from modules.audit import append_audit
+    from modules.ledger_daemon import find_daemon
+
+    out = sys.stdout
+    with redirect_stdout(sys.stderr):
+        daemon_socket = find_daemon(loans_file)
+        if daemon_socket is None:
+            _boot(loans_file, repayments_file, session="batch", actor="BATCH", detail={"command": args.command})
+        else:
+            logger.info(f"App boot (via ledger daemon {daemon_socket})")
+            append_audit("START", "app", "batch", {"cwd": os.getcwd(), "command": args.command,
+                                                   "daemon": str(daemon_socket)}, actor="BATCH")
+        try:
+            code = BATCH_COMMANDS[args.command](args, out, today, loans_file, repayments_file)
+        except Exception as e:
+            logger.error(f"Batch command failed: {args.command}: {e}", exc_info=True)
+            append_audit("ERROR", "app", "batch", {"command": args.command, "error": str(e)}, actor="BATCH")
+            print(f"❌ ERROR: 処理に失敗しました: {e}。")
+            return EXIT_FAILED
+
+        append_audit("END", "app", "batch", {"command": args.command, "exit_code": code}, actor="BATCH")
+        logger.info(f"Batch command finished: {args.command} (exit {code})")
+        return code
+
+def run_daemon(args, loans_file, repayments_file) -> int:
+    """台帳を整備してから常駐デーモンを起動する（Ctrl+C か shutdown 要求で終了）。"""
+    from modules.audit import append_audit
+    from modules.ledger_daemon import serve
+
+    _boot(loans_file, repayments_file, session="daemon", actor="DAEMON")
+    code = serve(loans_file, repayments_file, args.socket)
+    append_audit("END", "app", "daemon", {"exit_code": code}, actor="DAEMON")
+    logger.info(f"Ledger daemon exited (exit {code})")
+    return code
+
+def _boot(loans_file, repayments_file, *, session="session", actor="CLI", detail=None):
+    """起動時の台帳の整備（ジャーナル復旧・スキーマ整合・ヘッダ健全化）と起動の記録。"""
+    from modules.audit import append_audit
+
+    # 前回の異常終了で反映しきれなかった台帳操作をやり直す（マイグレーションより先に）
+    try:
+        from modules.journal import journal_path_for, recover
+        redone = recover(journal_path_for(loans_file))
+        if redone:
+            logger.warning(f"Journal recovery: re-applied {redone} pending write(s)")
+    except Exception as e:
+        logger.warning(f"Journal recovery failed (continue anyway): {e}")
 
     # C-6.5: 起動スキーマ整合（無停止・冪等）
     try:
@@ -304,7 +635,7 @@ def main():
 
     # 起動ログ監査
     logger.info("App boot")
-    append_audit("START", "app", "session", {"cwd": os.getcwd()}, actor="CLI")
+    append_audit("START", "app", session, {"cwd": os.getcwd(), **(detail or {})}, actor=actor)
 
     # ヘッダが "col" 形式なら自動で外す（初回だけでOK）
     # [C-6] 起動時のCSV健全化：引用符ヘッダがあれば除去してINFOログを残す
@@ -339,6 +670,35 @@ def main():
         {"loan_id", "customer_id", "repayment_amount", "repayment_date"},
     )
 
+def main(argv: list[str] | None = None):
+    global logger
+    from modules.logger import get_logger
+    from modules.audit import append_audit
+
+    logger = get_logger("k_loan_ledger")
+
+    # C-7.5
+    args = _parse_cli_args(argv)
+
+    today_override = _parse_today_arg(args.today)
+    paths = get_project_paths()
+    loans_file = str(paths["loans_csv"])
+    repayments_file = str(paths["repayments_csv"])
+
+    if args.command == "serve":
+        return run_daemon(args, loans_file, repayments_file)
+    if args.command:
+        return run_batch(args, today_override, loans_file, repayments_file)
+
+    _boot(loans_file, repayments_file)
+
+    # 常駐デーモンが動いていれば、照会モード（5/9/10）はデーモンに問い合わせる
+    global daemon_socket
+    from modules.ledger_daemon import find_daemon
+    daemon_socket = find_daemon(loans_file)
+    if daemon_socket is not None:
+        logger.info(f"Using ledger daemon: {daemon_socket}")
+
     # メニューを表示して、どのモードを動かすか選ぶ
     # ユーザーの入力に応じて各モードを呼び出す
     try:
@@ -373,36 +733,53 @@ def main():
                 enter_mode("repayment_history")
                 print("\n=== 返済履歴表示モード ===")
                 customer_id = prompt_customer_id("👤 顧客IDを入力してください（例：CUST001 または 001）: ")
+                from modules.loan_module import display_repayment_history
                 display_repayment_history(customer_id, filepath=repayments_file)
 
             elif choice == "5":
                 enter_mode("balance_inquiry")
                 print("\n=== 残高照会モード ===")
                 customer_id = prompt_customer_id("👤 顧客IDを入力してください（例：CUST001 または 001）: ")
-                display_balance(customer_id)
+                from modules.balance_module import display_balance
+                remote = _daemon_call(loans_file, {
+                    "op": "balance", "customers": [customer_id], "today": today_override.isoformat(),
+                })
+                display_balance(customer_id, balance=remote["rows"][0] if remote else None)
 
             elif choice == "9":
                 enter_mode("unpaid_summary")
                 print("\n=== 未返済貸付一覧＋サマリー ===")
                 customer_id = prompt_customer_id("👤 顧客IDを入力してください（例：CUST001 または 001）: ")
+                from modules.loan_module import display_unpaid_loans
+                remote = _daemon_call(loans_file, {
+                    "op": "unpaid", "customers": [customer_id], "filter_mode": "all",
+                    "today": today_override.isoformat(),
+                })
                 display_unpaid_loans(
                     customer_id,
                     filter_mode="all",
                     loan_file=loans_file,
                     repayment_file=repayments_file,
                     today=today_override,
+                    rows=remote["rows"] if remote else None,
                 )
 
             elif choice == "10":
                 enter_mode("overdue_loans")
                 print("\n=== 延滞貸付一覧表示モード ===")
                 customer_id = prompt_customer_id("👤 顧客IDを入力してください（例：CUST001 または 001）: ")
+                from modules.loan_module import display_unpaid_loans
+                remote = _daemon_call(loans_file, {
+                    "op": "unpaid", "customers": [customer_id], "filter_mode": "overdue",
+                    "today": today_override.isoformat(),
+                })
                 display_unpaid_loans(
                     customer_id,
                     filter_mode="overdue",
                     loan_file=loans_file,
                     repayment_file=repayments_file,
                     today=today_override,
+                    rows=remote["rows"] if remote else None,
                 )
 
             elif choice == "11":
@@ -424,4 +801,4 @@ def main():
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
\ No newline at end of file
@@ -6,6 +6,8 @@ from datetime import datetime, timezone
 from typing import Any, Dict, Union
 from pathlib import Path
 
+from modules.file_lock import ledger_lock
+
 # 監査ログの出力先（デフォルト）
 AUDIT_PATH = Path("audit_log.csv")
 
@@ -35,6 +37,18 @@ def _serialize_details(details: Union[str, Dict[str, Any], None]) -> str:
         return str(details)
 
 
+def format_audit_row(
+    action: str,
+    entity: str,
+    entity_id: Union[str, int],
+    details: Union[str, Dict[str, Any], None] = None,
+    actor: str = "CLI",
+) -> list:
+    """監査ログ1行分（_HEADER の順）を組み立てる。ジャーナル経由の書き込みでも同じ形式にする。"""
+    ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+    return [ts, str(action), str(entity), str(entity_id), str(actor), _serialize_details(details)]
+
+
 def append_audit(
     action: str,
     entity: str,
@@ -48,9 +62,10 @@ def append_audit(
         path = AUDIT_PATH
     path = str(path)
 
-    _ensure_header(path)
-    ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") + "Z"
-    row = [ts,str(action), str(entity), str(entity_id), str(actor), _serialize_details(details)]
-    with open(path, "a", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow(row)
-        f.flush()
+    row = format_audit_row(action, entity, entity_id, details, actor)
+    # ジャーナル経由の追記（記録した位置に書く）とぶつからないよう、同じ排他ロックの中で書く
+    with ledger_lock(exclusive=[path]):
+        _ensure_header(path)
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(row)
+            f.flush()
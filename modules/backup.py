@@ -0,0 +1,315 @@
+# modules/backup.py
+"""
+NFR Backup Policy の世代バックアップ（差分・重複排除つき）。
+
+台帳CSVは追記が基本なので、前の世代から増えたバイト範囲だけを保存すれば足りる。
+
+backup/<csvファイル名>/
+  manifest.json        世代の一覧（kind/offset/size/probe）
+  000001.full          丸ごとコピー（初回・書き換え後）
+  000002.delta         直前の世代から追記された範囲 [offset, size)
+  ...
+
+- 直前の世代の「末尾 64KiB と先頭 4KiB」が今のファイルと一致すれば追記とみなして delta、
+  一致しなければ（cancel_contract / マイグレーション等の書き換え）full を取る
+- 内容が変わっていなければ新しい世代は作らない（重複排除）
+- restore() は直近の full から delta を順に連結して任意の世代を復元する
+- 保持世代数を超えたら古い世代を消す。最古の保持世代が delta になる場合は、
+  消す delta のバイトを基の full の末尾に足して、その世代の full にする（コストは消す差分の分だけ）
+
+保存先は環境変数 APP_BACKUP_DIR。未指定なら data/ と同じ階層の backup/
+（CSV が data/ 以外にある場合は CSV と同じフォルダの backup/）。
+APP_BACKUP=0 で無効化、APP_BACKUP_KEEP で保持世代数（既定 10）。
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from modules.file_lock import ledger_lock
+
+PathLike = Union[str, Path]
+
+MANIFEST = "manifest.json"
+DEFAULT_KEEP = 10
+_HEAD_SPAN = 4 * 1024
+_TAIL_SPAN = 64 * 1024
+_COPY_CHUNK = 1024 * 1024
+
+
+class BackupError(RuntimeError):
+    """世代が見つからない・差分の連結が合わないなど、復元できない状態。"""
+
+
+def backup_enabled() -> bool:
+    return os.getenv("APP_BACKUP", "1").strip().lower() not in ("0", "false", "off", "no")
+
+
+def keep_generations() -> int:
+    try:
+        return max(1, int(os.getenv("APP_BACKUP_KEEP", DEFAULT_KEEP)))
+    except ValueError:
+        return DEFAULT_KEEP
+
+
+def default_backup_root(csv_path: PathLike) -> Path:
+    env = os.getenv("APP_BACKUP_DIR")
+    if env:
+        return Path(env)
+    parent = Path(csv_path).resolve().parent
+    if parent.name == "data":
+        return parent.parent / "backup"
+    return parent / "backup"
+
+
+def _gen_dir(csv_path: Path, backup_root: Optional[PathLike]) -> Path:
+    root = Path(backup_root) if backup_root else default_backup_root(csv_path)
+    return root / csv_path.name
+
+
+# ======================
+# manifest
+# ======================
+
+
+def _load_manifest(gdir: Path) -> dict:
+    try:
+        return json.loads((gdir / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"generations": []}
+
+
+def _save_manifest(gdir: Path, manifest: dict) -> None:
+    tmp = gdir / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, gdir / MANIFEST)
+
+
+def _probe(f, size: int) -> str:
+    """先頭 4KiB と、size の直前 64KiB のハッシュ（前の世代がそのまま残っているかの判定用）。"""
+    h = hashlib.blake2b(digest_size=16)
+    f.seek(0)
+    h.update(f.read(min(size, _HEAD_SPAN)))
+    start = max(0, size - _TAIL_SPAN)
+    f.seek(start)
+    h.update(f.read(size - start))
+    return h.hexdigest()
+
+
+def _copy_range(src, dst_path: Path, offset: int, length: int) -> None:
+    src.seek(offset)
+    with open(dst_path, "wb") as out:
+        left = length
+        while left > 0:
+            chunk = src.read(min(_COPY_CHUNK, left))
+            if not chunk:
+                break
+            out.write(chunk)
+            left -= len(chunk)
+
+
+# ======================
+# 取得
+# ======================
+
+
+def backup_file(
+    csv_path: PathLike,
+    *,
+    backup_root: Optional[PathLike] = None,
+    keep: Optional[int] = None,
+    force_full: bool = False,
+) -> Optional[dict]:
+    """
+    csv_path の現在の内容を1世代として保存し、その世代の情報（manifest の1要素）を返す。
+    ファイルが無い・無効化されている場合は None。内容が直前の世代と同じなら直前の世代を返す。
+    """
+    p = Path(csv_path)
+    if not backup_enabled() or not p.is_file():
+        return None
+    gdir = _gen_dir(p.resolve(), backup_root)
+    gdir.mkdir(parents=True, exist_ok=True)
+
+    with ledger_lock(exclusive=[gdir / MANIFEST]):
+        manifest = _load_manifest(gdir)
+        gens: List[dict] = manifest["generations"]
+        last = gens[-1] if gens else None
+
+        with open(p, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            probe = _probe(f, size)
+
+            appended = False
+            if last is not None and not force_full and size >= last["size"]:
+                appended = _probe(f, last["size"]) == last["probe"]
+            if appended and size == last["size"]:
+                return last  # 変化なし
+
+            gen_no = (last["gen"] + 1) if last else 1
+            if appended:
+                entry = {"gen": gen_no, "kind": "delta", "offset": last["size"]}
+            else:
+                entry = {"gen": gen_no, "kind": "full", "offset": 0}
+            entry.update(
+                {
+                    "size": size,
+                    "probe": probe,
+                    "blob": f"{gen_no:06d}.{entry['kind']}",
+                    "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+            )
+            _copy_range(f, gdir / entry["blob"], entry["offset"], size - entry["offset"])
+
+        gens.append(entry)
+        manifest["source"] = str(p.resolve())
+        dropped = _prune(gdir, gens, keep or keep_generations())
+        _save_manifest(gdir, manifest)
+        # manifest が新しい世代一覧を指してから、使わなくなった blob を消す
+        for blob in dropped:
+            _unlink(gdir / blob)
+    return entry
+
+
+def _prune(gdir: Path, gens: List[dict], keep: int) -> List[str]:
+    """
+    保持数を超えた古い世代を gens から外し、消してよい blob 名を返す。
+    最古の保持世代が delta なら、基の full の末尾にそこまでの delta を足してその世代の full にする
+    （コピーするのは外す delta の分だけ。ファイル全体は読み直さない）。
+    """
+    if len(gens) <= keep:
+        return []
+    first_kept = len(gens) - keep
+    target = gens[first_kept]
+    if target["kind"] != "full":
+        base = first_kept
+        while base >= 0 and gens[base]["kind"] != "full":
+            base -= 1
+        if base < 0:
+            raise BackupError(f"世代 {target['gen']} の基になる full バックアップがありません")
+        full = gens[base]
+        with open(gdir / full["blob"], "r+b") as out:
+            # 前回の畳み込みが manifest 保存前に中断していても、記録済みの長さから足し直す
+            out.truncate(full["size"])
+            out.seek(full["size"])
+            for g in gens[base + 1:first_kept + 1]:
+                if g["offset"] != full["size"]:
+                    raise BackupError(f"世代 {g['gen']} の差分位置が一致しません（offset={g['offset']}）")
+                with open(gdir / g["blob"], "rb") as src:
+                    shutil.copyfileobj(src, out, _COPY_CHUNK)
+                full = dict(full, size=g["size"])
+            out.flush()
+            os.fsync(out.fileno())
+        dropped_blob = target["blob"]
+        target.update({"kind": "full", "offset": 0, "blob": gens[base]["blob"]})
+        dropped = [g["blob"] for g in gens[:first_kept] if g["blob"] != target["blob"]]
+        dropped.append(dropped_blob)
+    else:
+        dropped = [g["blob"] for g in gens[:first_kept]]
+    del gens[:first_kept]
+    return dropped
+
+
+def _unlink(p: Path) -> None:
+    try:
+        p.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# ======================
+# 参照・復元
+# ======================
+
+
+def list_generations(csv_path: PathLike, *, backup_root: Optional[PathLike] = None) -> List[dict]:
+    return list(_load_manifest(_gen_dir(Path(csv_path).resolve(), backup_root))["generations"])
+
+
+def _write_generation(gdir: Path, gens: List[dict], idx: int, out) -> None:
+    base = idx
+    while base >= 0 and gens[base]["kind"] != "full":
+        base -= 1
+    if base < 0:
+        raise BackupError(f"世代 {gens[idx]['gen']} の基になる full バックアップがありません")
+    written = 0
+    for g in gens[base:idx + 1]:
+        if g["offset"] != written:
+            raise BackupError(f"世代 {g['gen']} の差分位置が一致しません（offset={g['offset']}, 復元済み={written}）")
+        # full の blob は畳み込みの途中で記録より長くなっていることがあるので、記録した長さだけ使う
+        left = g["size"] - g["offset"]
+        with open(gdir / g["blob"], "rb") as src:
+            while left > 0:
+                chunk = src.read(min(_COPY_CHUNK, left))
+                if not chunk:
+                    raise BackupError(f"世代 {g['gen']} のバックアップが途中で切れています: {g['blob']}")
+                out.write(chunk)
+                left -= len(chunk)
+        written = g["size"]
+
+
+def restore(
+    csv_path: PathLike,
+    generation: Optional[int] = None,
+    *,
+    dest: Optional[PathLike] = None,
+    backup_root: Optional[PathLike] = None,
+) -> Path:
+    """
+    指定世代（未指定なら最新）を復元して dest（未指定なら csv_path）に書く。
+    上書き前の csv_path も1世代として保存してから置き換える。
+    """
+    p = Path(csv_path).resolve()
+    gdir = _gen_dir(p, backup_root)
+    gens = _load_manifest(gdir)["generations"]
+    if not gens:
+        raise BackupError(f"バックアップがありません: {p.name}")
+    if generation is None:
+        idx = len(gens) - 1
+    else:
+        idx = next((i for i, g in enumerate(gens) if g["gen"] == generation), None)
+        if idx is None:
+            raise BackupError(f"世代 {generation} はありません（保持: {[g['gen'] for g in gens]}）")
+
+    out_path = Path(dest) if dest else p
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".restore.tmp")
+    with open(tmp, "wb") as out:
+        _write_generation(gdir, gens, idx, out)
+    if out_path == p and p.exists():
+        backup_file(p, backup_root=backup_root)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def _main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="台帳CSVの世代バックアップ（一覧・取得・復元）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("list", "backup", "restore"):
+        sp = sub.add_parser(name)
+        sp.add_argument("csv")
+        sp.add_argument("--backup-dir", default=None)
+        if name == "restore":
+            sp.add_argument("--gen", type=int, default=None)
+            sp.add_argument("--dest", default=None)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "list":
+        for g in list_generations(args.csv, backup_root=args.backup_dir):
+            print(f"{g['gen']:>6}  {g['kind']:<5}  {g['size']:>12,} bytes  {g['created_at']}")
+    elif args.cmd == "backup":
+        g = backup_file(args.csv, backup_root=args.backup_dir)
+        print(f"✅ SUCCESS: 世代 {g['gen']} ({g['kind']})" if g else "⚠️ WARN: バックアップ対象がありません。")
+    else:
+        out = restore(args.csv, args.gen, dest=args.dest, backup_root=args.backup_dir)
+        print(f"✅ SUCCESS: 復元しました: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
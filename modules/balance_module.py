@@ -3,7 +3,7 @@ from __future__ import annotations
 import csv
 from pathlib import Path
 from collections import defaultdict
-from typing import Dict, Iterable, Tuple, List
+from typing import Dict, Iterable, Mapping, Tuple, List
 
 from modules.utils import (
     get_project_paths,
@@ -12,7 +12,8 @@ from modules.utils import (
 )
 from modules.logger import get_logger
 
-from modules.loan_module import get_unpaid_loans_rows, calculate_total_repaid_by_loan_id
+from modules.loan_module import get_unpaid_loans_rows
+from modules.ledger_snapshot import load_repayment_totals
 
 
 # --- C-6: balance側でも明示的にスキーマ検証してログに出す ---
@@ -110,48 +111,94 @@ def _normalize_row(d: dict) -> dict:
     return {n(k): n(v) for k, v in (d or {}).items()}
 
 # --- 公開API ---
-def display_balance(customer_id: str,paths: Dict[str, Path] | None = None,today=None,clamp_negative: bool = True,) -> None:
+def compute_balances(
+    customer_ids: Iterable[str] | None = None,
+    paths: Dict[str, Path] | None = None,
+    today=None,
+    clamp_negative: bool = True,
+) -> List[dict]:
     """
-    残高を表示する(メニュー5から利用)
-    - モード9/10と同じ判定軸（loan_idベース / CANCELLED除外 / REPAYMENTのみ）で残高を算出する
+    顧客ごとの残高（display_balance と同じ集計。表示なし）。
+    - customer_ids=None なら未返済の貸付がある全顧客（customer_id 順）
+    - 指定した顧客に未返済が無ければ 0 の行を返す
+    貸付・返済は1回だけ読む（顧客数に比例して読み直さない）。
     """
     paths = paths or get_project_paths()
-    logger = get_logger("k_loan_ledger")
-
-    _preflight(paths, logger)
-
     loans_file = str(Path(paths["loans_csv"]))
     reps_file  = str(Path(paths["repayments_csv"]))
 
     unpaid_loans = get_unpaid_loans_rows(
-        customer_id,
+        None,
         loan_file=loans_file,
         repayment_file=reps_file,
         filter_mode="all",
         today=today,
     )
 
-    total_expected = 0
-    total_repaid = 0
-    total_remaining = 0
+    # REPAYMENT累計は1回だけ集計（スナップショットが新鮮ならファイル1回読み）
+    totals = load_repayment_totals(reps_file)
+    return balances_from(unpaid_loans, totals, customer_ids, clamp_negative=clamp_negative)
+
+
+def balances_from(
+    unpaid_loans: Iterable[dict],
+    totals: Mapping[str, Tuple[int, int]],
+    customer_ids: Iterable[str] | None = None,
+    clamp_negative: bool = True,
+) -> List[dict]:
+    """compute_balances の集計部分（未返済の貸付行と loan_id -> (REPAYMENT累計, LATE_FEE累計) から）。"""
+    wanted = None if customer_ids is None else list(dict.fromkeys(customer_ids))
+    balances: Dict[str, dict] = {
+        cid: {"customer_id": cid, "unpaid_loans": 0, "total_expected": 0, "total_repaid": 0, "total_remaining": 0}
+        for cid in (wanted or [])
+    }
 
     for loan in unpaid_loans:
         loan_id = loan.get("loan_id")
         if not loan_id:
             continue
+        cid = loan.get("customer_id", "")
+        if wanted is not None and cid not in balances:
+            continue
+        b = balances.setdefault(
+            cid,
+            {"customer_id": cid, "unpaid_loans": 0, "total_expected": 0, "total_repaid": 0, "total_remaining": 0},
+        )
 
         try:
             expected = int(float(loan.get("repayment_expected") or 0))
         except (ValueError, TypeError):
             expected = 0
 
-        repaid = calculate_total_repaid_by_loan_id(reps_file, loan_id)
-        raw_remaining = expected - repaid       
+        repaid = totals.get(loan_id, (0, 0))[0]
+        raw_remaining = expected - repaid
         remaining = max(0, raw_remaining) if clamp_negative else raw_remaining
 
-        total_expected += expected
-        total_repaid += repaid
-        total_remaining += remaining
+        b["unpaid_loans"] += 1
+        b["total_expected"] += expected
+        b["total_repaid"] += repaid
+        b["total_remaining"] += remaining
+
+    if wanted is not None:
+        return [balances[cid] for cid in wanted]
+    return [balances[cid] for cid in sorted(balances)]
+
+def display_balance(customer_id: str,paths: Dict[str, Path] | None = None,today=None,clamp_negative: bool = True,balance: dict | None = None,) -> None:
+    """
+    残高を表示する(メニュー5から利用)
+    - モード9/10と同じ判定軸（loan_idベース / CANCELLED除外 / REPAYMENTのみ）で残高を算出する
+    - balance（compute_balances の1行）を渡すと集計せずにそれを表示する（常駐デーモン経由）
+    """
+    paths = paths or get_project_paths()
+    logger = get_logger("k_loan_ledger")
+
+    _preflight(paths, logger)
+
+    if balance is None:
+        balance = compute_balances([customer_id], paths=paths, today=today, clamp_negative=clamp_negative)[0]
+    total_expected = balance["total_expected"]
+    total_repaid = balance["total_repaid"]
+    total_remaining = balance["total_remaining"]
 
     print("\n=== 残高照会モード ===")
     print(f"顧客ID：{customer_id}")
@@ -0,0 +1,346 @@
+# modules/csv_scanner.py
+"""
+mmap ベースの軽量 CSV スキャナ。
+
+csv.DictReader は1行ごとに dict と全列ぶんの str を作るため、
+「loan_id と repayment_amount だけ欲しい」集計でも行数ぶんのオブジェクトが発生する。
+ここではファイルを mmap してバイト列のまま行/列を分割し、
+要求された列だけを（必要なら int / date に直接）変換して返す。
+
+- 引用符(")を含む行だけは csv モジュールにフォールバックする（カンマ・改行入りのセル対策）
+- ファイルが無い/空の場合は何も返さない（_iter_repayments_rows と同じ扱い）
+"""
+from __future__ import annotations
+
+import csv
+import mmap
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+PathLike = Union[str, Path]
+
+_BOM = b"\xef\xbb\xbf"
+_NL = b"\n"
+_QUOTE = b'"'
+_COMMA = b","
+_DASH = 0x2D  # "-"
+_CHUNK = 1 << 20  # 1MiB ずつ切り出す（ページキャッシュからの読み出し単位）
+
+
+# ======================
+# 値の変換（fast path）
+# ======================
+
+
+def parse_int_field(raw: bytes) -> int:
+    """
+    金額セルを int に。"500" は bytes のまま int() に渡す（デコード不要の fast path）。
+    "500.0" のような表記は従来どおり int(float(...)) で吸収し、読めなければ 0。
+    """
+    try:
+        return int(raw)
+    except ValueError:
+        pass
+    try:
+        return int(float(raw.decode("utf-8").strip() or 0))
+    except (ValueError, UnicodeDecodeError):
+        return 0
+
+
+def parse_iso_date_field(raw: bytes) -> Optional[date]:
+    """
+    "YYYY-MM-DD" を strptime を通さずに date へ。形式外/存在しない日付は None。
+    """
+    raw = raw.strip()
+    if len(raw) != 10 or raw[4] != _DASH or raw[7] != _DASH:
+        return None
+    try:
+        return date(int(raw[0:4]), int(raw[5:7]), int(raw[8:10]))
+    except ValueError:
+        return None
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="replace")
+
+
+_CONVERTERS: Dict[str, Callable[[bytes], object]] = {
+    # bytes.decode は C 実装のメソッドなので Python 関数で包まない（1セルごとの呼び出しコスト削減）
+    "str": bytes.decode,
+    "int": parse_int_field,
+    "date": parse_iso_date_field,
+}
+
+_TEXT_CONVERTERS: Dict[str, Callable[[str], object]] = {
+    "str": lambda s: s,
+    "int": lambda s: parse_int_field(s.encode("utf-8")),
+    "date": lambda s: parse_iso_date_field(s.encode("utf-8")),
+}
+
+_MISSING: Dict[str, object] = {"str": "", "int": 0, "date": None}
+
+
+# ======================
+# ヘッダ
+# ======================
+
+
+def _default_header_normalizer(cols: List[str]) -> List[str]:
+    return [c.strip().strip('"').strip("'") for c in cols]
+
+
+def _read_header(mm: mmap.mmap) -> Tuple[List[str], int]:
+    """先頭行を csv として読み、(列名リスト, 本文の開始オフセット) を返す。"""
+    end = mm.find(_NL)
+    if end < 0:
+        end = len(mm)
+    line = mm[0:end]
+    if line.startswith(_BOM):
+        line = line[len(_BOM):]
+    text = _decode(line).rstrip("\r")
+    cols = next(csv.reader([text]), [])
+    return cols, min(end + 1, len(mm))
+
+
+# ======================
+# 行の切り出し
+# ======================
+
+
+def _record_end(mm: mmap.mmap, start: int, size: int) -> int:
+    """
+    start から始まる1レコードの終端（改行位置 or size）を返す。
+    引用符が奇数個のまま改行が来た場合はセル内改行とみなして次の行まで伸ばす。
+    """
+    end = mm.find(_NL, start)
+    if end < 0:
+        return size
+    if mm.find(_QUOTE, start, end) < 0:
+        return end
+    while mm[start:end].count(_QUOTE) % 2 == 1:
+        nxt = mm.find(_NL, end + 1)
+        if nxt < 0:
+            return size
+        end = nxt
+    return end
+
+
+def _line_starts(mm: mmap.mmap, body: int, size: int, needle: Optional[bytes]) -> Iterator[int]:
+    """
+    走査対象となる行頭オフセットを返す。
+    needle 指定時は mm.find で needle を含む行だけに飛ぶ（C 実装の検索なので全行分割より速い）。
+    """
+    if needle is None:
+        pos = body
+        while pos < size:
+            yield pos
+            pos = _record_end(mm, pos, size) + 1
+        return
+
+    pos = body
+    while pos < size:
+        hit = mm.find(needle, pos)
+        if hit < 0:
+            return
+        start = mm.rfind(_NL, body, hit) + 1
+        if start <= 0:
+            start = body
+        yield start
+        pos = _record_end(mm, start, size) + 1
+
+
+# ======================
+# 公開API
+# ======================
+
+
+def scan_columns(
+    path: PathLike,
+    columns: Sequence[str],
+    *,
+    kinds: Optional[Mapping[str, str]] = None,
+    header_normalizer: Optional[Callable[[List[str]], List[str]]] = None,
+    contains: Optional[str] = None,
+) -> Iterator[tuple]:
+    """CSV から指定列だけを取り出して tuple で順に返す。
+
+    Args:
+        path: CSV ファイルパス（UTF-8 / BOM 可）。
+        columns: 取り出す列名（ヘッダ正規化後の名前）。順序どおりの tuple を返す。
+        kinds: 列名 -> "str" / "int" / "date"。未指定は "str"。
+            "int" は読めなければ 0、"date" は YYYY-MM-DD 以外なら None。
+        header_normalizer: ヘッダ列名リストを正規化する関数（別名吸収など）。
+        contains: 指定時はこの文字列を含む行だけを走査する（事前フィルタ）。
+            呼び出し側で列値の一致を必ず再確認すること。
+
+    Returns:
+        Iterator[tuple]: 1行につき1 tuple。ヘッダに無い列/足りないセルは既定値（"" / 0 / None）。
+    """
+    p = Path(path)
+    try:
+        f = p.open("rb")
+    except FileNotFoundError:
+        return
+    with f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空ファイルは mmap できない
+            return
+        try:
+            yield from _scan_mm(mm, columns, kinds or {}, header_normalizer, contains)
+        finally:
+            mm.close()
+
+
+def _scan_mm(
+    mm: mmap.mmap,
+    columns: Sequence[str],
+    kinds: Mapping[str, str],
+    header_normalizer: Optional[Callable[[List[str]], List[str]]],
+    contains: Optional[str],
+) -> Iterator[tuple]:
+    size = len(mm)
+    header, body = _read_header(mm)
+    header = (header_normalizer or _default_header_normalizer)(header)
+    idx = {name: i for i, name in enumerate(header)}
+
+    col_kinds = [kinds.get(c, "str") for c in columns]
+    plan = [
+        (idx.get(c), _CONVERTERS[k], _TEXT_CONVERTERS[k], _MISSING[k])
+        for c, k in zip(columns, col_kinds)
+    ]
+
+    needle = contains.encode("utf-8") if contains else None
+    has_quote = mm.find(_QUOTE, body) >= 0
+    if not has_quote and needle is None:
+        yield from _scan_plain(mm, body, size, plan)
+        return
+    # 引用符入りセルがあるとセル内改行で行頭推定が狂うので、その場合は全行走査に切り替える
+    if has_quote:
+        needle = None
+
+    for start in _line_starts(mm, body, size, needle):
+        end = _record_end(mm, start, size)
+        raw = mm[start:end]
+        if raw.endswith(b"\r"):
+            raw = raw[:-1]
+        if not raw:
+            continue
+
+        if _QUOTE in raw:
+            cells = next(csv.reader([_decode(raw)]), [])
+            n = len(cells)
+            yield tuple(
+                [miss if (i is None or i >= n) else conv_text(cells[i]) for i, _conv, conv_text, miss in plan]
+            )
+            continue
+
+        yield _convert_cells(raw.split(_COMMA), plan)
+
+
+def _convert_cells(cells: List[bytes], plan) -> tuple:
+    n = len(cells)
+    return tuple([miss if (i is None or i >= n) else conv(cells[i]) for i, conv, _conv_text, miss in plan])
+
+
+def _iter_plain_lines(mm: mmap.mmap, body: int, size: int) -> Iterator[bytes]:
+    """
+    引用符を含まないファイル用：CHUNK 単位で切り出して split(b"\n") する。
+    行ごとの find/スライスを避け、ファイル全体をコピーせずに済む。
+    """
+    carry = b""
+    pos = body
+    while pos < size:
+        chunk = mm[pos:pos + _CHUNK]
+        pos += _CHUNK
+        lines = (carry + chunk).split(_NL) if carry else chunk.split(_NL)
+        carry = lines.pop() if pos < size else b""
+        for raw in lines:
+            if raw.endswith(b"\r"):
+                raw = raw[:-1]
+            if raw:
+                yield raw
+    carry = carry.rstrip(b"\r")
+    if carry:
+        yield carry
+
+
+def _scan_plain(mm: mmap.mmap, body: int, size: int, plan) -> Iterator[tuple]:
+    # 全列が揃った行は plan を引かずに変換する（列不足の行だけ _convert_cells で欠損値を埋める）
+    need = max((i for i, *_ in plan if i is not None), default=-1)
+    direct = all(i is not None for i, *_ in plan)
+    fast = [(i, conv) for i, conv, _t, _m in plan]
+    for raw in _iter_plain_lines(mm, body, size):
+        cells = raw.split(_COMMA)
+        if direct and len(cells) > need:
+            yield tuple([conv(cells[i]) for i, conv in fast])
+        else:
+            yield _convert_cells(cells, plan)
+
+
+def sum_by_key(
+    path: PathLike,
+    key_column: str,
+    amount_column: str,
+    *,
+    class_column: Optional[str] = None,
+    header_normalizer: Optional[Callable[[List[str]], List[str]]] = None,
+) -> Dict[Tuple[str, str], int]:
+    """
+    全件集計用：(key, class) -> 金額合計 を1パスで返す。
+    key/class はバイト列のまま辞書に積み、最後に一度だけデコードする（行ごとの str 生成を避ける）。
+    class_column 未指定/ヘッダに無い場合は class="" として集計する。
+    """
+    p = Path(path)
+    if not p.exists() or p.stat().st_size == 0:
+        return {}
+    acc: Dict[Tuple[bytes, bytes], int] = {}
+    with p.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        header, body = _read_header(mm)
+        header = (header_normalizer or _default_header_normalizer)(header)
+        idx = {name: i for i, name in enumerate(header)}
+        ki = idx.get(key_column)
+        ai = idx.get(amount_column)
+        ci = idx.get(class_column) if class_column else None
+        if ki is None or ai is None:
+            return {}
+
+        if mm.find(_QUOTE, body) >= 0:
+            # 引用符入りファイルは汎用経路で（正しさ優先）
+            cols = (key_column, amount_column) + ((class_column,) if ci is not None else ())
+            for row in _scan_mm(mm, cols, {amount_column: "int"}, header_normalizer, None):
+                k = (row[0].encode("utf-8"), row[2].encode("utf-8") if ci is not None else b"")
+                acc[k] = acc.get(k, 0) + row[1]
+        else:
+            need = max(ki, ai, ci if ci is not None else 0)
+            get = acc.get
+            for raw in _iter_plain_lines(mm, body, size):
+                cells = raw.split(_COMMA)
+                if len(cells) <= need:
+                    n = len(cells)
+                    key = cells[ki] if ki < n else b""
+                    amt = parse_int_field(cells[ai]) if ai < n else 0
+                    cls = cells[ci] if (ci is not None and ci < n) else b""
+                else:
+                    key = cells[ki]
+                    cls = cells[ci] if ci is not None else b""
+                    try:
+                        amt = int(cells[ai])
+                    except ValueError:
+                        amt = parse_int_field(cells[ai])
+                k = (key, cls)
+                acc[k] = get(k, 0) + amt
+
+    return {(k.decode("utf-8", errors="replace"), c.decode("utf-8", errors="replace")): v for (k, c), v in acc.items()}
+
+
+def read_header(path: PathLike) -> List[str]:
+    """ヘッダ行だけを返す（ファイルが無い/空なら []）。"""
+    p = Path(path)
+    if not p.exists() or p.stat().st_size == 0:
+        return []
+    with p.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return _read_header(mm)[0]
@@ -0,0 +1,153 @@
+# modules/file_lock.py
+"""
+台帳CSVのプロセス間ロック（fcntl.flock）。
+
+- ロックは CSV 本体ではなく隣の `<csv>.lock` に掛ける
+  （cancel_contract などは tmp → os.replace で中身を差し替えるため、本体の inode は入れ替わる）
+- 共有ロック（読むだけ）／排他ロック（読んで検証して書く）をファイルごとに指定できる
+- 複数ファイルは常にパス順で取る（取り方が揃うのでデッドロックしない）
+- 同一プロセス内では再入可能。既に持っているロックは数え上げるだけ
+- 待ち時間を記録し、get_lock_stats() で参照できる
+
+fcntl が無い環境（Windows）ではロックせずに動く（従来どおり単一プロセス前提）。
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+PathLike = Union[str, Path]
+
+LOCK_SUFFIX = ".lock"
+SHARED = "shared"
+EXCLUSIVE = "exclusive"
+
+# 同一プロセス内の保持状況: lock path -> [fd, mode, depth]
+_held: Dict[str, list] = {}
+_guard = threading.RLock()
+
+# 待ち時間メトリクス: lock path -> dict
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+class LockUpgradeError(RuntimeError):
+    """共有ロック保持中に同じファイルの排他ロックを取ろうとした（flock の昇格は原子的でない）。"""
+
+
+def lock_path_for(path: PathLike) -> str:
+    p = Path(path).resolve()
+    return str(p.with_name(p.name + LOCK_SUFFIX))
+
+
+def _record_wait(key: str, waited: float) -> None:
+    st = _stats.setdefault(
+        key, {"acquired": 0, "contended": 0, "wait_total_s": 0.0, "wait_max_s": 0.0}
+    )
+    st["acquired"] += 1
+    st["wait_total_s"] += waited
+    if waited > st["wait_max_s"]:
+        st["wait_max_s"] = waited
+
+
+def _acquire(key: str, mode: str) -> None:
+    held = _held.get(key)
+    if held is not None:
+        if held[1] == SHARED and mode == EXCLUSIVE:
+            raise LockUpgradeError(f"共有ロック保持中に排他ロックは取れません: {key}")
+        held[2] += 1
+        return
+
+    if fcntl is None:
+        _held[key] = [None, mode, 1]
+        return
+
+    os.makedirs(os.path.dirname(key) or ".", exist_ok=True)
+    fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o644)
+    op = fcntl.LOCK_SH if mode == SHARED else fcntl.LOCK_EX
+    start = time.perf_counter()
+    try:
+        # まずは待たずに取りに行き、取れなかった時だけ「競合」として数える
+        try:
+            fcntl.flock(fd, op | fcntl.LOCK_NB)
+            contended = False
+        except BlockingIOError:
+            contended = True
+            fcntl.flock(fd, op)
+    except BaseException:
+        os.close(fd)
+        raise
+    _record_wait(key, time.perf_counter() - start)
+    if contended:
+        _stats[key]["contended"] += 1
+    _held[key] = [fd, mode, 1]
+
+
+def _release(key: str) -> None:
+    held = _held.get(key)
+    if held is None:
+        return
+    held[2] -= 1
+    if held[2] > 0:
+        return
+    del _held[key]
+    fd = held[0]
+    if fd is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def ledger_lock(
+    exclusive: Iterable[PathLike] = (),
+    shared: Iterable[PathLike] = (),
+) -> Iterator[None]:
+    """
+    with ledger_lock(exclusive=[repayments_file], shared=[loans_file]):
+        ...読み取り → 検証 → 追記...
+
+    同じファイルが両方に入っていれば排他を優先する。
+    """
+    wanted: Dict[str, str] = {}
+    for p in shared:
+        if p:
+            wanted[lock_path_for(p)] = SHARED
+    for p in exclusive:
+        if p:
+            wanted[lock_path_for(p)] = EXCLUSIVE
+
+    acquired: List[str] = []
+    # flock はプロセス単位なので、同一プロセス内のスレッド間は _guard で直列化する
+    with _guard:
+        try:
+            for key in sorted(wanted):
+                _acquire(key, wanted[key])
+                acquired.append(key)
+        except BaseException:
+            for key in reversed(acquired):
+                _release(key)
+            raise
+        try:
+            yield
+        finally:
+            for key in reversed(acquired):
+                _release(key)
+
+
+def get_lock_stats() -> Dict[str, Dict[str, float]]:
+    """lock path -> {acquired, contended, wait_total_s, wait_max_s}（OSロックを実際に取った回数ぶん）。"""
+    return {k: dict(v) for k, v in _stats.items()}
+
+
+def reset_lock_stats() -> None:
+    _stats.clear()
@@ -0,0 +1,396 @@
+# modules/journal.py
+"""
+台帳CSVの先行書き込みジャーナル（WAL）。
+
+1つの業務操作（貸付登録・返済の2行分割・契約解除）で触る
+loan_v3.csv / repayments.csv / audit_log.csv への書き込みを「全部か、無しか」にそろえる。
+
+手順（redo のみのログ）:
+  0) 対象CSVの世代バックアップを取る（modules.backup、差分のみ。監査ログは追記専用なので取らない）
+  1) 書き込む内容を全部バイト列にしてから、ジャーナルに1行(JSON)で記録して fsync
+  2) 各CSVへ反映（追記は記録したオフセットへ書き込み、全体書き換えは tmp → os.replace）
+  3) 各CSVを fsync したら、ジャーナルを空にする（チェックポイント）
+
+途中で落ちても、起動時の recover() がジャーナルに残った操作をやり直す。
+やり直しは冪等（既に書かれていれば何もしない）なので、何度走っても壊れない。
+ジャーナル行自体が途中で切れている場合は、その操作は未反映のまま捨てる。
+
+group_commit() の中では CSV 側の fsync とチェックポイントをまとめて行う
+（ジャーナルの fsync は操作ごと1回。行数・ファイル数ぶんの fsync はしない）。
+世代バックアップもチェックポイントごとに対象CSV1つにつき1回（まとめの最初の書き込みの前）だけ取る。
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Union
+
+from modules.file_lock import ledger_lock
+
+PathLike = Union[str, Path]
+
+JOURNAL_NAME = "ledger.journal"
+REWRITE_SUFFIX = ".jtmp"
+DEFAULT_GROUP_SIZE = 256
+
+
+class JournalError(RuntimeError):
+    """ジャーナルに記録できない操作（同一ファイルへの追記と書き換えの混在など）。"""
+
+
+def journal_path_for(data_file: PathLike) -> Path:
+    """
+    ジャーナルの置き場所。既定は台帳CSVと同じディレクトリの ledger.journal
+    （環境変数 APP_JOURNAL_FILE で上書き可）。
+    """
+    env = os.getenv("APP_JOURNAL_FILE")
+    if env:
+        return Path(env)
+    return Path(data_file).resolve().parent / JOURNAL_NAME
+
+
+def _csv_bytes(rows: Iterable[Sequence[Any]]) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+
+def _fsync_path(path: PathLike) -> None:
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # ディレクトリの fsync 非対応（Windows 等）は無視
+        pass
+    finally:
+        os.close(fd)
+
+
+# ======================
+# トランザクション
+# ======================
+
+
+class Transaction:
+    """
+    1つの業務操作ぶんの書き込みを溜める入れ物。commit まで実ファイルには触らない。
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        self._appends: Dict[str, List[bytes]] = {}
+        self._headers: Dict[str, Optional[Sequence[str]]] = {}
+        self._rewrites: Dict[str, bytes] = {}
+        self._order: List[str] = []
+        self._audit: Set[str] = set()  # 監査ログ（世代バックアップの対象外）
+
+    def _touch(self, path: PathLike) -> str:
+        key = str(Path(path).resolve())
+        if key not in self._order:
+            self._order.append(key)
+        return key
+
+    def append_rows(
+        self,
+        path: PathLike,
+        rows: Iterable[Sequence[Any]],
+        *,
+        header: Optional[Sequence[str]] = None,
+    ) -> None:
+        """CSVに行を追記する。ファイルが無い/空なら header を先頭に付ける。"""
+        key = self._touch(path)
+        if key in self._rewrites:
+            raise JournalError(f"同一トランザクションで追記と書き換えは混在できません: {path}")
+        self._appends.setdefault(key, []).append(_csv_bytes(rows))
+        if header is not None and self._headers.get(key) is None:
+            self._headers[key] = list(header)
+
+    def rewrite_rows(self, path: PathLike, header: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+        """CSVを header + rows で丸ごと書き換える。"""
+        key = self._touch(path)
+        if key in self._appends:
+            raise JournalError(f"同一トランザクションで追記と書き換えは混在できません: {path}")
+        self._rewrites[key] = _csv_bytes([list(header), *rows])
+
+    def append_audit(
+        self,
+        action: str,
+        entity: str,
+        entity_id: Union[str, int],
+        details: Union[str, Dict[str, Any], None] = None,
+        actor: str = "CLI",
+        *,
+        path: Union[str, Path, None] = None,
+    ) -> None:
+        """modules.audit.append_audit と同じ行を、このトランザクションに含めて書く。"""
+        from modules import audit
+
+        if path is None:
+            path = audit.AUDIT_PATH
+        row = audit.format_audit_row(action, entity, entity_id, details, actor)
+        self.append_rows(path, [row], header=audit.AUDIT_HEADERS)
+        self._audit.add(self._touch(path))
+
+    def _materialize(self) -> List[dict]:
+        """ジャーナルに書く操作リストを作る（追記はこの時点のファイル末尾をオフセットにする）。"""
+        ops: List[dict] = []
+        for key in self._order:
+            if key in self._rewrites:
+                tmp = key + REWRITE_SUFFIX
+                with open(tmp, "wb") as f:
+                    f.write(self._rewrites[key])
+                    f.flush()
+                    os.fsync(f.fileno())
+                ops.append({"op": "rewrite", "path": key, "tmp": tmp})
+                continue
+            try:
+                offset = os.path.getsize(key)
+            except FileNotFoundError:
+                offset = 0
+            data = b"".join(self._appends[key])
+            header = self._headers.get(key)
+            if offset == 0 and header is not None:
+                data = _csv_bytes([header]) + data
+            if data:
+                ops.append({"op": "append", "path": key, "offset": offset, "data": data.decode("utf-8")})
+        return ops
+
+    def _discard(self) -> None:
+        for key in self._rewrites:
+            try:
+                os.remove(key + REWRITE_SUFFIX)
+            except FileNotFoundError:
+                pass
+
+
+# ======================
+# 反映・やり直し
+# ======================
+
+
+def _apply_append(path: str, offset: int, data: bytes) -> bool:
+    """
+    path の offset 以降を data にそろえる。反映したら True。
+    既に同じ内容があれば何もしない。記録した位置の内容が食い違っていれば
+    （ロックを通らない書き込み・手編集など）確定済みの記録を黙って捨てないよう JournalError を投げる
+    （ジャーナルは消さずに残るので、直してから recover をやり直せる）。
+    """
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        size = 0
+    if size < offset:
+        raise JournalError(f"ジャーナルの追記位置がファイル末尾を超えています（offset={offset}, size={size}）: {path}")
+    if size > offset:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            current = f.read(len(data) + 1)
+        if current.startswith(data):
+            return False  # 反映済み（後ろに続く記録の追記が既にあるだけ）
+        if not data.startswith(current):
+            raise JournalError(f"ジャーナル記録後にファイルが変更されています（offset={offset}）: {path}")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(data)
+    return True
+
+
+def _apply_op(op: dict) -> bool:
+    if op["op"] == "append":
+        return _apply_append(op["path"], int(op["offset"]), op["data"].encode("utf-8"))
+    if op["op"] == "rewrite":
+        if os.path.exists(op["tmp"]):
+            os.replace(op["tmp"], op["path"])
+            return True
+        return False  # 置換済み
+    raise JournalError(f"未知のジャーナル操作: {op.get('op')}")
+
+
+def _sync_targets(ops: Iterable[dict]) -> Set[str]:
+    targets: Set[str] = set()
+    for op in ops:
+        targets.add(op["path"])
+        if op["op"] == "rewrite":
+            targets.add(str(Path(op["path"]).parent))  # rename を永続化
+    return targets
+
+
+def _backup_before_write(paths: Iterable[str]) -> None:
+    """NFR Backup Policy: 書き込み前に対象CSVの世代を取る（追記分だけの差分なので軽い）。"""
+    from modules.backup import backup_file
+
+    for path in paths:
+        try:
+            backup_file(path)
+        except Exception as e:
+            print(f"⚠️ WARN: バックアップに失敗しました（書き込みは続行）: {e}。")
+
+
+# ======================
+# ジャーナル本体
+# ======================
+
+
+class Journal:
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        self._pending: Set[str] = set()  # group_commit 中、まだ fsync していないCSV
+        self._pending_count = 0
+        self._backed_up: Set[str] = set()  # 前回のチェックポイント以降に世代を取ったCSV
+
+    def _write_record(self, record: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n"
+        with open(self.path, "a+b") as f:
+            # 前回の書きかけ行に続けて書かないよう、改行で区切ってから追記する
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = "\n" + line
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def checkpoint(self) -> None:
+        """未 fsync のCSVを永続化してからジャーナルを空にする。"""
+        with ledger_lock(exclusive=[self.path]):
+            self._checkpoint_locked()
+
+    def _checkpoint_locked(self) -> None:
+        # 他プロセスが group_commit 中に残した記録の分もまとめて永続化してから消す
+        targets = set(self._pending)
+        for rec in self.records():
+            targets |= _sync_targets(rec.get("ops") or [])
+        for p in sorted(targets):
+            _fsync_path(p)
+        self._pending.clear()
+        self._pending_count = 0
+        self._backed_up.clear()
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(0)
+
+    def commit(self, tx: Transaction) -> None:
+        # ジャーナルは同じデータディレクトリを使う全プロセスで共有するので、
+        # 記録 → 反映 → チェックポイントの間は排他ロックを持つ
+        with ledger_lock(exclusive=[self.path]):
+            self._commit_locked(tx)
+
+    def _commit_locked(self, tx: Transaction) -> None:
+        grouped = _group_depth > 0
+        # 書き換えを含む操作の前に溜まっている分を確定させる
+        # （古い追記のやり直しが書き換え後のファイルに当たらないように）
+        if tx._rewrites and (self._pending or self.path.exists() and self.path.stat().st_size):
+            self._checkpoint_locked()
+        # 追記位置を決めてから反映し終えるまで、対象CSVにも排他ロックを持つ
+        # （ジャーナルを通らない追記（監査ログ等）が間に入ると、記録した位置がずれる）
+        with ledger_lock(exclusive=tx._order):
+            ops = tx._materialize()
+            if not ops:
+                return
+            # 世代はチェックポイントの区切りごとに1回（group_commit 中の後続の追記はジャーナルが守る）
+            targets = [op["path"] for op in ops if op["path"] not in tx._audit and op["path"] not in self._backed_up]
+            _backup_before_write(targets)
+            self._backed_up.update(targets)
+            self._write_record({"tx": uuid.uuid4().hex, "label": tx.label, "ops": ops})
+            for op in ops:
+                _apply_op(op)
+
+        self._pending |= _sync_targets(ops)
+        self._pending_count += 1
+        if not grouped or tx._rewrites or self._pending_count >= _group_size:
+            self._checkpoint_locked()
+        else:
+            _group_journals.add(self)
+
+    def records(self) -> Iterator[dict]:
+        """完全に書けている記録だけを返す（末尾の書きかけ行は捨てる）。"""
+        try:
+            raw = self.path.read_bytes()
+        except FileNotFoundError:
+            return
+        for line in raw.split(b"\n")[:-1]:
+            try:
+                yield json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+
+    def recover(self) -> int:
+        """ジャーナルに残った操作をやり直す。実際に反映した操作数を返す。"""
+        applied = 0
+        with ledger_lock(exclusive=[self.path]):
+            for rec in self.records():
+                for op in rec.get("ops") or []:
+                    if _apply_op(op):
+                        applied += 1
+            self._checkpoint_locked()
+        return applied
+
+
+_journals: Dict[str, Journal] = {}
+_group_depth = 0
+_group_size = DEFAULT_GROUP_SIZE
+_group_journals: Set[Journal] = set()
+
+
+def get_journal(path: PathLike) -> Journal:
+    key = str(Path(path).resolve())
+    j = _journals.get(key)
+    if j is None:
+        j = _journals[key] = Journal(key)
+    return j
+
+
+@contextmanager
+def transaction(label: str, *, journal: PathLike) -> Iterator[Transaction]:
+    """
+    with transaction("REGISTER_REPAYMENT", journal=journal_path_for(loans_file)) as tx:
+        tx.append_rows(...); tx.append_audit(...)
+    ブロックを正常に抜けたときだけ、まとめて反映する。
+    """
+    tx = Transaction(label)
+    try:
+        yield tx
+    except BaseException:
+        tx._discard()
+        raise
+    get_journal(journal).commit(tx)
+
+
+@contextmanager
+def group_commit(size: int = DEFAULT_GROUP_SIZE) -> Iterator[None]:
+    """
+    一括投入向け。中のトランザクションはジャーナルの fsync だけで確定扱いにし、
+    CSV の fsync とチェックポイントは size 件ごと／ブロック終了時にまとめて行う。
+    """
+    global _group_depth, _group_size
+    prev_size = _group_size
+    _group_depth += 1
+    _group_size = max(1, int(size))
+    try:
+        yield
+    finally:
+        _group_depth -= 1
+        _group_size = prev_size
+        if _group_depth == 0:
+            for j in list(_group_journals):
+                j.checkpoint()
+            _group_journals.clear()
+
+
+def recover(journal: PathLike) -> int:
+    """起動時のリカバリ。ジャーナルが無ければ 0。"""
+    if not Path(journal).exists():
+        return 0
+    return get_journal(journal).recover()
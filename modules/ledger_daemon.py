@@ -0,0 +1,507 @@
+# modules/ledger_daemon.py
+"""
+台帳の常駐デーモン（任意）。
+
+main.py は起動のたびに CSV を読み直す。大きな台帳で照会を繰り返すなら、
+このデーモンを常駐させておくと、貸付行と loan_id ごとの返済累計をメモリに持ったまま
+ローカルの Unix ソケットで答える（main.py のバッチ用サブコマンド・メニュー 5/9/10 が使う）。
+
+- 起動:  python main.py serve              （既定のソケットは <台帳ディレクトリ>/ledger.sock）
+- 利用:  ソケットがあれば main.py が自動で使う。繋がらなければ従来どおり CSV を読む
+- 書き込み（返済登録・契約解除）は loan_module の通常の経路（ロック・ジャーナル・監査）で行う
+- CSV の変化は要求ごとに stat で確かめる。追記だけなら増えたバイトだけ読んで足し込み、
+  書き換え（契約解除・マイグレーション・手編集）なら読み直す。他のプロセスの書き込みも拾う
+- 要求は1本のソケットで1つずつ処理する（状態の更新と照会が混ざらない）
+
+プロトコル: 1行1つの JSON（{"op": ..., ...}）を送り、1行の JSON（{"ok": true, ...}）を受け取る。
+環境変数 APP_LEDGER_SOCKET でソケットの場所を上書き可。
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import socket
+import socketserver
+from contextlib import redirect_stdout
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from modules.csv_scanner import parse_int_field, read_header
+from modules.file_lock import ledger_lock
+from modules.logger import get_logger
+
+PathLike = Union[str, Path]
+
+SOCKET_NAME = "ledger.sock"
+_HEAD_SPAN = 4096
+_TAIL_SPAN = 256
+
+logger = get_logger("ledger_daemon")
+
+
+class DaemonUnavailable(RuntimeError):
+    """ソケットが無い・繋がらない（要求は届いていない。呼び出し側はローカル実行に戻ってよい）。"""
+
+
+class DaemonError(RuntimeError):
+    """要求を送ったあとの失敗（応答が無い・壊れている）。書き込みが済んだかどうかは分からない。"""
+
+
+def socket_path_for(loans_file: PathLike) -> Path:
+    env = os.getenv("APP_LEDGER_SOCKET")
+    if env:
+        return Path(env)
+    return Path(loans_file).resolve().parent / SOCKET_NAME
+
+
+# ======================
+# CSV の読み進め位置
+# ======================
+
+
+class _Cursor:
+    """
+    どこまで読んだか（offset）と、その時点のファイルの目印。
+    同じ inode で offset より後ろが増えただけ（先頭と offset 直前のバイトが同じ）なら追記とみなす。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.stat_key: Optional[Tuple[int, int, int, int]] = None  # (dev, ino, size, mtime_ns)
+        self.offset = 0
+        self.head = b""
+        self.tail = b""
+        self.clean = False  # 読み終えた位置が行の終わりか（そうでなければ次の変化で読み直す）
+
+    @staticmethod
+    def _stat_key(path: Path) -> Optional[Tuple[int, int, int, int]]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def changed(self) -> bool:
+        return self._stat_key(self.path) != self.stat_key
+
+    def appended(self) -> Optional[bytes]:
+        """追記分のバイト（行の途中までは読まない）。追記でなければ None。"""
+        key = self._stat_key(self.path)
+        if not self.clean or key is None or key[:2] != self.stat_key[:2] or key[2] < self.offset:
+            return None
+        with self.path.open("rb") as f:
+            if f.read(len(self.head)) != self.head:
+                return None
+            f.seek(self.offset - len(self.tail))
+            if f.read(len(self.tail)) != self.tail:
+                return None
+            data = f.read(key[2] - self.offset)
+        # 改行で終わっていない最後の行は、続きが書かれてから読む
+        end = data.rfind(b"\n") + 1
+        self.stat_key = key
+        self.offset += end
+        self.tail = (self.tail + data[:end])[-_TAIL_SPAN:]
+        return data[:end]
+
+    def reset(self) -> None:
+        """ファイル全体を読み終えた位置に合わせる（最後の行が改行で終わっていなければ次は読み直す）。"""
+        key = self._stat_key(self.path)
+        self.stat_key = key
+        if key is None:
+            self.offset, self.head, self.tail, self.clean = 0, b"", b"", False
+            return
+        with self.path.open("rb") as f:
+            self.head = f.read(_HEAD_SPAN)
+            f.seek(max(0, key[2] - _TAIL_SPAN))
+            self.tail = f.read(_TAIL_SPAN)
+        self.offset = key[2]
+        self.clean = self.tail.endswith(b"\n")
+
+
+def _csv_rows(data: bytes) -> Iterable[List[str]]:
+    for row in csv.reader(io.StringIO(data.decode("utf-8"), newline="")):
+        if row:
+            yield row
+
+
+# ======================
+# メモリ上の台帳
+# ======================
+
+
+class LedgerState:
+    """
+    貸付行（load_loan_rows と同じ dict）・顧客ごとの索引・loan_id ごとの (REPAYMENT累計, LATE_FEE累計)。
+    refresh() で CSV の変化を取り込む。generation は中身が変わるたびに増える。
+    """
+
+    def __init__(self, loans_file: PathLike, repayments_file: PathLike):
+        self.loans_file = str(Path(loans_file).resolve())
+        self.repayments_file = str(Path(repayments_file).resolve())
+        self.loans: List[Dict[str, str]] = []
+        self.by_customer: Dict[str, List[Dict[str, str]]] = {}
+        self.by_id: Dict[str, Dict[str, str]] = {}
+        self.totals: Dict[str, Tuple[int, int]] = {}
+        self.generation = 0
+        self.reloads = {"loans": 0, "repayments": 0}
+        self._loan_columns: List[str] = []
+        self._rep_columns: List[str] = []
+        self._cursors = {
+            "loans": _Cursor(Path(self.loans_file)),
+            "repayments": _Cursor(Path(self.repayments_file)),
+        }
+        self._memo: Dict[tuple, object] = {}
+
+    # ---- 取り込み ----
+
+    def refresh(self) -> None:
+        loans, reps = self._cursors["loans"], self._cursors["repayments"]
+        if not (loans.changed() or reps.changed()):
+            return
+        # 書き込み側は排他ロックを持って書くので、共有ロックの間はファイルが止まっている
+        with ledger_lock(shared=[self.loans_file, self.repayments_file]):
+            changed = False
+            if loans.changed():
+                data = loans.appended()
+                if data is None:
+                    self._load_loans()
+                else:
+                    self._add_loans(data)
+                changed = True
+            if reps.changed():
+                data = reps.appended()
+                if data is None:
+                    self._load_repayments()
+                else:
+                    self._add_repayments(data)
+                changed = True
+        if changed:
+            self.generation += 1
+            self._memo.clear()
+
+    def _load_loans(self) -> None:
+        from modules.ledger_snapshot import load_loan_rows
+
+        self.reloads["loans"] += 1
+        cursor = self._cursors["loans"]
+        cursor.reset()
+        self._loan_columns = [
+            c.lstrip("\ufeff").strip().strip('"').strip("'") for c in read_header(self.loans_file)
+        ]
+        self.loans, self.by_customer, self.by_id = [], {}, {}
+        if cursor.stat_key is not None:
+            for row in load_loan_rows(self.loans_file):
+                self._index_loan(row)
+
+    def _add_loans(self, data: bytes) -> None:
+        columns = self._loan_columns
+        for cells in _csv_rows(data):
+            cells = cells + [""] * (len(columns) - len(cells))
+            self._index_loan(dict(zip(columns, cells)))
+
+    def _index_loan(self, row: Dict[str, str]) -> None:
+        self.loans.append(row)
+        self.by_customer.setdefault(row.get("customer_id", ""), []).append(row)
+        self.by_id.setdefault(row.get("loan_id", ""), row)  # get_loan_info_by_loan_id と同じく先頭を使う
+
+    def _load_repayments(self) -> None:
+        from modules.ledger_snapshot import load_repayment_totals
+        from modules.loan_module import _repayments_header_normalizer
+
+        self.reloads["repayments"] += 1
+        cursor = self._cursors["repayments"]
+        cursor.reset()
+        header = read_header(self.repayments_file)
+        self._rep_columns = _repayments_header_normalizer(header) if header else []
+        self.totals = dict(load_repayment_totals(self.repayments_file)) if cursor.stat_key else {}
+
+    def _add_repayments(self, data: bytes) -> None:
+        index = {name: i for i, name in enumerate(self._rep_columns)}
+        i_loan, i_amount, i_type = (index.get(c) for c in ("loan_id", "repayment_amount", "payment_type"))
+
+        def cell(cells, i):
+            return cells[i] if i is not None and i < len(cells) else ""
+
+        for cells in _csv_rows(data):
+            loan_id = cell(cells, i_loan)
+            amount = parse_int_field(cell(cells, i_amount).encode("utf-8"))
+            kind = cell(cells, i_type).strip().upper()
+            repaid, late_fee = self.totals.get(loan_id, (0, 0))
+            if kind in ("", "REPAYMENT"):
+                self.totals[loan_id] = (repaid + amount, late_fee)
+            elif kind == "LATE_FEE":
+                self.totals[loan_id] = (repaid, late_fee + amount)
+
+    # ---- 照会 ----
+
+    def loans_of(self, customers: Optional[Iterable[str]]) -> List[Dict[str, str]]:
+        if customers is None:
+            return self.loans
+        return [row for cid in dict.fromkeys(customers) for row in self.by_customer.get(cid, [])]
+
+    def missing_customers(self, customers: Optional[Iterable[str]]) -> List[str]:
+        if customers is None:
+            return []
+        return [cid for cid in customers if cid not in self.by_customer]
+
+    def unpaid_rows(self, customers: Optional[List[str]], filter_mode: str, today: date) -> List[dict]:
+        """main.py cmd_unpaid と同じ行（customers を渡したらその順に並べる）。"""
+        from modules.loan_module import build_unpaid_loan_rows, unpaid_rows_from
+
+        if today < date.today():
+            # 過去日付は延滞スナップショット（その日時点の累計）を使う経路に任せる
+            rows = build_unpaid_loan_rows(
+                None, self.loans_file, self.repayments_file, filter_mode=filter_mode, today=today
+            )
+            if customers is None:
+                return rows
+            by_customer: Dict[str, List[dict]] = {}
+            for row in rows:
+                by_customer.setdefault(row["customer_id"], []).append(row)
+            return [row for cid in dict.fromkeys(customers) for row in by_customer.get(cid, [])]
+
+        if customers is not None:
+            return [
+                row
+                for cid in dict.fromkeys(customers)
+                for row in unpaid_rows_from(self.by_customer.get(cid, []), self.totals,
+                                            filter_mode=filter_mode, today=today)
+            ]
+        key = ("unpaid", filter_mode, today)
+        if key not in self._memo:
+            self._memo[key] = unpaid_rows_from(self.loans, self.totals, filter_mode=filter_mode, today=today)
+        return self._memo[key]
+
+    def balances(self, customers: Optional[List[str]], today: date) -> List[dict]:
+        from modules.balance_module import balances_from
+        from modules.loan_module import select_unpaid_loans
+
+        unpaid = select_unpaid_loans(self.loans_of(customers), self.totals, today=today)
+        return balances_from(unpaid, self.totals, customers)
+
+    def summary(self, today: date) -> dict:
+        from modules.ledger_stats import get_stats, portfolio_summary, summary_row
+
+        portfolio = portfolio_summary(get_stats(self.loans_file, self.repayments_file), today)
+        return summary_row(today, portfolio, self.unpaid_rows(None, "all", today))
+
+
+# ======================
+# 要求の処理
+# ======================
+
+
+def _today(req: dict) -> date:
+    value = req.get("today")
+    return date.fromisoformat(value) if value else date.today()
+
+
+def _op_ping(state: LedgerState, req: dict) -> dict:
+    return {
+        "pid": os.getpid(),
+        "loans_file": state.loans_file,
+        "repayments_file": state.repayments_file,
+        "loans": len(state.loans),
+        "generation": state.generation,
+        "reloads": dict(state.reloads),
+    }
+
+
+def _op_unpaid(state: LedgerState, req: dict) -> dict:
+    customers = req.get("customers")
+    rows = state.unpaid_rows(customers, req.get("filter_mode", "all"), _today(req))
+    return {"rows": rows, "missing": state.missing_customers(customers)}
+
+
+def _op_balance(state: LedgerState, req: dict) -> dict:
+    customers = req.get("customers")
+    return {"rows": state.balances(customers, _today(req)), "missing": state.missing_customers(customers)}
+
+
+def _op_summary(state: LedgerState, req: dict) -> dict:
+    return {"result": state.summary(_today(req))}
+
+
+def _op_register_repayment(state: LedgerState, req: dict) -> dict:
+    from modules.loan_module import register_repayment_complete
+
+    loan_id = req["loan_id"]
+    if loan_id not in state.by_id:
+        return {"found": False}
+    summary = register_repayment_complete(
+        loans_file=state.loans_file,
+        repayments_file=state.repayments_file,
+        loan_id=loan_id,
+        amount=int(req["amount"]),
+        repayment_date=req["repayment_date"],
+        actor=req.get("actor", "BATCH"),
+    )
+    state.refresh()
+    return {"found": True, "result": summary or None}
+
+
+def _op_cancel(state: LedgerState, req: dict) -> dict:
+    from modules.loan_module import cancel_contract
+
+    loan_id = req["loan_id"]
+    if loan_id not in state.by_id:
+        return {"found": False}
+    ok = cancel_contract(state.loans_file, loan_id, reason=req.get("reason", ""),
+                         operator=req.get("actor", "BATCH"))
+    state.refresh()
+    return {"found": True, "result": bool(ok)}
+
+
+OPS: Dict[str, Callable[[LedgerState, dict], dict]] = {
+    "ping": _op_ping,
+    "unpaid": _op_unpaid,
+    "balance": _op_balance,
+    "summary": _op_summary,
+    "register-repayment": _op_register_repayment,
+    "cancel": _op_cancel,
+}
+
+
+def handle(state: LedgerState, req: dict) -> dict:
+    """
+    要求1つを処理して応答を返す。モジュール関数の表示（print）は messages に入れて返す
+    （クライアントが標準エラーに出す。ローカルのバッチ実行と同じ振る舞い）。
+    """
+    # rejected: 何も実行していない（クライアントはローカル実行に戻ってよい）
+    op = OPS.get(req.get("op"))
+    if op is None:
+        return {"ok": False, "rejected": True, "error": f"unknown op: {req.get('op')!r}"}
+    loans_file = req.get("loans_file")
+    if loans_file and str(Path(loans_file).resolve()) != state.loans_file:
+        return {"ok": False, "rejected": True, "error": f"ledger mismatch: serving {state.loans_file}"}
+
+    buf = io.StringIO()
+    try:
+        with redirect_stdout(buf):
+            state.refresh()
+            result = op(state, req)
+    except Exception as e:
+        logger.error(f"Daemon op failed: {req.get('op')}: {e}", exc_info=True)
+        return {"ok": False, "error": str(e), "messages": buf.getvalue()}
+    return {"ok": True, "messages": buf.getvalue(), **result}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    timeout = 30.0  # 要求を送らずに繋ぎっぱなしのクライアントで他を待たせない
+
+    def handle(self) -> None:
+        try:
+            self._serve_lines()
+        except (socket.timeout, ConnectionError):
+            pass
+
+    def _serve_lines(self) -> None:
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+            except ValueError:
+                resp = {"ok": False, "error": "malformed request"}
+            else:
+                if req.get("op") == "shutdown":
+                    self._send({"ok": True})
+                    self.server.stopping = True
+                    return
+                resp = handle(self.server.state, req)
+            self._send(resp)
+
+    def _send(self, resp: dict) -> None:
+        self.wfile.write(json.dumps(resp, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class LedgerServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_path: PathLike, state: LedgerState):
+        self.state = state
+        self.stopping = False
+        self.socket_path = str(socket_path)
+        old_umask = os.umask(0o177)  # 自分だけが読み書きできるソケット
+        try:
+            super().__init__(self.socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def serve_until_shutdown(self) -> None:
+        while not self.stopping:
+            self.handle_request()
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def serve(loans_file: PathLike, repayments_file: PathLike, socket_path: Optional[PathLike] = None) -> int:
+    """台帳を読み込み、shutdown を受けるまでソケットで答える。"""
+    socket_path = Path(socket_path or socket_path_for(loans_file))
+    if socket_path.exists():
+        try:
+            call(socket_path, {"op": "ping"}, timeout=1.0)
+        except (DaemonUnavailable, DaemonError):
+            socket_path.unlink()  # 前回の異常終了で残ったソケット
+        else:
+            print(f"❌ ERROR: 既にデーモンが動いています: {socket_path}。")
+            return 1
+
+    state = LedgerState(loans_file, repayments_file)
+    state.refresh()
+    server = LedgerServer(socket_path, state)
+    logger.info(f"Ledger daemon listening on {socket_path} (loans={len(state.loans)})")
+    print(f"✅ SUCCESS: 台帳デーモンを起動しました: {socket_path}（貸付 {len(state.loans):,} 件）。")
+    try:
+        server.serve_until_shutdown()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("Ledger daemon stopped")
+    return 0
+
+
+# ======================
+# クライアント
+# ======================
+
+
+def call(socket_path: PathLike, request: dict, *, timeout: float = 30.0) -> dict:
+    """
+    要求を1つ送って応答を返す。
+    繋がらなければ DaemonUnavailable、送ったあとに失敗したら DaemonError。
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        try:
+            s.connect(str(socket_path))
+        except OSError as e:
+            raise DaemonUnavailable(str(e)) from e
+        try:
+            s.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            with s.makefile("rb") as f:
+                line = f.readline()
+        except OSError as e:
+            raise DaemonError(str(e)) from e
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        raise DaemonError(f"malformed response: {line[:80]!r}") from e
+
+
+def find_daemon(loans_file: PathLike, *, timeout: float = 1.0) -> Optional[Path]:
+    """loans_file を受け持つデーモンが応答すればソケットのパス、なければ None。"""
+    path = socket_path_for(loans_file)
+    if not path.exists():
+        return None
+    try:
+        resp = call(path, {"op": "ping", "loans_file": str(loans_file)}, timeout=timeout)
+    except (DaemonUnavailable, DaemonError):
+        return None
+    return path if resp.get("ok") else None
@@ -0,0 +1,343 @@
+# modules/ledger_snapshot.py
+"""
+data/*.csv の派生キャッシュ（バイナリスナップショット）。
+
+CSV が正データであることは変わらない。ここでは CSV を一度パースした結果を
+列指向の配列（array）＋文字列テーブルとして `<csv>.snap` に書き出し、
+次回以降はファイル1回の読み込みで復元する。
+
+- 鮮度キー：元CSVの size / mtime_ns / 先頭・末尾 64KiB の blake2b
+  → 一致しなければ（追記・書き換え・差し替え）透過的に作り直す
+- 書き込みは tmp → os.replace のアトミック置換。書けない環境（読み取り専用など）では
+  キャッシュなしで動く（CSV を直接読んだ結果を返すだけ）
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from array import array
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from modules.csv_scanner import read_header, scan_columns
+
+PathLike = Union[str, Path]
+
+SNAPSHOT_SUFFIX = ".snap"
+_MAGIC = b"KLSNAP01"
+_VERSION = 1
+_DIGEST_SPAN = 64 * 1024
+_SEP = "\x00"  # csv モジュールは NUL を含むセルを読めないので区切りに使える
+
+# プロセス内メモ（同じCSVを1コマンド中に何度も読むケース向け）: (path, kind) -> (source_key, _Snapshot)
+_memo: Dict[Tuple[str, str], Tuple[dict, "_Snapshot"]] = {}
+
+
+# ======================
+# 鮮度キー
+# ======================
+
+
+def source_key(path: PathLike) -> Optional[dict]:
+    """元CSVの鮮度キーを返す。ファイルが無ければ None。"""
+    p = Path(path)
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    with p.open("rb") as f:
+        h.update(f.read(_DIGEST_SPAN))
+        if st.st_size > _DIGEST_SPAN:
+            f.seek(max(_DIGEST_SPAN, st.st_size - _DIGEST_SPAN))
+            h.update(f.read(_DIGEST_SPAN))
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": h.hexdigest()}
+
+
+def snapshot_path(path: PathLike) -> Path:
+    p = Path(path)
+    return p.with_name(p.name + SNAPSHOT_SUFFIX)
+
+
+# ======================
+# 入出力（汎用）
+# ======================
+
+
+class _Snapshot:
+    def __init__(self, meta: dict, strings: List[str], arrays: Dict[str, array]):
+        self.meta = meta
+        self.strings = strings
+        self.arrays = arrays
+        self.derived: Dict[str, object] = {}  # スナップショットから組み立てた値のメモ
+
+
+def _write(path: Path, kind: str, key: dict, strings: List[str], arrays: Dict[str, array]) -> None:
+    sections = []
+    blobs = []
+    offset = 0
+    str_blob = _SEP.join(strings).encode("utf-8")
+    sections.append({"name": "__strings__", "typecode": "", "offset": 0, "length": len(str_blob)})
+    blobs.append(str_blob)
+    offset += len(str_blob)
+    for name, arr in arrays.items():
+        raw = arr.tobytes()
+        sections.append({"name": name, "typecode": arr.typecode, "offset": offset, "length": len(raw)})
+        blobs.append(raw)
+        offset += len(raw)
+
+    meta = {
+        "version": _VERSION,
+        "kind": kind,
+        "source": key,
+        "n_strings": len(strings),
+        "sections": sections,
+    }
+    head = json.dumps(meta, sort_keys=True).encode("utf-8")
+
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    with tmp.open("wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<I", len(head)))
+        f.write(head)
+        for b in blobs:
+            f.write(b)
+    os.replace(tmp, path)
+
+
+def _read(path: Path, kind: str, key: dict) -> Optional[_Snapshot]:
+    try:
+        buf = path.read_bytes()
+    except OSError:
+        return None
+    if len(buf) < len(_MAGIC) + 4 or not buf.startswith(_MAGIC):
+        return None
+    (head_len,) = struct.unpack_from("<I", buf, len(_MAGIC))
+    start = len(_MAGIC) + 4
+    try:
+        meta = json.loads(buf[start:start + head_len].decode("utf-8"))
+    except ValueError:
+        return None
+    if meta.get("version") != _VERSION or meta.get("kind") != kind or meta.get("source") != key:
+        return None
+
+    view = memoryview(buf)[start + head_len:]
+    strings: List[str] = []
+    arrays: Dict[str, array] = {}
+    for sec in meta["sections"]:
+        raw = view[sec["offset"]:sec["offset"] + sec["length"]]
+        if sec["name"] == "__strings__":
+            strings = bytes(raw).decode("utf-8").split(_SEP) if meta["n_strings"] else []
+            continue
+        arr = array(sec["typecode"])
+        arr.frombytes(raw)
+        arrays[sec["name"]] = arr
+    if len(strings) != meta["n_strings"]:
+        return None
+    return _Snapshot(meta, strings, arrays)
+
+
+def _load(csv_path: PathLike, kind: str, build):
+    """
+    鮮度キーが一致するスナップショット（プロセス内メモ → .snap）を返す。
+    無い/古い場合は build(csv_path) で作り直して保存する。
+    """
+    p = Path(csv_path)
+    key = source_key(p)
+    if key is None:
+        return None
+    memo_key = (str(p.resolve()), kind)
+    hit = _memo.get(memo_key)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+
+    snap_file = snapshot_path(p)
+    snap = _read(snap_file, kind, key)
+    if snap is None:
+        strings, arrays = build(p)
+        snap = _Snapshot({"kind": kind, "source": key}, strings, arrays)
+        # パース中に追記されていたらキャッシュしない（次回作り直す）
+        if source_key(p) == key:
+            try:
+                _write(snap_file, kind, key, strings, arrays)
+            except OSError:
+                pass
+    _memo[memo_key] = (key, snap)
+    return snap
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def add(self, s: str) -> int:
+        i = self._index.get(s)
+        if i is None:
+            i = self._index[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+
+# ======================
+# 貸付（loan_v3.csv）
+# ======================
+
+
+class LoanTable:
+    """
+    loan_v3.csv の列指向表現。各列は文字列テーブルへの index 配列（uint32）。
+    行 dict は必要な分だけ row()/rows_where() で組み立てる。
+    """
+
+    def __init__(self, columns: List[str], strings: List[str], arrays: Dict[str, array]):
+        self.columns = columns
+        self.strings = strings
+        self._cols = [arrays[f"col:{c}"] for c in columns]
+        self._by_name = dict(zip(columns, self._cols))
+        self._lookup: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._cols[0]) if self._cols else 0
+
+    def row(self, i: int) -> Dict[str, str]:
+        s = self.strings
+        return {name: s[col[i]] for name, col in zip(self.columns, self._cols)}
+
+    def rows(self) -> Iterator[Dict[str, str]]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def column(self, name: str) -> List[str]:
+        col = self._by_name.get(name)
+        if col is None:
+            return [""] * len(self)
+        s = self.strings
+        return [s[k] for k in col]
+
+    def rows_where(self, column: str, value: str) -> List[Dict[str, str]]:
+        col = self._by_name.get(column)
+        if col is None:
+            return []
+        if self._lookup is None:
+            self._lookup = {v: i for i, v in enumerate(self.strings)}
+        k = self._lookup.get(value)
+        if k is None:
+            return []
+        return [self.row(i) for i, v in enumerate(col) if v == k]
+
+
+def _build_loans(p: Path):
+    columns = read_header(p)
+    columns = [c.lstrip("\ufeff").strip().strip('"').strip("'") for c in columns]
+    table = _StringTable()
+    table.add("")
+    cols = [array("I") for _ in columns]
+    for row in scan_columns(p, columns):
+        for arr, v in zip(cols, row):
+            arr.append(table.add(v))
+    arrays = {f"col:{c}": arr for c, arr in zip(columns, cols)}
+    arrays["__columns__"] = array("I", [table.add(c) for c in columns])
+    return table.strings, arrays
+
+
+def load_loan_table(loans_file: PathLike) -> Optional[LoanTable]:
+    """loan_v3.csv を LoanTable で返す（ファイルが無ければ None）。"""
+    snap = _load(loans_file, "loans", _build_loans)
+    if snap is None:
+        return None
+    table = snap.derived.get("table")
+    if table is None:
+        columns = [snap.strings[i] for i in snap.arrays["__columns__"]]
+        table = snap.derived["table"] = LoanTable(columns, snap.strings, snap.arrays)
+    return table
+
+
+def load_loan_rows(loans_file: PathLike, *, customer_id: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    loan_v3.csv の行を dict のリストで返す（csv.DictReader 相当）。
+    customer_id 指定時はその顧客の行だけを組み立てる。ファイルが無ければ FileNotFoundError。
+    """
+    table = load_loan_table(loans_file)
+    if table is None:
+        raise FileNotFoundError(str(loans_file))
+    if customer_id is not None:
+        return table.rows_where("customer_id", customer_id)
+    return list(table.rows())
+
+
+# ======================
+# 返済（repayments.csv）
+# ======================
+
+
+def _build_repayments(p: Path):
+    # 列名の別名吸収は loan_module 側と同一ルールにそろえる（循環 import を避けて遅延 import）
+    from modules.loan_module import _repayments_header_normalizer
+
+    table = _StringTable()
+    table.add("")
+    loan_col, cust_col, date_col, type_col = array("I"), array("I"), array("I"), array("I")
+    amount_col = array("q")
+    repaid: Dict[int, int] = {}
+    late_fee: Dict[int, int] = {}
+    for loan_id, customer_id, amt, rdate, ptype in scan_columns(
+        p,
+        ("loan_id", "customer_id", "repayment_amount", "repayment_date", "payment_type"),
+        kinds={"repayment_amount": "int"},
+        header_normalizer=_repayments_header_normalizer,
+    ):
+        li = table.add(loan_id)
+        loan_col.append(li)
+        cust_col.append(table.add(customer_id))
+        amount_col.append(amt)
+        date_col.append(table.add(rdate))
+        type_col.append(table.add(ptype))
+        kind = ptype.strip().upper()
+        if kind in ("", "REPAYMENT"):
+            repaid[li] = repaid.get(li, 0) + amt
+        elif kind == "LATE_FEE":
+            late_fee[li] = late_fee.get(li, 0) + amt
+
+    keys = sorted(set(repaid) | set(late_fee))
+    arrays = {
+        "loan_id": loan_col,
+        "customer_id": cust_col,
+        "repayment_amount": amount_col,
+        "repayment_date": date_col,
+        "payment_type": type_col,
+        # 派生：loan_id ごとの累計（一覧/残高表示が毎回全件集計しないため）
+        "totals:loan": array("I", keys),
+        "totals:repaid": array("q", (repaid.get(k, 0) for k in keys)),
+        "totals:late_fee": array("q", (late_fee.get(k, 0) for k in keys)),
+    }
+    return table.strings, arrays
+
+
+def load_repayment_totals(repayments_file: PathLike) -> Mapping[str, Tuple[int, int]]:
+    """
+    loan_id -> (REPAYMENT累計, LATE_FEE累計)。
+    loan_module.calculate_total_repaid_by_loan_id / calculate_total_late_fee_paid_by_loan_id と
+    同じ値を、全 loan_id 分まとめてスナップショット経由で返す。
+    プロセス内メモを呼び出し元どうしで共有するので読み取り専用（書き換えるなら dict(...) で複製する）。
+    """
+    snap = _load(repayments_file, "repayments", _build_repayments)
+    if snap is None:
+        return MappingProxyType({})
+    totals = snap.derived.get("totals")
+    if totals is None:
+        s = snap.strings
+        a = snap.arrays
+        totals = snap.derived["totals"] = MappingProxyType({
+            s[k]: (r, f)
+            for k, r, f in zip(a["totals:loan"], a["totals:repaid"], a["totals:late_fee"])
+        })
+    return totals
+
+
+def clear_memo() -> None:
+    """プロセス内メモを捨てる（テストや長寿命プロセス向け）。"""
+    _memo.clear()
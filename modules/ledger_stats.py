@@ -0,0 +1,337 @@
+# modules/ledger_stats.py
+"""
+台帳全体の集計（件数・貸付総額・返済総額・残高・延滞件数/金額）のサイドカー。
+
+main.py --summary は `<台帳ディレクトリ>/ledger_stats.json` を読むだけで答える
+（台帳CSVは開かない。数GBの台帳でも監視スクリプトから毎分呼べるように）。
+
+- 貸付登録・返済登録・契約解除のたびに loan_module から差分で更新する
+- サイドカーには最後に反映した時点の CSV の鮮度キー（size / mtime_ns / 末尾の blake2b）を持つ。
+  一致しなければ（手編集・マイグレーション・ジャーナルのやり直し・差分更新をしない書き込み）
+  全件から数え直す
+- 延滞は日付で変わるので、未返済の残高を「延滞になる日の前日」（期日＋猶予日数）ごとに持ち、
+  読むときに today より前の分を足す（calc_overdue_days と同じ判定）
+
+標準ライブラリだけで動く（--summary の起動を軽く保つため、他の modules は import しない）。
+環境変数 APP_LEDGER_STATS_FILE で置き場所を上書き可。
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Union
+
+PathLike = Union[str, Path]
+
+STATS_NAME = "ledger_stats.json"
+_VERSION = 1
+_DIGEST_SPAN = 4096
+_UNDATED = ""  # 期日が無い/読めない貸付（延滞にはならない）
+
+
+def stats_path_for(loans_file: PathLike) -> Path:
+    env = os.getenv("APP_LEDGER_STATS_FILE")
+    if env:
+        return Path(env)
+    return Path(loans_file).resolve().parent / STATS_NAME
+
+
+def file_state(path: PathLike) -> Optional[dict]:
+    """CSV の鮮度キー。ファイルが無ければ None。"""
+    p = Path(path)
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    with p.open("rb") as f:
+        if st.st_size > _DIGEST_SPAN:
+            f.seek(st.st_size - _DIGEST_SPAN)
+        h.update(f.read(_DIGEST_SPAN))
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "tail": h.hexdigest()}
+
+
+def _sources(loans_file: PathLike, repayments_file: PathLike) -> dict:
+    return {
+        "loans": {"path": str(Path(loans_file).resolve()), "state": file_state(loans_file)},
+        "repayments": {"path": str(Path(repayments_file).resolve()), "state": file_state(repayments_file)},
+    }
+
+
+# ======================
+# 1件ぶんの値
+# ======================
+
+
+def _int(value, default: int = 0) -> int:
+    try:
+        return int(float(str(value).replace(",", "").strip() or default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _is_cancelled(loan: Mapping[str, str]) -> bool:
+    return (loan.get("contract_status") or "ACTIVE").strip().upper() == "CANCELLED"
+
+
+def _is_repayment(payment_type) -> bool:
+    return (payment_type or "").strip().upper() in ("", "REPAYMENT")
+
+
+def _overdue_from(loan: Mapping[str, str]) -> str:
+    """延滞判定の境目（期日＋猶予日数）。この日より後の today で延滞になる。"""
+    try:
+        due = datetime.strptime((loan.get("due_date") or "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return _UNDATED
+    return (due + timedelta(days=max(0, _int(loan.get("grace_period_days"))))).isoformat()
+
+
+def _add_open(stats: dict, key: str, count: int, amount: int) -> None:
+    bucket = stats["open_by_overdue_from"].setdefault(key, [0, 0])
+    bucket[0] += count
+    bucket[1] += amount
+    if bucket[0] <= 0:
+        del stats["open_by_overdue_from"][key]
+
+
+def _empty() -> dict:
+    return {
+        "version": _VERSION,
+        "loans": 0,
+        "repayments": 0,
+        "total_lent": 0,       # CANCELLED 以外の貸付金額の合計
+        "total_repaid": 0,     # REPAYMENT（payment_type 空を含む）の合計。LATE_FEE は含まない
+        "late_fee_paid": 0,
+        "outstanding": 0,      # CANCELLED 以外の max(0, 予定返済額 - REPAYMENT累計) の合計
+        "open_by_overdue_from": {},  # 境目の日付 -> [未返済件数, 残高]
+    }
+
+
+# ======================
+# 読み込み・全件集計
+# ======================
+
+
+def _read(path: Path) -> Optional[dict]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stats if isinstance(stats, dict) and stats.get("version") == _VERSION else None
+
+
+def _write(path: Path, stats: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError:
+        # 書けなくても集計は返せる（次回また数え直すだけ）
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def _rows(path: PathLike) -> Iterable[Dict[str, str]]:
+    try:
+        f = open(path, "r", newline="", encoding="utf-8-sig")
+    except FileNotFoundError:
+        return
+    with f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        names = [h.strip().strip('"').strip("'").lower() for h in header]
+        for row in reader:
+            if row:
+                yield dict(zip(names, row))
+
+
+def rebuild_stats(loans_file: PathLike, repayments_file: PathLike) -> dict:
+    """
+    全件から数え直してサイドカーを書き直す。
+    数えている間に台帳が書き換わったら、結果は返すが保存しない（次回また数え直す）。
+    """
+    sources = _sources(loans_file, repayments_file)
+    stats = _empty()
+
+    repaid: Dict[str, int] = {}
+    for rep in _rows(repayments_file):
+        amount = _int(rep.get("repayment_amount", rep.get("amount")))
+        stats["repayments"] += 1
+        if _is_repayment(rep.get("payment_type")):
+            stats["total_repaid"] += amount
+            loan_id = rep.get("loan_id", "")
+            repaid[loan_id] = repaid.get(loan_id, 0) + amount
+        else:
+            stats["late_fee_paid"] += amount
+
+    for loan in _rows(loans_file):
+        stats["loans"] += 1
+        if _is_cancelled(loan):
+            continue
+        stats["total_lent"] += _int(loan.get("loan_amount"))
+        remaining = max(0, _int(loan.get("repayment_expected")) - repaid.get(loan.get("loan_id", ""), 0))
+        if remaining > 0:
+            stats["outstanding"] += remaining
+            _add_open(stats, _overdue_from(loan), 1, remaining)
+
+    stats["sources"] = sources
+    if _sources(loans_file, repayments_file) == sources:
+        _write(stats_path_for(loans_file), stats)
+    return stats
+
+
+def load_stats(loans_file: PathLike, repayments_file: PathLike) -> Optional[dict]:
+    """サイドカーが台帳と一致していれば返す（古い/無い/壊れていれば None）。"""
+    stats = _read(stats_path_for(loans_file))
+    if stats is None or stats.get("sources") != _sources(loans_file, repayments_file):
+        return None
+    return stats
+
+
+def get_stats(loans_file: PathLike, repayments_file: PathLike) -> dict:
+    return load_stats(loans_file, repayments_file) or rebuild_stats(loans_file, repayments_file)
+
+
+def portfolio_summary(stats: dict, today: Optional[date] = None) -> dict:
+    """サイドカーの集計を today 時点の表示用の値にする。"""
+    day = (today or date.today()).isoformat()
+    overdue_count = overdue_amount = 0
+    for key, (count, amount) in stats["open_by_overdue_from"].items():
+        if key != _UNDATED and key < day:
+            overdue_count += count
+            overdue_amount += amount
+    return {
+        "loans": stats["loans"],
+        "repayments": stats["repayments"],
+        "total_lent": stats["total_lent"],
+        "total_repaid": stats["total_repaid"],
+        "late_fee_paid": stats["late_fee_paid"],
+        "outstanding": stats["outstanding"],
+        "open_loans": sum(count for count, _ in stats["open_by_overdue_from"].values()),
+        "overdue_count": overdue_count,
+        "overdue_amount": overdue_amount,
+    }
+
+
+# ======================
+# 差分更新（loan_module の書き込み直後、台帳のロックを持ったまま呼ぶ）
+# ======================
+
+
+def _update(loans_file: PathLike, which: str, path: PathLike, before: Optional[dict], apply) -> None:
+    """
+    サイドカーが「書き込み前の台帳」と一致しているときだけ差分を足す。
+    一致しなければ何もしない（次の --summary で数え直す）。
+    """
+    stats_path = stats_path_for(loans_file)
+    stats = _read(stats_path)
+    if stats is None:
+        return
+    source = (stats.get("sources") or {}).get(which) or {}
+    if source.get("path") != str(Path(path).resolve()) or source.get("state") != before:
+        return
+    apply(stats)
+    source["state"] = file_state(path)
+    _write(stats_path, stats)
+
+
+def record_loan(loans_file: PathLike, before: Optional[dict], loan: Mapping[str, str]) -> None:
+    """貸付1件を追記した直後に呼ぶ（before は追記前の file_state(loans_file)）。"""
+
+    def apply(stats):
+        stats["loans"] += 1
+        if _is_cancelled(loan):
+            return
+        stats["total_lent"] += _int(loan.get("loan_amount"))
+        expected = _int(loan.get("repayment_expected"))
+        if expected > 0:
+            stats["outstanding"] += expected
+            _add_open(stats, _overdue_from(loan), 1, expected)
+
+    _update(loans_file, "loans", loans_file, before, apply)
+
+
+def record_repayments(
+    loans_file: PathLike,
+    repayments_file: PathLike,
+    before: Optional[dict],
+    loan: Mapping[str, str],
+    repaid_before: int,
+    rows: Iterable[Mapping[str, str]],
+) -> None:
+    """
+    1件の貸付への返済行（REPAYMENT / LATE_FEE）を追記した直後に呼ぶ。
+    repaid_before はこの追記前の REPAYMENT 累計。
+    """
+    rows = list(rows)
+
+    def apply(stats):
+        repaid_now = sum(_int(r.get("repayment_amount")) for r in rows if _is_repayment(r.get("payment_type")))
+        stats["repayments"] += len(rows)
+        stats["total_repaid"] += repaid_now
+        stats["late_fee_paid"] += sum(
+            _int(r.get("repayment_amount")) for r in rows if not _is_repayment(r.get("payment_type"))
+        )
+        if _is_cancelled(loan):
+            return
+        expected = _int(loan.get("repayment_expected"))
+        remaining_before = max(0, expected - repaid_before)
+        remaining_after = max(0, expected - repaid_before - repaid_now)
+        if remaining_before > 0:
+            stats["outstanding"] -= remaining_before - remaining_after
+            _add_open(
+                stats,
+                _overdue_from(loan),
+                -1 if remaining_after == 0 else 0,
+                remaining_after - remaining_before,
+            )
+
+    _update(loans_file, "repayments", repayments_file, before, apply)
+
+
+def record_cancel(loans_file: PathLike, before: Optional[dict], loan: Mapping[str, str], repaid: int) -> None:
+    """契約解除で loans_file を書き換えた直後に呼ぶ（loan は解除前の行、repaid は REPAYMENT 累計）。"""
+
+    def apply(stats):
+        if _is_cancelled(loan):
+            return
+        stats["total_lent"] -= _int(loan.get("loan_amount"))
+        remaining = max(0, _int(loan.get("repayment_expected")) - repaid)
+        if remaining > 0:
+            stats["outstanding"] -= remaining
+            _add_open(stats, _overdue_from(loan), -1, -remaining)
+
+    _update(loans_file, "loans", loans_file, before, apply)
+
+
+def summary_row(today: date, portfolio: Mapping[str, int], unpaid_rows: Iterable[Mapping]) -> dict:
+    """
+    main.py の summary サブコマンドの1行（portfolio_summary と未返済行の集計をまとめる）。
+    ローカル実行と常駐デーモン（modules.ledger_daemon）で同じ値になるようにここで組み立てる。
+    """
+    rows = list(unpaid_rows)
+    return {
+        "today": today.isoformat(),
+        "loans": portfolio["loans"],
+        "repayments": portfolio["repayments"],
+        "total_lent": portfolio["total_lent"],
+        "total_repaid": portfolio["total_repaid"],
+        "outstanding": portfolio["outstanding"],
+        "customers_with_unpaid": len({r["customer_id"] for r in rows}),
+        "unpaid_loans": len(rows),
+        "overdue_loans": sum(1 for r in rows if r["status"] == "OVERDUE"),
+        "total_remaining": sum(r["remaining"] for r in rows),
+        "total_late_fee": sum(r["late_fee"] for r in rows),
+        "total_recovery": sum(r["recovery_total"] for r in rows),
+    }
@@ -8,6 +8,12 @@ from datetime import date, datetime, timedelta
 from modules.utils import (
     get_project_paths,
     normalize_method,)  
+from modules.csv_scanner import scan_columns
+from modules.ledger_snapshot import load_loan_rows, load_repayment_totals
+from modules.overdue_snapshot import snapshot_as_of as overdue_snapshot_as_of
+from modules.journal import journal_path_for, transaction
+from modules.file_lock import ledger_lock
+from modules import ledger_stats
 # 既存の正規化（文字列）を再利用
 from decimal import Decimal, ROUND_HALF_UP, getcontext
 from enum import Enum
@@ -19,6 +25,14 @@ getcontext().prec = 28
 VERBOSE_AUDIT = True  # 本番で抑えたいときは False
 
 
+def _record_ledger_stats(record, *args) -> None:
+    """--summary 用サイドカーの差分更新。失敗しても登録は成功のまま（次の --summary で数え直す）。"""
+    try:
+        record(*args)
+    except Exception as e:
+        print(f"⚠️ WARN: 集計サイドカーの更新に失敗しました（次回数え直します）: {e}。")
+
+
 # 日付ごとにユニークな loan_id を生成する関数
 def generate_loan_id(file_path, loan_date=None):
     # 貸付日が未指定なら今日の日付を設定
@@ -164,87 +178,69 @@ def register_loan(
     late_base_amount = amount
     print(f"[DEBUG] late_base_amount の設定: {late_base_amount}")
 
-    # ユニークな loan_id を生成
-    loan_id = generate_loan_id(file_path, loan_date)
-
     # 返済方法をENUM化に正規化（内部統一）
     method_enum = _normalize_method_to_enum(repayment_method)
 
     try:
-        # ファイルが存在しない or 空なら header を w モードで書く
-        if not os.path.exists(file_path) or os.stat(file_path).st_size == 0:
-            with open(file_path, mode="w", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow(header)
-
-        # データ行を a モードで　CSV　に追記する
-        with open(file_path, mode="a", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file)
+        # loan_id の採番（同日件数の数え上げ）→ 追記 までを loan_v3.csv の排他ロック内で行う
+        # （複数プロセスが同時に登録しても同じ連番を払い出さない）
+        with ledger_lock(exclusive=[file_path]):
+            # ユニークな loan_id を生成
+            loan_id = generate_loan_id(file_path, loan_date)
+
+            row = [
+                loan_id,
+                customer_id,
+                amount,
+                loan_date,
+                due_date,
+                interest_rate_percent,
+                repayment_expected,
+                method_enum.value,
+                grace_period_days,
+                late_fee_rate_percent,
+                late_base_amount,
+                # C-9 の初期値
+                "ACTIVE",
+                "",
+                "",
+                # C-12 notes
+                notes,
+            ]
+
             # 保存する内容をデバック出力
-            print(
-                "[DEBUG] 保存内容：",
-                [
-                    loan_id,
-                    customer_id,
-                    amount,
-                    loan_date,
-                    due_date,
-                    interest_rate_percent,
-                    repayment_expected,
-                    method_enum.value,
-                    grace_period_days,
-                    late_fee_rate_percent,
-                    late_base_amount,
-                ],
-            )
-            writer.writerow(
-                [
-                    loan_id,
-                    customer_id,
-                    amount,
-                    loan_date,
-                    due_date,
-                    interest_rate_percent,
-                    repayment_expected,
-                    method_enum.value,
-                    grace_period_days,
-                    late_fee_rate_percent,
-                    late_base_amount,
-                    # C-9 の初期値
-                    "ACTIVE",
-                    "",
-                    "",
-                    # C-12 notes
-                    notes,
-                ]
-            )
+            print("[DEBUG] 保存内容：", row[:11])
+
+            # 貸付行と監査行はジャーナル経由で一括反映（途中で落ちても片方だけ残らない）
+            # ファイルが存在しない or 空なら header も先頭に書く
+            stats_before = ledger_stats.file_state(file_path)
+            with transaction("REGISTER_LOAN", journal=journal_path_for(file_path)) as tx:
+                tx.append_rows(file_path, [row], header=header)
+                # ★C-4 監査フック（成功時のみ）
+                tx.append_audit(
+                    action="REGISTER_LOAN",
+                    entity="loan",
+                    entity_id=loan_id,
+                    details={
+                        "customer_id": customer_id,
+                        "loan_date": loan_date,
+                        "due_date": due_date,
+                        "interest_rate_percent": interest_rate_percent,
+                        "repayment_expected": repayment_expected,
+                        "repayment_method": method_enum.value,
+                        "grace_period_days": grace_period_days,
+                        "late_fee_rate_percent": late_fee_rate_percent,
+                        "late_base_amount": late_base_amount,
+                        "amount": amount,
+                    },
+                    actor="CLI",
+                )
+            _record_ledger_stats(ledger_stats.record_loan, file_path, stats_before, dict(zip(header, row)))
 
         # 保存成功メッセージ
         #print("✅貸付記録が保存されました。")
         print("✅ SUCCESS: 貸付記録を保存しました。")
 
-        # ★C-4 監査フック（成功時のみ）
-        try:
-            _audit_event(
-                "REGISTER_LOAN",
-                loan_id=loan_id,
-                meta={
-                    "customer_id": customer_id,
-                    "loan_date": loan_date,
-                    "due_date": due_date,
-                    "interest_rate_percent": interest_rate_percent,
-                    "repayment_expected": repayment_expected,
-                    "repayment_method": method_enum.value,
-                    "grace_period_days": grace_period_days,
-                    "late_fee_rate_percent": late_fee_rate_percent,
-                    "late_base_amount": late_base_amount,
-                    "amount": amount,
-                },
-                actor="CLI",
-            )
-        except Exception as _e:
-            print(f"⚠️ WARN: 監査ログの記録に失敗しました: {_e}。")
-    
     except Exception as e:        
         print(f"❌ ERROR: 処理に失敗しました: {e}。")
 
@@ -338,47 +334,49 @@ def register_repayment():
 
     repayments_csv_path = "repayments.csv"
     
-    if not is_over_repayment(loans_csv_path, repayments_csv_path, loan_id, amount):
-        # is_over_repayment() 側で詳細メッセージと残額案内を出すため、ここでは重複表示しない
-        return
-    
-    try:
-        file_exists = os.path.exists(repayments_csv_path)
-        need_header = (not file_exists) or (os.stat(repayments_csv_path).st_size == 0)
+    # 過剰返済チェック → 追記 を同じロック内で行う
+    with ledger_lock(exclusive=[repayments_csv_path], shared=[loans_csv_path]):
+        if not is_over_repayment(loans_csv_path, repayments_csv_path, loan_id, amount):
+            # is_over_repayment() 側で詳細メッセージと残額案内を出すため、ここでは重複表示しない
+            return
 
-        with open(repayments_csv_path, mode="a", newline="", encoding="utf-8") as file:
-            writer = csv.DictWriter(file, fieldnames=REPAYMENTS_HEADER)
+        try:
+            file_exists = os.path.exists(repayments_csv_path)
+            need_header = (not file_exists) or (os.stat(repayments_csv_path).st_size == 0)
+
+            with open(repayments_csv_path, mode="a", newline="", encoding="utf-8") as file:
+                writer = csv.DictWriter(file, fieldnames=REPAYMENTS_HEADER)
+
+                if need_header:
+                    writer.writeheader()
+
+                writer.writerow(
+                    {
+                        "loan_id": loan_id,
+                        "customer_id": customer_id,
+                        "repayment_amount": amount,
+                        "repayment_date": repayment_date,
+                        "payment_type": "REPAYMENT",  # ← 旧モードでも必ず明示
+                    }
+                )
 
-            if need_header:
-                writer.writeheader()
+            print(f"✅ SUCCESS: 返済記録を保存しました（顧客ID: {customer_id}）。")
 
-            writer.writerow(
-                {
-                    "loan_id": loan_id,
-                    "customer_id": customer_id,
-                    "repayment_amount": amount,
-                    "repayment_date": repayment_date,
-                    "payment_type": "REPAYMENT",  # ← 旧モードでも必ず明示
-                }
-            )
+            # ★C-4 監査フック（成功時のみ）
+            try:
+                _audit_event(
+                    "REGISTER_REPAYMENT",
+                    loan_id=loan_id,
+                    amount=amount,
+                    meta={"customer_id": customer_id, "paid_date": repayment_date},
+                    actor="user",
+                )
+            except Exception as _e:
+                print(f"⚠️ WARN: 監査ログの記録に失敗しました: {_e}。")
 
-        print(f"✅ SUCCESS: 返済記録を保存しました（顧客ID: {customer_id}）。")
-
-        # ★C-4 監査フック（成功時のみ）
-        try:
-            _audit_event(
-                "REGISTER_REPAYMENT",
-                loan_id=loan_id,
-                amount=amount,
-                meta={"customer_id": customer_id, "paid_date": repayment_date},
-                actor="user",
-            )
-        except Exception as _e:
-            print(f"⚠️ WARN: 監査ログの記録に失敗しました: {_e}。")
-    
-    except Exception as e:
-        print(f"❌ ERROR: 返済記録の保存に失敗しました: {e}。")
-        return
+        except Exception as e:
+            print(f"❌ ERROR: 返済記録の保存に失敗しました: {e}。")
+            return
 
 def register_repayment_api(
     *, loan_id: str, customer_id: str, amount: int, repayment_date: str | None = None
@@ -438,23 +436,25 @@ def register_repayment_api(
         repayments_csv_path = "repayments.csv"
 
 
-    if not is_over_repayment(loans_csv_path, repayments_csv_path, loan_id, amount):
-        return False
-    
-    # ここで repayments のスキーマ/ヘッダーを必ず保証（5列）
-    _ensure_repayments_csv_initialized(repayments_csv_path)
+    # 過剰返済チェック → 追記 を同じロック内で行う
+    with ledger_lock(exclusive=[repayments_csv_path], shared=[loans_csv_path]):
+        if not is_over_repayment(loans_csv_path, repayments_csv_path, loan_id, amount):
+            return False
 
-    with open(repayments_csv_path, "a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=REPAYMENTS_HEADER)
-        w.writerow(
-            {
-                "loan_id": loan_id,
-                "customer_id": customer_id,
-                "repayment_amount": str(amount),
-                "repayment_date": repayment_date,
-                "payment_type": "REPAYMENT", # ★ D-2.1:必ず明示
-            }
-        )
+        # ここで repayments のスキーマ/ヘッダーを必ず保証（5列）
+        _ensure_repayments_csv_initialized(repayments_csv_path)
+
+        with open(repayments_csv_path, "a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=REPAYMENTS_HEADER)
+            w.writerow(
+                {
+                    "loan_id": loan_id,
+                    "customer_id": customer_id,
+                    "repayment_amount": str(amount),
+                    "repayment_date": repayment_date,
+                    "payment_type": "REPAYMENT", # ★ D-2.1:必ず明示
+                }
+            )
 
     _audit_event(
         "REGISTER_REPAYMENT",
@@ -550,7 +550,46 @@ def register_repayment_complete(
     - amount を ①元本返済(REPAYMENT) ②延滞手数料(LATE_FEE) に自動配分し、repayments.csv に2行で記録
     - 「残元本 + 延滞手数料残」を上限とし、超過入力は過剰回収になるためブロック
     - 監査ログ(audit)も同時に残す
+    - 集計 → 上限チェック → 追記 は repayments.csv の排他ロック内で行う
+      （同時に返済登録されても、両方が同じ残高を見て過剰回収にならない）
     """
+    with ledger_lock(
+        exclusive=[repayments_file, _redirect_relative_repayments_csv(repayments_file)],
+        shared=[loans_file],
+    ):
+        return _register_repayment_complete_locked(
+            loans_file=loans_file,
+            repayments_file=repayments_file,
+            loan_id=loan_id,
+            amount=amount,
+            repayment_date=repayment_date,
+            actor=actor,
+        )
+
+
+def _redirect_relative_repayments_csv(repayments_file: str) -> str:
+    """相対パスの "repayments.csv" は data/repayments.csv に寄せる（D-2.1 の書き込み先）。"""
+    try:
+        p = Path(repayments_file)
+        is_relative_repayments_csv = (p.name.lower() == "repayments.csv" and not p.is_absolute())
+    except Exception:
+        is_relative_repayments_csv = False
+
+    if is_relative_repayments_csv:
+        paths = _get_project_paths_patched()
+        return str(paths["repayments_csv"])
+    return repayments_file
+
+
+def _register_repayment_complete_locked(
+    *,
+    loans_file: str,
+    repayments_file: str,
+    loan_id: str,
+    amount: int,
+    repayment_date: str,
+    actor: str,
+) -> dict | None:
 
     # 1) repayments.csv の列が想定スキーマ（payment_type等）になっていることを保証する
     _ensure_repayments_schema(repayments_file)
@@ -627,15 +666,7 @@ def register_repayment_complete(
     fee_part = min(late_fee_remaining_now, leftover)
 
     # 8) repayments_file が相対パスで "repayments.csv" の場合は data/repayments.csv に寄せる
-    try:
-        p = Path(repayments_file)
-        is_relative_repayments_csv = (p.name.lower() == "repayments.csv" and not p.is_absolute())
-    except Exception:
-        is_relative_repayments_csv = False
-
-    if is_relative_repayments_csv:
-        paths = _get_project_paths_patched()
-        repayments_file = str(paths["repayments_csv"])
+    repayments_file = _redirect_relative_repayments_csv(repayments_file)
 
     print(f"[DEBUG] repayments_csv_path = {repayments_file}")
 
@@ -644,57 +675,42 @@ def register_repayment_complete(
     #      - 延滞手数料(LATE_FEE)行（fee_part）
     #      それぞれ audit_log にも同内容を残す（監査性/説明責任）
 
-    written_rows = []
-    with open(repayments_file, "a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=REPAYMENTS_HEADER)
+    #      REPAYMENT/LATE_FEE 行と監査行は1つのジャーナル操作として反映する
+    #      （途中で落ちても「片方だけ記録」「台帳と監査の不一致」にならない）
 
-        if repayment_part > 0:
-            row1 = {
+    written_rows = []
+    stats_before = ledger_stats.file_state(repayments_file)
+    with transaction("REGISTER_REPAYMENT", journal=journal_path_for(repayments_file)) as tx:
+        for part, ptype in ((repayment_part, "REPAYMENT"), (fee_part, "LATE_FEE")):
+            if part <= 0:
+                continue
+            row = {
                 "loan_id": loan_id,
                 "customer_id": info.get("customer_id"),
-                "repayment_amount": str(repayment_part),
+                "repayment_amount": str(part),
                 "repayment_date": repayment_date,
-                "payment_type": "REPAYMENT",
+                "payment_type": ptype,
             }
-            w.writerow(row1)
-            written_rows.append(row1)
+            tx.append_rows(repayments_file, [[row[k] for k in REPAYMENTS_HEADER]], header=REPAYMENTS_HEADER)
+            written_rows.append(row)
 
-            append_audit(
+            tx.append_audit(
                 action="REGISTER_REPAYMENT",
                 entity="loan",
                 entity_id=loan_id,
                 details={
                     "customer_id": info.get("customer_id"),
-                    "amount": repayment_part,
+                    "amount": part,
                     "paid_date": repayment_date,
-                    "payment_type": "REPAYMENT",
+                    "payment_type": ptype,
                 },
                 actor=actor,
             )
 
-        if fee_part > 0:
-            row2 = {
-                "loan_id": loan_id,
-                "customer_id": info.get("customer_id"),
-                "repayment_amount": str(fee_part),
-                "repayment_date": repayment_date,
-                "payment_type": "LATE_FEE",
-            }
-            w.writerow(row2)
-            written_rows.append(row2)
-
-            append_audit(
-                action="REGISTER_REPAYMENT",
-                entity="loan",
-                entity_id=loan_id,
-                details={
-                    "customer_id": info.get("customer_id"),
-                    "amount": fee_part,
-                    "paid_date": repayment_date,
-                    "payment_type": "LATE_FEE",
-                },
-                actor=actor,
-            )
+    _record_ledger_stats(
+        ledger_stats.record_repayments,
+        loans_file, repayments_file, stats_before, info, total_repaid, written_rows,
+    )
 
     # 9) 呼び出し側（CLI）に「何が起きたか」を返すため summary を返却する
     return {
@@ -746,7 +762,7 @@ def display_repayment_history(customer_id, filepath="repayments.csv"):
 
 
 # 未返済の貸付を表示　B-14　新
-def display_unpaid_loans(
+def build_unpaid_loan_rows(
     customer_id,
     loan_file="loan_v3.csv",
     repayment_file="repayments.csv",
@@ -755,216 +771,267 @@ def display_unpaid_loans(
     today=None,
 ):
     """
-    未返済ローンを一括表示する。
-    - filter_mode="all"     : 返済期日を問わず未返済すべて（旧モード9）
-    - filter_mode="overdue" : 返済期日を過ぎた未返済のみ（旧モード10）
+    未返済ローンの行（表示なし）。display_unpaid_loans と main.py のバッチ用サブコマンドが使う。
+    - customer_id=None なら全顧客
+    - filter_mode="overdue" なら返済期日（猶予込み）を過ぎたものだけ
+    - 並び順は期日昇順→loan_id（期日なし/不正は末尾）
+    読み込みに失敗したときは例外をそのまま投げる。
     """
-    try:
-        _today = today or date.today()
+    _today = today or date.today()
 
-        # 1) 顧客の全貸付
-        with open(loan_file, newline="", encoding="utf-8") as lf:
-            loan_reader = csv.DictReader(lf)
-            loans = [
-                row for row in loan_reader if row.get("customer_id") == customer_id
-            ]
-        # CANCELLED は一覧から除外（回収対象ではないため）
-        loans = [row for row in loans if row.get("contract_status", "ACTIVE") != "CANCELLED"]
+    # 1) 顧客の全貸付（スナップショット経由：新鮮なら .snap を1回読むだけ）
+    loans = load_loan_rows(loan_file, customer_id=customer_id)
+    # CANCELLED は一覧から除外（回収対象ではないため）
+    loans = [row for row in loans if row.get("contract_status", "ACTIVE") != "CANCELLED"]
 
+    # 過去日付の一覧は、その日時点の貸付・返済だけで数える（延滞スナップショットがあればそれを読み、
+    # 無ければ同じ計算をその場で行う。スナップショットの有無で答えが変わらないように）
+    snapshot = overdue_snapshot_as_of(loan_file, repayment_file, _today) if _today < date.today() else None
+    if snapshot is not None:
+        loans = [row for row in loans if row.get("loan_id") in snapshot]
+        totals = {
+            loan_id: (row["total_repaid"], row["late_fee_paid"])
+            for loan_id, row in snapshot.items()
+        }
+    else:
+        # loan_id -> (REPAYMENT累計, LATE_FEE累計)。ローンごとの全件走査をしない
+        totals = load_repayment_totals(repayment_file)
 
-        # 2) 未返済のみ抽出（loan_idベース）
-        unpaid = []
-        for loan in loans:
-            loan_id = loan.get("loan_id")
-            if not loan_id:
-                continue
-            if not is_loan_fully_repaid(loan_id, loan_file, repayment_file):
-                unpaid.append(loan)
-
-        # 3) overdueフィルタ（インライン化してスコープ問題を回避）
-        if filter_mode == "overdue":
-            filtered = []
-            for ln in unpaid:
-                ds = ln.get("due_date", "")
-                if not ds:
-                    continue
-                try:
-                    grace_days = int(ln.get("grace_period_days", 0))
-                except ValueError:
-                    grace_days = 0
-                # ✅ 猶予込み延滞判定
-                if calc_overdue_days(_today, ds, grace_days) > 0:
-                    filtered.append(ln)
-            unpaid = filtered
-        elif filter_mode != "all":
-            print(f"⚠️ WARN: filter_modeが不正です: {filter_mode}（'all'として処理します）。")
+    return unpaid_rows_from(loans, totals, filter_mode=filter_mode, today=_today)
 
-        # 4) 並び順：期日昇順→loan_id（期日なし/不正は末尾）
-        def _due_key(ln):
+
+def select_unpaid_loans(loans, totals, *, filter_mode="all", today=None):
+    """
+    貸付行（loan_v3 の row）から未返済のものを選ぶ（CANCELLED 除外 / loan_id ベース）。
+    totals は loan_id -> (REPAYMENT累計, LATE_FEE累計)。
+    filter_mode="overdue" なら返済期日（猶予込み）を過ぎたものだけ。
+    """
+    _today = today or date.today()
+    unpaid = []
+    for loan in loans:
+        loan_id = loan.get("loan_id")
+        if not loan_id or loan.get("contract_status", "ACTIVE") == "CANCELLED":
+            continue
+        if not _is_fully_repaid_row(loan, totals):
+            unpaid.append(loan)
+
+    if filter_mode == "overdue":
+        filtered = []
+        for ln in unpaid:
             ds = ln.get("due_date", "")
+            if not ds:
+                continue
             try:
-                return (
-                    0,
-                    datetime.strptime(ds, "%Y-%m-%d").date(),
-                    ln.get("loan_id", ""),
-                )
+                grace_days = int(ln.get("grace_period_days", 0))
             except ValueError:
-                return (1, date.max, ln.get("loan_id", ""))
+                grace_days = 0
+            # ✅ 猶予込み延滞判定
+            if calc_overdue_days(_today, ds, grace_days) > 0:
+                filtered.append(ln)
+        unpaid = filtered
+    return unpaid
 
-        unpaid.sort(key=_due_key)
 
-        # 3) 表示
-        if not unpaid:
-            if filter_mode == "overdue":
-                print("✅ SUCCESS: 現在、延滞中の未返済はありません。")
-            else:
-                print("✅ 全ての貸付は返済済みです。")
-            return []
+def unpaid_rows_from(loans, totals, *, filter_mode="all", today=None):
+    """
+    build_unpaid_loan_rows の集計部分（読み込み済みの貸付行と返済累計から行を作る）。
+    常駐デーモン（modules.ledger_daemon）はメモリ上の台帳でこれを呼ぶ。
+    """
+    _today = today or date.today()
+    unpaid = select_unpaid_loans(loans, totals, filter_mode=filter_mode, today=_today)
 
-        header = f"\n■ 顧客ID: {customer_id} の{'延滞中の未返済' if filter_mode=='overdue' else '未返済'}貸付一覧"
-        print(header)
-        print(
-            "  [STATUS]  loan_id      ｜貸付日        ｜金額        ｜期日           ｜予定        ｜返済済      ｜残高"
-        )
+    # 4) 並び順：期日昇順→loan_id（期日なし/不正は末尾）
+    def _due_key(ln):
+        ds = ln.get("due_date", "")
+        try:
+            return (
+                0,
+                datetime.strptime(ds, "%Y-%m-%d").date(),
+                ln.get("loan_id", ""),
+            )
+        except ValueError:
+            return (1, date.max, ln.get("loan_id", ""))
 
-        rows_out = []
-        for loan in unpaid:
-            loan_id = loan["loan_id"]
+    unpaid.sort(key=_due_key)
 
-            loan_date_jp = datetime.strptime(loan["loan_date"], "%Y-%m-%d").strftime(
-                "%Y年%m月%d日"
-            )
-            amount = int(loan["loan_amount"])
-            amount_str = f"{amount:,}円"
+    # 5) 行ごとの残高・延滞手数料・回収額
+    rows_out = []
+    for loan in unpaid:
+        loan_id = loan["loan_id"]
+        amount = int(loan["loan_amount"])
+        due_str = loan.get("due_date", "")
 
-            due_str = loan.get("due_date", "")
+        status = "UNPAID"
+        overdue_days = 0
+        late_fee = 0
+        # 期日がない/不正でも破綻しないよう規定は 「残高=回収額」
+        recovery_amount = None  # 後で remaining + late_fee に必ず埋める
 
-            status = "UNPAID"
-            overdue_days = 0
-            late_fee = 0
-            # 期日がない/不正でも破綻しないよう規定は 「残高=回収額」
-            recovery_amount = None  # 後で remaining + late_fee に必ず埋める
+        # 予定返済額・累計返済・残
+        try:
+            expected = int(loan.get("repayment_expected", "0"))
+        except ValueError:
+            expected = 0
+        total_repaid, late_fee_paid_total = totals.get(loan_id, (0, 0))
+        remaining = max(0, expected - total_repaid)
 
-            # 予定返済額・累計返済・残
+        if due_str:
             try:
-                expected = int(loan.get("repayment_expected", "0"))
-            except ValueError:
-                expected = 0
-            total_repaid = calculate_total_repaid_by_loan_id(repayment_file, loan_id)
-            remaining = max(0, expected - total_repaid)
+                # 期日バース（フォーマット検証用）
+                datetime.strptime(due_str, "%Y-%m-%d")
 
-            if due_str:
+                # CSVから延滞用パラメータ
                 try:
-                    # 期日バース
-                    _ = datetime.strptime(due_str, "%Y-%m-%d")  # フォーマット検証用
-                    due_jp = (
-                        datetime.strptime(due_str, "%Y-%m-%d")
-                        .date()
-                        .strftime("%Y年%m月%d日")
+                    late_base_amount = int(
+                        float(loan.get("late_base_amount", amount))
                     )
-
-                    # CSVから延滞用パラメータ
-                    try:
-                        late_base_amount = int(
-                            float(loan.get("late_base_amount", amount))
-                        )
-                    except ValueError:
-                        late_base_amount = amount
-                    try:
-                        late_rate_percent = float(
-                            loan.get("late_fee_rate_percent", 10.0)
-                        )
-                    except ValueError:
-                        late_rate_percent = 10.0
-                    grace_days = int(loan.get("grace_period_days", 0))
-
-                    # ✅ 統一計算：残・延滞日数・延滞手数料・回収額（残＋手数料）
-                    info = compute_recovery_amount(
-                        repayment_expected=expected,
-                        total_repaid=total_repaid,
-                        today=_today,
-                        due_date_str=due_str,
-                        grace_period_days=grace_days,
-                        late_fee_rate_percent=late_rate_percent,
-                        late_base_amount=late_base_amount,
+                except ValueError:
+                    late_base_amount = amount
+                try:
+                    late_rate_percent = float(
+                        loan.get("late_fee_rate_percent", 10.0)
                     )
+                except ValueError:
+                    late_rate_percent = 10.0
+                grace_days = int(loan.get("grace_period_days", 0))
+
+                # ✅ 統一計算：残・延滞日数・延滞手数料・回収額（残＋手数料）
+                info = compute_recovery_amount(
+                    repayment_expected=expected,
+                    total_repaid=total_repaid,
+                    today=_today,
+                    due_date_str=due_str,
+                    grace_period_days=grace_days,
+                    late_fee_rate_percent=late_rate_percent,
+                    late_base_amount=late_base_amount,
+                )
 
-                    late_fee_paid_total = calculate_total_late_fee_paid_by_loan_id(repayment_file, loan_id)
-                    
-                    overdue_days = info["overdue_days"]
+                overdue_days = info["overdue_days"]
 
-                    # 返済日(=today)基準で発生している延滞手数料（総額）
-                    late_fee_accrued_now = info["late_fee"]
+                # 返済日(=today)基準で発生している延滞手数料（総額）から、
+                # すでに支払われた延滞手数料（LATE_FEEの合計）を差し引いた「残」
+                late_fee = max(0, info["late_fee"] - late_fee_paid_total)
 
-                    # すでに支払われた延滞手数料（LATE_FEEの合計）を差し引く
-                    late_fee_remaining_now = max(0, late_fee_accrued_now - late_fee_paid_total)
+                # 残元本(利息込み)は従来通り
+                remaining = info["remaining"]
 
-                    # 画面に出す late_fee は 「残」
-                    late_fee = late_fee_remaining_now
+                # 回収額も「残 + 延滞手数料」
+                recovery_amount = remaining + late_fee
 
-                    # 残元本(利息込み)は従来通り
-                    remaining = info["remaining"]
+                status = "OVERDUE" if overdue_days > 0 else "UNPAID"
 
-                    # 回収額も「残 + 延滞手数料」
-                    recovery_amount = remaining + late_fee_remaining_now
+            except ValueError:
+                status = "DATE_ERR"
 
-                    status = "OVERDUE" if overdue_days > 0 else "UNPAID"
+        # 回収額は常に定義（未延滞・期日不正でも remaining + late_fee）
+        if recovery_amount is None:
+            recovery_amount = remaining + (late_fee or 0)
 
-                except ValueError:
-                    status = "DATE_ERR"
-                    due_jp = due_str
+        # C-5 正字で返却
+        try:
+            grace_val = int(loan.get("grace_period_days", 0))
+        except ValueError:
+            grace_val = 0
+        rows_out.append(
+            {
+                "loan_id": loan_id,
+                "customer_id": loan.get("customer_id", ""),
+                "loan_date": loan["loan_date"],
+                "loan_amount": amount,
+                "due_date": due_str,
+                "status": status,
+                "repayment_expected": expected,
+                "total_repaid": total_repaid,
+                "remaining": remaining,
+                "grace_period_days": grace_val,
+                "overdue_days": overdue_days,
+                "late_fee": late_fee,
+                "late_fee_paid": late_fee_paid_total,
+                "recovery_total": recovery_amount,
+            }
+        )
+
+    return rows_out
+
+
+def display_unpaid_loans(
+    customer_id,
+    loan_file="loan_v3.csv",
+    repayment_file="repayments.csv",
+    *,
+    filter_mode="all",  # "all" /  "overdue"
+    today=None,
+    rows=None,
+):
+    """
+    未返済ローンを一括表示する。
+    - filter_mode="all"     : 返済期日を問わず未返済すべて（旧モード9）
+    - filter_mode="overdue" : 返済期日を過ぎた未返済のみ（旧モード10）
+    - rows を渡すと集計せずにそれを表示する（常駐デーモンから受け取った行など）
+    """
+    try:
+        if filter_mode not in ("all", "overdue"):
+            print(f"⚠️ WARN: filter_modeが不正です: {filter_mode}（'all'として処理します）。")
+            filter_mode = "all"
+
+        rows_out = rows if rows is not None else build_unpaid_loan_rows(
+            customer_id,
+            loan_file,
+            repayment_file,
+            filter_mode=filter_mode,
+            today=today,
+        )
 
+        # 表示
+        if not rows_out:
+            if filter_mode == "overdue":
+                print("✅ SUCCESS: 現在、延滞中の未返済はありません。")
             else:
-                due_jp = due_str
+                print("✅ 全ての貸付は返済済みです。")
+            return []
+
+        header = f"\n■ 顧客ID: {customer_id} の{'延滞中の未返済' if filter_mode=='overdue' else '未返済'}貸付一覧"
+        print(header)
+        print(
+            "  [STATUS]  loan_id      ｜貸付日        ｜金額        ｜期日           ｜予定        ｜返済済      ｜残高"
+        )
+
+        sep = "｜"
+        for row in rows_out:
+            loan_date_jp = datetime.strptime(row["loan_date"], "%Y-%m-%d").strftime(
+                "%Y年%m月%d日"
+            )
+            amount_str = f"{row['loan_amount']:,}円"
+            due_str = row["due_date"]
+            status = row["status"]
+            due_jp = (
+                datetime.strptime(due_str, "%Y-%m-%d").date().strftime("%Y年%m月%d日")
+                if due_str and status != "DATE_ERR"
+                else due_str
+            )
 
-            sep = "｜"
             # 延滞行のみ、追加情報を右側に連結
-            
-            # 回収額は常に定義（未延滞・期日不正でも remaining + late_fee）
-            if recovery_amount is None:
-                recovery_amount = remaining + (late_fee or 0)
             extra = (
-                f"{sep}延滞日数：{overdue_days}日"
-                f"{sep}延滞手数料残：¥{late_fee_remaining_now:,}"
-                f"{sep}(支払済：¥{late_fee_paid_total:,})"
-                f"{sep}回収額：¥{recovery_amount:,}"
+                f"{sep}延滞日数：{row['overdue_days']}日"
+                f"{sep}延滞手数料残：¥{row['late_fee']:,}"
+                f"{sep}(支払済：¥{row['late_fee_paid']:,})"
+                f"{sep}回収額：¥{row['recovery_total']:,}"
                 if status == "OVERDUE"
                 else ""
             )
 
             line = (
                 f"[{status:<7}] "
-                f"{loan_id:<14}{sep}"
+                f"{row['loan_id']:<14}{sep}"
                 f"{loan_date_jp:<12}{sep}"
                 f"{amount_str:>10}{sep}"
                 f"期日：{due_jp:<12}{sep}"
-                f"予定：¥{expected:,}{sep}"
-                f"返済済：¥{total_repaid:,}{sep}"
-                f"残：¥{remaining:,}"
+                f"予定：¥{row['repayment_expected']:,}{sep}"
+                f"返済済：¥{row['total_repaid']:,}{sep}"
+                f"残：¥{row['remaining']:,}"
                 f"{extra}"
             )
             print(line)
-            
-            # C-5 正字で返却
-            try:
-                grace_val = int(loan.get("grace_period_days",0))
-            except ValueError:
-                grace_val =0
-            rows_out.append(
-                {
-                    "loan_id": loan_id,
-                    "loan_date": loan["loan_date"],
-                    "loan_amount": amount,
-                    "due_date": due_str,
-                    "status": status,
-                    "repayment_expected": expected,
-                    "remaining": remaining,
-                    "grace_period_days": grace_val,
-                    "overdue_days": overdue_days,
-                    "late_fee": late_fee,
-                    "recovery_total": recovery_amount,
-                }
-            )
 
         # サマリー
         total_unpaid = len(rows_out)
@@ -997,39 +1064,9 @@ def get_unpaid_loans_rows(
     表示なしで「未返済loan行（loan_v3のrow）」だけ返す。
     display_unpaid_loans() と同じ抽出条件（CANCELLED除外 / loan_idベース）で統一する。
     """
-    _today = today or date.today()
-
-    with open(loan_file, newline="", encoding="utf-8") as lf:
-        loan_reader = csv.DictReader(lf)
-        loans = [row for row in loan_reader if row.get("customer_id") == customer_id]
-
-    # CANCELLED除外（回収対象外）
-    loans = [row for row in loans if row.get("contract_status", "ACTIVE") != "CANCELLED"]
-
-    unpaid = []
-    for loan in loans:
-        loan_id = loan.get("loan_id")
-        if not loan_id:
-            continue
-        if not is_loan_fully_repaid(loan_id, loan_file, repayment_file):
-            unpaid.append(loan)
-
-    if filter_mode == "overdue":
-        filtered = []
-        for ln in unpaid:
-            ds = ln.get("due_date", "")
-            if not ds:
-                continue
-            try:
-                grace_days = int(ln.get("grace_period_days", 0))
-            except ValueError:
-                grace_days = 0
-
-            if calc_overdue_days(_today, ds, grace_days) > 0:
-                filtered.append(ln)
-        unpaid = filtered
-
-    return unpaid
+    loans = load_loan_rows(loan_file, customer_id=customer_id)
+    totals = load_repayment_totals(repayment_file)
+    return select_unpaid_loans(loans, totals, filter_mode=filter_mode, today=today)
 
 
 # 延滞日数と延滞手数料を計算する関数
@@ -1094,21 +1131,14 @@ def calculate_total_repaid_by_loan_id(repayments_file: str, loan_id: str) -> int
     """
     total = 0
 
-    for row in _iter_repayments_rows(repayments_file) or []:
-        if (row.get("loan_id") or "") != loan_id:
+    for row_loan_id, pt, amt in _scan_repayments(repayments_file, contains=loan_id):
+        if row_loan_id != loan_id:
             continue
 
-        pt = (row.get("payment_type") or "").strip().upper()
-
         # 後方互換：列が無い/空 → REPAYMENT扱い
-        if pt not in ("", "REPAYMENT"):
+        if pt.strip().upper() not in ("", "REPAYMENT"):
             continue
 
-        try:
-            amt = int(float(row.get("repayment_amount") or 0))
-        except (ValueError, TypeError):
-            amt = 0
-
         total += amt
 
     return total
@@ -1124,17 +1154,14 @@ def get_total_repaid_amount(repayments_file: str, loan_id: str) -> int:
 
 def calculate_total_late_fee_paid_by_loan_id(repayments_file: str, loan_id: str) -> int:
     total = 0
-    for row in _iter_repayments_rows(repayments_file) or []:
-        if row["loan_id"] != loan_id:
+    for row_loan_id, pt, amt in _scan_repayments(repayments_file, contains=loan_id):
+        if row_loan_id != loan_id:
             continue
-        if (row.get("payment_type") or "").strip().upper() != "LATE_FEE":
-            continue
-        try:
-            total += int(float(row["repayment_amount"]))
-        except Exception:
+        if pt.strip().upper() != "LATE_FEE":
             continue
+        total += amt
     return total
-        
+
 
 def get_repayment_expected(loan_id: str, loan_file: str = "loan_v3.csv") -> float:
     """指定 loan_id の予定返済額を CSV から取得（pandas不要）"""
@@ -1165,6 +1192,18 @@ def is_loan_fully_repaid(
     return total_repaid >= expected
 
 
+def _is_fully_repaid_row(loan: dict, totals: dict) -> bool:
+    """
+    is_loan_fully_repaid と同じ判定を、読み込み済みの loan 行と累計マップで行う
+    （一覧処理でローンごとに CSV を開き直さないため）。
+    """
+    try:
+        expected = float(loan.get("repayment_expected", 0))
+    except (TypeError, ValueError):
+        expected = 0.0
+    return totals.get(loan.get("loan_id"), (0, 0))[0] >= expected
+
+
 # C-0 （today＋猶予の延滞統一 & 回収額一本化）
 def _parse_date_yyyy_mm_dd(s: str) -> date:
     return datetime.strptime(s.strip(), "%Y-%m-%d").date()
@@ -1381,20 +1420,30 @@ def cancel_contract(loan_file: str, loan_id: str, *, reason: str = "", operator:
     契約をCANCELLEDにして cancelled_at と cancel_reason を埋める。
     返り値: True=成功 / False=見つからない・既にCANCELLED・（必要なら）完済など
     例外は基本的に起こさない（IOエラー等は上位に伝播）。
+    読み出し → 書き換え は loan_v3.csv の排他ロック内で行う（同時の追記・解除を取りこぼさない）。
     """
+    DATA_DIR = _cancel_data_dir(loan_file)
+    with ledger_lock(exclusive=[loan_file], shared=[DATA_DIR / "repayments.csv"]):
+        return _cancel_contract_locked(loan_file, loan_id, DATA_DIR, reason=reason, operator=operator)
 
-    # 1) CSV 読み出し
-    import csv
-    import datetime
 
+def _cancel_data_dir(loan_file: str) -> Path:
     # データディレクトリを loan_file から推定
     try:
         paths = _get_project_paths_patched()
         # loan_v3.csv のディレクトリを基準にする
-        DATA_DIR = Path(paths.get("loans_csv", loan_file)).resolve().parent
+        return Path(paths.get("loans_csv", loan_file)).resolve().parent
     except Exception:
         # 念のためフォールバック
-        DATA_DIR = Path("data").resolve()
+        return Path("data").resolve()
+
+
+def _cancel_contract_locked(
+    loan_file: str, loan_id: str, DATA_DIR: Path, *, reason: str, operator: str
+) -> bool:
+    # 1) CSV 読み出し
+    import csv
+    import datetime
 
     with open(loan_file, "r", newline="", encoding="utf-8-sig") as f:
         rows = list(csv.reader(f))
@@ -1476,7 +1525,8 @@ def cancel_contract(loan_file: str, loan_id: str, *, reason: str = "", operator:
         print(f"   予定返済額: ¥{expected:,} / 返済合計: ¥{repaid_sum:,}")
         return False
 
-    # 6) 状態を更新
+    # 6) 状態を更新（集計サイドカー用に解除前の行を残しておく）
+    loan_before = dict(zip(header, row))
     now_iso = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
     row[idx[C9_COL_STATUS]] = "CANCELLED"
     row[idx[C9_COL_CANCELLED_AT]] = now_iso
@@ -1484,24 +1534,27 @@ def cancel_contract(loan_file: str, loan_id: str, *, reason: str = "", operator:
 
     body[found_i] = row
 
-    # 7) 書き戻し（上書き）
-    with open(loan_file, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(header)
-        w.writerows(body)
-
-    # 8) 監査ログ
-    _audit_event(
-        "CANCEL_CONTRACT",
-        loan_id=loan_id,
-        meta={
-            "previous_status": prev_status or "ACTIVE",
-            "new_status": "CANCELLED",
-            "cancelled_at": now_iso,
-            "cancel_reason": reason or "",
-            "loan_id": loan_id,
-        },
-        actor=operator,
+    # 7) 書き戻し（上書き）と 8) 監査ログ を1つのジャーナル操作として反映
+    stats_before = ledger_stats.file_state(loan_file)
+    with transaction("CANCEL_CONTRACT", journal=journal_path_for(loan_file)) as tx:
+        tx.rewrite_rows(loan_file, header, body)
+        tx.append_audit(
+            action="CANCEL_CONTRACT",
+            entity="loan",
+            entity_id=loan_id,
+            details={
+                "previous_status": prev_status or "ACTIVE",
+                "new_status": "CANCELLED",
+                "cancelled_at": now_iso,
+                "cancel_reason": reason or "",
+                "loan_id": loan_id,
+            },
+            actor=operator,
+        )
+    _record_ledger_stats(
+        ledger_stats.record_cancel,
+        loan_file, stats_before, loan_before,
+        calculate_total_repaid_by_loan_id(str(DATA_DIR / "repayments.csv"), loan_id),
     )
     return True
 
@@ -1558,38 +1611,35 @@ def _ensure_repayments_schema(repayments_file: str) -> None:
         w.writerows(new_rows)
 
 # D-2.1
+def _repayments_header_normalizer(header: list[str]) -> list[str]:
+    header = [h.lstrip("\ufeff").strip().strip('"') for h in header]
+    return _normalize_repayments_headers(header)
+
+
+def _scan_repayments(repayments_file: str, *, contains: str | None = None):
+    """
+    集計用の軽量走査：(loan_id, payment_type, repayment_amount:int) の tuple を返す。
+    dict を作らず必要な3列だけを mmap から取り出す（modules.csv_scanner）。
+    """
+    return scan_columns(
+        repayments_file,
+        ("loan_id", "payment_type", "repayment_amount"),
+        kinds={"repayment_amount": "int"},
+        header_normalizer=_repayments_header_normalizer,
+        contains=contains,
+    )
+
+
 def _iter_repayments_rows(repayments_file: str):
-    try:
-        with open(repayments_file, "r", newline="", encoding="utf-8-sig") as f:
-            r = csv.reader(f)
-            header = next(r, None)
-            if not header:
-                return
-            header = [h.lstrip("\ufeff").strip().strip('"') for h in header]
-            header = _normalize_repayments_headers(header)
-
-            idx = {name: i for i, name in enumerate(header)}
-
-            def getv(row, key, default=""):
-                i = idx.get(key)
-                if i is None or i >= len(row):
-                    return default
-                return row[i]
-            
-            has_type = "payment_type" in idx
-
-            for row in r:
-                loan_id = getv(row, "loan_id")
-                custoemer_id = getv(row, "customer_id")
-                payment_type = getv(row, "payment_type") if has_type else "REPAYMENT"
-                amt = getv(row, "repayment_amount")
-                rdate = getv(row, "repayment_date")
-                yield {
-                    "loan_id": loan_id,
-                    "customer_id": custoemer_id,
-                    "payment_type": (payment_type or "REPAYMENT").strip(),
-                    "repayment_amount": amt,
-                    "repayment_date": rdate,
-                }
-    except FileNotFoundError:
-        return        
\ No newline at end of file
+    for loan_id, customer_id, payment_type, amt, rdate in scan_columns(
+        repayments_file,
+        ("loan_id", "customer_id", "payment_type", "repayment_amount", "repayment_date"),
+        header_normalizer=_repayments_header_normalizer,
+    ):
+        yield {
+            "loan_id": loan_id,
+            "customer_id": customer_id,
+            "payment_type": (payment_type or "REPAYMENT").strip(),
+            "repayment_amount": amt,
+            "repayment_date": rdate,
+        }
@@ -0,0 +1,256 @@
+# modules/overdue_snapshot.py
+"""
+CLI 台帳（data/*.csv）の延滞スナップショット（日付ごと）。
+
+未返済・延滞の判定は「今日」に依存するので、過去日付（main.py --today）の一覧を出すたびに
+返済履歴を全件集計し直すことになる。夜間に1日1ファイル作っておき、過去日付の表示はそれを読む。
+
+overdue_snapshots/<YYYY-MM-DD>.csv（loan_v3.csv と同じフォルダ。APP_OVERDUE_SNAPSHOT_DIR で変更可）
+- その日以前の貸付・返済だけで計算した、未返済（残高 or 延滞手数料残がある）貸付の一覧
+- 計算は display_unpaid_loans と同じ compute_recovery_amount（四捨五入も同じ）
+- CANCELLED は含めない
+- 書き込みは tmp → os.replace のアトミック置換
+
+cron からは `python -m modules.overdue_snapshot build`（--date で日付指定）。
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from modules.csv_scanner import scan_columns
+from modules.ledger_snapshot import load_loan_rows
+
+PathLike = Union[str, Path]
+
+SNAPSHOT_COLUMNS = [
+    "loan_id",
+    "customer_id",
+    "due_date",
+    "repayment_expected",
+    "total_repaid",
+    "late_fee_paid",
+    "remaining",
+    "overdue_days",
+    "late_fee_accrued",
+    "late_fee_remaining",
+    "status",
+]
+_INT_COLUMNS = (
+    "repayment_expected",
+    "total_repaid",
+    "late_fee_paid",
+    "remaining",
+    "overdue_days",
+    "late_fee_accrued",
+    "late_fee_remaining",
+)
+
+
+def snapshot_dir(loans_file: PathLike) -> Path:
+    env = os.getenv("APP_OVERDUE_SNAPSHOT_DIR")
+    if env:
+        return Path(env)
+    return Path(loans_file).resolve().parent / "overdue_snapshots"
+
+
+def snapshot_path(loans_file: PathLike, as_of: date) -> Path:
+    return snapshot_dir(loans_file) / f"{as_of:%Y-%m-%d}.csv"
+
+
+def _repayment_totals_as_of(repayments_file: PathLike, as_of: date) -> Dict[str, List[int]]:
+    """loan_id -> [REPAYMENT累計, LATE_FEE累計]（as_of 以前の返済だけ）。"""
+    # 列名の別名吸収は loan_module 側と同一ルールにそろえる（循環 import を避けて遅延 import）
+    from modules.loan_module import _repayments_header_normalizer
+
+    totals: Dict[str, List[int]] = {}
+    for loan_id, amount, paid_on, ptype in scan_columns(
+        repayments_file,
+        ("loan_id", "repayment_amount", "repayment_date", "payment_type"),
+        kinds={"repayment_amount": "int", "repayment_date": "date"},
+        header_normalizer=_repayments_header_normalizer,
+    ):
+        # 日付が読めない行は時点を決められないので、現在の集計と同じく数えておく
+        if paid_on is not None and paid_on > as_of:
+            continue
+        kind = ptype.strip().upper()
+        if kind in ("", "REPAYMENT"):
+            slot = 0
+        elif kind == "LATE_FEE":
+            slot = 1
+        else:
+            continue
+        acc = totals.get(loan_id)
+        if acc is None:
+            acc = totals[loan_id] = [0, 0]
+        acc[slot] += amount
+    return totals
+
+
+def _int(value, default=0) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _float(value, default) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def build_snapshot(as_of: date, loans_file: PathLike, repayments_file: PathLike) -> List[dict]:
+    """as_of 時点の未返済貸付の行（SNAPSHOT_COLUMNS）を期日→loan_id 順で返す。"""
+    from modules.loan_module import compute_recovery_amount
+
+    totals = _repayment_totals_as_of(repayments_file, as_of)
+    as_of_str = f"{as_of:%Y-%m-%d}"
+    rows = []
+    for loan in load_loan_rows(loans_file):
+        loan_id = loan.get("loan_id", "")
+        if not loan_id or (loan.get("contract_status") or "ACTIVE").strip().upper() == "CANCELLED":
+            continue
+        loan_date = (loan.get("loan_date") or "").strip()
+        if len(loan_date) == 10 and loan_date > as_of_str:
+            continue  # まだ貸し付けていない
+
+        expected = _int(loan.get("repayment_expected"))
+        total_repaid, late_fee_paid = totals.get(loan_id, (0, 0))
+        row = {
+            "loan_id": loan_id,
+            "customer_id": loan.get("customer_id", ""),
+            "due_date": loan.get("due_date", ""),
+            "repayment_expected": expected,
+            "total_repaid": total_repaid,
+            "late_fee_paid": late_fee_paid,
+            "remaining": max(0, expected - total_repaid),
+            "overdue_days": 0,
+            "late_fee_accrued": 0,
+            "late_fee_remaining": 0,
+            "status": "UNPAID",
+        }
+        if not row["due_date"]:
+            info = None  # 期日なし：延滞判定はできないので残高だけ
+        else:
+            try:
+                info = compute_recovery_amount(
+                    repayment_expected=expected,
+                    total_repaid=total_repaid,
+                    today=as_of,
+                    due_date_str=row["due_date"],
+                    grace_period_days=_int(loan.get("grace_period_days")),
+                    late_fee_rate_percent=_float(loan.get("late_fee_rate_percent"), 10.0) or 10.0,
+                    late_base_amount=_int(loan.get("late_base_amount"), _int(loan.get("loan_amount"))),
+                )
+            except ValueError:
+                info = None
+                row["status"] = "DATE_ERR"
+
+        if info is not None:
+            row.update(
+                remaining=info["remaining"],
+                overdue_days=info["overdue_days"],
+                late_fee_accrued=info["late_fee"],
+                late_fee_remaining=max(0, info["late_fee"] - late_fee_paid),
+            )
+            if row["remaining"] > 0:
+                row["status"] = "OVERDUE" if row["overdue_days"] > 0 else "UNPAID"
+            else:
+                row["status"] = "LATE_FEE_ONLY"
+
+        if row["remaining"] > 0 or row["late_fee_remaining"] > 0:
+            rows.append(row)
+
+    rows.sort(key=lambda r: (r["due_date"], r["loan_id"]))
+    return rows
+
+
+def write_snapshot(as_of: date, loans_file: PathLike, repayments_file: PathLike) -> Path:
+    """as_of のスナップショットを作り直し、そのパスを返す。"""
+    rows = build_snapshot(as_of, loans_file, repayments_file)
+    path = snapshot_path(loans_file, as_of)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SNAPSHOT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp, path)
+    return path
+
+
+def load_snapshot(loans_file: PathLike, as_of: date) -> Optional[Dict[str, dict]]:
+    """as_of のスナップショットを loan_id -> 行 で返す。作られていなければ None。"""
+    try:
+        f = snapshot_path(loans_file, as_of).open(newline="", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    with f:
+        rows = {}
+        for row in csv.DictReader(f):
+            for name in _INT_COLUMNS:
+                row[name] = _int(row.get(name))
+            rows[row["loan_id"]] = row
+    return rows
+
+
+def snapshot_as_of(loans_file: PathLike, repayments_file: PathLike, as_of: date) -> Dict[str, dict]:
+    """
+    as_of 時点の未返済貸付を loan_id -> 行 で返す。
+    スナップショットがあればそれを読み、無ければ同じ計算（build_snapshot）をその場で行う。
+    """
+    rows = load_snapshot(loans_file, as_of)
+    if rows is None:
+        rows = {row["loan_id"]: row for row in build_snapshot(as_of, loans_file, repayments_file)}
+    return rows
+
+
+def _main(argv: Optional[List[str]] = None) -> int:
+    from modules.utils import get_project_paths
+
+    paths = get_project_paths()
+    ap = argparse.ArgumentParser(description="延滞スナップショット（日付ごと）の作成・表示")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("build", "show"):
+        sp = sub.add_parser(name)
+        sp.add_argument("--date", default=None, help="YYYY-MM-DD（指定がなければ今日）")
+        sp.add_argument("--loans", default=str(paths["loans_csv"]))
+        if name == "build":
+            sp.add_argument("--repayments", default=str(paths["repayments_csv"]))
+        else:
+            sp.add_argument("--customer", default=None)
+    args = ap.parse_args(argv)
+
+    try:
+        as_of = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else date.today()
+    except ValueError:
+        raise SystemExit(f"❌ ERROR: --dateはYYYY-MM-DD形式で指定してください: {args.date!r}。")
+
+    if args.cmd == "build":
+        out = write_snapshot(as_of, args.loans, args.repayments)
+        print(f"✅ SUCCESS: 延滞スナップショットを作成しました: {out}")
+        return 0
+
+    rows = load_snapshot(args.loans, as_of)
+    if rows is None:
+        print(f"⚠️ WARN: {as_of:%Y-%m-%d} のスナップショットはありません。")
+        return 1
+    for row in rows.values():
+        if args.customer and row["customer_id"] != args.customer:
+            continue
+        print(
+            f"[{row['status']:<13}] {row['loan_id']:<14}｜期日：{row['due_date']:<10}"
+            f"｜残：¥{row['remaining']:,}｜延滞日数：{row['overdue_days']}日"
+            f"｜延滞手数料残：¥{row['late_fee_remaining']:,}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -1,10 +1,12 @@
 # schema_migrator.py
 from __future__ import annotations
 import csv
-import shutil
+import json
+import os
+import sys
 import time
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 from modules.logger import get_logger
 from modules.utils import get_project_paths
@@ -29,12 +31,16 @@ TARGET_SCHEMAS: Dict[str, List[str]] = {
         "contract_status",
         "cancelled_at",
         "cancel_reason",
+        # C-12 column
+        "notes",
     ],
     "repayments": [
         "loan_id",
         "customer_id",
         "repayment_amount",
         "repayment_date",
+        # D-2 column
+        "payment_type",
     ],
 }
 
@@ -67,23 +73,34 @@ DEFAULTS: Dict[str, Dict[str, str]] = {
         "contract_status": "ACTIVE",
         "cancelled_at": "",
         "cancel_reason": "",
+        "notes": "",
+    },
+    "repayments": {
+        "payment_type": "REPAYMENT",
     },
-    "repayments": {},
 }
 
-ENABLE_BACKUP = True  # *.bak.YYYYMMDD_HHMMSS を作る
+ENABLE_BACKUP = True  # backup/ に世代を取る（modules.backup）
 
+# 書き直しの途中経過。CHECKPOINT_ROWS 行ごとに再開位置を保存し、そのとき前回から
+# PROGRESS_INTERVAL 秒以上たっていれば進み具合（行数・%・rows/s）をログに出す
+CHECKPOINT_ROWS = 50_000
+PROGRESS_INTERVAL = 2.0
 
-def _ts() -> str:
-    return time.strftime("%Y%m%d_%H%M%S")
+# 前回確認したときのファイルの指紋（サイズ・更新時刻・正スキーマ）。
+# 変わっていなければヘッダーも読まずに済ませる（起動のたびに CSV を開かない）。
+# 環境変数 APP_SCHEMA_CACHE_FILE で置き場所を上書き可。
+SCHEMA_CACHE_NAME = ".schema_cache.json"
 
 
 def _backup(src: Path) -> None:
     if not ENABLE_BACKUP or not src.exists():
         return
-    dst = src.with_suffix(src.suffix + f".bak.{_ts()}")
-    shutil.copy2(src, dst)
-    logger.info(f"Backup: {src.name} -> {dst.name}")
+    from modules.backup import backup_file
+
+    gen = backup_file(src)
+    if gen:
+        logger.info(f"Backup: {src.name} -> generation {gen['gen']} ({gen['kind']})")
 
 
 def _read_header(p: Path) -> List[str]:
@@ -96,32 +113,149 @@ def _read_header(p: Path) -> List[str]:
     return [h.strip().strip('"').strip("'") for h in hdr]
 
 
+def _column_plan(
+    src_header: List[str],
+    new_header: List[str],
+    rename_map: Dict[str, str],
+    defaults: Dict[str, str],
+) -> List[Tuple[Optional[int], str]]:
+    """
+    リネーム・欠落列のデフォルト・並べ替えを1回で済ませるための対応表。
+    出力列ごとに (元の列番号 or None, 空のときの値)。同じ列名が重なったら後ろの列を使う。
+    """
+    index = {rename_map.get(c, c): i for i, c in enumerate(src_header)}
+    return [(index.get(col), defaults.get(col, "")) for col in new_header]
+
+
+def _checkpoint_path(csv_path: Path) -> Path:
+    return csv_path.with_suffix(".migrate.json")
+
+
+def _load_checkpoint(path: Path, expect: dict) -> Optional[dict]:
+    """途中まで書いた tmp の続きから再開できるなら、そのときのチェックポイントを返す。"""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            ck = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(ck, dict) or any(ck.get(k) != v for k, v in expect.items()):
+        return None
+    return ck
+
+
+def _save_checkpoint(path: Path, ck: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(ck, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _tracked_lines(f, pos: List[int]):
+    """バイナリの行を str にして渡しつつ、渡し終えた位置（バイト）を pos[0] に持つ。"""
+    for raw in f:
+        pos[0] += len(raw)
+        yield raw.decode("utf-8")
+
+
 def _write_with_new_header(
     src: Path,
     dst: Path,
     new_header: List[str],
     rename_map: Dict[str, str],
     defaults: Dict[str, str],
-) -> None:
-    with src.open("r", newline="", encoding="utf-8-sig") as rf, dst.open(
-        "w", newline="", encoding="utf-8"
-    ) as wf:
-        reader = csv.DictReader(rf)
-        norm_rows = []
-        for row in reader:
-            n = {}
-            for k, v in row.items():
-                n[rename_map.get(k, k)] = v
-            norm_rows.append(n)
-
-        writer = csv.DictWriter(wf, fieldnames=new_header, extrasaction="ignore")
-        writer.writeheader()
-        for r in norm_rows:
-            out = {}
-            for col in new_header:
-                val = r.get(col, "")
-                out[col] = val if (val is not None and val != "") else defaults.get(col, "")
-            writer.writerow(out)
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    src を1行ずつ読んで dst に書く（メモリは行数に比例しない）。
+
+    CHECKPOINT_ROWS 行ごとに dst を fsync し、読み終えた位置を <src>.migrate.json に残す。
+    中断されても、src と移行内容が同じなら次回はその位置から続ける。
+    返り値: {"rows": 全行数, "resumed_from": 再開した行数, "seconds": 今回の所要秒}
+    """
+    st = src.stat()
+    ck_path = _checkpoint_path(src)
+    expect = {
+        "source": {"size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        "tmp": dst.name,
+        "header": new_header,
+        "renames": rename_map,
+        "defaults": defaults,
+    }
+    ck = _load_checkpoint(ck_path, expect)
+    if ck is not None:
+        try:
+            if dst.stat().st_size < ck["tmp_size"]:
+                ck = None
+        except OSError:
+            ck = None
+
+    started = time.perf_counter()
+    last_report = started
+    reported = -1
+    pos = [0]
+    with src.open("rb") as rf:
+        if rf.read(3) != b"\xef\xbb\xbf":
+            rf.seek(0)
+        pos[0] = rf.tell()
+        reader = csv.reader(_tracked_lines(rf, pos))
+        src_header = [h.strip().strip('"').strip("'") for h in next(reader, [])]
+        plan = _column_plan(src_header, new_header, rename_map, defaults)
+
+        if ck is None:
+            rows = resumed = 0
+            wf = dst.open("w", newline="", encoding="utf-8")
+            csv.writer(wf).writerow(new_header)
+        else:
+            rows = resumed = ck["rows"]
+            wf = dst.open("r+", newline="", encoding="utf-8")
+            wf.seek(ck["tmp_size"])
+            wf.truncate()
+            rf.seek(ck["offset"])
+            pos[0] = ck["offset"]
+            reader = csv.reader(_tracked_lines(rf, pos))
+            logger.info(f"RESUME {src.name}: from row {rows:,}")
+
+        with wf:
+            writer = csv.writer(wf)
+            for row in reader:
+                if not row:
+                    continue
+                width = len(row)
+                writer.writerow([
+                    (row[i] if i is not None and i < width else "") or default
+                    for i, default in plan
+                ])
+                rows += 1
+
+                if rows % CHECKPOINT_ROWS == 0:
+                    wf.flush()
+                    os.fsync(wf.fileno())
+                    _save_checkpoint(ck_path, dict(expect, rows=rows, offset=pos[0], tmp_size=wf.tell()))
+                    now = time.perf_counter()
+                    if now - last_report >= PROGRESS_INTERVAL:
+                        last_report, reported = now, rows
+                        _report(src, progress, rows, resumed, pos[0], st.st_size, now - started)
+
+            wf.flush()
+            os.fsync(wf.fileno())
+
+    elapsed = time.perf_counter() - started
+    if reported != rows:
+        _report(src, progress, rows, resumed, st.st_size, st.st_size, elapsed)
+    return {"rows": rows, "resumed_from": resumed, "seconds": elapsed}
+
+
+def _report(src: Path, progress, rows: int, resumed: int, done: int, total: int, elapsed: float) -> None:
+    rate = (rows - resumed) / elapsed if elapsed > 0 else 0.0
+    info = {
+        "file": src.name,
+        "rows": rows,
+        "percent": 100.0 * done / total if total else 100.0,
+        "rows_per_sec": rate,
+    }
+    logger.info(f"MIGRATE {src.name}: {rows:,} rows ({info['percent']:.0f}%) {rate:,.0f} rows/s")
+    if progress is not None:
+        progress(info)
 
 
 def _migrate_one(
@@ -129,10 +263,26 @@ def _migrate_one(
     target_header: List[str],
     rename_map: Dict[str, str],
     defaults: Dict[str, str],
+    progress: Optional[Callable[[dict], None]] = None,
 ) -> Tuple[bool, str]:
     if not csv_path.exists():
         return False, f"SKIP (not found): {csv_path.name}"
 
+    # 書き換えの間に来た追記（register_loan / 返済登録）や契約解除を取りこぼさないよう、
+    # ヘッダーの確認から置き換え・チェックポイント削除までを台帳の排他ロックの中で行う
+    from modules.file_lock import ledger_lock
+
+    with ledger_lock(exclusive=[csv_path]):
+        return _migrate_locked(csv_path, target_header, rename_map, defaults, progress)
+
+
+def _migrate_locked(
+    csv_path: Path,
+    target_header: List[str],
+    rename_map: Dict[str, str],
+    defaults: Dict[str, str],
+    progress: Optional[Callable[[dict], None]] = None,
+) -> Tuple[bool, str]:
     current = _read_header(csv_path)
     if not current:
         _backup(csv_path)
@@ -150,11 +300,13 @@ def _migrate_one(
     if not need:
         return False, f"OK (already up-to-date): {csv_path.name}"
 
+    # 再開時は前回の開始時に取った世代がある（backup_file は内容が同じなら世代を増やさない）
     _backup(csv_path)
     tmp = csv_path.with_suffix(".tmp")
     new_header = target_header + extras  # 余剰を残したい方針。削除したいなら target_header のみに。
-    _write_with_new_header(csv_path, tmp, new_header, rename_map, defaults)
+    result = _write_with_new_header(csv_path, tmp, new_header, rename_map, defaults, progress)
     tmp.replace(csv_path)
+    _checkpoint_path(csv_path).unlink(missing_ok=True)
 
     detail = []
     if missing:
@@ -165,10 +317,87 @@ def _migrate_one(
         detail.append("reordered")
     if logical != current:
         detail.append("renamed")
-    return True, f"FIXED {csv_path.name}: " + ", ".join(detail)
+    if result["resumed_from"]:
+        detail.append(f"resumed at row {result['resumed_from']:,}")
+    rate = (result["rows"] - result["resumed_from"]) / result["seconds"] if result["seconds"] > 0 else 0.0
+    return True, (
+        f"FIXED {csv_path.name}: " + ", ".join(detail)
+        + f" ({result['rows']:,} rows, {rate:,.0f} rows/s)"
+    )
+
+
+def schema_cache_path(data_dir: Path) -> Path:
+    env = os.getenv("APP_SCHEMA_CACHE_FILE")
+    if env:
+        return Path(env)
+    return Path(data_dir) / SCHEMA_CACHE_NAME
+
+
+def _load_cache(path: Path) -> Dict[str, dict]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _save_cache(path: Path, cache: Dict[str, dict]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+    except OSError as e:
+        # キャッシュは無くても動く（次回また確認するだけ）
+        logger.warning(f"Schema cache not saved: {e}")
+
 
+def _fingerprint(csv_path: Path, name: str) -> Optional[dict]:
+    try:
+        st = csv_path.stat()
+    except OSError:
+        return None
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "schema": TARGET_SCHEMAS[name],
+        "renames": RENAME_MAPS.get(name, {}),
+        "defaults": DEFAULTS.get(name, {}),
+    }
 
-def check_or_migrate_schemas() -> None:
+
+def _check_one(
+    cache: Dict[str, dict],
+    name: str,
+    csv_path: Path,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> bool:
+    """指紋が前回と同じなら何もしない。変更があれば移行して指紋を取り直す。"""
+    key = str(Path(csv_path).resolve())
+    before = _fingerprint(csv_path, name)
+    if before is not None and cache.get(key) == before:
+        logger.info(f"OK (unchanged since last check): {csv_path.name}")
+        return False
+
+    changed, message = _migrate_one(
+        csv_path, TARGET_SCHEMAS[name], RENAME_MAPS.get(name, {}), DEFAULTS.get(name, {}), progress
+    )
+    logger.info(message)
+
+    after = _fingerprint(csv_path, name)
+    if after is None:
+        cache.pop(key, None)
+    else:
+        cache[key] = after
+    return changed
+
+
+def check_or_migrate_schemas(progress: Optional[Callable[[dict], None]] = None) -> None:
+    """
+    台帳CSVのヘッダーを正スキーマに揃える。
+    progress を渡すと、書き直し中の進み具合（file / rows / percent / rows_per_sec）を渡して呼ぶ。
+    """
     paths = get_project_paths()
     data_dir = paths["data"]
     loan_csv = paths["loans_csv"]
@@ -185,18 +414,27 @@ def check_or_migrate_schemas() -> None:
         logger.warning("TARGET_SCHEMAS entries are empty. Please fill correct headers.")
         return
 
-    changed1, m1 = _migrate_one(
-        loan_csv, loan_schema, RENAME_MAPS.get("loan_v3", {}), DEFAULTS.get("loan_v3", {})
-    )
-    logger.info(m1)
-    changed2, m2 = _migrate_one(
-        rep_csv, rep_schema, RENAME_MAPS.get("repayments", {}), DEFAULTS.get("repayments", {})
-    )
-    logger.info(m2)
+    cache_path = schema_cache_path(data_dir)
+    cache = _load_cache(cache_path)
+    snapshot = json.dumps(cache, sort_keys=True)
+
+    changed1 = _check_one(cache, "loan_v3", loan_csv, progress)
+    changed2 = _check_one(cache, "repayments", rep_csv, progress)
+
+    if json.dumps(cache, sort_keys=True) != snapshot:
+        _save_cache(cache_path, cache)
 
     if not (changed1 or changed2):
         logger.info("Schema check: no changes. All good.")
 
 
+def _print_progress(info: dict) -> None:
+    print(
+        f"[migrate] {info['file']}: {info['rows']:,} rows ({info['percent']:.0f}%) "
+        f"{info['rows_per_sec']:,.0f} rows/s",
+        file=sys.stderr,
+    )
+
+
 if __name__ == "__main__":
-    check_or_migrate_schemas()
+    check_or_migrate_schemas(progress=_print_progress)
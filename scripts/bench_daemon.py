@@ -0,0 +1,105 @@
+# scripts/bench_daemon.py
+"""
+常駐デーモン（modules.ledger_daemon）の照会の速さ。
+
+- local : 毎回新しいプロセスのつもりで、.snap から貸付・返済累計を読み直して1顧客の未返済一覧を作る
+- memory: デーモン内（LedgerState）での同じ照会
+- socket: Unix ソケット越しの往復（クライアントが実際に待つ時間）
+- append: 返済1行を追記したあとの最初の照会（増えた分だけ読む）
+
+使い方（一時ディレクトリに台帳を作るので data/ には触らない）:
+    python scripts/bench_daemon.py --loans 200000 --queries 200
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))  # project root を import path に追加
+sys.path.append(str(ROOT / "scripts"))
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="常駐デーモンの照会の計測")
+    ap.add_argument("--loans", type=int, default=200_000, help="台帳の貸付件数")
+    ap.add_argument("--queries", type=int, default=200, help="種類ごとの照会回数")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    from bench_summary import write_ledger
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_daemon_"))
+    os.environ["APP_AUDIT_FILE"] = str(workdir / "audit_log.csv")
+    try:
+        write_ledger(workdir, args.loans, seed=args.seed)
+        loans, reps = str(workdir / "loan_v3.csv"), str(workdir / "repayments.csv")
+
+        from modules import ledger_daemon
+        from modules.ledger_snapshot import clear_memo
+        from modules.loan_module import build_unpaid_loan_rows
+
+        started = time.perf_counter()
+        state = ledger_daemon.LedgerState(loans, reps)
+        state.refresh()
+        print(f"ledger: loans={len(state.loans):,} | daemon load {(time.perf_counter() - started) * 1000:,.0f} ms")
+
+        rnd = random.Random(args.seed)
+        customers = list(state.by_customer)
+        today = date.today()
+
+        def local():
+            clear_memo()
+            build_unpaid_loan_rows(rnd.choice(customers), loans, reps, today=today)
+
+        def memory():
+            state.refresh()
+            state.unpaid_rows([rnd.choice(customers)], "all", today)
+
+        sock = workdir / "ledger.sock"
+        server = ledger_daemon.LedgerServer(sock, state)
+        threading.Thread(target=server.serve_until_shutdown, daemon=True).start()
+
+        def remote():
+            ledger_daemon.call(sock, {"op": "unpaid", "customers": [rnd.choice(customers)],
+                                      "filter_mode": "all", "today": today.isoformat()})
+
+        loan_ids = list(state.by_id)
+
+        def append():
+            with open(reps, "a", encoding="utf-8") as f:
+                f.write(f"{rnd.choice(loan_ids)},CUST000001,1,{today},REPAYMENT\n")
+            remote()
+
+        print(f"{'query':<8}{'median ms':>12}{'p95 ms':>10}")
+        for name, fn, n in (("local", local, max(3, args.queries // 20)), ("memory", memory, args.queries),
+                            ("socket", remote, args.queries), ("append", append, args.queries)):
+            median, p95 = timed(fn, n)
+            print(f"{name:<8}{median:>12.3f}{p95:>10.3f}")
+        print(f"reloads after appends: {state.reloads}")
+        ledger_daemon.call(sock, {"op": "shutdown"})
+        server.server_close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
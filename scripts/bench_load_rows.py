@@ -0,0 +1,82 @@
+# scripts/bench_load_rows.py
+"""
+load_loans / load_repayments / load_customers の読み込み方式の比較。
+
+- orm : Model.query...all() で ORM オブジェクトを作ってから *_to_dict で dict にする（従来の方式）
+- core: 列だけの select を yield_per で読み、そのまま dict にする（現在の load_*）
+
+使い方（一時DBを作るので本番DBには触らない）:
+    python scripts/bench_load_rows.py --loans 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))  # project root を import path に追加
+sys.path.append(str(ROOT / "scripts"))
+
+
+def best_of(repeat, run):
+    """run() を repeat 回実行し、(最短ミリ秒, 件数) を返す。"""
+    best = None
+    count = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = len(run())
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="load_* の ORM 読み込みと列 select の比較")
+    ap.add_argument("--loans", type=int, default=100000, help="投入する貸付件数")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_load_rows_"))
+    os.environ["APP_DB_PATH"] = str(workdir / "bench.db")
+
+    import app as web_app
+    from flask import g
+    from web_seed import seed_web_db
+
+    counts = seed_web_db(web_app, args.loans, seed=args.seed)
+    print(f"seeded: loans={counts['loans']:,} repayments={counts['repayments']:,} ({workdir})")
+
+    def orm(model, to_dict, *order):
+        def run():
+            entities = model.query.filter_by(user_id=g.user.user_id).order_by(*order).all()
+            rows = [to_dict(entity) for entity in entities]
+            web_app.db.session.expunge_all()
+            return rows
+        return run
+
+    cases = [
+        ("load_loans", orm(web_app.Loan, web_app.loan_to_dict,
+                           web_app.Loan.loan_date, web_app.Loan.loan_id), web_app.load_loans),
+        ("load_repayments", orm(web_app.Repayment, web_app.repayment_to_dict,
+                                web_app.Repayment.repayment_date, web_app.Repayment.repayment_id),
+         web_app.load_repayments),
+        ("load_customers", orm(web_app.Customer, web_app.customer_to_dict,
+                               web_app.Customer.customer_id), web_app.load_customers),
+    ]
+
+    print(f"{'helper':<18}{'rows':>10}{'orm ms':>10}{'core ms':>10}{'speedup':>9}")
+    with web_app.app.test_request_context():
+        g.user = web_app.db.session.get(web_app.User, 1)
+        for name, orm_run, core_run in cases:
+            assert orm_run() == core_run()
+            orm_ms, rows = best_of(args.repeat, orm_run)
+            core_ms, _ = best_of(args.repeat, core_run)
+            print(f"{name:<18}{rows:>10,}{orm_ms:>10.1f}{core_ms:>10.1f}{orm_ms / core_ms:>8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+# scripts/bench_migrate.py
+"""
+schema_migrator の書き直し（旧ヘッダーの loan_v3.csv → 正スキーマ）の速度とピークメモリ。
+
+使い方（一時ディレクトリに旧形式の台帳を作るので data/ には触らない）:
+    python scripts/bench_migrate.py --loans 1000000
+"""
+import argparse
+import csv
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))  # project root を import path に追加
+
+OLD_HEADER = ["loan_id", "customer_id", "amount", "loan_date", "due_date", "interest_percent",
+              "repayment_expected_amount", "repaymentMethod", "grace_days"]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="schema_migrator の書き直しの計測")
+    ap.add_argument("--loans", type=int, default=500_000, help="旧形式の台帳の行数")
+    args = ap.parse_args(argv)
+
+    import schema_migrator as sm
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_migrate_"))
+    try:
+        src = workdir / "loan_v3.csv"
+        with src.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(OLD_HEADER)
+            for i in range(args.loans):
+                w.writerow([f"L20250101-{i:07d}", f"CUST{i % 5000:05d}", 10000, "2025-01-01",
+                            "2025-01-31", 10, 11000, "CASH", "" if i % 2 else 3])
+        print(f"source: {args.loans:,} rows ({src.stat().st_size / 1e6:,.1f} MB)")
+
+        sm.ENABLE_BACKUP = False
+        original = src.read_bytes() if args.loans <= 2_000_000 else None
+
+        started = time.perf_counter()
+        _, message = sm._migrate_one(src, sm.TARGET_SCHEMAS["loan_v3"], sm.RENAME_MAPS["loan_v3"],
+                                     sm.DEFAULTS["loan_v3"], progress=sm._print_progress)
+        print(message)
+        print(f"elapsed {time.perf_counter() - started:,.2f} s")
+
+        if original is not None:
+            # ピークメモリは別に測る（tracemalloc を付けると数倍遅くなるため）
+            src.write_bytes(original)
+            del original
+            tracemalloc.start()
+            sm._migrate_one(src, sm.TARGET_SCHEMAS["loan_v3"], sm.RENAME_MAPS["loan_v3"], sm.DEFAULTS["loan_v3"])
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"peak {peak / 1024:,.0f} KiB (tracemalloc)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+# scripts/bench_startup.py
+"""
+CLI（main.py）の起動時間の計測。
+
+- import: `python -X importtime -c "import main"` の main の累積時間と、時間のかかった上位モジュール
+- wall  : `python main.py --summary` と、メニューを出してすぐ終了（"0" を入力）するまでの実時間
+
+使い方:
+    python scripts/bench_startup.py --repeat 5
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def import_times(module="main", cwd=ROOT, env=None):
+    """
+    -X importtime の出力を {モジュール名: (self マイクロ秒, 累積マイクロ秒)} にして返す。
+    同じ名前が複数回出たときは最後（一番外側）の値。
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def wall_ms(args, stdin_text, cwd, env):
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args], cwd=cwd, env=env, input=stdin_text,
+        capture_output=True, text=True, check=True,
+    )
+    return (time.perf_counter() - started) * 1000
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="main.py の起動時間の計測")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10, help="表示する上位モジュール数")
+    args = ap.parse_args(argv)
+
+    # CLI 一式を一時ディレクトリに写して動かす（台帳・ログ・監査は写した先の data/ に書かれる）
+    workdir = Path(tempfile.mkdtemp(prefix="bench_startup_"))
+    for name in ("main.py", "schema_migrator.py"):
+        shutil.copy2(ROOT / name, workdir / name)
+    shutil.copytree(ROOT / "modules", workdir / "modules", ignore=shutil.ignore_patterns("__pycache__"))
+    env = dict(os.environ)
+    env.pop("APP_SCHEMA_CACHE_FILE", None)
+
+    runs = [import_times(cwd=workdir, env=env) for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times["main"][1])
+    print(f"import main: best {best['main'][1] / 1000:.1f} ms（{args.repeat} 回中）")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda kv: -kv[1][0])[: args.top]:
+        print(f"  {name:<32}{self_us / 1000:>8.1f} ms self{cumulative_us / 1000:>9.1f} ms cumulative")
+
+    baseline = min(wall_ms(["-c", "pass"], "", workdir, env) for _ in range(args.repeat))
+    summary = min(wall_ms(["main.py", "--summary"], "", workdir, env) for _ in range(args.repeat))
+    menu = min(wall_ms(["main.py"], "0\n", workdir, env) for _ in range(args.repeat))
+    print(f"python -c pass       : {baseline:>7.1f} ms")
+    print(f"main.py --summary    : {summary:>7.1f} ms")
+    print(f"main.py（メニュー→0）: {menu:>7.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
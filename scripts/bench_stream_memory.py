@@ -0,0 +1,122 @@
+# scripts/bench_stream_memory.py
+"""
+一覧画面の描画方式による、ピークメモリと最初の1バイトまでの時間（TTFB）の比較。
+
+- buffered: 行をリストに読み込んでから render_template で HTML 全体を作る（従来の方式）
+- streamed: 実際のルート（stream_template + カーソルからの逐次読み出し）をチャンクごとに読み捨てる
+
+使い方（一時DBを作るので本番DBには触らない）:
+    python scripts/bench_stream_memory.py --loans 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))  # project root を import path に追加
+sys.path.append(str(ROOT / "scripts"))
+
+
+def measure(run):
+    """run() が返すチャンクのイテレーターを読み切り、(ピークKiB, TTFBミリ秒, 合計ミリ秒, バイト数) を返す。"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    first = None
+    size = 0
+
+    for chunk in run():
+        if first is None:
+            first = time.perf_counter()
+        size += len(chunk)
+
+    ended = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024, ((first or ended) - started) * 1000, (ended - started) * 1000, size
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="一覧画面の buffered / streamed 描画のメモリ比較")
+    ap.add_argument("--loans", type=int, default=20000, help="投入する貸付件数")
+    ap.add_argument("--per-page", type=int, default=500, help="貸付一覧・返済一覧の1ページの件数")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_stream_"))
+    os.environ["APP_DB_PATH"] = str(workdir / "bench.db")
+    os.environ["APP_VIEW_CACHE_SIZE"] = "0"
+
+    import app as web_app
+    from flask import g, render_template
+    from web_seed import seed_web_db
+
+    counts = seed_web_db(web_app, args.loans, seed=args.seed)
+    print(f"seeded: loans={counts['loans']:,} repayments={counts['repayments']:,} ({workdir})")
+
+    client = web_app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+
+    def buffered(path, build):
+        def run():
+            with web_app.app.test_request_context(path):
+                g.user = web_app.db.session.get(web_app.User, 1)
+                yield build().encode("utf-8")
+        return run
+
+    def streamed(path):
+        def run():
+            response = client.get(path)
+            try:
+                for chunk in response.response:
+                    yield chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+            finally:
+                response.close()
+        return run
+
+    def loan_list_buffered():
+        loans, page = web_app.keyset_page(
+            web_app.Loan.query.filter_by(user_id=g.user.user_id),
+            (web_app.Loan.loan_date, web_app.Loan.loan_id),
+            web_app.loan_to_dict,
+        )
+        return render_template("loan_list.html", loans=loans, page=page)
+
+    def repayment_list_buffered():
+        repayments, page = web_app.keyset_page(
+            web_app.Repayment.query.filter_by(user_id=g.user.user_id),
+            (web_app.Repayment.repayment_date, web_app.Repayment.repayment_id),
+            web_app.repayment_to_dict,
+        )
+        return render_template("repayment_list.html", repayments=repayments, page=page)
+
+    def loan_status_buffered():
+        today = date.today()
+        rows = web_app.query_unpaid_loan_rows(g.user.user_id, today)
+        summary = web_app.summarize_unpaid_rows(g.user.user_id, today)
+        return render_template("loan_status.html", as_of=None, unpaid_loans=rows, **summary)
+
+    cases = [
+        (f"/loans?per_page={args.per_page}", loan_list_buffered),
+        (f"/repayments?per_page={args.per_page}", repayment_list_buffered),
+        ("/loan-status", loan_status_buffered),
+    ]
+
+    print(f"{'page':<28}{'mode':<10}{'peak KiB':>12}{'TTFB ms':>10}{'total ms':>10}{'bytes':>12}")
+    for path, build in cases:
+        # 1回目は SQLite のページキャッシュ・テンプレートのコンパイルを温めるだけ
+        measure(buffered(path, build))
+        for mode, run in (("buffered", buffered(path, build)), ("streamed", streamed(path))):
+            peak, ttfb, total, size = measure(run)
+            print(f"{path:<28}{mode:<10}{peak:>12,.0f}{ttfb:>10.1f}{total:>10.1f}{size:>12,}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+# scripts/bench_summary.py
+"""
+main.py --summary の実時間の計測（大きな台帳で、集計サイドカーが無いとき/あるとき）。
+
+- cold: ledger_stats.json が無い状態（台帳を全件数え直してサイドカーを書く）
+- warm: サイドカーが台帳と一致している状態（台帳 CSV は開かない）
+
+使い方（一時ディレクトリに台帳を作るので data/ には触らない）:
+    python scripts/bench_summary.py --loans 500000 --repeat 5
+"""
+import argparse
+import csv
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+LOAN_HEADER = [
+    "loan_id", "customer_id", "loan_amount", "loan_date", "due_date", "interest_rate_percent",
+    "repayment_expected", "repayment_method", "grace_period_days", "late_fee_rate_percent",
+    "late_base_amount", "contract_status", "cancelled_at", "cancel_reason", "notes",
+]
+REPAYMENT_HEADER = ["loan_id", "customer_id", "repayment_amount", "repayment_date", "payment_type"]
+
+
+def write_ledger(data_dir, n_loans, seed=0):
+    rnd = random.Random(seed)
+    today = date.today()
+    with (data_dir / "loan_v3.csv").open("w", newline="", encoding="utf-8") as lf, \
+            (data_dir / "repayments.csv").open("w", newline="", encoding="utf-8") as rf:
+        loans, reps = csv.writer(lf), csv.writer(rf)
+        loans.writerow(LOAN_HEADER)
+        reps.writerow(REPAYMENT_HEADER)
+        for i in range(n_loans):
+            loan_date = today - timedelta(days=rnd.randint(0, 400))
+            amount = rnd.randrange(1_000, 500_000, 1_000)
+            expected = int(amount * 1.1)
+            loan_id = f"L{loan_date:%Y%m%d}-{i:07d}"
+            customer_id = f"CUST{rnd.randint(1, max(1, n_loans // 5)):06d}"
+            loans.writerow([
+                loan_id, customer_id, amount, loan_date.isoformat(),
+                (loan_date + timedelta(days=30)).isoformat(), 10, expected, "CASH",
+                rnd.choice([0, 3]), 10, amount, "ACTIVE", "", "", "",
+            ])
+            paid = rnd.choice([0, expected // 3, expected])
+            if paid:
+                reps.writerow([loan_id, customer_id, paid, loan_date.isoformat(), "REPAYMENT"])
+
+
+def time_summary(cwd, repeat, before=None):
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "main.py", "--summary"], cwd=cwd, check=True,
+                       stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="main.py --summary の cold / warm 比較")
+    ap.add_argument("--loans", type=int, default=200_000, help="台帳の貸付件数")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_summary_"))
+    try:
+        shutil.copy2(ROOT / "main.py", workdir / "main.py")
+        shutil.copytree(ROOT / "modules", workdir / "modules",
+                        ignore=shutil.ignore_patterns("__pycache__"))
+        (workdir / "data").mkdir()
+        write_ledger(workdir / "data", args.loans, seed=args.seed)
+        stats_file = workdir / "data" / "ledger_stats.json"
+        size_mb = sum(p.stat().st_size for p in (workdir / "data").glob("*.csv")) / 1e6
+        print(f"ledger: loans={args.loans:,} ({size_mb:,.1f} MB)")
+
+        cold = time_summary(workdir, args.repeat, before=lambda: stats_file.unlink(missing_ok=True))
+        warm = time_summary(workdir, args.repeat)
+        print(f"--summary cold (recount): {cold:8.1f} ms")
+        print(f"--summary warm (sidecar): {warm:8.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,401 @@
+# scripts/loadtest.py
+"""
+Web 版のローカル負荷試験（gunicorn の worker 数・種類を決めるための計測用）。
+
+一時DBにデータを投入し（scripts/web_seed.py）、仮想ユーザーごとにログインしてから
+ダッシュボード・未返済一覧の表示と、返済・貸付の登録 POST を重み付きで繰り返す。
+エンドポイントごとの件数・エラー数・スループット・レイテンシ（p50 / p90 / p99 / max）を表示する。
+
+モード:
+- client  : Flask の test client をプロセス内で使う（ネットワーク・WSGI サーバーを含まない）
+- gunicorn: gunicorn をローカルで起動し、HTTP で叩く（--worker-class sync / gthread を比較できる）
+
+例:
+    python scripts/loadtest.py --mode client --loans 5000 --users 4 --concurrency 8 --duration 20
+    python scripts/loadtest.py --mode gunicorn --worker-class gthread --workers 2 --threads 4
+    python scripts/loadtest.py --mode client --drop-index ix_loans_user_trim_loan   # インデックスの効果
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))  # project root を import path に追加
+sys.path.append(str(ROOT / "scripts"))
+
+PASSWORD = "loadtest"
+DEFAULT_MIX = "dashboard=4,loan_status=3,repayment=2,loan=1"
+PERCENTILES = (50, 90, 99)
+
+
+# ======================
+# シナリオ
+# ======================
+
+
+def parse_mix(text):
+    """'dashboard=4,loan_status=3' を [(名前, 重み), ...] に。"""
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"❌ ERROR: 不明なシナリオです: {name!r}（{', '.join(SCENARIOS)}）")
+        mix.append((name, int(weight or 1)))
+    return mix
+
+
+def dashboard(vuser):
+    return "GET", "/dashboard", None, 200
+
+
+def loan_status(vuser):
+    return "GET", "/loan-status", None, 200
+
+
+def repayment(vuser):
+    # 1円ずつ返すので、投入済みの未返済貸付に対してはほぼ必ず受け付けられる
+    return "POST", "/repayments/new", {
+        "loan_id": vuser.rnd.choice(vuser.loan_ids),
+        "repayment_amount": "1",
+        "repayment_date": date.today().isoformat(),
+        "payment_type": "REPAYMENT",
+    }, 302
+
+
+def loan(vuser):
+    today = date.today()
+    return "POST", "/loans/new", {
+        "customer_id": vuser.rnd.choice(vuser.customer_ids),
+        "loan_amount": str(vuser.rnd.randrange(1_000, 200_000, 1_000)),
+        "loan_date": today.isoformat(),
+        "due_date": (today + timedelta(days=30)).isoformat(),
+        "interest_rate_percent": "10",
+        "repayment_method": "CASH",
+        "grace_period_days": "0",
+        "late_fee_rate_percent": "14.6",
+        "notes": "",
+    }, 302
+
+
+SCENARIOS = {
+    "dashboard": dashboard,
+    "loan_status": loan_status,
+    "repayment": repayment,
+    "loan": loan,
+}
+
+
+# ======================
+# クライアント
+# ======================
+
+
+class TestClientDriver:
+    """Flask の test client（仮想ユーザーごとに1つ。Cookie も別々）。"""
+
+    def __init__(self, web_app):
+        self.client = web_app.app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        try:
+            response.get_data()  # ストリーミング応答も最後まで読む
+            return response.status_code
+        finally:
+            response.close()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """urllib による HTTP クライアント（リダイレクトは追わずに 302 をそのまま数える）。"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect,
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode("utf-8") if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+
+# ======================
+# 実行
+# ======================
+
+
+class VirtualUser:
+    def __init__(self, index, driver, username, loan_ids, customer_ids, seed):
+        self.index = index
+        self.driver = driver
+        self.username = username
+        self.loan_ids = loan_ids
+        self.customer_ids = customer_ids
+        self.rnd = random.Random(seed * 1000 + index)
+
+    def login(self):
+        status = self.driver.request("POST", "/login", {"username": self.username, "password": PASSWORD})
+        if status != 302:
+            raise RuntimeError(f"ログインに失敗しました: {self.username}（HTTP {status}）")
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name, seconds, ok):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    """エンドポイントごと（と全体）の集計を返す。時間はミリ秒。"""
+    rows = {}
+    everything = []
+    for name in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[name])
+        everything.extend(values)
+        rows[name] = _stats(values, recorder.errors[name], elapsed)
+    rows["TOTAL"] = _stats(sorted(everything), sum(recorder.errors.values()), elapsed)
+    return rows
+
+
+def _stats(values, errors, elapsed):
+    stats = {
+        "count": len(values),
+        "errors": errors,
+        "rps": len(values) / elapsed if elapsed else 0.0,
+    }
+    for pct in PERCENTILES:
+        stats[f"p{pct}_ms"] = percentile(values, pct) * 1000
+    stats["max_ms"] = (values[-1] if values else 0.0) * 1000
+    return stats
+
+
+def load_fixtures(web_app, users):
+    """仮想ユーザーが使う loan_id（未返済のもの）と customer_id をユーザーごとに読む。"""
+    fixtures = {}
+    with web_app.app.app_context():
+        for user_id, username in users:
+            rows = web_app.query_unpaid_loan_rows(user_id, date.today())
+            loan_ids = [row["loan_id"] for row in rows if row["remaining"] > 0]
+            customer_ids = [
+                customer.customer_id
+                for customer in web_app.Customer.query.filter_by(user_id=user_id)
+            ]
+            fixtures[username] = (loan_ids, customer_ids)
+    return fixtures
+
+
+def run(make_driver, users, fixtures, mix, *, concurrency, duration, seed=0):
+    """
+    concurrency 本のスレッドで duration 秒間シナリオを繰り返し、(Recorder, 経過秒) を返す。
+    スレッド i はユーザー users[i % len(users)] としてログインする。
+    """
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    recorder = Recorder()
+    vusers = []
+    for i in range(concurrency):
+        _, username = users[i % len(users)]
+        loan_ids, customer_ids = fixtures[username]
+        vuser = VirtualUser(i, make_driver(), username, loan_ids, customer_ids, seed)
+        vuser.login()
+        vusers.append(vuser)
+
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def worker(vuser):
+        while time.perf_counter() < deadline:
+            name = vuser.rnd.choices(names, weights)[0]
+            method, path, data, expected = SCENARIOS[name](vuser)
+            t0 = time.perf_counter()
+            try:
+                status = vuser.driver.request(method, path, data)
+            except Exception:
+                status = None
+            recorder.add(name, time.perf_counter() - t0, status == expected)
+
+    threads = [threading.Thread(target=worker, args=(vuser,), daemon=True) for vuser in vusers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - started
+
+
+def print_report(rows, elapsed, label):
+    print(f"\n=== {label}（{elapsed:.1f} 秒） ===")
+    header = f"{'endpoint':<14}{'count':>8}{'errors':>8}{'req/s':>9}"
+    header += "".join(f"{f'p{pct} ms':>10}" for pct in PERCENTILES) + f"{'max ms':>10}"
+    print(header)
+    for name, stats in rows.items():
+        line = f"{name:<14}{stats['count']:>8,}{stats['errors']:>8,}{stats['rps']:>9.1f}"
+        line += "".join(f"{stats[f'p{pct}_ms']:>10.1f}" for pct in PERCENTILES)
+        line += f"{stats['max_ms']:>10.1f}"
+        print(line)
+
+
+# ======================
+# gunicorn
+# ======================
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args, env):
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--chdir", str(ROOT),
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--worker-class", args.worker_class,
+        "--threads", str(args.threads),
+        "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ ERROR: gunicorn が起動できませんでした（終了コード {process.returncode}）。")
+        try:
+            with urllib.request.urlopen(base_url + "/login", timeout=1) as response:
+                response.read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise SystemExit("❌ ERROR: gunicorn の起動待ちがタイムアウトしました。")
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# ======================
+# main
+# ======================
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Web 版のローカル負荷試験")
+    ap.add_argument("--mode", choices=("client", "gunicorn"), default="client")
+    ap.add_argument("--loans", type=int, default=2000, help="ユーザーあたりの貸付件数")
+    ap.add_argument("--users", type=int, default=2, help="ログインするユーザー数")
+    ap.add_argument("--concurrency", type=int, default=4, help="同時に動く仮想ユーザー数")
+    ap.add_argument("--duration", type=float, default=10.0, help="計測時間（秒）")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"シナリオの重み（既定 {DEFAULT_MIX}）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--db", default=None, help="DBファイル（既定は一時ディレクトリ。既存ファイルは作り直す）")
+    ap.add_argument("--drop-index", action="append", default=[], metavar="NAME",
+                    help="投入後に削除するインデックス（複数指定可。インデックスの効果を見る用）")
+    ap.add_argument("--json", default=None, help="集計結果を JSON で書き出すパス")
+    ap.add_argument("--workers", type=int, default=2, help="gunicorn の worker 数")
+    ap.add_argument("--worker-class", default="sync", help="gunicorn の worker 種類（sync / gthread など）")
+    ap.add_argument("--threads", type=int, default=1, help="gunicorn の worker あたりのスレッド数")
+    args = ap.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    db_path = Path(args.db) if args.db else Path(tempfile.mkdtemp(prefix="loadtest_")) / "loadtest.db"
+    os.environ["APP_DB_PATH"] = str(db_path)
+    os.environ.setdefault("SECRET_KEY", "loadtest-secret-key")
+
+    import app as web_app
+    from sqlalchemy import text
+    from web_seed import seed_web_db
+
+    t0 = time.perf_counter()
+    counts = seed_web_db(web_app, args.loans, users=args.users, seed=args.seed, password=PASSWORD)
+    print(f"seeded {db_path}: users={len(counts['users'])} loans={counts['loans']:,} "
+          f"repayments={counts['repayments']:,}（{time.perf_counter() - t0:.1f} 秒）")
+
+    with web_app.app.app_context():
+        for name in args.drop_index:
+            web_app.db.session.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+            print(f"dropped index: {name}")
+        web_app.db.session.commit()
+
+    fixtures = load_fixtures(web_app, counts["users"])
+    label = f"mode={args.mode} concurrency={args.concurrency} mix={args.mix}"
+
+    if args.mode == "client":
+        recorder, elapsed = run(
+            lambda: TestClientDriver(web_app), counts["users"], fixtures, mix,
+            concurrency=args.concurrency, duration=args.duration, seed=args.seed,
+        )
+    else:
+        label += f" workers={args.workers} worker_class={args.worker_class} threads={args.threads}"
+        process, base_url = start_gunicorn(args, dict(os.environ))
+        try:
+            recorder, elapsed = run(
+                lambda: HttpDriver(base_url), counts["users"], fixtures, mix,
+                concurrency=args.concurrency, duration=args.duration, seed=args.seed,
+            )
+        finally:
+            stop_gunicorn(process)
+
+    rows = summarize(recorder, elapsed)
+    print_report(rows, elapsed, label)
+
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps({"label": label, "elapsed": elapsed, "endpoints": rows}, ensure_ascii=False, indent=1),
+            encoding="utf-8",
+        )
+    return 1 if rows["TOTAL"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -141,11 +141,16 @@ def recalc_expected(principal: str, rate_percent: str) -> int:
     return int(expected.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
 
 
-def backup_csv(csv_path: Path, backup_dir: Path) -> Path:
-    ts = datetime.now(timezone.utc).astimezone().strftime("%Y%m%d%H%M%S")
-    backup_path = backup_dir / f"{csv_path.stem}_{ts}.bak{csv_path.suffix}"
-    backup_path.write_bytes(csv_path.read_bytes())
-    return backup_path
+def backup_csv(csv_path: Path, backup_dir: Path | None) -> Path:
+    # backup/<csv名>/ に世代として保存（直前の世代からの追記分だけを保存する）
+    root = str(Path(__file__).resolve().parents[1])  # project root を import path に追加
+    if root not in sys.path:
+        sys.path.append(root)
+    from modules.backup import backup_file, default_backup_root
+
+    gen = backup_file(csv_path, backup_root=backup_dir)
+    root = Path(backup_dir) if backup_dir else default_backup_root(csv_path)
+    return root / csv_path.name / gen["blob"]
 
 
 def append_audit_row(
@@ -208,7 +213,7 @@ def migrate(
     csv_path: Path,
     dry_run: bool,
     no_backup: bool,
-    backup_dir: Path,
+    backup_dir: Path | None,
     fail_on_warn: bool,
     operator: str,
     mapping_path: Path,
@@ -244,7 +249,6 @@ def migrate(
     # Backup
     backup_path = None
     if not dry_run and not no_backup:
-        backup_dir.mkdir(parents=True, exist_ok=True)
         backup_path = backup_csv(csv_path, backup_dir)
 
     # Process rows
@@ -367,14 +371,14 @@ def main():
     p.add_argument("--csv", default="data/loan_v3.csv")
     p.add_argument("--dry-run", action="store_true")
     p.add_argument("--no-backup", action="store_true")
-    p.add_argument("--backup-dir", default="data/")
+    p.add_argument("--backup-dir", default=None, help="既定: APP_BACKUP_DIR または backup/")
     p.add_argument("--fail-on-warn", action="store_true")
     p.add_argument("--operator", default="CLI_USER")
     p.add_argument("--mapping", default="data/c35_method_mapping.json")
     args = p.parse_args()
 
     csv_path = Path(args.csv)
-    backup_dir = Path(args.backup_dir)
+    backup_dir = Path(args.backup_dir) if args.backup_dir else None
     mapping_path = Path(args.mapping)
 
     code = migrate(
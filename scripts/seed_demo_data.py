@@ -45,9 +45,17 @@ def _backup_if_exists(path: Path):
     # ファイルが存在する時だけバックアップ（ディレクトリは無視）
     if not path.is_file():
         return
+    try:
+        from modules.backup import backup_file
+    except ImportError:
+        backup_file = None
+    if backup_file is not None:
+        # backup/ に世代として保存（--force の上書き前なので、次の世代は full になる）
+        backup_file(path)
+        return
     from datetime import datetime
     ts = datetime.now().strftime("%Y%m%d%H%M%S")
-    # 例: loan_v3.csv.bak.20251029... を同じフォルダに作成
+    # 最小構成（modules/backup.py が無い）では従来どおり同じフォルダにコピー
     candidate = path.with_name(f"{path.name}.bak.{ts}")
     i = 1
     while candidate.exists():
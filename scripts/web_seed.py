@@ -0,0 +1,120 @@
+# scripts/web_seed.py
+"""
+Web 版（SQLite）のベンチマーク・負荷試験用に、ランダムな顧客・貸付・返済を一括投入する。
+
+app.py は import 時に DB パスを決めるので、APP_DB_PATH を設定してから app を import して渡すこと。
+データの分布は tests/conftest.py の seed_ledger と同じ（完済・一部返済・未返済・延滞手数料支払いが混ざる）。
+"""
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+INSERT_BATCH_SIZE = 5000
+
+
+def _flush(web_app, model, rows):
+    if rows:
+        web_app.db.session.execute(insert(model), rows)
+        rows.clear()
+
+
+def seed_web_db(web_app, n_loans, *, users=1, seed=0, password="pw"):
+    """
+    DB を作り直し、users 人のユーザー（user1, user2, ...）それぞれに n_loans 件の貸付を入れる。
+    返り値: {"users": [(user_id, username), ...], "loans": 件数, "repayments": 件数}
+    """
+    rnd = random.Random(seed)
+    today = date.today()
+    now = web_app.now_str()
+    password_hash = generate_password_hash(password)
+    counts = {"users": [], "loans": 0, "repayments": 0}
+
+    with web_app.app.app_context():
+        web_app.db.drop_all()
+        web_app.db.create_all()
+
+        for user_id in range(1, users + 1):
+            username = f"user{user_id}"
+            web_app.db.session.add(
+                web_app.User(
+                    user_id=user_id,
+                    username=username,
+                    password_hash=password_hash,
+                    role="ADMIN" if user_id == 1 else "USER",
+                    is_active=True,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+            counts["users"].append((user_id, username))
+        web_app.db.session.commit()
+
+        for user_id in range(1, users + 1):
+            prefix = f"U{user_id}"
+            customers = [f"{prefix}C{i:05d}" for i in range(max(1, n_loans // 5))]
+            web_app.db.session.execute(
+                insert(web_app.Customer),
+                [
+                    dict(customer_id=cid, user_id=user_id, customer_name=cid,
+                         credit_limit=1_000_000, created_at=now)
+                    for cid in customers
+                ],
+            )
+
+            loans, repayments = [], []
+            for i in range(n_loans):
+                loan_date = today - timedelta(days=rnd.randint(0, 400))
+                due_date = loan_date + timedelta(days=rnd.choice([7, 30, 60, 90]))
+                amount = rnd.randrange(1_000, 500_000, 1_000)
+                rate = rnd.choice([0, 5, 10, 15])
+                expected = int(amount * (1 + rate / 100))
+                loan_id = f"L{loan_date:%Y%m%d}-{prefix}{i:07d}"
+                customer_id = rnd.choice(customers)
+                loans.append(dict(
+                    loan_id=loan_id, user_id=user_id, customer_id=customer_id,
+                    loan_amount=amount, loan_date=loan_date.isoformat(),
+                    due_date=due_date.isoformat(), interest_rate_percent=rate,
+                    repayment_expected=expected, repayment_method="CASH",
+                    grace_period_days=rnd.choice([0, 0, 3, 10]),
+                    late_fee_rate_percent=rnd.choice([0, 10, 14.6]),
+                    late_base_amount=amount,
+                    contract_status="CANCELLED" if rnd.random() < 0.1 else "ACTIVE",
+                    cancelled_at=None, cancel_reason=None, notes=None, created_at=now,
+                ))
+
+                paid = rnd.choice([0, expected // 3, expected])
+                for part in (paid // 2, paid - paid // 2) if paid else ():
+                    if part:
+                        repayments.append(dict(
+                            user_id=user_id, loan_id=loan_id, customer_id=customer_id,
+                            repayment_amount=part,
+                            repayment_date=(loan_date + timedelta(days=rnd.randint(0, 60))).isoformat(),
+                            payment_type="REPAYMENT", created_at=now,
+                        ))
+                if rnd.random() < 0.3:
+                    repayments.append(dict(
+                        user_id=user_id, loan_id=loan_id, customer_id=customer_id,
+                        repayment_amount=rnd.randint(1, 3_000),
+                        repayment_date=today.isoformat(),
+                        payment_type="LATE_FEE", created_at=now,
+                    ))
+
+                counts["loans"] += 1
+                if len(loans) >= INSERT_BATCH_SIZE:
+                    _flush(web_app, web_app.Loan, loans)
+                if len(repayments) >= INSERT_BATCH_SIZE:
+                    # 返済は貸付より後に入れる（loan_balances のトリガーが貸付を引くため）
+                    _flush(web_app, web_app.Loan, loans)
+                    counts["repayments"] += len(repayments)
+                    _flush(web_app, web_app.Repayment, repayments)
+
+            _flush(web_app, web_app.Loan, loans)
+            counts["repayments"] += len(repayments)
+            _flush(web_app, web_app.Repayment, repayments)
+            web_app.db.session.commit()
+
+    web_app.view_cache.clear()
+    web_app.invalidate_principal()
+    return counts
@@ -26,6 +26,13 @@ REPAY_HEADER_ALIASES = {
 def _backup_if_exists(path: Path):
     if not path.is_file():
         return
+    try:
+        from modules.backup import backup_file
+    except ImportError:  # 最小構成（modules/utils.py のみ）では従来の丸ごとコピー
+        backup_file = None
+    if backup_file is not None:
+        backup_file(path)
+        return
     ts = __import__("datetime").datetime.now().strftime("%Y%m%d%H%M%S")
     candidate = path.with_name(f"{path.name}.bak.{ts}")
     i = 1
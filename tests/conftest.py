@@ -0,0 +1,185 @@
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# app.py は import 時に DB パスを決めるので、Web 系テストは専用の一時DBを使う
+_TEST_DIR = Path(tempfile.mkdtemp(prefix="loan_ledger_test_"))
+os.environ.setdefault("APP_DB_PATH", str(_TEST_DIR / "loan_ledger.db"))
+os.environ.setdefault("APP_UPLOAD_REPORT_DIR", str(_TEST_DIR / "upload_reports"))
+
+
+@pytest.fixture
+def web():
+    """空のDBとログイン済みユーザー（user_id=1）の test client を返す。"""
+    from werkzeug.security import generate_password_hash
+
+    import app as web_app
+
+    web_app.app.config["TESTING"] = True
+    # DBを作り直すとデータバージョンも振り出しに戻るので、画面キャッシュも空にする
+    web_app.view_cache.clear()
+    web_app.invalidate_principal()
+    with web_app.app.app_context():
+        web_app.db.drop_all()
+        web_app.db.create_all()
+        for user_id, name in ((1, "admin"), (2, "other")):
+            web_app.db.session.add(
+                web_app.User(
+                    user_id=user_id,
+                    username=name,
+                    password_hash=generate_password_hash("pw"),
+                    role="ADMIN" if user_id == 1 else "USER",
+                    is_active=True,
+                    created_at=web_app.now_str(),
+                    updated_at=web_app.now_str(),
+                )
+            )
+        web_app.db.session.commit()
+
+    client = web_app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+    client.module = web_app
+    yield client
+    with web_app.app.app_context():
+        web_app.db.session.remove()
+
+
+@pytest.fixture
+def seed_ledger(web):
+    """
+    ランダムな顧客・貸付・返済を投入する関数を返す。
+    seed_ledger(n_loans, seed=0, user_id=1) -> 投入した貸付件数
+    """
+    import random
+    from datetime import date, timedelta
+
+    m = web.module
+
+    def _seed(n_loans, seed=0, user_id=1):
+        rnd = random.Random(seed)
+        today = date.today()
+        prefix = f"U{user_id}S{seed}"
+        with m.app.app_context():
+            customers = [f"{prefix}C{i:03d}" for i in range(max(1, n_loans // 5))]
+            for cid in customers:
+                m.db.session.add(
+                    m.Customer(customer_id=cid, user_id=user_id, customer_name=cid,
+                               credit_limit=1_000_000, created_at=m.now_str())
+                )
+            for i in range(n_loans):
+                loan_date = today - timedelta(days=rnd.randint(0, 400))
+                due_date = loan_date + timedelta(days=rnd.choice([7, 30, 60, 90]))
+                amount = rnd.randrange(1_000, 500_000, 1_000)
+                rate = rnd.choice([0, 5, 10, 15])
+                expected = int(amount * (1 + rate / 100))
+                loan_id = f"L{loan_date:%Y%m%d}-{prefix}{i:05d}"
+                cancelled = rnd.random() < 0.1
+                m.db.session.add(
+                    m.Loan(
+                        loan_id=loan_id, user_id=user_id, customer_id=rnd.choice(customers),
+                        loan_amount=amount, loan_date=loan_date.isoformat(),
+                        due_date=due_date.isoformat(), interest_rate_percent=rate,
+                        repayment_expected=expected, repayment_method="CASH",
+                        grace_period_days=rnd.choice([0, 0, 3, 10]),
+                        late_fee_rate_percent=rnd.choice([0, 10, 14.6]),
+                        late_base_amount=amount,
+                        contract_status=rnd.choice(["CANCELLED", "cancelled "]) if cancelled else rnd.choice(["ACTIVE", "ACTIVE", " active"]),
+                        cancelled_at=None, cancel_reason=None, notes=None,
+                        created_at=m.now_str(),
+                    )
+                )
+                # 完済・一部返済・未返済・延滞手数料支払いをまんべんなく
+                paid = rnd.choice([0, expected // 3, expected])
+                for part in (paid // 2, paid - paid // 2) if paid else ():
+                    if part:
+                        m.db.session.add(
+                            m.Repayment(user_id=user_id, loan_id=loan_id, customer_id=customers[0],
+                                        repayment_amount=part,
+                                        repayment_date=(loan_date + timedelta(days=rnd.randint(0, 60))).isoformat(),
+                                        payment_type=rnd.choice(["REPAYMENT", "REPAYMENT", " repayment"]),
+                                        created_at=m.now_str())
+                        )
+                if rnd.random() < 0.3:
+                    m.db.session.add(
+                        m.Repayment(user_id=user_id, loan_id=loan_id, customer_id=customers[0],
+                                    repayment_amount=rnd.randint(1, 3_000),
+                                    repayment_date=today.isoformat(),
+                                    payment_type=rnd.choice(["LATE_FEE", "late_fee"]),
+                                    created_at=m.now_str())
+                    )
+            m.db.session.commit()
+        return n_loans
+
+    return _seed
+
+
+# CLI 台帳（loan_v3.csv / repayments.csv）の見出しと、特に指定がないときの中身
+LOAN_CSV_HEADER = (
+    "loan_id,customer_id,loan_amount,loan_date,due_date,interest_rate_percent,"
+    "repayment_expected,repayment_method,grace_period_days,"
+    "late_fee_rate_percent,late_base_amount,contract_status,cancelled_at,cancel_reason,notes\n"
+)
+REPAYMENT_CSV_HEADER = "loan_id,customer_id,repayment_amount,repayment_date,payment_type\n"
+DEFAULT_LOAN_ROWS = (
+    "L1,CUST001,10000,2025-01-01,2025-01-31,0,10000,CASH,0,10,10000,ACTIVE,,,\n"
+    "L2,CUST001,5000,2025-01-02,2025-03-31,0,5000,CASH,0,10,5000,ACTIVE,,,\n"
+    "L3,CUST002,8000,2025-03-01,2025-03-10,0,8000,CASH,5,10,8000,ACTIVE,,,\n"
+    "L4,CUST003,3000,2025-01-05,2025-02-05,0,3000,CASH,0,10,3000,ACTIVE,,,\n"
+)
+DEFAULT_REPAYMENT_ROWS = (
+    "L1,CUST001,4000,2025-02-01,REPAYMENT\n"
+    "L4,CUST003,3000,2025-02-01,REPAYMENT\n"
+)
+
+
+@pytest.fixture
+def csv_ledger(tmp_path, monkeypatch):
+    """
+    CLI 台帳を作る関数を返す。
+    csv_ledger(loans=..., repayments=..., directory=tmp_path) -> (loans_csv, repayments_csv) の文字列パス
+    - loans / repayments は見出しを除いた CSV の行（省略時は DEFAULT_*_ROWS）
+    - 監査ログ（modules.audit / loan_module の AUDIT_PATH）は tmp_path に向け、loan_module.get_project_paths もこの台帳を指すようにする
+    """
+    import modules.audit as audit
+    import modules.loan_module as loan_module
+    from modules.ledger_snapshot import clear_memo
+
+    # AUDIT_PATH は import 時に決まるので、モジュール側も差し替える（環境変数はサブプロセス向け）
+    audit_log = tmp_path / "audit_log.csv"
+    monkeypatch.setenv("APP_AUDIT_FILE", str(audit_log))
+    monkeypatch.setattr(audit, "AUDIT_PATH", audit_log)
+    monkeypatch.setattr(loan_module, "_AUDIT_PATH", audit_log)
+    for name in ("APP_LEDGER_STATS_FILE", "APP_JOURNAL_FILE", "APP_OVERDUE_SNAPSHOT_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+    def _make(loans=DEFAULT_LOAN_ROWS, repayments=DEFAULT_REPAYMENT_ROWS, directory=None):
+        data = Path(directory) if directory else tmp_path
+        data.mkdir(parents=True, exist_ok=True)
+        loans_csv = data / "loan_v3.csv"
+        repayments_csv = data / "repayments.csv"
+        loans_csv.write_text(LOAN_CSV_HEADER + loans, encoding="utf-8")
+        repayments_csv.write_text(REPAYMENT_CSV_HEADER + repayments, encoding="utf-8")
+        monkeypatch.setattr(
+            loan_module, "get_project_paths",
+            lambda: {"loans_csv": loans_csv, "repayments_csv": repayments_csv},
+        )
+        clear_memo()
+        return str(loans_csv), str(repayments_csv)
+
+    return _make
+
+
+@pytest.fixture
+def cli_project(tmp_path, csv_ledger):
+    """main.py と modules/ を tmp_path に写し、data/ に既定の台帳を置いたプロジェクト（サブプロセス実行用）。"""
+    import shutil
+
+    root = Path(__file__).resolve().parents[1]
+    for name in ("main.py", "schema_migrator.py"):
+        shutil.copy2(root / name, tmp_path / name)
+    shutil.copytree(root / "modules", tmp_path / "modules", ignore=shutil.ignore_patterns("__pycache__"))
+    csv_ledger(directory=tmp_path / "data")
+    return tmp_path
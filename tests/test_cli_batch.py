@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+import subprocess
+import sys
+from datetime import date
+
+
+def run(project, *args):
+    return subprocess.run(
+        [sys.executable, "main.py", *args],
+        cwd=project, stdin=subprocess.DEVNULL, capture_output=True, text=True,
+    )
+
+
+def test_unpaid_csv_for_all_customers(cli_project):
+    result = run(cli_project, "--today", "2025-04-01", "unpaid", "--all")
+    assert result.returncode == 0, result.stderr
+
+    rows = list(csv.DictReader(io.StringIO(result.stdout)))
+    assert [(r["customer_id"], r["loan_id"], r["status"]) for r in rows] == [
+        ("CUST001", "L1", "OVERDUE"),
+        ("CUST002", "L3", "OVERDUE"),
+        ("CUST001", "L2", "OVERDUE"),
+    ]
+    assert rows[0]["remaining"] == "6000" and rows[0]["total_repaid"] == "4000"
+
+
+def test_unpaid_json_keeps_customer_order_and_flags_unknown(cli_project):
+    # --today はサブコマンドの後ろでもよい
+    result = run(cli_project, "unpaid", "--customer", "2", "--customer", "CUST001", "--customer", "9",
+                 "--overdue", "--format", "json", "--today", "2025-03-01")
+    assert result.returncode == 3
+    assert "CUST009" in result.stderr
+
+    rows = json.loads(result.stdout)
+    assert [r["loan_id"] for r in rows] == ["L1"]
+    assert rows[0]["overdue_days"] == 29
+
+
+def test_balance_and_summary(cli_project):
+    result = run(cli_project, "balance", "--customer", "1", "--customer", "3", "--format", "json")
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == [
+        {"customer_id": "CUST001", "unpaid_loans": 2, "total_expected": 15000,
+         "total_repaid": 4000, "total_remaining": 11000},
+        {"customer_id": "CUST003", "unpaid_loans": 0, "total_expected": 0,
+         "total_repaid": 0, "total_remaining": 0},
+    ]
+
+    summary = json.loads(run(cli_project, "summary", "--format", "json", "--today", "2025-02-15").stdout)
+    assert summary["loans"] == 4 and summary["repayments"] == 2
+    assert (summary["customers_with_unpaid"], summary["unpaid_loans"], summary["overdue_loans"]) == (1, 2, 1)  # L3 は 3/1 の貸付
+    assert summary["total_remaining"] == 6000 + 5000
+
+
+def test_register_repayment_and_cancel_exit_codes(cli_project):
+    ok = run(cli_project, "--today", "2025-02-10", "register-repayment", "--loan-id", "L2", "--amount", "1000")
+    assert ok.returncode == 0, ok.stderr
+    result = json.loads(ok.stdout)
+    assert result["ok"] and result["repayment_part"] == 1000
+    assert result["written_rows"][0]["repayment_date"] == "2025-02-10"
+
+    too_much = run(cli_project, "register-repayment", "--loan-id", "L2", "--amount", "999999", "--date", "2025-02-10")
+    assert too_much.returncode == 1 and json.loads(too_much.stdout)["ok"] is False
+
+    missing = run(cli_project, "cancel", "--loan-id", "L9")
+    assert missing.returncode == 3
+
+    assert run(cli_project, "cancel", "--loan-id", "L3", "--reason", "dup").returncode == 0
+    assert run(cli_project, "cancel", "--loan-id", "L3").returncode == 1
+
+    rows = list(csv.DictReader(io.StringIO(run(cli_project, "unpaid", "--all").stdout)))
+    assert "L3" not in {r["loan_id"] for r in rows}
+
+
+def test_bad_arguments_exit_with_usage_error(cli_project):
+    assert run(cli_project, "unpaid").returncode == 2
+    assert run(cli_project, "unpaid", "--all", "--format", "xml").returncode == 2
+
+
+def test_register_repayment_file_checkpoints_once_for_the_whole_file(csv_ledger, tmp_path, monkeypatch):
+    import main
+    from modules import journal
+
+    loans, reps = csv_ledger()
+    batch = tmp_path / "batch.csv"
+    batch.write_text("loan_id,amount,repayment_date\nL1,1000,\nL2,500,2025-02-11\nL9,100,\nL2,abc,\n",
+                     encoding="utf-8")
+
+    fsyncs, checkpoints = [], []
+    real_fsync, real_checkpoint = journal.os.fsync, journal.Journal._checkpoint_locked
+    monkeypatch.setattr(journal.os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+    monkeypatch.setattr(journal.Journal, "_checkpoint_locked",
+                        lambda self: checkpoints.append(self.path) or real_checkpoint(self))
+
+    out = io.StringIO()
+    args = main._parse_cli_args(["register-repayment", "--file", str(batch)])
+    code = main.cmd_register_repayment(args, out, date(2025, 2, 10), loans, reps)
+
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert code == main.EXIT_FAILED
+    assert [(r["row"], r["ok"]) for r in results] == [(2, True), (3, True), (4, False), (5, False)]
+    assert results[2]["error"] == "loan_id not found"
+    assert [r["repayment_date"] for r in csv.DictReader(open(reps, encoding="utf-8"))][-2:] == ["2025-02-10", "2025-02-11"]
+
+    # 2件の登録でチェックポイントは1回。fsync はジャーナル2回＋返済CSV・監査ログを最後に1回ずつ
+    # （1件ずつ確定させると 2 × 3 回）
+    assert len(checkpoints) == 1
+    assert len(fsyncs) == 4
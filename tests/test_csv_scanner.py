@@ -0,0 +1,79 @@
+from datetime import date
+
+from modules.csv_scanner import scan_columns, parse_int_field, parse_iso_date_field, sum_by_key
+from modules.loan_module import (
+    calculate_total_repaid_by_loan_id,
+    calculate_total_late_fee_paid_by_loan_id,
+)
+
+
+def test_scan_only_requested_columns_with_kinds(tmp_path):
+    p = tmp_path / "repayments.csv"
+    p.write_bytes(
+        b"\xef\xbb\xbfloan_id,customer_id,repayment_amount,repayment_date,payment_type\r\n"
+        b"L1,C001,500,2025-01-05,REPAYMENT\r\n"
+        b"\r\n"
+        b"L2,C002,300.0,bad,LATE_FEE\r\n"
+        b"L3,C003,\r\n"
+    )
+    rows = list(
+        scan_columns(
+            p,
+            ("loan_id", "repayment_amount", "repayment_date", "payment_type"),
+            kinds={"repayment_amount": "int", "repayment_date": "date"},
+        )
+    )
+    assert rows == [
+        ("L1", 500, date(2025, 1, 5), "REPAYMENT"),
+        ("L2", 300, None, "LATE_FEE"),
+        ("L3", 0, None, ""),
+    ]
+
+
+def test_quoted_rows_fall_back_to_csv(tmp_path):
+    p = tmp_path / "loan_v3.csv"
+    p.write_text(
+        'loan_id,notes,loan_amount\n'
+        'L1,"a,b",100\n'
+        'L2,"line1\nline2",200\n'
+        'L3,plain,300\n',
+        encoding="utf-8",
+    )
+    rows = list(scan_columns(p, ("loan_id", "notes", "loan_amount"), kinds={"loan_amount": "int"}))
+    assert rows == [("L1", "a,b", 100), ("L2", "line1\nline2", 200), ("L3", "plain", 300)]
+    # 事前フィルタ指定でも引用符入りファイルは全行走査に切り替わる
+    hits = [r for r in scan_columns(p, ("loan_id",), contains="L3") if r[0] == "L3"]
+    assert hits == [("L3",)]
+
+
+def test_missing_or_empty_file(tmp_path):
+    assert list(scan_columns(tmp_path / "nope.csv", ("loan_id",))) == []
+    empty = tmp_path / "empty.csv"
+    empty.write_bytes(b"")
+    assert list(scan_columns(empty, ("loan_id",))) == []
+
+
+def test_field_parsers():
+    assert parse_int_field(b"1200") == 1200
+    assert parse_int_field(b"1200.9") == 1200
+    assert parse_int_field(b"abc") == 0
+    assert parse_iso_date_field(b"2025-02-30") is None
+    assert parse_iso_date_field(b"2025-02-28") == date(2025, 2, 28)
+
+
+def test_loan_totals_match_between_point_and_bulk(tmp_path):
+    p = tmp_path / "repayments.csv"
+    p.write_text(
+        "loan_id,customer_id,repayment_amount,repayment_date,payment_type\n"
+        "L1,C001,500,2025-01-05,REPAYMENT\n"
+        "L10,C001,999,2025-01-05,REPAYMENT\n"
+        "L1,C001,70,2025-01-06,LATE_FEE\n"
+        "L1,C001,30,2025-01-07,\n",
+        encoding="utf-8",
+    )
+    # "L1" は "L10" の部分文字列でもあるが、列値で一致確認されること
+    assert calculate_total_repaid_by_loan_id(str(p), "L1") == 530
+    assert calculate_total_late_fee_paid_by_loan_id(str(p), "L1") == 70
+    assert sum_by_key(p, "loan_id", "repayment_amount", class_column="payment_type") == {
+        ("L1", "REPAYMENT"): 500, ("L1", "LATE_FEE"): 70, ("L1", ""): 30, ("L10", "REPAYMENT"): 999,
+    }
@@ -0,0 +1,101 @@
+import csv
+import multiprocessing as mp
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from modules import file_lock
+from modules.file_lock import LockUpgradeError, get_lock_stats, ledger_lock, reset_lock_stats
+
+pytestmark = pytest.mark.skipif(file_lock.fcntl is None, reason="fcntl が無い環境")
+
+N_PROCS = 4
+PER_PROC = 6
+
+
+def _quiet():
+    sys.stdout = open(os.devnull, "w")
+
+
+def _repay_worker(loans, reps, n):
+    _quiet()
+    from modules.loan_module import register_repayment_complete
+
+    for _ in range(n):
+        register_repayment_complete(
+            loans_file=loans,
+            repayments_file=reps,
+            loan_id="L001",
+            amount=300,
+            repayment_date="2025-01-05",
+        )
+
+
+def _loan_worker(loans, n):
+    _quiet()
+    from modules.loan_module import register_loan
+
+    for _ in range(n):
+        register_loan("CUST001", 1000, "2025-01-01", file_path=loans)
+
+
+def _run(target, args):
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=target, args=args) for _ in range(N_PROCS)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+
+@pytest.fixture
+def ledger(csv_ledger, monkeypatch):
+    # spawn した子プロセスからも modules を import できるように
+    monkeypatch.setenv("PYTHONPATH", str(Path(__file__).resolve().parents[1]))
+    return csv_ledger
+
+
+def test_concurrent_repayments_never_over_collect(ledger, tmp_path):
+    loans, reps = ledger(
+        loans="L001,CUST001,3000,2025-01-01,2025-12-31,0,3000,CASH,0,10,3000,ACTIVE,,,\n",
+        repayments="",
+    )
+    # 4プロセス × 6回 × 300円 = 7200円 を投げるが、記録されるのは 3000円ちょうどまで
+    _run(_repay_worker, (loans, reps, PER_PROC))
+
+    with open(reps, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert sum(int(r["repayment_amount"]) for r in rows) == 3000
+    assert len(rows) == 10
+    with (tmp_path / "audit_log.csv").open(newline="", encoding="utf-8") as f:
+        assert sum(1 for r in csv.DictReader(f) if r["action"] == "REGISTER_REPAYMENT") == 10
+
+
+def test_concurrent_loan_registration_has_unique_ids(ledger):
+    loans, _ = ledger(loans="", repayments="")
+    _run(_loan_worker, (loans, PER_PROC))
+
+    with open(loans, newline="", encoding="utf-8") as f:
+        ids = [r["loan_id"] for r in csv.DictReader(f)]
+    assert len(ids) == N_PROCS * PER_PROC
+    assert [k for k, c in Counter(ids).items() if c > 1] == []
+
+
+def test_reentrant_and_stats(tmp_path):
+    reset_lock_stats()
+    a = tmp_path / "a.csv"
+    with ledger_lock(exclusive=[a]):
+        with ledger_lock(exclusive=[a], shared=[a]):
+            pass
+    with ledger_lock(shared=[a]):
+        with pytest.raises(LockUpgradeError):
+            with ledger_lock(exclusive=[a]):
+                pass
+    st = get_lock_stats()[file_lock.lock_path_for(a)]
+    assert st["acquired"] == 2
+    assert st["contended"] == 0
+    assert file_lock._held == {}
@@ -0,0 +1,219 @@
+import csv
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import modules.audit as audit
+import modules.journal as journal
+from modules.journal import group_commit, recover, transaction
+from modules.loan_module import register_repayment_complete
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_transaction_appends_all_files_and_checkpoints(tmp_path):
+    jpath = tmp_path / "ledger.journal"
+    reps = tmp_path / "repayments.csv"
+    log = tmp_path / "audit.csv"
+
+    with transaction("T", journal=jpath) as tx:
+        tx.append_rows(reps, [["L1", "C1", "100"]], header=["loan_id", "customer_id", "amount"])
+        tx.append_rows(reps, [["L1", "C1", "5"]])
+        tx.append_audit("REGISTER_REPAYMENT", "loan", "L1", {"amount": 105}, path=log)
+
+    assert read_rows(reps) == [["loan_id", "customer_id", "amount"], ["L1", "C1", "100"], ["L1", "C1", "5"]]
+    assert read_rows(log)[0] == audit.AUDIT_HEADERS
+    assert read_rows(log)[1][1:4] == ["REGISTER_REPAYMENT", "loan", "L1"]
+    assert jpath.read_bytes() == b""
+
+
+def test_exception_inside_block_writes_nothing(tmp_path):
+    reps = tmp_path / "repayments.csv"
+    with pytest.raises(RuntimeError):
+        with transaction("T", journal=tmp_path / "j") as tx:
+            tx.append_rows(reps, [["x"]])
+            raise RuntimeError("boom")
+    assert not reps.exists()
+
+
+def test_crash_between_files_is_redone_by_recover(tmp_path, monkeypatch):
+    jpath = tmp_path / "ledger.journal"
+    reps = tmp_path / "repayments.csv"
+    log = tmp_path / "audit.csv"
+    reps.write_text("loan_id,amount\r\n", encoding="utf-8")
+
+    # 1ファイル目を書きかけ（半分だけ）にして落ちる
+    real_apply = journal._apply_op
+
+    def crash(op):
+        data = op["data"].encode("utf-8")
+        with open(op["path"], "ab") as f:
+            f.write(data[: len(data) // 2])
+        raise SystemExit("power loss")
+
+    monkeypatch.setattr(journal, "_apply_op", crash)
+    with pytest.raises(SystemExit):
+        with transaction("T", journal=jpath) as tx:
+            tx.append_rows(reps, [["L1", "100"], ["L1", "5"]])
+            tx.append_audit("REGISTER_REPAYMENT", "loan", "L1", path=log)
+    monkeypatch.setattr(journal, "_apply_op", real_apply)
+    journal._journals.clear()
+
+    assert not log.exists()
+    assert recover(jpath) == 2
+    assert read_rows(reps) == [["loan_id", "amount"], ["L1", "100"], ["L1", "5"]]
+    assert len(read_rows(log)) == 2
+    # 2回目は何もしない（冪等）
+    assert recover(jpath) == 0
+    assert len(read_rows(reps)) == 3
+
+
+def test_torn_journal_tail_is_ignored(tmp_path):
+    jpath = tmp_path / "ledger.journal"
+    target = tmp_path / "a.csv"
+    jpath.write_bytes(b'{"tx": "x", "ops": [{"op": "append", "path": "')
+    assert recover(jpath) == 0
+    assert not target.exists()
+
+    # 書きかけ行の後ろに次の記録が来ても読める
+    jpath.write_bytes(b'{"tx": "x", "ops": [')
+    journal.get_journal(jpath)._write_record(
+        {"tx": "y", "ops": [{"op": "append", "path": str(target), "offset": 0, "data": "a\r\n"}]}
+    )
+    assert recover(jpath) == 1
+    assert target.read_bytes() == b"a\r\n"
+
+
+def test_recover_replays_several_appends_to_the_same_file_quietly(tmp_path, capsys):
+    jpath = tmp_path / "ledger.journal"
+    reps = tmp_path / "repayments.csv"
+    reps.write_bytes(b"h\r\n")
+    j = journal.get_journal(jpath)
+    first = {"op": "append", "path": str(reps), "offset": 3, "data": "a\r\n"}
+    second = {"op": "append", "path": str(reps), "offset": 6, "data": "b\r\n"}
+    j._write_record({"tx": "1", "ops": [first]})
+    j._write_record({"tx": "2", "ops": [second]})
+
+    # 1件目は反映済み・2件目は書きかけで落ちた（group_commit 中のクラッシュ相当）
+    reps.write_bytes(b"h\r\na\r\nb")
+    assert recover(jpath) == 1
+    assert reps.read_bytes() == b"h\r\na\r\nb\r\n"
+    assert "WARN" not in capsys.readouterr().out
+
+    # 記録した位置の内容が食い違っていれば、記録を捨てずに止まる（ジャーナルは残る）
+    j._write_record({"tx": "1", "ops": [first]})
+    reps.write_bytes(b"h\r\nz\r\n")
+    with pytest.raises(journal.JournalError, match="ジャーナル記録後にファイルが変更されています"):
+        recover(jpath)
+    assert reps.read_bytes() == b"h\r\nz\r\n"
+    assert len(list(j.records())) == 1
+
+
+def test_unjournaled_audit_append_waits_for_the_commit(tmp_path, monkeypatch):
+    jpath = tmp_path / "ledger.journal"
+    reps = tmp_path / "repayments.csv"
+    log = tmp_path / "audit.csv"
+    real = journal.Transaction._materialize
+    others = []
+    script = "import sys; from modules.audit import append_audit; append_audit('ENTER', 'mode', '1', path=sys.argv[1])"
+
+    def racing_materialize(self):
+        ops = real(self)
+        # 追記位置を決めた直後に、別プロセスからジャーナルを通らない監査ログの追記（main.py の ENTER 等）が来る
+        p = subprocess.Popen([sys.executable, "-c", script, str(log)], cwd=Path(journal.__file__).resolve().parents[1])
+        others.append(p)
+        try:
+            p.wait(1)
+        except subprocess.TimeoutExpired:
+            pass  # 排他ロックで待たされている
+        return ops
+
+    monkeypatch.setattr(journal.Transaction, "_materialize", racing_materialize)
+    with transaction("T", journal=jpath) as tx:
+        tx.append_rows(reps, [["L1", "100"]], header=["loan_id", "amount"])
+        tx.append_audit("REGISTER_REPAYMENT", "loan", "L1", path=log)
+    assert others[0].wait(10) == 0
+
+    assert [r[1] for r in read_rows(log)[1:]] == ["REGISTER_REPAYMENT", "ENTER"]
+    assert jpath.read_bytes() == b""
+
+
+def test_group_commit_batches_fsync(tmp_path, monkeypatch):
+    calls = []
+    real_fsync = journal.os.fsync
+    monkeypatch.setattr(journal.os, "fsync", lambda fd: calls.append(fd) or real_fsync(fd))
+    jpath = tmp_path / "ledger.journal"
+    reps = tmp_path / "repayments.csv"
+    log = tmp_path / "audit.csv"
+
+    def one(i):
+        with transaction("T", journal=jpath) as tx:
+            tx.append_rows(reps, [[f"L{i}", "1"], [f"L{i}", "2"]])
+            tx.append_audit("X", "loan", f"L{i}", path=log)
+
+    one(0)
+    per_tx = len(calls)
+    calls.clear()
+    with group_commit():
+        for i in range(50):
+            one(i)
+    # ジャーナル1回/操作 ＋ 終了時のCSV分だけ
+    assert len(calls) <= 50 + 2
+    assert per_tx > 1
+    assert len(read_rows(reps)) == 2 + 100
+    assert jpath.read_bytes() == b""
+
+
+def test_group_commit_takes_one_backup_per_file_and_skips_audit_log(tmp_path, monkeypatch):
+    import modules.backup as backup
+
+    taken = []
+    monkeypatch.setattr(backup, "backup_file", lambda path, **kw: taken.append(path))
+    jpath = tmp_path / "ledger.journal"
+    reps = tmp_path / "repayments.csv"
+    log = tmp_path / "audit.csv"
+    reps.write_text("loan_id,amount\r\n", encoding="utf-8")
+
+    def one(i):
+        with transaction("T", journal=jpath) as tx:
+            tx.append_rows(reps, [[f"L{i}", "1"]])
+            tx.append_audit("X", "loan", f"L{i}", path=log)
+
+    with group_commit(size=20):
+        for i in range(50):
+            one(i)
+    # チェックポイント（20件ごと）の区切りごとに repayments.csv を1回。監査ログは取らない
+    assert taken == [str(reps.resolve())] * 3
+
+    taken.clear()
+    one(50)
+    one(51)
+    assert taken == [str(reps.resolve())] * 2  # まとめの外では操作ごと
+
+
+def test_register_repayment_complete_goes_through_journal(tmp_path, monkeypatch):
+    loans = tmp_path / "loan_v3.csv"
+    reps = tmp_path / "repayments.csv"
+    log = tmp_path / "audit.csv"
+    monkeypatch.setattr(audit, "AUDIT_PATH", str(log))
+    loans.write_text(
+        "loan_id,customer_id,repayment_expected,due_date,contract_status\n"
+        "L001,CUST001,1000,2025-01-10,ACTIVE\n",
+        encoding="utf-8",
+    )
+    res = register_repayment_complete(
+        loans_file=str(loans),
+        repayments_file=str(reps),
+        loan_id="L001",
+        amount=1010,
+        repayment_date="2025-02-10",
+    )
+    assert res["repayment_part"] == 1000 and res["late_fee_part"] == 10
+    assert [r[-1] for r in read_rows(reps)[1:]] == ["REPAYMENT", "LATE_FEE"]
+    assert len(read_rows(log)) == 3
+    assert (tmp_path / "ledger.journal").read_bytes() == b""
@@ -0,0 +1,155 @@
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+import modules.loan_module as loan_module
+from modules import ledger_daemon
+from modules.balance_module import compute_balances
+from modules.ledger_snapshot import clear_memo
+from modules.ledger_stats import get_stats, portfolio_summary, summary_row
+
+FUTURE = date(2099, 1, 1)  # 過去日付は延滞スナップショットの経路に回るので、メモリ上の集計は未来日で確かめる
+
+
+@pytest.fixture
+def ledger(csv_ledger, tmp_path, monkeypatch):
+    monkeypatch.setenv("APP_LEDGER_SOCKET", str(tmp_path / "ledger.sock"))
+    return csv_ledger()
+
+
+def _local_unpaid(loans, reps, customers, filter_mode):
+    clear_memo()
+    rows = loan_module.build_unpaid_loan_rows(None, loans, reps, filter_mode=filter_mode, today=FUTURE)
+    if customers is None:
+        return rows
+    return [r for cid in customers for r in rows if r["customer_id"] == cid]
+
+
+def test_memory_queries_match_local_reads(ledger):
+    loans, reps = ledger
+    with open(reps, "a", encoding="utf-8") as f:
+        f.write("L1,CUST001,100,2025-02-01,LATE_FEE\n")
+    state = ledger_daemon.LedgerState(loans, reps)
+    state.refresh()
+
+    for customers in (None, ["CUST002", "CUST001", "CUST009"]):
+        for mode in ("all", "overdue"):
+            assert state.unpaid_rows(customers, mode, FUTURE) == _local_unpaid(loans, reps, customers, mode)
+        paths = {"loans_csv": Path(loans), "repayments_csv": Path(reps)}
+        assert state.balances(customers, FUTURE) == compute_balances(customers, paths=paths, today=FUTURE)
+
+    portfolio = portfolio_summary(get_stats(loans, reps), FUTURE)
+    assert state.summary(FUTURE) == summary_row(FUTURE, portfolio, _local_unpaid(loans, reps, None, "all"))
+    assert state.missing_customers(["CUST001", "CUST009"]) == ["CUST009"]
+
+
+def test_appends_are_read_incrementally_and_rewrites_reload(ledger):
+    loans, reps = ledger
+    state = ledger_daemon.LedgerState(loans, reps)
+    state.refresh()
+    assert state.reloads == {"loans": 1, "repayments": 1}
+
+    with open(reps, "a", encoding="utf-8") as f:
+        f.write("L3,CUST002,2000,2025-03-02,REPAYMENT\nL3,CUST002,50,2025-03-02,LATE_FEE\n")
+        f.write("L3,CUST002,1000,2025-03-03")  # 書きかけの行は、改行が来るまで数えない
+    with open(loans, "a", encoding="utf-8") as f:
+        f.write("L5,CUST004,7000,2025-04-01,2025-05-01,0,7000,CASH,0,10,7000,ACTIVE,,,\n")
+    state.refresh()
+    assert state.totals["L3"] == (2000, 50)
+    assert [r["loan_id"] for r in state.by_customer["CUST004"]] == ["L5"]
+
+    with open(reps, "a", encoding="utf-8") as f:
+        f.write(",REPAYMENT\n")
+    state.refresh()
+    assert state.totals["L3"] == (3000, 50)
+    assert state.reloads == {"loans": 1, "repayments": 1}
+
+    # 通常の経路での書き込み：返済は追記、契約解除は台帳の書き換え
+    assert loan_module.register_repayment_complete(
+        loans_file=loans, repayments_file=reps, loan_id="L5", amount=7000, repayment_date="2025-04-02",
+    )
+    assert loan_module.cancel_contract(loans, "L2", reason="test")
+    state.refresh()
+    assert state.totals["L5"] == (7000, 0)
+    assert state.by_id["L2"]["contract_status"] == "CANCELLED"
+    assert state.reloads == {"loans": 2, "repayments": 1}
+    assert state.unpaid_rows(None, "all", FUTURE) == _local_unpaid(loans, reps, None, "all")
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix ソケットが必要")
+def test_socket_round_trip(ledger):
+    loans, reps = ledger
+    state = ledger_daemon.LedgerState(loans, reps)
+    state.refresh()
+    sock = ledger_daemon.socket_path_for(loans)
+    server = ledger_daemon.LedgerServer(sock, state)
+    thread = threading.Thread(target=server.serve_until_shutdown, daemon=True)
+    thread.start()
+    try:
+        assert ledger_daemon.find_daemon(loans) == sock
+        resp = ledger_daemon.call(sock, {"op": "unpaid", "loans_file": loans, "customers": ["CUST001"],
+                                         "filter_mode": "all", "today": FUTURE.isoformat()})
+        assert resp["ok"] and [r["loan_id"] for r in resp["rows"]] == ["L1", "L2"]
+
+        resp = ledger_daemon.call(sock, {"op": "register-repayment", "loan_id": "L2", "amount": 5000,
+                                         "repayment_date": "2025-02-10"})
+        assert resp["ok"] and resp["found"] and resp["result"]["repayment_part"] == 5000
+        assert "repayments.csv" in resp["messages"]  # loan_module の表示はクライアントへ渡す
+        assert ledger_daemon.call(sock, {"op": "cancel", "loan_id": "L404"}) == {"ok": True, "messages": "",
+                                                                                  "found": False}
+
+        other = ledger_daemon.call(sock, {"op": "ping", "loans_file": str(Path(loans).with_name("x.csv"))})
+        assert other["rejected"] and "mismatch" in other["error"]
+        assert ledger_daemon.call(sock, {"op": "shutdown"}) == {"ok": True}
+        thread.join(5)
+    finally:
+        server.server_close()
+    assert not sock.exists()
+    assert ledger_daemon.find_daemon(loans) is None
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix ソケットが必要")
+def test_batch_commands_through_daemon_match_local(cli_project):
+    sock = cli_project / "data" / "ledger.sock"
+
+    def run(*args):
+        return subprocess.run([sys.executable, "main.py", "--today", FUTURE.isoformat(), *args],
+                              cwd=cli_project, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+
+    commands = [
+        ("unpaid", "--all"),
+        ("unpaid", "--customer", "1", "--customer", "9", "--overdue", "--format", "json"),
+        ("balance", "--all", "--format", "json"),
+        ("summary",),
+    ]
+    local = [run(*c) for c in commands]
+
+    daemon = subprocess.Popen([sys.executable, "main.py", "serve"], cwd=cli_project,
+                              stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            if ledger_daemon.find_daemon(cli_project / "data" / "loan_v3.csv"):
+                break
+            time.sleep(0.05)
+        else:
+            pytest.fail("daemon did not start")
+
+        for command, expected in zip(commands, local):
+            got = run(*command)
+            assert (got.returncode, got.stdout) == (expected.returncode, expected.stdout), command
+
+        got = run("register-repayment", "--loan-id", "L3", "--amount", "8000", "--date", "2025-03-05")
+        assert got.returncode == 0, got.stderr
+        assert "L3" not in run("unpaid", "--all").stdout
+        assert run("cancel", "--loan-id", "L404").returncode == 3
+    finally:
+        ledger_daemon.call(sock, {"op": "shutdown"}, timeout=5)
+        daemon.wait(10)
+    assert not sock.exists()
+    assert "via ledger daemon" in (cli_project / "data" / "app.log").read_text(encoding="utf-8")
@@ -0,0 +1,96 @@
+import pytest
+
+from modules import ledger_snapshot as snap
+from modules.ledger_snapshot import (
+    load_loan_rows,
+    load_repayment_totals,
+    snapshot_path,
+)
+from modules.loan_module import calculate_total_late_fee_paid_by_loan_id, calculate_total_repaid_by_loan_id
+
+
+LOANS = (
+    "loan_id,customer_id,loan_amount,loan_date,due_date,repayment_expected,contract_status,notes\n"
+    "L1,C001,10000,2025-01-01,2025-01-31,11000,ACTIVE,\n"
+    'L2,C002,5000,2025-01-02,2025-02-01,5500,ACTIVE,"a,b"\n'
+    "L3,C001,3000,2025-01-03,2025-02-02,3300,CANCELLED,x\n"
+)
+
+
+def test_loan_rows_roundtrip_and_persisted(tmp_path):
+    loans = tmp_path / "loan_v3.csv"
+    loans.write_text(LOANS, encoding="utf-8")
+
+    rows = load_loan_rows(loans, customer_id="C001")
+    assert [r["loan_id"] for r in rows] == ["L1", "L3"]
+    assert rows[1]["notes"] == "x"
+    assert load_loan_rows(loans)[1]["notes"] == "a,b"
+    assert snapshot_path(loans).exists()
+
+    # プロセス内メモを捨てても .snap から同じ結果が得られる（CSV を読まない）
+    snap.clear_memo()
+    called = []
+    orig = snap._build_loans
+    try:
+        snap._build_loans = lambda p: called.append(p) or orig(p)
+        assert [r["loan_id"] for r in load_loan_rows(loans)] == ["L1", "L2", "L3"]
+    finally:
+        snap._build_loans = orig
+    assert called == []
+
+
+def test_stale_snapshot_is_rebuilt_after_append(tmp_path):
+    reps = tmp_path / "repayments.csv"
+    reps.write_text(
+        "loan_id,customer_id,repayment_amount,repayment_date,payment_type\n"
+        "L1,C001,500,2025-01-05,REPAYMENT\n",
+        encoding="utf-8",
+    )
+    assert load_repayment_totals(reps) == {"L1": (500, 0)}
+
+    with reps.open("a", encoding="utf-8") as f:
+        f.write("L1,C001,40,2025-01-06,LATE_FEE\n")
+        f.write("L2,C002,7,2025-01-06,\n")
+    snap.clear_memo()
+    got = load_repayment_totals(reps)
+    assert got == {"L1": (500, 40), "L2": (7, 0)}
+    assert got == {
+        loan_id: (calculate_total_repaid_by_loan_id(str(reps), loan_id),
+                  calculate_total_late_fee_paid_by_loan_id(str(reps), loan_id))
+        for loan_id in ("L1", "L2")
+    }
+
+
+def test_repayment_totals_are_read_only(tmp_path):
+    reps = tmp_path / "repayments.csv"
+    reps.write_text(
+        "loan_id,customer_id,repayment_amount,repayment_date,payment_type\n"
+        "L1,C001,500,2025-01-05,REPAYMENT\n",
+        encoding="utf-8",
+    )
+    totals = load_repayment_totals(reps)
+    # プロセス内メモを共有しているので、呼び出し元は書き換えられない
+    with pytest.raises(TypeError):
+        totals["L1"] = (0, 0)
+    with pytest.raises(TypeError):
+        load_repayment_totals(tmp_path / "missing.csv")["L1"] = (0, 0)
+    assert load_repayment_totals(reps) is totals
+    assert load_repayment_totals(reps) == {"L1": (500, 0)}
+
+
+def test_corrupt_snapshot_falls_back_to_csv(tmp_path):
+    loans = tmp_path / "loan_v3.csv"
+    loans.write_text(LOANS, encoding="utf-8")
+    snapshot_path(loans).write_bytes(b"garbage")
+    snap.clear_memo()
+    assert len(load_loan_rows(loans)) == 3
+
+
+def test_missing_files(tmp_path):
+    assert load_repayment_totals(tmp_path / "repayments.csv") == {}
+    try:
+        load_loan_rows(tmp_path / "loan_v3.csv")
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError("FileNotFoundError expected")
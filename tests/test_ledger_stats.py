@@ -0,0 +1,99 @@
+import random
+from datetime import date
+
+import pytest
+
+import modules.ledger_stats as ledger_stats
+import modules.loan_module as loan_module
+from modules.ledger_snapshot import clear_memo
+
+@pytest.fixture
+def ledger(csv_ledger):
+    # 猶予日数・期日なし・契約解除・種別空欄の返済を含む台帳
+    return csv_ledger(
+        loans=(
+            "L1,CUST001,10000,2025-01-01,2025-01-31,0,10000,CASH,0,10,10000,ACTIVE,,,\n"
+            "L2,CUST001,5000,2025-01-02,2025-03-31,0,5000,CASH,3,10,5000,ACTIVE,,,\n"
+            "L3,CUST002,8000,2025-03-01,,0,8000,CASH,0,10,8000,ACTIVE,,,\n"
+            "L4,CUST003,3000,2025-01-05,2025-02-05,0,3000,CASH,0,10,3000,CANCELLED,,,\n"
+        ),
+        repayments=(
+            "L1,CUST001,4000,2025-02-01,REPAYMENT\n"
+            "L1,CUST001,300,2025-02-01,LATE_FEE\n"
+            "L2,CUST001,5000,2025-02-01,\n"
+        ),
+    )
+
+
+def test_rebuild_totals_and_overdue_by_date(ledger):
+    loans, reps = ledger
+    stats = ledger_stats.get_stats(loans, reps)
+
+    s = ledger_stats.portfolio_summary(stats, date(2025, 4, 2))
+    assert (s["loans"], s["repayments"]) == (4, 3)
+    assert s["total_lent"] == 10000 + 5000 + 8000      # CANCELLED は除く
+    assert s["total_repaid"] == 9000 and s["late_fee_paid"] == 300
+    assert s["outstanding"] == 6000 + 8000              # L2 は完済
+    assert (s["open_loans"], s["overdue_count"], s["overdue_amount"]) == (2, 1, 6000)
+
+    # 期日＋猶予日数の翌日から延滞（期日なしの L3 は延滞にならない）
+    assert ledger_stats.portfolio_summary(stats, date(2025, 1, 31))["overdue_count"] == 0
+    assert ledger_stats.portfolio_summary(stats, date(2025, 2, 1))["overdue_count"] == 1
+
+
+def test_fresh_sidecar_is_read_without_opening_the_ledger(ledger, monkeypatch):
+    loans, reps = ledger
+    built = ledger_stats.get_stats(loans, reps)
+    assert ledger_stats.stats_path_for(loans).exists()
+
+    def fail(path):
+        raise AssertionError(f"ledger re-read: {path}")
+
+    monkeypatch.setattr(ledger_stats, "_rows", fail)
+    assert ledger_stats.get_stats(loans, reps) == built
+
+
+def test_external_edit_makes_sidecar_stale(ledger):
+    loans, reps = ledger
+    ledger_stats.get_stats(loans, reps)
+
+    with open(reps, "a", encoding="utf-8") as f:
+        f.write("L1,CUST001,6000,2025-02-10,REPAYMENT\n")
+
+    assert ledger_stats.load_stats(loans, reps) is None
+    s = ledger_stats.portfolio_summary(ledger_stats.get_stats(loans, reps), date(2025, 4, 2))
+    assert s["outstanding"] == 8000 and s["overdue_count"] == 0
+
+
+def test_incremental_updates_match_full_recount(ledger, capsys):
+    loans, reps = ledger
+    ledger_stats.get_stats(loans, reps)
+    rnd = random.Random(5)
+
+    for i in range(12):
+        loan_module.register_loan(
+            f"CUST{rnd.randint(1, 3):03d}", rnd.randrange(1000, 9000, 1000), "2025-02-01",
+            due_date=f"2025-02-{rnd.randint(2, 28):02d}",
+            interest_rate_percent=10.0, repayment_method="CASH",
+            grace_period_days=rnd.choice([0, 5]), late_fee_rate_percent=10.0,
+            file_path=loans,
+        )
+    loan_ids = [row["loan_id"] for row in loan_module.load_loan_rows(loans)]
+    for _ in range(20):
+        clear_memo()
+        loan_module.register_repayment_complete(
+            loans_file=loans, repayments_file=reps, loan_id=rnd.choice(loan_ids),
+            amount=rnd.randint(500, 6000), repayment_date="2025-03-01",
+        )
+    assert loan_module.cancel_contract(loans, "L3", reason="test")
+
+    incremental = ledger_stats.load_stats(loans, reps)
+    assert incremental is not None, "an append fell back to a full recount"
+    ledger_stats.stats_path_for(loans).unlink()
+    recounted = ledger_stats.rebuild_stats(loans, reps)
+
+    def comparable(stats):
+        return {k: v for k, v in stats.items() if k != "sources"}
+
+    assert comparable(incremental) == comparable(recounted)
+    assert recounted["loans"] == 16 and recounted["repayments"] > 3
@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "scripts"))
+
+import loadtest  # noqa: E402
+from web_seed import seed_web_db  # noqa: E402
+
+
+def test_client_mode_replays_every_scenario(web):
+    m = web.module
+    counts = seed_web_db(m, 40, users=2, seed=3, password=loadtest.PASSWORD)
+    fixtures = loadtest.load_fixtures(m, counts["users"])
+    mix = loadtest.parse_mix(loadtest.DEFAULT_MIX)
+
+    recorder, elapsed = loadtest.run(
+        lambda: loadtest.TestClientDriver(m), counts["users"], fixtures, mix,
+        concurrency=2, duration=1.5,
+    )
+    rows = loadtest.summarize(recorder, elapsed)
+
+    assert set(rows) == {"dashboard", "loan_status", "repayment", "loan", "TOTAL"}
+    assert rows["TOTAL"]["errors"] == 0
+    assert rows["TOTAL"]["count"] == sum(rows[name]["count"] for name in loadtest.SCENARIOS)
+    assert rows["TOTAL"]["p50_ms"] <= rows["TOTAL"]["p99_ms"] <= rows["TOTAL"]["max_ms"]
+
+
+def test_percentile_and_mix_parsing():
+    assert loadtest.percentile([0.1, 0.2, 0.3, 0.4], 50) == 0.2
+    assert loadtest.percentile([0.1, 0.2, 0.3, 0.4], 99) == 0.4
+    assert loadtest.percentile([], 90) == 0.0
+    assert loadtest.parse_mix("dashboard=2,loan") == [("dashboard", 2), ("loan", 1)]
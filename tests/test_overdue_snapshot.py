@@ -0,0 +1,90 @@
+from datetime import date
+
+import pytest
+
+from modules.ledger_snapshot import clear_memo
+from modules.loan_module import build_unpaid_loan_rows, display_unpaid_loans
+from modules.overdue_snapshot import build_snapshot, load_snapshot, snapshot_path, write_snapshot
+
+@pytest.fixture
+def ledger(csv_ledger):
+    # L1 は 2/1 と 3/1 に分けて返済、L3 は契約解除、L4 は 3/1 の貸付
+    return csv_ledger(
+        loans=(
+            "L1,C001,10000,2025-01-01,2025-01-31,0,10000,CASH,0,10,10000,ACTIVE,,,\n"
+            "L2,C001,5000,2025-01-02,2025-03-31,0,5000,CASH,0,10,5000,ACTIVE,,,\n"
+            "L3,C001,5000,2025-01-02,2025-01-10,0,5000,CASH,0,10,5000,CANCELLED,,,\n"
+            "L4,C002,8000,2025-03-01,2025-03-10,0,8000,CASH,5,10,8000,ACTIVE,,,\n"
+        ),
+        repayments=(
+            "L1,C001,4000,2025-02-01,REPAYMENT\n"
+            "L1,C001,6000,2025-03-01,REPAYMENT\n"
+            "L1,C001,100,2025-03-01,LATE_FEE\n"
+        ),
+    )
+
+
+def test_snapshot_counts_only_loans_and_repayments_up_to_the_date(ledger):
+    loans, reps = ledger
+    rows = {r["loan_id"]: r for r in build_snapshot(date(2025, 2, 15), loans, reps)}
+
+    assert set(rows) == {"L1", "L2"}  # L3 は契約解除、L4 はまだ貸していない
+    assert rows["L1"]["total_repaid"] == 4000
+    assert rows["L1"]["remaining"] == 6000
+    assert rows["L1"]["overdue_days"] == 15
+    assert rows["L1"]["late_fee_accrued"] == 500  # 10000 × 10% × 15/30
+    assert rows["L1"]["status"] == "OVERDUE"
+    assert rows["L2"]["status"] == "UNPAID"
+
+    # 元本完済後も延滞手数料が残っていれば載る
+    later = {r["loan_id"]: r for r in build_snapshot(date(2025, 3, 20), loans, reps)}
+    assert later["L1"]["status"] == "LATE_FEE_ONLY"
+    assert later["L1"]["late_fee_remaining"] == 1600 - 100  # 48日延滞 − 支払済
+    assert later["L4"]["overdue_days"] == 5
+
+
+def test_write_and_load_roundtrip(ledger):
+    loans, reps = ledger
+    as_of = date(2025, 2, 15)
+    assert load_snapshot(loans, as_of) is None
+
+    path = write_snapshot(as_of, loans, reps)
+    assert path == snapshot_path(loans, as_of)
+    loaded = load_snapshot(loans, as_of)
+    assert list(loaded.values()) == build_snapshot(as_of, loans, reps)
+
+
+def test_display_unpaid_loans_reads_snapshot_for_past_dates(ledger, capsys):
+    loans, reps = ledger
+    as_of = date(2025, 2, 15)
+
+    replayed = display_unpaid_loans("C001", loans, reps, today=as_of)
+    write_snapshot(as_of, loans, reps)
+    # スナップショットがあれば返済履歴は読まない
+    with open(reps, "w", encoding="utf-8") as f:
+        f.write("loan_id,customer_id,repayment_amount,repayment_date,payment_type\n")
+    clear_memo()
+    from_snapshot = display_unpaid_loans("C001", loans, reps, today=as_of)
+
+    assert [r["loan_id"] for r in from_snapshot] == ["L1", "L2"]
+    assert from_snapshot[0]["remaining"] == 6000
+    # スナップショットが無くても、その日時点の返済だけで数える（3月の返済で L1 を消さない）
+    assert replayed == from_snapshot
+
+
+def test_past_dates_give_the_same_rows_with_or_without_snapshot(ledger):
+    loans, reps = ledger
+    as_of = date(2025, 2, 15)
+    with open(reps, "a", encoding="utf-8") as f:
+        f.write("L2,C001,5000,2025-03-01,REPAYMENT\n")
+
+    # L1 は 3/1 に完済、L4 は 3/1 の貸付：2/15 時点では L1 が延滞・L2 が未返済・L4 はまだ無い
+    for mode in ("all", "overdue"):
+        clear_memo()
+        without = build_unpaid_loan_rows(None, loans, reps, filter_mode=mode, today=as_of)
+        write_snapshot(as_of, loans, reps)
+        clear_memo()
+        with_snapshot = build_unpaid_loan_rows(None, loans, reps, filter_mode=mode, today=as_of)
+        snapshot_path(loans, as_of).unlink()
+        assert without == with_snapshot
+    assert [(r["loan_id"], r["status"]) for r in without] == [("L1", "OVERDUE")]
@@ -0,0 +1,205 @@
+import csv
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import schema_migrator
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    paths = {
+        "data": data,
+        "loans_csv": data / "loan_v3.csv",
+        "repayments_csv": data / "repayments.csv",
+    }
+    monkeypatch.setattr(schema_migrator, "get_project_paths", lambda: paths)
+    monkeypatch.setattr(schema_migrator, "ENABLE_BACKUP", False)
+    monkeypatch.delenv("APP_SCHEMA_CACHE_FILE", raising=False)
+    return paths
+
+
+def _write(path, header, rows=()):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+
+
+def _header(path):
+    with path.open(newline="", encoding="utf-8") as f:
+        return next(csv.reader(f))
+
+
+def test_current_headers_are_left_untouched(ledger):
+    _write(ledger["loans_csv"], schema_migrator.TARGET_SCHEMAS["loan_v3"])
+    _write(ledger["repayments_csv"], schema_migrator.TARGET_SCHEMAS["repayments"], [["L1", "C1", "100", "2025-01-01", "LATE_FEE"]])
+    before = {p: p.stat().st_mtime_ns for p in (ledger["loans_csv"], ledger["repayments_csv"])}
+
+    schema_migrator.check_or_migrate_schemas()
+
+    # notes / payment_type を持つ現行ヘッダーは書き直さない
+    assert {p: p.stat().st_mtime_ns for p in before} == before
+
+
+def test_unchanged_files_skip_the_header_check(ledger, monkeypatch):
+    _write(ledger["loans_csv"], ["loan_id", "customer_id", "amount"], [["L1", "C1", "5000"]])
+    _write(ledger["repayments_csv"], schema_migrator.TARGET_SCHEMAS["repayments"])
+    seen = []
+    read_header = schema_migrator._read_header
+    monkeypatch.setattr(schema_migrator, "_read_header", lambda p: seen.append(p.name) or read_header(p))
+
+    schema_migrator.check_or_migrate_schemas()
+    assert seen == ["loan_v3.csv", "repayments.csv"]
+    assert _header(ledger["loans_csv"]) == schema_migrator.TARGET_SCHEMAS["loan_v3"]
+    assert schema_migrator.schema_cache_path(ledger["data"]).exists()
+
+    seen.clear()
+    schema_migrator.check_or_migrate_schemas()
+    assert seen == []
+
+    # 書き換えられたファイルだけ確認し直す
+    _write(ledger["repayments_csv"], ["loan_id", "customer_id", "amount", "paid_at"], [["L1", "C1", "10", "2025-01-02"]])
+    schema_migrator.check_or_migrate_schemas()
+
+    assert seen == ["repayments.csv"]
+    with ledger["repayments_csv"].open(newline="", encoding="utf-8") as f:
+        assert list(csv.DictReader(f)) == [{
+            "loan_id": "L1", "customer_id": "C1", "repayment_amount": "10",
+            "repayment_date": "2025-01-02", "payment_type": "REPAYMENT",
+        }]
+
+
+def test_schema_change_invalidates_cache(ledger, monkeypatch):
+    _write(ledger["loans_csv"], schema_migrator.TARGET_SCHEMAS["loan_v3"])
+    _write(ledger["repayments_csv"], schema_migrator.TARGET_SCHEMAS["repayments"])
+    schema_migrator.check_or_migrate_schemas()
+
+    schemas = dict(schema_migrator.TARGET_SCHEMAS)
+    schemas["loan_v3"] = schemas["loan_v3"] + ["collector"]
+    monkeypatch.setattr(schema_migrator, "TARGET_SCHEMAS", schemas)
+    schema_migrator.check_or_migrate_schemas()
+
+    assert _header(ledger["loans_csv"])[-1] == "collector"
+
+
+OLD_LOANS = ["loan_id", "customer_id", "amount", "loan_date", "grace_days", "memo"]
+
+
+def _old_loans(path, n):
+    rows = [[f"L{i:05d}", "C1", str(1000 + i), "2025-01-01", "" if i % 3 else "5", f"行{i}\n\"改行\", あり"]
+            for i in range(n)]
+    rows.append(["L99999", "C2", "7"])  # 列が足りない行
+    with path.open("w", newline="", encoding="utf-8-sig") as f:  # BOM 付き
+        w = csv.writer(f)
+        w.writerow(OLD_LOANS)
+        w.writerows(rows)
+
+
+def _rows(path):
+    with path.open(newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_single_pass_rename_default_reorder(ledger):
+    _old_loans(ledger["loans_csv"], 5)
+    _write(ledger["repayments_csv"], schema_migrator.TARGET_SCHEMAS["repayments"])
+
+    schema_migrator.check_or_migrate_schemas()
+
+    rows = _rows(ledger["loans_csv"])
+    assert _header(ledger["loans_csv"]) == schema_migrator.TARGET_SCHEMAS["loan_v3"] + ["memo"]
+    assert len(rows) == 6
+    assert rows[0]["loan_amount"] == "1000" and rows[0]["grace_period_days"] == "5"
+    assert rows[1]["grace_period_days"] == "0" and rows[1]["contract_status"] == "ACTIVE"
+    assert rows[2]["memo"] == '行2\n"改行", あり'
+    assert rows[-1]["loan_amount"] == "7" and rows[-1]["memo"] == ""
+    assert not schema_migrator._checkpoint_path(ledger["loans_csv"]).exists()
+
+
+def test_interrupted_migration_resumes_from_checkpoint(ledger, tmp_path, monkeypatch):
+    _old_loans(ledger["loans_csv"], 95)
+    _write(ledger["repayments_csv"], schema_migrator.TARGET_SCHEMAS["repayments"])
+
+    # 中断しない場合の結果
+    clean = tmp_path / "clean.csv"
+    clean.write_bytes(ledger["loans_csv"].read_bytes())
+    monkeypatch.setattr(schema_migrator, "CHECKPOINT_ROWS", 20)
+    schema_migrator._migrate_one(clean, schema_migrator.TARGET_SCHEMAS["loan_v3"],
+                                 schema_migrator.RENAME_MAPS["loan_v3"], schema_migrator.DEFAULTS["loan_v3"])
+
+    save = schema_migrator._save_checkpoint
+    calls = []
+
+    def crash_on_third(path, ck):
+        calls.append(ck["rows"])
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        save(path, ck)
+
+    monkeypatch.setattr(schema_migrator, "_save_checkpoint", crash_on_third)
+    with pytest.raises(KeyboardInterrupt):
+        schema_migrator.check_or_migrate_schemas()
+    assert ledger["loans_csv"].read_text(encoding="utf-8-sig").startswith(",".join(OLD_LOANS))  # 元ファイルはそのまま
+    assert schema_migrator._checkpoint_path(ledger["loans_csv"]).exists()
+
+    seen, resumed = [], []
+    monkeypatch.setattr(schema_migrator, "_save_checkpoint", lambda path, ck: resumed.append(ck["rows"]) or save(path, ck))
+    schema_migrator.check_or_migrate_schemas(progress=seen.append)
+
+    assert calls == [20, 40, 60] and resumed == [60, 80]  # 40 行目の続きから
+
+    assert ledger["loans_csv"].read_bytes() == clean.read_bytes()
+    assert not schema_migrator._checkpoint_path(ledger["loans_csv"]).exists()
+    assert seen[-1]["rows"] == 96 and seen[-1]["percent"] == 100.0
+
+
+def test_checkpoint_is_ignored_when_source_changed(ledger, monkeypatch):
+    _old_loans(ledger["loans_csv"], 50)
+    _write(ledger["repayments_csv"], schema_migrator.TARGET_SCHEMAS["repayments"])
+    monkeypatch.setattr(schema_migrator, "CHECKPOINT_ROWS", 10)
+    save = schema_migrator._save_checkpoint
+
+    def crash(path, ck):
+        save(path, ck)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(schema_migrator, "_save_checkpoint", crash)
+    with pytest.raises(KeyboardInterrupt):
+        schema_migrator.check_or_migrate_schemas()
+
+    # 中断後に台帳が書き換わったら最初からやり直す
+    _old_loans(ledger["loans_csv"], 3)
+    monkeypatch.setattr(schema_migrator, "_save_checkpoint", save)
+    schema_migrator.check_or_migrate_schemas()
+
+    assert [r["loan_id"] for r in _rows(ledger["loans_csv"])] == ["L00000", "L00001", "L00002", "L99999"]
+
+
+def test_concurrent_append_waits_for_the_rewrite(ledger):
+    _old_loans(ledger["loans_csv"], 5)
+    _write(ledger["repayments_csv"], schema_migrator.TARGET_SCHEMAS["repayments"])
+    root = Path(schema_migrator.__file__).resolve().parent
+    line = "L77777,CUST009,500,2025-05-01,2025-05-31,0,500,CASH,0,10,500,ACTIVE,,,\n"
+    script = (
+        "import sys; from modules.file_lock import ledger_lock\n"
+        "with ledger_lock(exclusive=[sys.argv[1]]):\n"
+        "    open(sys.argv[1], 'a', encoding='utf-8').write(sys.argv[2])\n"
+    )
+    writers = []
+
+    def start_writer(info):
+        # 書き換えの最中（置き換えの直前）に別プロセスが追記しに来る
+        writers.append(subprocess.Popen([sys.executable, "-c", script, str(ledger["loans_csv"]), line], cwd=root))
+        time.sleep(0.5)
+        assert writers[0].poll() is None  # 排他ロックで待たされている
+
+    schema_migrator.check_or_migrate_schemas(progress=start_writer)
+    assert writers and writers[0].wait(10) == 0
+    assert ledger["loans_csv"].read_text(encoding="utf-8").endswith(line)
+    assert [r["loan_id"] for r in _rows(ledger["loans_csv"])][-1] == "L77777"
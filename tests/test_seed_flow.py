@@ -9,7 +9,7 @@ def run_ok(cmd: list[str], cwd: Path | None = None):
 def test_seed_then_summary(tmp_path: Path):
     proj = tmp_path
     # 必要ファイルをコピー
-    for p in ["seed_demo_data.py", "main.py", "modules/utils.py", "modules/__init__.py"]:
+    for p in ["seed_demo_data.py", "main.py", "modules/utils.py", "modules/__init__.py", "modules/ledger_stats.py"]:
         dst = proj / p
         dst.parent.mkdir(parents=True, exist_ok=True)
         shutil.copy2(p, dst)
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT / "scripts"))
+
+from bench_startup import import_times  # noqa: E402
+
+# `import main` の累積時間の上限（遅いマシンでは環境変数で緩める）
+IMPORT_BUDGET_MS = float(os.getenv("CLI_IMPORT_BUDGET_MS", "60"))
+
+# メニューに入る前には読み込まないモジュール（各モードに入ったときに読み込む）
+DEFERRED = (
+    "modules.loan_module",
+    "modules.customer_module",
+    "modules.balance_module",
+    "modules.audit",
+    "modules.journal",
+    "modules.logger",
+    "decimal",
+    "argparse",
+    "logging",
+)
+
+
+def test_import_main_stays_within_budget():
+    runs = [import_times("main", cwd=ROOT) for _ in range(3)]
+    for times in runs:
+        assert not [name for name in DEFERRED if name in times]
+
+    best_ms = min(times["main"][1] for times in runs) / 1000
+    assert best_ms <= IMPORT_BUDGET_MS, f"import main took {best_ms:.1f} ms (budget {IMPORT_BUDGET_MS} ms)"
+
+
+def test_summary_exits_before_loading_modules(tmp_path):
+    (tmp_path / "modules").mkdir()
+    for rel in ("main.py", "modules/__init__.py", "modules/ledger_stats.py"):
+        (tmp_path / rel).write_text((ROOT / rel).read_text(encoding="utf-8"), encoding="utf-8")
+
+    # --summary は集計サイドカー（modules.ledger_stats）だけで答える
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "main.py", "--summary"],
+        cwd=tmp_path, capture_output=True, text=True, check=True,
+    )
+    assert "[summary] loans: 0 | repayments: 0" in result.stdout
+    loaded = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines() if "|" in line}
+    assert {name for name in loaded if name.startswith("modules")} == {"modules", "modules.ledger_stats"}
@@ -0,0 +1,43 @@
+from datetime import date
+
+
+def _python_dashboard(m, user_id):
+    """SQL化前のダッシュボード計算（load_* + build_unpaid_loan_rows）"""
+    from flask import g
+
+    g.user = m.db.session.get(m.User, user_id)
+    loans = m.load_loans()
+    repayments = m.load_repayments()
+    unpaid = m.build_unpaid_loan_rows(loans, repayments)
+    return {
+        "total_loan_amount": sum(loan["loan_amount"] for loan in loans),
+        "total_repaid": sum(
+            r["repayment_amount"] for r in repayments
+            if r["payment_type"].strip().upper() == "REPAYMENT"
+        ),
+        "total_remaining": sum(row["remaining"] for row in unpaid),
+        "overdue_count": sum(1 for row in unpaid if row["status"] == "OVERDUE"),
+    }
+
+
+def test_dashboard_sql_matches_python(web, seed_ledger):
+    m = web.module
+    seed_ledger(300, seed=1)
+    seed_ledger(50, seed=2, user_id=2)  # 他ユーザーの行は混ざらない
+
+    with m.app.test_request_context():
+        want = _python_dashboard(m, 1)
+        got = m.calculate_dashboard_data(1, date.today())
+    assert got == want
+    assert want["overdue_count"] > 0
+
+
+def test_dashboard_empty_and_page(web):
+    m = web.module
+    with m.app.app_context():
+        assert m.calculate_dashboard_data(1, date.today()) == {
+            "total_loan_amount": 0, "total_repaid": 0, "total_remaining": 0, "overdue_count": 0,
+        }
+    res = web.get("/dashboard")
+    assert res.status_code == 200
+    assert "総貸付額" in res.get_data(as_text=True)
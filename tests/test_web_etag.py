@@ -0,0 +1,86 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+PAGES = ["/loans", "/repayments", "/customers", "/loan-status"]
+
+
+def record_statements(m, fn):
+    statements = []
+
+    def record(conn, cursor, statement, params, context, executemany):
+        # ログインユーザーの読み込みはキャッシュの有無で変わるので数えない
+        if "FROM users" not in statement:
+            statements.append(statement)
+
+    with m.app.app_context():
+        engine = m.db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        res = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return res, statements
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_conditional_get_returns_304_with_one_query(web, seed_ledger, path):
+    m = web.module
+    seed_ledger(20, seed=3)
+
+    first = web.get(path)
+    assert first.status_code == 200
+    first.get_data()  # ストリーミング応答は読み切るまでリクエストが終わらない
+    etag = first.headers["ETag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    res, statements = record_statements(m, lambda: web.get(path, headers={"If-None-Match": etag}))
+    assert res.status_code == 304
+    assert res.headers["ETag"] == etag
+    assert res.get_data() == b""
+    assert len(statements) == 1 and "user_data_versions" in statements[0]
+
+    # 別の ETag なら通常どおり描画する
+    assert web.get(path, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_write_changes_etag(web, seed_ledger):
+    m = web.module
+    seed_ledger(5, seed=4)
+    before = web.get("/loans").headers["ETag"]
+
+    with m.app.app_context():
+        m.db.session.add(m.Customer(customer_id="NEW001", user_id=1, customer_name="新規",
+                                    credit_limit=1000, created_at=m.now_str()))
+        m.db.session.commit()
+
+    res = web.get("/loans", headers={"If-None-Match": before})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != before
+
+    # 他ユーザーの書き込みでは変わらない
+    seed_ledger(3, seed=5, user_id=2)
+    after = res.headers["ETag"]
+    assert web.get("/loans", headers={"If-None-Match": after}).status_code == 304
+
+
+def test_query_string_and_date_are_part_of_etag(web, seed_ledger, monkeypatch):
+    m = web.module
+    seed_ledger(5, seed=6)
+
+    assert web.get("/loans").headers["ETag"] != web.get("/loans?page=2").headers["ETag"]
+
+    loans = web.get("/loans").headers["ETag"]
+    status = web.get("/loan-status").headers["ETag"]
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    monkeypatch.setattr(m, "date", Tomorrow)
+    # 延滞判定を含む画面だけ日付で変わる
+    assert web.get("/loans", headers={"If-None-Match": loans}).status_code == 304
+    assert web.get("/loan-status", headers={"If-None-Match": status}).status_code == 200
@@ -0,0 +1,63 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date
+
+
+def test_loans_and_repayments_csv(web, seed_ledger):
+    m = web.module
+    seed_ledger(300, seed=1)
+    seed_ledger(20, seed=1, user_id=2)
+
+    res = web.get("/export/loans.csv")
+    assert res.status_code == 200
+    assert res.is_streamed
+    assert res.headers["Content-Disposition"] == 'attachment; filename="loans.csv"'
+    rows = list(csv.DictReader(io.StringIO(res.get_data(as_text=True))))
+    assert len(rows) == 300
+    assert list(rows[0]) == m.LOAN_CSV_COLUMNS
+    assert all("U1S1" in r["loan_id"] for r in rows)
+    assert [(r["loan_date"], r["loan_id"]) for r in rows] == sorted((r["loan_date"], r["loan_id"]) for r in rows)
+
+    res = web.get("/export/repayments.csv")
+    rows = list(csv.DictReader(io.StringIO(res.get_data(as_text=True))))
+    with m.app.app_context():
+        assert len(rows) == m.Repayment.query.filter_by(user_id=1).count()
+    assert list(rows[0]) == m.REPAYMENT_CSV_COLUMNS
+
+
+def test_unpaid_jsonl_matches_screen_rows(web, seed_ledger):
+    m = web.module
+    seed_ledger(200, seed=2)
+    res = web.get("/export/unpaid.jsonl")
+    got = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    with m.app.app_context():
+        assert got == m.query_unpaid_loan_rows(1, date.today())
+    assert got
+
+
+def test_stream_starts_immediately_and_gzip(web, seed_ledger, monkeypatch):
+    m = web.module
+    monkeypatch.setattr(m, "EXPORT_CHUNK_BYTES", 512)
+    seed_ledger(100, seed=3)
+
+    res = web.get("/export/loans.csv", buffered=False)
+    chunks = iter(res.response)
+    assert next(chunks) == (",".join(m.LOAN_CSV_COLUMNS) + "\r\n").encode()
+    rest = list(chunks)
+    assert len(rest) > 5
+    res.close()
+
+    plain = web.get("/export/unpaid.jsonl").get_data()
+    res = web.get("/export/unpaid.jsonl", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in res.headers["Vary"]
+    assert gzip.decompress(res.get_data()) == plain
+    assert len(res.get_data()) < len(plain)
+
+
+def test_export_requires_login(web):
+    with web.session_transaction() as sess:
+        sess.clear()
+    assert web.get("/export/loans.csv").status_code == 302
@@ -0,0 +1,45 @@
+import pytest
+from flask import g
+
+
+@pytest.mark.parametrize(
+    "loader, model, to_dict, order",
+    [
+        ("load_loans", "Loan", "loan_to_dict", ("loan_date", "loan_id")),
+        ("load_repayments", "Repayment", "repayment_to_dict", ("repayment_date", "repayment_id")),
+        ("load_customers", "Customer", "customer_to_dict", ("customer_id",)),
+    ],
+)
+def test_column_loaders_match_orm_dicts(web, seed_ledger, monkeypatch, loader, model, to_dict, order):
+    m = web.module
+    seed_ledger(120, seed=21)
+    seed_ledger(15, seed=21, user_id=2)
+    # yield_per の区切りをまたぐように小さくする
+    monkeypatch.setattr(m, "LOAD_BATCH_SIZE", 7)
+
+    with m.app.test_request_context():
+        g.user = m.db.session.get(m.User, 1)
+        cls = getattr(m, model)
+        entities = cls.query.filter_by(user_id=1).order_by(*(getattr(cls, c) for c in order)).all()
+        want = [getattr(m, to_dict)(entity) for entity in entities]
+
+        got = getattr(m, loader)()
+        assert got == want and len(got) > 7
+        for row, expected in zip(got, want):
+            assert list(row) == list(expected)
+            assert all(type(row[k]) is type(expected[k]) for k in row)
+
+
+def test_loan_loader_blanks_null_text_columns(web, seed_ledger):
+    m = web.module
+    seed_ledger(5, seed=22)
+
+    with m.app.test_request_context():
+        g.user = m.db.session.get(m.User, 1)
+        m.Loan.query.update({"notes": None, "cancelled_at": None, "cancel_reason": None})
+        m.db.session.commit()
+        loans = m.load_loans()
+        # 取り込み元の ORM オブジェクトは作らない
+        assert not any(isinstance(obj, m.Loan) for obj in m.db.session.identity_map.values())
+
+    assert loans and all(l["notes"] == l["cancelled_at"] == l["cancel_reason"] == "" for l in loans)
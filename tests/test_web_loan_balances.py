@@ -0,0 +1,126 @@
+import sqlite3
+
+
+def _balances(m):
+    return {
+        b.loan_id: (b.total_repaid, b.late_fee_paid, b.last_repayment_date, b.fully_repaid)
+        for b in m.LoanBalance.query.all()
+    }
+
+
+def _python_balances(m, user_id):
+    from flask import g
+
+    g.user = m.db.session.get(m.User, user_id)
+    loans = m.load_loans()
+    repayments = m.load_repayments()
+    repaid = m.calculate_total_repaid_map(repayments)
+    late = m.calculate_late_fee_paid_map(repayments)
+    out = {}
+    for loan in loans:
+        key = loan["loan_id"].strip()
+        dates = [r["repayment_date"] for r in repayments if r["loan_id"].strip() == key]
+        out[loan["loan_id"]] = (
+            repaid.get(key, 0),
+            late.get(key, 0),
+            max(dates) if dates else None,
+            loan["repayment_expected"] <= repaid.get(key, 0),
+        )
+    return out
+
+
+def test_triggers_keep_balances_in_sync(web, seed_ledger):
+    m = web.module
+    seed_ledger(200, seed=7)
+    seed_ledger(30, seed=7, user_id=2)
+
+    with m.app.test_request_context():
+        got = _balances(m)
+        want = {**_python_balances(m, 1), **_python_balances(m, 2)}
+        assert got == want
+        assert any(v[3] for v in got.values()) and not all(v[3] for v in got.values())
+
+        # 更新・削除・貸付の変更も反映される
+        rep = m.Repayment.query.filter_by(user_id=1).first()
+        rep.repayment_amount += 1
+        m.db.session.delete(m.Repayment.query.filter_by(user_id=1).order_by(m.Repayment.repayment_id.desc()).first())
+        loan = m.Loan.query.filter_by(user_id=2).first()
+        loan.repayment_expected = 0
+        m.db.session.commit()
+        m.db.session.expire_all()
+        assert _balances(m) == {**_python_balances(m, 1), **_python_balances(m, 2)}
+
+        conn = m.db.engine.raw_connection()
+        try:
+            assert m.verify_loan_balances(conn) == []
+        finally:
+            conn.close()
+
+
+def test_repayment_form_updates_balance(web, seed_ledger):
+    m = web.module
+    seed_ledger(5, seed=3)
+    with m.app.app_context():
+        loan = next(
+            l for l in m.Loan.query.filter_by(user_id=1).all()
+            if l.contract_status.strip().upper() != "CANCELLED"
+            and not m.db.session.get(m.LoanBalance, l.loan_id).fully_repaid
+        )
+        before = m.db.session.get(m.LoanBalance, loan.loan_id).total_repaid
+        loan_id = loan.loan_id
+
+    res = web.post("/repayments/new", data={
+        "loan_id": loan_id, "repayment_amount": "1",
+        "repayment_date": "2030-01-02", "payment_type": "REPAYMENT",
+    })
+    assert res.status_code == 302
+    with m.app.app_context():
+        bal = m.db.session.get(m.LoanBalance, loan_id)
+        assert (bal.total_repaid, bal.last_repayment_date) == (before + 1, "2030-01-02")
+
+
+def test_verify_detects_drift_and_cli_rebuilds(web, seed_ledger):
+    m = web.module
+    seed_ledger(20, seed=4)
+    with m.app.app_context():
+        m.db.session.execute(m.db.text("UPDATE loan_balances SET total_repaid = total_repaid + 5"))
+        m.db.session.execute(m.db.text("DELETE FROM loan_balances WHERE rowid IN (SELECT rowid FROM loan_balances LIMIT 1)"))
+        m.db.session.commit()
+
+    runner = m.app.test_cli_runner()
+    res = runner.invoke(args=["verify-balances"])
+    assert res.exit_code == 1
+    assert "20 件" in res.output
+
+    res = runner.invoke(args=["rebuild-balances"])
+    assert res.exit_code == 0 and "20 件" in res.output
+    res = runner.invoke(args=["verify-balances"])
+    assert res.exit_code == 0
+
+
+def test_init_db_backfills_existing_database(tmp_path, monkeypatch):
+    import database
+
+    db_path = tmp_path / "old.db"
+    monkeypatch.setattr(database, "DB_PATH", db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE loans (loan_id TEXT PRIMARY KEY, user_id INTEGER, customer_id TEXT,
+            loan_amount INTEGER, loan_date TEXT, due_date TEXT, interest_rate_percent REAL,
+            repayment_expected INTEGER, repayment_method TEXT, grace_period_days INTEGER,
+            late_fee_rate_percent REAL, late_base_amount INTEGER, contract_status TEXT,
+            cancelled_at TEXT, cancel_reason TEXT, notes TEXT, created_at TEXT);
+        CREATE TABLE repayments (repayment_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+            loan_id TEXT, customer_id TEXT, repayment_amount INTEGER, repayment_date TEXT,
+            payment_type TEXT, created_at TEXT);
+        INSERT INTO loans (loan_id, user_id, repayment_expected) VALUES ('L1', 1, 100);
+        INSERT INTO repayments (user_id, loan_id, repayment_amount, repayment_date, payment_type)
+            VALUES (1, 'L1', 100, '2025-01-01', 'REPAYMENT'), (1, 'L1', 7, '2025-01-03', 'late_fee');
+    """)
+    conn.commit()
+    conn.close()
+
+    database.init_db()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT * FROM loan_balances").fetchall() == [("L1", 1, 100, 7, "2025-01-03", 1)]
+    conn.close()
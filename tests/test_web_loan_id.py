@@ -0,0 +1,120 @@
+import multiprocessing as mp
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+N_PROCS = 8
+PER_PROC = 40
+LOAN_DATE = "2025-04-01"
+
+
+def _post_loans(db_path, n, queue):
+    os.environ["APP_DB_PATH"] = db_path
+    import app as web_app
+
+    client = web_app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+    codes = []
+    for _ in range(n):
+        res = client.post("/loans/new", data={
+            "customer_id": "C1", "loan_amount": "1000", "loan_date": LOAN_DATE,
+            "due_date": "2025-05-01", "interest_rate_percent": "0", "repayment_method": "CASH",
+            "grace_period_days": "0", "late_fee_rate_percent": "0", "notes": "",
+        })
+        codes.append(res.status_code)
+    queue.put(codes)
+
+
+def test_concurrent_registrations_get_unique_sequential_ids(tmp_path, monkeypatch):
+    import database
+
+    db_path = tmp_path / "ledger.db"
+    monkeypatch.setattr(database, "DB_PATH", db_path)
+    database.init_db()
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users VALUES (1, 'admin', 'x', 'ADMIN', 1, '', '')")
+    conn.execute("INSERT INTO customers VALUES ('C1', 1, 'c', 1000000, '')")
+    # 連番表を通さずに入った既存の貸付（CSV移行分など）の続きから払い出される
+    conn.execute(
+        "INSERT INTO loans VALUES ('L20250401-007', 1, 'C1', 1, ?, ?, 0, 1, 'CASH', 0, 0, 1, 'ACTIVE', NULL, NULL, NULL, '')",
+        (LOAN_DATE, LOAN_DATE),
+    )
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setenv("PYTHONPATH", str(Path(__file__).resolve().parents[1]))
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_post_loans, args=(str(db_path), PER_PROC, queue)) for _ in range(N_PROCS)]
+    for p in procs:
+        p.start()
+    codes = [c for _ in procs for c in queue.get(timeout=120)]
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    assert codes == [302] * (N_PROCS * PER_PROC)
+    conn = sqlite3.connect(db_path)
+    ids = [row[0] for row in conn.execute("SELECT loan_id FROM loans ORDER BY loan_id")]
+    seq = conn.execute("SELECT last_number FROM loan_id_sequences WHERE date_part = '20250401'").fetchone()
+    conn.close()
+
+    numbers = [int(re.fullmatch(r"L20250401-(\d+)", i).group(1)) for i in ids]
+    assert numbers == list(range(7, 8 + N_PROCS * PER_PROC))
+    assert seq == (7 + N_PROCS * PER_PROC,)
+
+
+def test_allocate_skips_ids_taken_outside_the_sequence(web):
+    m = web.module
+    with m.app.app_context():
+        assert m.allocate_loan_id("2025-06-01") == "L20250601-001"
+        m.db.session.add(m.Customer(customer_id="C1", user_id=1, customer_name="c", credit_limit=1, created_at=""))
+        m.db.session.add(m.Loan(loan_id="L20250601-002", user_id=2, customer_id="C1", loan_amount=1,
+                                loan_date="2025-06-01", due_date="2025-06-01", interest_rate_percent=0,
+                                repayment_expected=1, repayment_method="CASH", grace_period_days=0,
+                                late_fee_rate_percent=0, late_base_amount=1, contract_status="ACTIVE",
+                                created_at=""))
+        m.db.session.commit()
+        assert m.allocate_loan_id("2025-06-01") == "L20250601-003"
+        assert m.allocate_loan_id("2025-06-02") == "L20250602-001"
+
+
+def test_save_new_loan_retries_only_loan_id_conflicts(web, monkeypatch):
+    from types import SimpleNamespace
+
+    import pytest
+    from sqlalchemy.exc import IntegrityError
+
+    m = web.module
+    allocated = []
+    real_allocate = m.allocate_loan_id
+    monkeypatch.setattr(m, "allocate_loan_id", lambda d: allocated.append(d) or real_allocate(d))
+    loan_data = {
+        "customer_id": "C1", "loan_amount": "1000", "loan_date": "2025-06-01", "due_date": "2025-07-01",
+        "interest_rate_percent": "0", "repayment_expected": "1000", "repayment_method": "CASH",
+        "grace_period_days": "0", "late_fee_rate_percent": "0", "late_base_amount": "1000", "contract_status": "ACTIVE",
+    }
+
+    with m.app.test_request_context():
+        m.db.session.add(m.Customer(customer_id="C1", user_id=1, customer_name="c", credit_limit=1, created_at=""))
+        m.db.session.commit()
+        # 番号の重複ではない制約違反（user_id が NULL）は、番号を取り直さずにそのまま送出する
+        m.g.user = SimpleNamespace(user_id=None)
+        with pytest.raises(IntegrityError):
+            m.save_new_loan(loan_data)
+        assert len(allocated) == 1
+
+        # 払い出した番号が既に使われていた（loans.loan_id の重複）ときだけ、番号を取り直す
+        m.g.user = SimpleNamespace(user_id=1)
+        m.db.session.add(m.Loan(loan_id="L20250601-002", user_id=1, customer_id="C1", loan_amount=1,
+                                loan_date="2025-06-01", due_date="2025-06-01", interest_rate_percent=0,
+                                repayment_expected=1, repayment_method="CASH", grace_period_days=0,
+                                late_fee_rate_percent=0, late_base_amount=1, contract_status="ACTIVE",
+                                created_at=""))
+        m.db.session.commit()
+        ids = iter(["L20250601-002", "L20250601-003"])
+        monkeypatch.setattr(m, "allocate_loan_id", lambda d: allocated.append(d) or next(ids))
+        assert m.save_new_loan(loan_data) == "L20250601-003"
+        assert len(allocated) == 3
@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+
+import pytest
+
+
+def _python_rows_as_of(m, user_id, as_of, monkeypatch):
+    from flask import g
+
+    class AsOf(date):
+        @classmethod
+        def today(cls):
+            return as_of
+
+    g.user = m.db.session.get(m.User, user_id)
+    day = as_of.isoformat()
+    loans = [l for l in m.load_loans() if l["loan_date"].strip() <= day]
+    repayments = [r for r in m.load_repayments() if r["repayment_date"].strip() <= day]
+    with monkeypatch.context() as patch:
+        patch.setattr(m, "date", AsOf)
+        return m.build_unpaid_loan_rows(loans, repayments)
+
+
+@pytest.mark.parametrize("days_ago", [0, 45, 200])
+def test_snapshot_matches_python_replay(web, seed_ledger, monkeypatch, days_ago):
+    m = web.module
+    seed_ledger(200, seed=7)
+    seed_ledger(30, seed=7, user_id=2)
+    as_of = date.today() - timedelta(days=days_ago)
+
+    with m.app.test_request_context():
+        want = _python_rows_as_of(m, 1, as_of, monkeypatch)
+        assert m.query_unpaid_loan_rows(1, as_of, as_of=True) == want
+
+        count = m.write_overdue_snapshot(as_of)
+        assert count == m.OverdueSnapshot.query.filter_by(snapshot_date=as_of.isoformat()).count()
+        assert m.query_unpaid_loan_rows(1, as_of, as_of=True) == want
+        assert {row["status"] for row in want} & {"OVERDUE", "UNPAID"}
+
+
+def test_as_of_reads_snapshot_without_replaying(web, seed_ledger):
+    m = web.module
+    seed_ledger(50, seed=8)
+    as_of = date.today() - timedelta(days=30)
+
+    with m.app.app_context():
+        m.write_overdue_snapshot(as_of)
+        stored = m.query_unpaid_loan_rows(1, as_of, as_of=True)
+
+        # スナップショットがあれば返済履歴は読まない（後から消しても結果は変わらない）
+        m.Repayment.query.delete()
+        m.db.session.commit()
+        assert m.query_unpaid_loan_rows(1, as_of, as_of=True) == stored
+        assert m.query_unpaid_loan_rows(1, as_of - timedelta(days=1), as_of=True) != []
+
+
+def test_as_of_pages_and_cli(web, seed_ledger):
+    m = web.module
+    seed_ledger(40, seed=9)
+    as_of = date.today() - timedelta(days=10)
+
+    result = m.app.test_cli_runner().invoke(args=["snapshot-overdue", "--date", as_of.isoformat()])
+    assert result.exit_code == 0, result.output
+    assert as_of.isoformat() in result.output
+
+    for url in ("/loan-status", "/overdue-loans"):
+        page = web.get(f"{url}?as_of={as_of.isoformat()}")
+        assert page.status_code == 200
+        assert f"{as_of.isoformat()} 時点" in page.get_data(as_text=True)
+
+        # 不正な日付・今日以降は現在の状態
+        for value in ("2020-13-01", date.today().isoformat()):
+            assert "時点の状態です" not in web.get(f"{url}?as_of={value}").get_data(as_text=True)
+
+    result = m.app.test_cli_runner().invoke(args=["snapshot-overdue", "--keep-days", "0"])
+    assert result.exit_code == 0, result.output
+    with m.app.app_context():
+        assert {row.snapshot_date for row in m.OverdueSnapshot.query} <= {date.today().isoformat()}
+
+
+def test_snapshot_with_no_rows_for_a_user_is_still_used(web, seed_ledger):
+    m = web.module
+    seed_ledger(20, seed=10)
+    as_of = date.today() - timedelta(days=20)
+    day = as_of.isoformat()
+
+    with m.app.app_context():
+        m.write_overdue_snapshot(as_of)
+
+        # スナップショットの後に、ユーザー2の過去日付の貸付が入った（ユーザー2はスナップショットに0件）
+        m.db.session.add(m.Customer(customer_id="C2-1", user_id=2, customer_name="c", credit_limit=1, created_at=""))
+        m.db.session.add(m.Loan(loan_id="L-U2", user_id=2, customer_id="C2-1", loan_amount=1000,
+                                loan_date="2020-01-01", due_date="2020-02-01", interest_rate_percent=0,
+                                repayment_expected=1000, repayment_method="CASH", grace_period_days=0,
+                                late_fee_rate_percent=0, late_base_amount=1000, contract_status="ACTIVE",
+                                created_at=""))
+        m.db.session.commit()
+
+        assert m.query_unpaid_loan_rows(2, as_of, as_of=True) == []
+        assert [r["loan_id"] for r in m.query_unpaid_loan_rows(2, as_of - timedelta(days=1), as_of=True)] == ["L-U2"]
+
+        # 過去日付の集計はそのユーザーの貸付だけを読む
+        balances = m.loan_balances_as_of(as_of, 2)
+        assert [row.loan_id for row in m.db.session.execute(m.select(balances.c.loan_id))] == ["L-U2"]
+        assert m.db.session.get(m.OverdueSnapshotRun, day).row_count == m.OverdueSnapshot.query.filter_by(
+            snapshot_date=day).count()
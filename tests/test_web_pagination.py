@@ -0,0 +1,69 @@
+import re
+from html import unescape
+
+from sqlalchemy import event
+
+
+def _ids(html):
+    return re.findall(r"<td>(L\d{8}-[^<]+)</td>", html)
+
+
+def _link(html, label):
+    m = re.search(r'<a href="([^"]+)">[^<]*' + label, html)
+    return unescape(m.group(1)) if m else None
+
+
+def test_loans_keyset_walk_forward_and_back(web, seed_ledger):
+    m = web.module
+    seed_ledger(120, seed=3)
+    with m.app.test_request_context():
+        from flask import g
+
+        g.user = m.db.session.get(m.User, 1)
+        want = [loan["loan_id"] for loan in m.load_loans()]
+
+    statements = []
+    with m.app.app_context():
+        engine = m.db.engine
+    listener = lambda conn, cur, stmt, params, *a: statements.append((stmt, params))  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        pages = []
+        url = "/loans?per_page=50"
+        while url:
+            html = web.get(url).get_data(as_text=True)
+            pages.append((url, _ids(html)))
+            url = _link(html, "次へ")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert [len(ids) for _, ids in pages] == [50, 50, 20]
+    assert sum((ids for _, ids in pages), []) == want
+    # SQLite 方言は LIMIT に OFFSET ? を添えるが、値は常に 0（読み飛ばしは発生しない）
+    assert all(params[-1] == 0 for stmt, params in statements if "OFFSET" in stmt.upper())
+    assert any("(loans.loan_date, loans.loan_id) >" in stmt for stmt, _ in statements)
+
+    # 最終ページから「前へ」で2ページ目に戻れる
+    last_html = web.get(pages[-1][0]).get_data(as_text=True)
+    prev_html = web.get(_link(last_html, "前へ")).get_data(as_text=True)
+    assert _ids(prev_html) == pages[1][1]
+
+
+def test_page_boundary_is_stable_under_inserts(web, seed_ledger):
+    m = web.module
+    seed_ledger(30, seed=4)
+    first = web.get("/loans?per_page=10").get_data(as_text=True)
+    next_url = _link(first, "次へ")
+
+    # 先頭側に新しい貸付が入っても、次ページは直前ページの続きから始まる
+    seed_ledger(30, seed=5)
+    second_ids = _ids(web.get(next_url).get_data(as_text=True))
+    assert second_ids and all(i > _ids(first)[-1] for i in second_ids)
+    assert set(second_ids).isdisjoint(_ids(first))
+
+
+def test_bad_cursor_and_page_size(web, seed_ledger):
+    seed_ledger(5, seed=6)
+    html = web.get("/repayments?after=!!!&per_page=abc").get_data(as_text=True)
+    assert "返済一覧" in html
+    assert web.get("/customers?per_page=100000").status_code == 200
@@ -0,0 +1,63 @@
+from sqlalchemy import event
+
+
+def _count_user_selects(m, client, url):
+    statements = []
+
+    def record(conn, cursor, statement, params, context, executemany):
+        statements.append(statement)
+
+    with m.app.app_context():
+        engine = m.db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        res = client.get(url)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return res, sum(1 for s in statements if "FROM users" in s)
+
+
+def test_principal_is_cached_per_worker(web):
+    m = web.module
+    assert _count_user_selects(m, web, "/")[1] == 1
+    res, selects = _count_user_selects(m, web, "/")
+    assert res.status_code == 200 and selects == 0
+    assert "admin" in res.get_data(as_text=True)
+
+    # static は DB もキャッシュも見ない
+    m.invalidate_principal()
+    res, selects = _count_user_selects(m, web, "/static/none.css")
+    assert selects == 0
+
+
+def test_deactivate_and_role_change_invalidate(web):
+    m = web.module
+    web.get("/")
+    with m.app.app_context():
+        user = m.db.session.get(m.User, 1)
+        user.role = "USER"
+        m.db.session.commit()
+    web.get("/")
+    with m.app.app_context():
+        assert m.get_principal(1).role == "USER"
+
+        user = m.db.session.get(m.User, 1)
+        user.is_active = False
+        m.db.session.commit()
+
+    res = web.get("/dashboard")
+    assert res.status_code == 302 and "/login" in res.headers["Location"]
+
+
+def test_ttl_expiry(web, monkeypatch):
+    m = web.module
+    web.get("/")
+    # 別プロセスで無効化された（このプロセスのイベントは発火しない）
+    with m.app.app_context():
+        m.db.session.execute(m.db.text("UPDATE users SET is_active = 0 WHERE user_id = 1"))
+        m.db.session.commit()
+    assert web.get("/dashboard").status_code == 200
+
+    clock = m.time.monotonic() + m.PRINCIPAL_TTL_SECONDS + 1
+    monkeypatch.setattr(m.time, "monotonic", lambda: clock)
+    assert web.get("/dashboard").status_code == 302
@@ -0,0 +1,62 @@
+from datetime import date
+
+import pytest
+from flask import g, render_template
+
+
+@pytest.mark.parametrize("path", ["/loans?per_page=40", "/repayments?per_page=40", "/loan-status"])
+def test_pages_are_streamed_in_chunks(web, seed_ledger, path):
+    seed_ledger(120, seed=11)
+
+    res = web.get(path)
+    assert res.status_code == 200
+    assert res.is_streamed
+    chunks = [chunk.decode("utf-8") for chunk in res.response]
+    res.close()
+    # 見出しまでは表の行を待たずに送られる
+    assert "<h1>" in chunks[0] and "</html>" not in chunks[0]
+    assert "".join(chunks).rstrip().endswith("</html>")
+
+
+def test_streamed_html_matches_buffered_render(web, seed_ledger):
+    m = web.module
+    seed_ledger(150, seed=12)
+    streamed = {
+        path: web.get(path).get_data(as_text=True)
+        for path in ("/loans?per_page=60", "/repayments?per_page=60", "/loan-status")
+    }
+
+    with m.app.test_request_context("/loans?per_page=60"):
+        g.user = m.db.session.get(m.User, 1)
+        loans, page = m.keyset_page(
+            m.Loan.query.filter_by(user_id=1), (m.Loan.loan_date, m.Loan.loan_id), m.loan_to_dict
+        )
+        assert page["next"] and "次へ" in streamed["/loans?per_page=60"]
+        assert streamed["/loans?per_page=60"] == render_template("loan_list.html", loans=loans, page=page)
+
+    with m.app.test_request_context("/loan-status"):
+        g.user = m.db.session.get(m.User, 1)
+        rows = m.query_unpaid_loan_rows(1, date.today())
+        summary = m.summarize_unpaid_rows(1, date.today())
+        assert streamed["/loan-status"] == render_template(
+            "loan_status.html", as_of=None, unpaid_loans=rows, **summary
+        )
+
+
+def test_summary_matches_row_totals(web, seed_ledger):
+    m = web.module
+    seed_ledger(300, seed=13)
+    seed_ledger(20, seed=13, user_id=2)
+
+    with m.app.app_context():
+        rows = m.query_unpaid_loan_rows(1, date.today())
+        summary = m.summarize_unpaid_rows(1, date.today())
+
+    assert summary["unpaid_loan_count"] == len(rows)
+    for status, key in (("OVERDUE", "overdue_count"), ("UNPAID", "unpaid_count"),
+                        ("LATE_FEE_ONLY", "late_fee_only_count")):
+        assert summary[key] == sum(1 for row in rows if row["status"] == status)
+    for column in ("loan_amount", "repayment_expected", "total_repaid", "remaining",
+                   "late_fee_remaining", "current_collect_amount"):
+        key = column if column.startswith("total_") else f"total_{column}"
+        assert summary[key] == sum(row[column] for row in rows)
@@ -0,0 +1,57 @@
+from datetime import date
+
+import pytest
+
+
+def _python_rows(m, user_id):
+    from flask import g
+
+    g.user = m.db.session.get(m.User, user_id)
+    return m.build_unpaid_loan_rows(m.load_loans(), m.load_repayments())
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_unpaid_rows_sql_matches_python(web, seed_ledger, seed):
+    m = web.module
+    seed_ledger(400, seed=seed)
+    seed_ledger(40, seed=seed, user_id=2)
+
+    with m.app.test_request_context():
+        want = _python_rows(m, 1)
+        got = m.query_unpaid_loan_rows(1, date.today())
+    assert got == want
+    statuses = {row["status"] for row in want}
+    assert {"OVERDUE", "UNPAID"} <= statuses
+    assert any(row["late_fee_amount"] > 0 for row in want)
+
+
+def test_unpaid_rows_edge_cases(web):
+    m = web.module
+    with m.app.app_context():
+        base = dict(user_id=1, customer_id="C1", loan_amount=100_000, loan_date="2020-01-01",
+                    interest_rate_percent=0, repayment_expected=100_000, repayment_method="CASH",
+                    grace_period_days=0, late_fee_rate_percent=14.6, late_base_amount=100_000,
+                    contract_status="ACTIVE", created_at=m.now_str())
+        m.db.session.add_all([
+            m.Loan(loan_id="L-EMPTY", **{**base, "due_date": ""}),
+            m.Loan(loan_id="L-BAD", **{**base, "due_date": "2020/01/31"}),
+            m.Loan(loan_id=" L-FEE ", **{**base, "due_date": " 2020-01-31"}),
+        ])
+        m.db.session.add(
+            m.Repayment(user_id=1, loan_id="L-FEE", customer_id="C1", repayment_amount=100_000,
+                        repayment_date="2020-02-01", payment_type="REPAYMENT", created_at=m.now_str())
+        )
+        m.db.session.commit()
+
+    with m.app.test_request_context():
+        want = _python_rows(m, 1)
+        got = m.query_unpaid_loan_rows(1, date.today())
+    assert got == want
+    assert [row["loan_id"] for row in got] == ["L-EMPTY", "L-FEE", "L-BAD"]
+    assert got[1]["status"] == "LATE_FEE_ONLY"
+
+
+def test_loan_status_page(web, seed_ledger):
+    seed_ledger(30, seed=5)
+    for url in ("/loan-status", "/overdue-loans"):
+        assert web.get(url).status_code == 200
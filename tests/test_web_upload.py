@@ -0,0 +1,235 @@
+import csv
+import io
+import time
+
+import pytest
+
+LOAN_HEADER = (
+    "loan_id,customer_id,loan_amount,loan_date,due_date,interest_rate_percent,repayment_expected,"
+    "repayment_method,grace_period_days,late_fee_rate_percent,late_base_amount,contract_status,"
+    "cancelled_at,cancel_reason,notes\n"
+)
+
+
+@pytest.fixture
+def customers(web):
+    m = web.module
+    with m.app.app_context():
+        for cid, uid in (("C1", 1), ("C2", 1), ("X1", 2)):
+            m.db.session.add(m.Customer(customer_id=cid, user_id=uid, customer_name=cid,
+                                        credit_limit=1, created_at=""))
+        m.db.session.commit()
+    return m
+
+
+def upload(client, url, text, dry_run=False):
+    data = {"file": (io.BytesIO(text.encode("utf-8")), "upload.csv")}
+    if dry_run:
+        data["dry_run"] = "1"
+    res = client.post(url, data=data, content_type="multipart/form-data")
+    assert res.status_code == 200
+    html = res.get_data(as_text=True)
+    token = html.split("/uploads/reports/")[1].split(".csv")[0] if "/uploads/reports/" in html else None
+    return html, token
+
+
+def report(client, token):
+    res = client.get(f"/uploads/reports/{token}.csv")
+    assert res.status_code == 200
+    return list(csv.DictReader(io.StringIO(res.get_data().decode("utf-8-sig"))))
+
+
+def test_loan_upload_reports_each_row(web, customers):
+    m = customers
+    text = LOAN_HEADER + (
+        ",C1,10000,2025-01-10,2025-02-10,10,,CASH,0,10,,,,,\n"
+        "LMIG-1,C2,20000,2025-01-10,2025-02-10,0,25000,,3,14.6,15000,cancelled,2025-01-20,reason,memo\n"
+        "LMIG-1,C2,20000,2025-01-10,2025-02-10,0,,,3,14.6,,,,,\n"
+        ",X1,10000,2025-01-10,2025-02-10,10,,,0,10,,,,,\n"
+        ",C1,abc,2025-01-10,2025-01-01,10,,,0,10,,UNKNOWN,,,\n"
+        ",C1,5000,2025-01-10,2025-02-10,0,,,0,0,,,,,\n"
+    )
+    html, token = upload(web, "/loans/upload", text)
+    assert "6 行中、エラー 3 行" in html
+    assert "3 件を登録しました" in html
+
+    rows = report(web, token)
+    assert [(r["row"], r["status"]) for r in rows] == [
+        ("2", "INSERTED"), ("3", "INSERTED"), ("4", "ERROR"), ("5", "ERROR"), ("6", "ERROR"), ("7", "INSERTED"),
+    ]
+    assert rows[0]["key"] == "L20250110-001" and rows[5]["key"] == "L20250110-002"
+    assert "既に登録" in rows[2]["errors"]
+    assert rows[3]["errors"] == "存在しない顧客IDです。"
+    assert rows[4]["errors"].split(" / ") == [
+        "貸付額は数値で入力してください。",
+        "返済期日は貸付日以降の日付を入力してください。",
+        "契約状態は ACTIVE または CANCELLED を入力してください。",
+    ]
+
+    with m.app.app_context():
+        migrated = m.db.session.get(m.Loan, "LMIG-1")
+        assert (migrated.repayment_expected, migrated.late_base_amount, migrated.contract_status,
+                migrated.repayment_method) == (25000, 15000, "CANCELLED", "UNKNOWN")
+        auto = m.db.session.get(m.Loan, "L20250110-001")
+        assert (auto.repayment_expected, auto.late_base_amount) == (11000, 10000)
+
+    # 他のユーザーからはレポートを取れない
+    with web.session_transaction() as sess:
+        sess["user_id"] = 2
+    assert web.get(f"/uploads/reports/{token}.csv").status_code == 404
+
+
+def test_repayment_upload_counts_earlier_rows(web, customers):
+    m = customers
+    upload(web, "/loans/upload", LOAN_HEADER + (
+        "L1,C1,1000,2025-01-01,2025-01-31,0,,,0,15,,,,,\n"
+        "L2,C1,1000,2025-01-01,2999-01-31,0,,,0,15,,CANCELLED,,,\n"
+    ))
+    text = (
+        "loan_id,customer_id,repayment_amount,repayment_date,payment_type\n"
+        "L1,C1,600,2025-02-01,REPAYMENT\n"
+        "L1,C1,600,2025-02-02,repayment\n"
+        "L1,,400,2025-02-03,\n"
+        "L1,C2,1,2025-02-03,LATE_FEE\n"
+        "L2,C1,1,2025-02-03,REPAYMENT\n"
+        "L9,C1,1,2025-02-03,REPAYMENT\n"
+    )
+    html, token = upload(web, "/repayments/upload", text, dry_run=True)
+    assert "チェックのみ" in html
+    with m.app.app_context():
+        assert m.Repayment.query.count() == 0
+    assert [r["status"] for r in report(web, token)] == ["OK", "ERROR", "OK", "ERROR", "ERROR", "ERROR"]
+
+    html, token = upload(web, "/repayments/upload", text)
+    rows = report(web, token)
+    assert [r["status"] for r in rows] == ["INSERTED", "ERROR", "INSERTED", "ERROR", "ERROR", "ERROR"]
+    assert rows[1]["errors"] == "通常返済額が通常残高を超えています。通常残高は 400 円です。"
+    assert "一致しません" in rows[3]["errors"]
+    assert rows[4]["errors"] == "取消済みの貸付には返済登録できません。"
+    assert rows[5]["errors"] == "存在しない loan_id です。"
+    with m.app.app_context():
+        bal = m.db.session.get(m.LoanBalance, "L1")
+        assert (bal.total_repaid, bal.fully_repaid) == (1000, True)
+
+
+def test_upload_rejects_missing_columns_and_files(web, customers):
+    html, token = upload(web, "/repayments/upload", "loan_id,amount\nL1,1\n")
+    assert "必要な列がありません: repayment_amount, repayment_date" in html and token is None
+    res = web.post("/loans/upload", data={}, content_type="multipart/form-data")
+    assert "CSVファイルを選択してください。" in res.get_data(as_text=True)
+
+
+def test_repayment_batch_is_rechecked_against_current_balances_before_insert(web, customers):
+    from datetime import date
+
+    m = customers
+    upload(web, "/loans/upload", LOAN_HEADER + (
+        "L1,C1,1000,2025-01-01,2999-01-31,0,,,0,15,,,,,\n"
+        "L2,C1,1000,2025-01-01,2999-01-31,0,,,0,15,,,,,\n"
+    ))
+    rows = [(2, {"loan_id": "L1", "repayment_amount": "600", "repayment_date": "2025-02-01"}),
+            (3, {"loan_id": "L2", "repayment_amount": "100", "repayment_date": "2025-02-01"}),
+            (4, {"loan_id": "L2", "repayment_amount": "200", "repayment_date": "2025-02-01"})]
+    today = date(2025, 2, 1)
+    recheck = lambda batch: m._recheck_repayment_batch(1, batch, today)
+
+    with m.app.app_context():
+        results = m.check_repayment_upload(1, rows, today)
+        assert [r[2] for r in results] == [[], [], []]
+        # チェックの後、登録の前に別の画面から L1 に 600 円、L2 に 800 円が入った（DBの制約には掛からない）
+        upload(web, "/repayments/upload",
+               "loan_id,customer_id,repayment_amount,repayment_date,payment_type\n"
+               "L1,C1,600,2025-02-01,REPAYMENT\nL2,C1,800,2025-02-01,REPAYMENT\n")
+
+        inserted = m._insert_batches(m.Repayment, results, recheck)
+        assert inserted == 1
+        assert results[0][2] == ["通常返済額が通常残高を超えています。通常残高は 400 円です。"]
+        assert results[1][2] == []
+        # 同じバッチの前の行の分も数に入れる
+        assert results[2][2] == ["通常返済額が通常残高を超えています。通常残高は 100 円です。"]
+        assert m.db.session.get(m.LoanBalance, "L1").total_repaid == 600
+        assert m.db.session.get(m.LoanBalance, "L2").total_repaid == 900
+
+
+def test_failed_repayment_batch_is_retried_row_by_row_with_a_fresh_check(web, customers):
+    from datetime import date
+
+    m = customers
+    upload(web, "/loans/upload", LOAN_HEADER + "L1,C1,1000,2025-01-01,2999-01-31,0,,,0,15,,,,,\n")
+    rows = [(2, {"loan_id": "L1", "repayment_amount": "600", "repayment_date": "2025-02-01"}),
+            (3, {"loan_id": "L1", "repayment_amount": "400", "repayment_date": "2025-02-01"})]
+    today = date(2025, 2, 1)
+
+    with m.app.app_context():
+        results = m.check_repayment_upload(1, rows, today)
+        results[0][3]["user_id"] = None  # 1行目はDBの制約で落ちる（バッチ全体が巻き戻る）
+
+        inserted = m._insert_batches(m.Repayment, results, lambda batch: m._recheck_repayment_batch(1, batch, today))
+        assert inserted == 1
+        assert results[0][2] == ["登録できませんでした（DB制約）。"]
+        assert results[1][2] == []
+        assert m.db.session.get(m.LoanBalance, "L1").total_repaid == 400
+
+
+def test_bulk_upload_of_thousands_of_rows_is_fast(web, customers):
+    m = customers
+    n = 3000
+    loans = LOAN_HEADER + "".join(
+        f"LB{i:05d},C{1 + i % 2},10000,2025-01-{1 + i % 28:02d},2025-03-01,10,,CASH,0,10,,,,,\n"
+        for i in range(n)
+    )
+    repayments = "loan_id,customer_id,repayment_amount,repayment_date,payment_type\n" + "".join(
+        f"LB{i:05d},,{5000 + j},2025-02-0{1 + j},REPAYMENT\n" for i in range(n) for j in range(2)
+    )
+
+    start = time.perf_counter()
+    html, _ = upload(web, "/loans/upload", loans)
+    assert f"{n} 件を登録しました" in html
+    html, token = upload(web, "/repayments/upload", repayments)
+    elapsed = time.perf_counter() - start
+
+    # 2行目は 11000 - 5000 = 6000 円の残高に対して 5001 円なので登録できる
+    assert f"{2 * n} 件を登録しました" in html
+    assert elapsed < 15
+    with m.app.app_context():
+        conn = m.db.engine.raw_connection()
+        try:
+            assert m.verify_loan_balances(conn) == []
+        finally:
+            conn.close()
+
+
+def test_loan_upload_checks_only_the_uploaded_ids_and_prunes_old_reports(web, customers, monkeypatch):
+    import os
+
+    m = customers
+    with m.app.app_context():
+        # 別ユーザーの登録済み loan_id とも重複チェックする
+        m.db.session.add(m.Loan(loan_id="LTAKEN", user_id=2, customer_id="X1", loan_amount=1,
+                                loan_date="2025-01-01", due_date="2025-02-01", interest_rate_percent=0,
+                                repayment_expected=1, repayment_method="CASH", grace_period_days=0,
+                                late_fee_rate_percent=0, late_base_amount=1, contract_status="ACTIVE",
+                                created_at=""))
+        m.db.session.commit()
+
+    old_report = m.UPLOAD_REPORT_DIR / "1" / "0123456789abcdef0123456789abcdef.csv"
+    old_report.parent.mkdir(parents=True, exist_ok=True)
+    old_report.write_text("row,status,key,errors\n", encoding="utf-8")
+    stale = time.time() - m.UPLOAD_REPORT_KEEP_SECONDS - 60
+    os.utime(old_report, (stale, stale))
+
+    statements = []
+    real_execute = m.db.session.execute
+    monkeypatch.setattr(m.db.session, "execute",
+                        lambda stmt, *a, **k: statements.append(str(stmt)) or real_execute(stmt, *a, **k))
+    html, token = upload(web, "/loans/upload", LOAN_HEADER + (
+        "LTAKEN,C1,1000,2025-01-10,2025-02-10,0,,,0,10,,,,,\n"
+        "LNEW,C1,1000,2025-01-10,2025-02-10,0,,,0,10,,,,,\n"
+    ), dry_run=True)
+    monkeypatch.undo()
+
+    assert [(r["key"], r["status"]) for r in report(web, token)] == [("LTAKEN", "ERROR"), ("LNEW", "OK")]
+    loan_id_queries = [s for s in statements if "SELECT loans.loan_id" in s]
+    assert loan_id_queries and all(" IN " in s for s in loan_id_queries)
+    assert not old_report.exists()
+    assert (m.UPLOAD_REPORT_DIR / "1" / f"{token}.csv").exists()
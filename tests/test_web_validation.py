@@ -0,0 +1,106 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def loans(web):
+    m = web.module
+    with m.app.app_context():
+        m.db.session.add(m.Customer(customer_id="C1", user_id=1, customer_name="c", credit_limit=1, created_at=m.now_str()))
+        base = dict(user_id=1, customer_id="C1", loan_amount=10_000, loan_date="2025-01-01",
+                    interest_rate_percent=0, repayment_expected=10_000, repayment_method="CASH",
+                    grace_period_days=0, late_fee_rate_percent=15, late_base_amount=10_000,
+                    contract_status="ACTIVE", created_at=m.now_str())
+        m.db.session.add_all([
+            m.Loan(loan_id="L-OVERDUE", **{**base, "due_date": "2025-01-31"}),
+            m.Loan(loan_id=" L-PAD ", **{**base, "due_date": "2999-12-31"}),
+            m.Loan(loan_id="L-CXL", **{**base, "due_date": "2999-12-31", "contract_status": "CANCELLED"}),
+            m.Loan(loan_id="L-OTHER", **{**base, "user_id": 2, "due_date": "2999-12-31"}),
+        ])
+        m.db.session.add(m.Repayment(user_id=1, loan_id="L-OVERDUE", customer_id="C1", repayment_amount=9_000,
+                                     repayment_date="2025-02-01", payment_type="REPAYMENT", created_at=m.now_str()))
+        m.db.session.commit()
+    return m
+
+
+def _validate(m, today=date(2025, 3, 2), **form):
+    data = {"loan_id": "", "repayment_amount": "", "repayment_date": "", "payment_type": "REPAYMENT", **form}
+    with m.app.app_context():
+        return m.validate_repayment_form(1, data, today)
+
+
+def test_repayment_validation_messages(loans):
+    m = loans
+    assert _validate(m, loan_id="L-OTHER", repayment_amount="1")[0] == ["存在しない loan_id です。"]
+    assert _validate(m, loan_id="L-CXL", repayment_amount="1")[0] == ["取消済みの貸付には返済登録できません。"]
+    assert _validate(m, payment_type="X", repayment_amount="0")[0] == [
+        "返済種別が正しくありません。", "loan_id を入力してください。", "返済金額は1円以上で入力してください。",
+    ]
+    assert _validate(m, loan_id="L-OVERDUE", repayment_amount="1001")[0] == [
+        "通常返済額が通常残高を超えています。通常残高は 1000 円です。",
+    ]
+    # 2025-01-31 から 30日延滞 → 10,000 × 15% × 30/30 = 1,500 円
+    assert _validate(m, loan_id="L-OVERDUE", repayment_amount="1501", payment_type="LATE_FEE")[0] == [
+        "延滞手数料返済額が延滞手数料残額を超えています。延滞手数料残額は 1500 円です。",
+    ]
+    assert _validate(m, loan_id="L-PAD", repayment_amount="1", payment_type="LATE_FEE")[0] == [
+        "この貸付には現在、延滞手数料が発生していません。",
+    ]
+    assert _validate(m, loan_id="L-PAD", repayment_amount="1", repayment_date="2025/01/01")[0] == [
+        "返済日の形式が正しくありません。",
+    ]
+
+    errors, data = _validate(m, loan_id="L-PAD", repayment_amount="500")
+    assert errors == []
+    assert data == {"loan_id": "L-PAD", "customer_id": "C1", "repayment_amount": 500,
+                    "repayment_date": "2025-03-02", "payment_type": "REPAYMENT"}
+
+
+def test_loan_cancel_validation(loans):
+    m = loans
+    with m.app.app_context():
+        assert m.validate_loan_cancel_form(1, {"loan_id": "", "cancel_reason": ""}) == [
+            "貸付IDを入力してください。", "契約解除理由を入力してください。",
+        ]
+        assert m.validate_loan_cancel_form(1, {"loan_id": "L-OTHER", "cancel_reason": "x"}) == ["存在しない貸付IDです。"]
+        assert m.validate_loan_cancel_form(1, {"loan_id": "L-CXL", "cancel_reason": "x"}) == ["この貸付はすでに契約解除済みです。"]
+        assert m.validate_loan_cancel_form(1, {"loan_id": "L-OVERDUE", "cancel_reason": "x"}) == []
+
+
+def test_repayment_post_cost_does_not_depend_on_portfolio_size(web, seed_ledger):
+    m = web.module
+
+    def post_and_count(loan_id):
+        statements = []
+
+        def record(conn, cursor, statement, params, context, executemany):
+            # ログインユーザーの読み込みはキャッシュの有無で変わるので数えない
+            if "FROM users" not in statement:
+                statements.append(statement)
+
+        with m.app.app_context():
+            engine = m.db.engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            res = web.post("/repayments/new", data={
+                "loan_id": loan_id, "repayment_amount": "999999999", "payment_type": "REPAYMENT",
+            })
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert "通常残高" in res.get_data(as_text=True) or "完了" in res.get_data(as_text=True)
+        return statements
+
+    def active_loan_id():
+        with m.app.app_context():
+            return next(l.loan_id for l in m.Loan.query.filter_by(user_id=1)
+                        if l.contract_status.strip().upper() == "ACTIVE")
+
+    seed_ledger(10, seed=1)
+    small = post_and_count(active_loan_id())
+    seed_ledger(500, seed=2)
+    large = post_and_count(active_loan_id())
+    assert len(small) == len(large)
+    # repayments の全件読み込みは無い
+    assert not any("FROM repayments" in s for s in large)
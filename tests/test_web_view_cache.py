@@ -0,0 +1,88 @@
+from datetime import date
+
+from view_cache import ViewCache
+
+
+def test_lru_and_disk_share(tmp_path):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"rows": [1, 2], "n": len(calls)}
+
+    a = ViewCache(max_entries=2, disk_dir=tmp_path)
+    assert a.get_or_compute("v", 1, 3, "2025-01-01", compute) == {"rows": [1, 2], "n": 1}
+    assert a.get_or_compute("v", 1, 3, "2025-01-01", compute)["n"] == 1
+    assert a.stats == {"hits": 1, "disk_hits": 0, "misses": 1}
+
+    # 別プロセス相当（LRU は空）でもディスクから読める
+    b = ViewCache(max_entries=2, disk_dir=tmp_path)
+    assert b.get_or_compute("v", 1, 3, "2025-01-01", compute)["n"] == 1
+    assert b.stats["disk_hits"] == 1
+
+    # バージョン・日付が変われば再計算し、古いファイルは消える
+    assert a.get_or_compute("v", 1, 4, "2025-01-01", compute)["n"] == 2
+    assert a.get_or_compute("v", 1, 4, "2025-01-02", compute)["n"] == 3
+    assert [p.name for p in (tmp_path / "1").iterdir()] == ["v-4-2025-01-02.json"]
+
+    # LRU は max_entries 件まで
+    assert len(a._entries) == 2
+
+    off = ViewCache(max_entries=0)
+    off.get_or_compute("v", 1, 1, "", compute)
+    off.get_or_compute("v", 1, 1, "", compute)
+    assert len(calls) == 5
+
+
+def test_writes_bump_version_and_invalidate(web, seed_ledger, monkeypatch):
+    m = web.module
+    calls = []
+    original = m.calculate_dashboard_data
+
+    def counting(user_id, today):
+        calls.append(user_id)
+        return original(user_id, today)
+
+    monkeypatch.setattr(m, "calculate_dashboard_data", counting)
+    seed_ledger(10, seed=1)
+
+    with m.app.app_context():
+        v1 = m.get_data_version(1)
+        assert v1 > 0 and m.get_data_version(2) == 0
+
+    for _ in range(3):
+        assert web.get("/dashboard").status_code == 200
+    assert len(calls) == 1
+
+    with m.app.app_context():
+        loan = m.Loan.query.filter_by(user_id=1).first()
+        loan.notes = "memo"
+        m.db.session.commit()
+        assert m.get_data_version(1) == v1 + 1
+
+    web.get("/dashboard")
+    assert len(calls) == 2
+
+    # 他ユーザーの書き込みでは無効化されない
+    seed_ledger(3, seed=2, user_id=2)
+    web.get("/dashboard")
+    assert len(calls) == 2
+
+
+def test_date_rollover_recomputes(web, seed_ledger, monkeypatch):
+    m = web.module
+    seed_ledger(10, seed=3)
+    for url in ("/loan-status", "/overdue-loans", "/loan-contracts"):
+        assert web.get(url).status_code == 200
+    misses = m.view_cache.stats["misses"]
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.fromordinal(date.today().toordinal() + 1)
+
+    monkeypatch.setattr(m, "date", Tomorrow)
+    for url in ("/loan-status", "/overdue-loans", "/loan-contracts"):
+        assert web.get(url).status_code == 200
+    # 日付に依存しない契約状況一覧だけはそのまま使われる
+    assert m.view_cache.stats["misses"] == misses + 2
@@ -0,0 +1,123 @@
+# view_cache.py
+"""
+画面（ダッシュボード・未返済一覧など）の計算結果を user_id ごとにキャッシュする。
+
+キーは (view, user_id, データバージョン, 日付)。
+- データバージョンは user_data_versions テーブルの値で、loans / repayments / customers への
+  書き込みのたびにトリガーで +1 される（定義は database.py）。書き込みがあれば古いキーは二度と引かれない
+- 延滞判定は date.today() に依存するので、日付もキーに含める（日付が変われば再計算）
+
+保存先は2段:
+- プロセス内 LRU（既定 256 件、APP_VIEW_CACHE_SIZE で変更、0 で無効）
+- APP_VIEW_CACHE_DIR を指定した場合のみ、ディスク（JSON）にも保存して gunicorn の worker 間で共有する
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 256
+
+CacheKey = Tuple[str, int, int, str]
+
+
+class ViewCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, disk_dir: Optional[os.PathLike] = None):
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._entries: "OrderedDict[CacheKey, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+    @classmethod
+    def from_env(cls) -> "ViewCache":
+        try:
+            max_entries = int(os.getenv("APP_VIEW_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+        except ValueError:
+            max_entries = DEFAULT_MAX_ENTRIES
+        return cls(max_entries=max_entries, disk_dir=os.getenv("APP_VIEW_CACHE_DIR") or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get_or_compute(
+        self,
+        view: str,
+        user_id: int,
+        version: int,
+        day: str,
+        compute: Callable[[], Any],
+    ) -> Any:
+        """
+        キャッシュにあればそれを、無ければ compute() の結果を保存して返す。
+        compute() の戻り値は JSON にできる値（dict / list / str / 数値）であること。
+        """
+        if not self.enabled:
+            return compute()
+
+        key = (view, user_id, version, day)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+
+        value = self._read_disk(key)
+        if value is not None:
+            self.stats["disk_hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            value = compute()
+            self._write_disk(key, value)
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        for name in self.stats:
+            self.stats[name] = 0
+
+    # ======================
+    # ディスク（worker 間共有）
+    # ======================
+
+    def _disk_path(self, key: CacheKey) -> Path:
+        view, user_id, version, day = key
+        return self.disk_dir / str(user_id) / f"{view}-{version}-{day}.json"
+
+    def _read_disk(self, key: CacheKey) -> Optional[Any]:
+        if self.disk_dir is None:
+            return None
+        try:
+            return json.loads(self._disk_path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: CacheKey, value: Any) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+
+            # 同じ画面の古いバージョン・古い日付のファイルは不要
+            for old in path.parent.glob(f"{key[0]}-*.json"):
+                if old != path:
+                    old.unlink(missing_ok=True)
+        except OSError:
+            # ディスクに書けなくても画面表示は続ける（プロセス内 LRU だけで動く）
+            pass